@@ -3,6 +3,8 @@ Pet Life Server - FastAPI入口
 在Vercel上部署的API服务
 """
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
@@ -15,9 +17,30 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from src.models import PetState, InteractRequest, FeedRequest
 from src.life_adapter import LifeAdapter
+from src.engine_executor import engine_executor, EngineBusyError
+from src.redis_pool import close_redis_clients
+from src.pet_events import start_event_scheduler, stop_event_scheduler
+from src.scheduler import start_scheduler
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：检查引擎兼容性，启动定时批量推进与事件调度（如已开启）；退出时停止它们、关闭引擎线程池、强制刷盘并关闭Redis连接池"""
+    LifeAdapter.check_engine()
+    scheduler = start_scheduler()
+    events = start_event_scheduler()
+    yield
+    stop_event_scheduler(events)
+    if scheduler is not None:
+        scheduler.stop()
+    engine_executor.shutdown()
+    LifeAdapter.shutdown()
+    close_redis_clients()
+
 
 # 创建FastAPI应用
 app = FastAPI(
+    lifespan=lifespan,
     title="Pet Life Server",
     description="桌面宠物云端服务",
     version="0.1.0"
@@ -48,9 +71,14 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """健康检查端点"""
+    """健康检查端点（附带存储层刷盘指标，在引擎线程池中收集）"""
+    try:
+        storage = await engine_executor.run(LifeAdapter.storage_stats)
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     return {
         "status": "healthy",
+        "storage": storage,
         "timestamp": datetime.utcnow().isoformat()
     }
 
@@ -69,14 +97,17 @@ async def get_pet_status(device_id: str):
         if not device_id:
             raise HTTPException(status_code=400, detail="device_id is required")
 
-        adapter = LifeAdapter(device_id)
-        state = adapter.get_state()
+        state = await engine_executor.run(
+            lambda: LifeAdapter(device_id).get_state()
+        )
 
         return {
             "success": True,
             "data": state,
             "timestamp": datetime.utcnow().isoformat()
         }
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -86,10 +117,10 @@ async def interact_pet(request: InteractRequest):
     """
     宠物互动
 
-    支持的action:
-    - feed: 喂食
-    - greet: 打招呼
-    - play: 玩耍
+    支持的action（效果见 src/action_effects.py）:
+    - feed: 喂食（补充能量，冷却60秒）
+    - greet: 打招呼（校准生物钟，冷却10秒）
+    - play: 玩耍（消耗能量、校准生物钟，能量低于30时无效，冷却30秒）
     """
     try:
         if not request.device_id:
@@ -97,8 +128,9 @@ async def interact_pet(request: InteractRequest):
         if not request.action:
             raise HTTPException(status_code=400, detail="action is required")
 
-        adapter = LifeAdapter(request.device_id)
-        state = adapter.interact(request.action)
+        state = await engine_executor.run(
+            lambda: LifeAdapter(request.device_id).interact(request.action)
+        )
 
         return {
             "success": True,
@@ -106,6 +138,8 @@ async def interact_pet(request: InteractRequest):
             "data": state,
             "timestamp": datetime.utcnow().isoformat()
         }
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -119,8 +153,9 @@ async def feed_pet(request: FeedRequest):
         if not request.device_id:
             raise HTTPException(status_code=400, detail="device_id is required")
 
-        adapter = LifeAdapter(request.device_id)
-        state = adapter.interact("feed")
+        state = await engine_executor.run(
+            lambda: LifeAdapter(request.device_id).interact("feed")
+        )
 
         return {
             "success": True,
@@ -128,6 +163,73 @@ async def feed_pet(request: FeedRequest):
             "data": state,
             "timestamp": datetime.utcnow().isoformat()
         }
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ==================== 多宠物API ====================
+
+@app.get("/api/pets/{pet_id}/status")
+async def get_registry_pet_status(pet_id: str, device_id: str):
+    """
+    获取指定宠物的状态（宠物按需从存储加载，节点内LRU常驻）
+
+    参数:
+    - pet_id: 宠物ID（字母、数字、下划线、短横线，最长64）
+    - device_id: 设备ID (必需)
+    """
+    try:
+        if not device_id:
+            raise HTTPException(status_code=400, detail="device_id is required")
+
+        state = await engine_executor.run(
+            lambda: LifeAdapter(device_id, pet_id=pet_id).get_state()
+        )
+
+        return {
+            "success": True,
+            "data": state,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/pets/{pet_id}/interact")
+async def interact_registry_pet(pet_id: str, request: InteractRequest):
+    """
+    与指定宠物互动（action与 /api/pet/interact 相同）
+    """
+    try:
+        if not request.device_id:
+            raise HTTPException(status_code=400, detail="device_id is required")
+        if not request.action:
+            raise HTTPException(status_code=400, detail="action is required")
+
+        state = await engine_executor.run(
+            lambda: LifeAdapter(request.device_id, pet_id=pet_id).interact(request.action)
+        )
+
+        return {
+            "success": True,
+            "action": request.action,
+            "data": state,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -140,8 +242,9 @@ async def debug_reset(device_id: str):
     重置宠物状态（调试用）
     """
     try:
-        adapter = LifeAdapter(device_id)
-        state = adapter.reset()
+        state = await engine_executor.run(
+            lambda: LifeAdapter(device_id).reset()
+        )
 
         return {
             "success": True,
@@ -149,6 +252,8 @@ async def debug_reset(device_id: str):
             "data": state,
             "timestamp": datetime.utcnow().isoformat()
         }
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
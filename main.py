@@ -15,6 +15,8 @@ from dotenv import load_dotenv
 load_dotenv()
 load_dotenv(".env.local", override=True)
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
@@ -22,9 +24,30 @@ from datetime import datetime
 
 from src.models import PetState, InteractRequest, FeedRequest
 from src.life_adapter import LifeAdapter
+from src.engine_executor import engine_executor, EngineBusyError
+from src.redis_pool import close_redis_clients
+from src.pet_events import start_event_scheduler, stop_event_scheduler
+from src.scheduler import start_scheduler
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：检查引擎兼容性，启动定时批量推进与事件调度（如已开启）；退出时停止它们、关闭引擎线程池、强制刷盘并关闭Redis连接池"""
+    LifeAdapter.check_engine()
+    scheduler = start_scheduler()
+    events = start_event_scheduler()
+    yield
+    stop_event_scheduler(events)
+    if scheduler is not None:
+        scheduler.stop()
+    engine_executor.shutdown()
+    LifeAdapter.shutdown()
+    close_redis_clients()
+
 
 # 创建FastAPI应用
 app = FastAPI(
+    lifespan=lifespan,
     title="Pet Life Server",
     description="桌面宠物云端服务 - 本地开发版本",
     version="0.1.0"
@@ -56,9 +79,14 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """健康检查端点"""
+    """健康检查端点（附带存储层刷盘指标，在引擎线程池中收集）"""
+    try:
+        storage = await engine_executor.run(LifeAdapter.storage_stats)
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     return {
         "status": "healthy",
+        "storage": storage,
         "timestamp": datetime.utcnow().isoformat()
     }
 
@@ -80,14 +108,17 @@ async def get_pet_status(device_id: str):
         if not device_id:
             raise HTTPException(status_code=400, detail="device_id is required")
 
-        adapter = LifeAdapter(device_id)
-        state = adapter.get_state()
+        state = await engine_executor.run(
+            lambda: LifeAdapter(device_id).get_state()
+        )
 
         return {
             "success": True,
             "data": state,
             "timestamp": datetime.utcnow().isoformat()
         }
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -97,10 +128,10 @@ async def interact_pet(request: InteractRequest):
     """
     宠物互动
 
-    支持的action:
-    - feed: 喂食
-    - greet: 打招呼
-    - play: 玩耍
+    支持的action（效果见 src/action_effects.py）:
+    - feed: 喂食（补充能量，冷却60秒）
+    - greet: 打招呼（校准生物钟，冷却10秒）
+    - play: 玩耍（消耗能量、校准生物钟，能量低于30时无效，冷却30秒）
 
     示例请求体：
     {
@@ -114,8 +145,9 @@ async def interact_pet(request: InteractRequest):
         if not request.action:
             raise HTTPException(status_code=400, detail="action is required")
 
-        adapter = LifeAdapter(request.device_id)
-        state = adapter.interact(request.action)
+        state = await engine_executor.run(
+            lambda: LifeAdapter(request.device_id).interact(request.action)
+        )
 
         return {
             "success": True,
@@ -125,6 +157,8 @@ async def interact_pet(request: InteractRequest):
         }
     except HTTPException:
         raise
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         import traceback
         print(f"Error in interact_pet: {e}")
@@ -146,8 +180,9 @@ async def feed_pet(request: FeedRequest):
         if not request.device_id:
             raise HTTPException(status_code=400, detail="device_id is required")
 
-        adapter = LifeAdapter(request.device_id)
-        state = adapter.interact("feed")
+        state = await engine_executor.run(
+            lambda: LifeAdapter(request.device_id).interact("feed")
+        )
 
         return {
             "success": True,
@@ -155,6 +190,8 @@ async def feed_pet(request: FeedRequest):
             "data": state,
             "timestamp": datetime.utcnow().isoformat()
         }
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -164,18 +201,18 @@ async def catchup_pet(device_id: str, hours: int = 24):
     """
     快速补偿（用于离线恢复）
 
-    当用户离线多小时后，执行快速补偿来计算宠物的状态变化。
-    利用延迟刷盘的性能优势，可以快速处理大量tick操作。
+    当用户离线多小时后，将宠物推进 hours 小时的模拟时间。
+    使用快进引擎批量推进，补偿时长不再等于tick次数。
 
     参数:
     - device_id: 设备ID (必需)
-    - hours: 补偿小时数 (默认24)
+    - hours: 补偿小时数 (默认24，最多720即30天)
 
     示例：
     - POST /api/pet/catchup?device_id=iphone-123&hours=24
 
     性能指标：
-    - 24小时补偿（1440个tick）耗时 <100ms
+    - 30天补偿（720小时）耗时 <10ms（预算见 LIFE_CATCHUP_BUDGET_MS）
     """
     try:
         if not device_id:
@@ -184,8 +221,9 @@ async def catchup_pet(device_id: str, hours: int = 24):
         if hours <= 0 or hours > 720:  # 限制最多30天
             raise HTTPException(status_code=400, detail="hours must be between 1 and 720")
 
-        adapter = LifeAdapter(device_id)
-        state = adapter.catchup(hours)
+        state = await engine_executor.run(
+            lambda: LifeAdapter(device_id).catchup(hours)
+        )
 
         return {
             "success": True,
@@ -196,6 +234,73 @@ async def catchup_pet(device_id: str, hours: int = 24):
         }
     except HTTPException:
         raise
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ==================== 多宠物API ====================
+
+@app.get("/api/pets/{pet_id}/status")
+async def get_registry_pet_status(pet_id: str, device_id: str):
+    """
+    获取指定宠物的状态（宠物按需从存储加载，节点内LRU常驻）
+
+    参数:
+    - pet_id: 宠物ID（字母、数字、下划线、短横线，最长64）
+    - device_id: 设备ID (必需)
+    """
+    try:
+        if not device_id:
+            raise HTTPException(status_code=400, detail="device_id is required")
+
+        state = await engine_executor.run(
+            lambda: LifeAdapter(device_id, pet_id=pet_id).get_state()
+        )
+
+        return {
+            "success": True,
+            "data": state,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/pets/{pet_id}/interact")
+async def interact_registry_pet(pet_id: str, request: InteractRequest):
+    """
+    与指定宠物互动（action与 /api/pet/interact 相同）
+    """
+    try:
+        if not request.device_id:
+            raise HTTPException(status_code=400, detail="device_id is required")
+        if not request.action:
+            raise HTTPException(status_code=400, detail="action is required")
+
+        state = await engine_executor.run(
+            lambda: LifeAdapter(request.device_id, pet_id=pet_id).interact(request.action)
+        )
+
+        return {
+            "success": True,
+            "action": request.action,
+            "data": state,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -211,8 +316,9 @@ async def debug_reset(device_id: str):
     - device_id: 设备ID
     """
     try:
-        adapter = LifeAdapter(device_id)
-        state = adapter.reset()
+        state = await engine_executor.run(
+            lambda: LifeAdapter(device_id).reset()
+        )
 
         return {
             "success": True,
@@ -220,6 +326,8 @@ async def debug_reset(device_id: str):
             "data": state,
             "timestamp": datetime.utcnow().isoformat()
         }
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,173 @@
+"""互动效果表 - 数据驱动的 action → 节律/能量状态变化
+
+背景：
+- LifeAdapter.interact 原先只记录 feed/greet/play 日志，然后统一执行一次1秒tick，
+  与 PetAdapter.interact 会调整能量/饥饿/心情的行为不一致
+
+思路：
+- 每种互动的效果（能量增减、节律同步、冷却时间、生效条件）登记在 ACTION_EFFECTS 表中
+- 一批互动在内存中的子系统状态上依次生效，整批只保存一次，不额外执行tick
+- 同一设备对同一互动在冷却期内重复触发时不生效；冷却记录是宠物状态的一部分
+  （COOLDOWN_KEY），与互动效果在同一次提交中写入存储：
+  - 多实例共享冷却（记录不在进程内存中）
+  - 提交失败时冷却也不生效；版本冲突重试时不会被自己上一次尝试的冷却挡住
+
+与宠物数值的对应关系（见 LifeAdapter._derive_simplified_state）：
+- 饥饿 = 100 - 能量，因此"减少饥饿"体现为增加能量
+- 心情受节律相位差影响，因此"提升心情"体现为内在节律向外部节律同步
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Life引擎能量刻度（0-100）
+ENERGY_MIN = 0.0
+ENERGY_MAX = 100.0
+
+# 冷却记录在宠物状态中的键：{"action:device_id": 最近一次生效的Unix时间戳}
+COOLDOWN_KEY = "cooldowns"
+
+
+@dataclass(frozen=True)
+class ActionEffect:
+    """一种互动对Life状态的效果"""
+    name: str
+    energy_delta: float = 0.0          # 能量变化（0-100刻度）
+    phase_sync: float = 0.0            # 内在节律向外部节律靠拢的比例（0-1）
+    cooldown_seconds: float = 0.0      # 同一设备两次生效的最小间隔
+    min_energy: Optional[float] = None  # 能量低于该值时不生效
+    description: str = ""
+
+
+# 互动效果表（新增互动只需在此登记）
+ACTION_EFFECTS: Dict[str, ActionEffect] = {
+    "feed": ActionEffect(
+        name="feed",
+        energy_delta=20.0,
+        cooldown_seconds=60.0,
+        description="喂食：补充能量（降低饥饿）",
+    ),
+    "greet": ActionEffect(
+        name="greet",
+        phase_sync=0.05,
+        cooldown_seconds=10.0,
+        description="打招呼：轻微校准生物钟（提升心情）",
+    ),
+    "play": ActionEffect(
+        name="play",
+        energy_delta=-10.0,
+        phase_sync=0.1,
+        cooldown_seconds=30.0,
+        min_energy=30.0,
+        description="玩耍：消耗能量，明显校准生物钟（提升心情）",
+    ),
+}
+
+
+def _wrapped_difference(target: float, current: float) -> float:
+    """相位差（周期分数），落在 [-0.5, 0.5)"""
+    return (target - current + 0.5) % 1.0 - 0.5
+
+
+def apply_effect(states: Dict[str, Dict[str, Any]], effect: ActionEffect) -> bool:
+    """
+    在子系统状态上应用一个互动效果（原地修改）
+
+    Returns:
+        是否生效（不满足生效条件时返回False）
+    """
+    energy_state = states.get("energy", {})
+    rhythm_state = states.get("rhythm", {})
+    energy = energy_state.get("energy")
+
+    if effect.min_energy is not None and energy is not None and energy < effect.min_energy:
+        return False
+
+    if effect.energy_delta and energy is not None:
+        energy_state["energy"] = max(ENERGY_MIN, min(ENERGY_MAX, energy + effect.energy_delta))
+
+    if effect.phase_sync and "internal_phase" in rhythm_state and "external_phase" in rhythm_state:
+        diff = _wrapped_difference(rhythm_state["external_phase"], rhythm_state["internal_phase"])
+        rhythm_state["internal_phase"] = (rhythm_state["internal_phase"] + effect.phase_sync * diff) % 1.0
+        if "phase_difference" in rhythm_state:
+            rhythm_state["phase_difference"] *= (1.0 - effect.phase_sync)
+
+    return True
+
+
+def merge_cooldowns(stored: Dict[str, float], recorded: Dict[str, float]) -> Dict[str, float]:
+    """合并两份冷却记录，同一键取较晚的时间戳（版本冲突重新加载后补回本次记录的冷却）"""
+    merged = dict(stored)
+    for key, applied_at in recorded.items():
+        merged[key] = max(applied_at, merged.get(key, applied_at))
+    return merged
+
+
+class ActionEffectApplier:
+    """
+    批量应用互动效果，冷却按状态中的冷却记录判定（见 COOLDOWN_KEY）
+
+    不在进程内记录冷却：冷却随状态一起提交，只有提交成功后才对其他请求/实例可见
+
+    Args:
+        effects: 互动效果表（默认 ACTION_EFFECTS）
+    """
+
+    def __init__(self, effects: Optional[Dict[str, ActionEffect]] = None):
+        self.effects = effects if effects is not None else ACTION_EFFECTS
+
+    def apply_batch(
+        self,
+        states: Dict[str, Dict[str, Any]],
+        batch: List[Tuple[str, str]],
+        now: float
+    ) -> List[str]:
+        """
+        按顺序把一批互动应用到子系统状态上（原地修改）
+
+        生效的互动记入 states[COOLDOWN_KEY]，调用方把它与子系统状态一起提交
+
+        Args:
+            states: {"rhythm": {...}, "energy": {...}, COOLDOWN_KEY: {...}}（没有冷却记录时新建）
+            batch: [(action, device_id), ...]
+            now: 当前Unix时间戳（秒），用于冷却判断
+
+        Returns:
+            实际生效的action列表
+        """
+        cooldowns = self._prune(states.get(COOLDOWN_KEY) or {}, now)
+        applied = []
+        for action, device_id in batch:
+            effect = self.effects.get(action)
+            if effect is None:
+                logger.info(f"  ❔ 未登记的互动 {action} by {device_id}，不产生效果")
+                continue
+
+            key = f"{action}:{device_id}"
+            last = cooldowns.get(key)
+            if last is not None and now - last < effect.cooldown_seconds:
+                logger.info(f"  ⏳ {action} 冷却中 by {device_id}")
+                continue
+
+            if not apply_effect(states, effect):
+                logger.info(f"  🚫 {action} 条件不满足 by {device_id}")
+                continue
+
+            cooldowns[key] = now
+            applied.append(action)
+            logger.info(f"  ✨ {effect.description} by {device_id}")
+
+        states[COOLDOWN_KEY] = cooldowns
+        return applied
+
+    def _prune(self, cooldowns: Dict[str, float], now: float) -> Dict[str, float]:
+        """去掉已过冷却期（或互动已不在效果表中）的记录，冷却记录只保留仍在冷却的设备"""
+        pruned = {}
+        for key, last in cooldowns.items():
+            effect = self.effects.get(key.split(":", 1)[0])
+            if effect is not None and now - last < effect.cooldown_seconds:
+                pruned[key] = last
+        return pruned
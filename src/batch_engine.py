@@ -0,0 +1,199 @@
+"""批量模拟引擎 - 用NumPy结构数组一次推进大量宠物
+
+背景：
+- PetAdapter._calculate_delta 每次只推进一只宠物（纯Python）
+- 路线图中的定时任务（每分钟推进所有社区/个人宠物）逐只循环，
+  Python的逐对象开销决定了吞吐上限
+
+思路（struct-of-arrays）：
+- N只宠物的每个字段各存为一个连续的float64数组（energy/hunger/mood/last_updated）
+- 推进时对整个数组做向量运算：增量、截断到0-100、更新时间戳都是一次numpy调用
+- 状态判定（_determine_state 的优先级规则）用 np.select 一次算出所有宠物的状态码
+- 规则与阈值直接取自 PetAdapter，两条路径的结果一致
+
+numpy是可选依赖：未安装时导入本模块不报错，创建 PetBatch 时抛出RuntimeError
+（pip install numpy）
+
+注意：Life引擎（micro-life-sim）的节律/能量更新规则在引擎内部实现，
+这里只向量化本仓库中的 PetAdapter 模型
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from src.pet_adapter import PetAdapter
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# 状态码 → 状态名（顺序即 _determine_state 的优先级）
+STATE_NAMES = (
+    PetAdapter.STATE_HUNGRY,
+    PetAdapter.STATE_SLEEPY,
+    PetAdapter.STATE_SLEEP,
+    PetAdapter.STATE_GRUMPY,
+    PetAdapter.STATE_PLAY,
+    PetAdapter.STATE_BORED,
+    PetAdapter.STATE_IDLE,
+)
+
+
+def _to_timestamp(value: Union[str, float, int]) -> float:
+    """PetAdapter的ISO时间（UTC，无时区）或Unix秒 → Unix秒"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+
+
+def _to_isoformat(timestamp: float) -> str:
+    """Unix秒 → 与PetAdapter一致的ISO时间（UTC，无时区）"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class PetBatch:
+    """
+    N只宠物的结构数组
+
+    Args:
+        capacity: 初始容量（不足时自动按倍数扩容）
+    """
+
+    FIELDS = ("energy", "hunger", "mood", "last_updated")
+
+    def __init__(self, capacity: int = 1024):
+        if np is None:
+            raise RuntimeError("numpy is required for PetBatch (pip install numpy)")
+        self.size = 0
+        self.ids: List[str] = []
+        self._index: Dict[str, int] = {}
+        self.energy = np.zeros(capacity, dtype=np.float64)
+        self.hunger = np.zeros(capacity, dtype=np.float64)
+        self.mood = np.zeros(capacity, dtype=np.float64)
+        self.last_updated = np.zeros(capacity, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, pet_id: str) -> bool:
+        return pet_id in self._index
+
+    @property
+    def capacity(self) -> int:
+        return len(self.energy)
+
+    def _grow(self, minimum: int) -> None:
+        capacity = max(minimum, self.capacity * 2)
+        for name in self.FIELDS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=np.float64)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def add(
+        self,
+        pet_id: str,
+        energy: float,
+        hunger: float,
+        mood: float,
+        last_updated: Union[str, float]
+    ) -> int:
+        """加入一只宠物（已存在时覆盖），返回其下标"""
+        index = self._index.get(pet_id)
+        if index is None:
+            if self.size == self.capacity:
+                self._grow(self.size + 1)
+            index = self.size
+            self.size += 1
+            self.ids.append(pet_id)
+            self._index[pet_id] = index
+
+        self.energy[index] = energy
+        self.hunger[index] = hunger
+        self.mood[index] = mood
+        self.last_updated[index] = _to_timestamp(last_updated)
+        return index
+
+    @classmethod
+    def from_states(cls, states: Iterable[Dict[str, Any]]) -> "PetBatch":
+        """由PetAdapter格式的状态构建（以pet_id为键，没有时用device_id）"""
+        states = list(states)
+        batch = cls(capacity=max(1, len(states)))
+        for state in states:
+            batch.add(
+                state.get("pet_id") or state["device_id"],
+                state["energy"],
+                state["hunger"],
+                state["mood"],
+                state["last_updated"],
+            )
+        return batch
+
+    def index(self, pet_id: str) -> int:
+        return self._index[pet_id]
+
+    def advance_to(self, now: float) -> int:
+        """
+        把所有宠物推进到now（Unix秒），规则与 PetAdapter._calculate_delta 一致
+
+        Returns:
+            实际推进的宠物数（last_updated 早于 now 的宠物）
+        """
+        n = self.size
+        if n == 0:
+            return 0
+
+        last_updated = self.last_updated[:n]
+        minutes = now - last_updated
+        minutes *= 1.0 / 60
+        advanced = minutes > 0
+        np.maximum(minutes, 0.0, out=minutes)
+
+        for values, rate in (
+            (self.energy[:n], PetAdapter.ENERGY_PER_MINUTE),
+            (self.hunger[:n], PetAdapter.HUNGER_PER_MINUTE),
+            (self.mood[:n], PetAdapter.MOOD_PER_MINUTE),
+        ):
+            values += minutes * rate
+            np.clip(values, 0.0, 100.0, out=values)
+
+        last_updated[advanced] = now
+        return int(np.count_nonzero(advanced))
+
+    def determine_states(self) -> "np.ndarray":
+        """所有宠物的状态码（STATE_NAMES的下标），规则与 PetAdapter._determine_state 一致"""
+        n = self.size
+        energy, hunger, mood = self.energy[:n], self.hunger[:n], self.mood[:n]
+        tired = energy <= PetAdapter.TIRED_ENERGY_THRESHOLD
+        conditions = [
+            hunger >= PetAdapter.HUNGRY_THRESHOLD,
+            tired & (hunger >= PetAdapter.SLEEPY_HUNGER_THRESHOLD),
+            tired,
+            mood <= PetAdapter.GRUMPY_MOOD_THRESHOLD,
+            (energy >= PetAdapter.PLAY_THRESHOLD) & (mood >= PetAdapter.PLAY_THRESHOLD),
+            energy <= PetAdapter.BORED_ENERGY_THRESHOLD,
+        ]
+        return np.select(conditions, range(len(conditions)), default=len(STATE_NAMES) - 1).astype(np.int8)
+
+    def to_state(self, pet_id: str, state_code: Optional[int] = None) -> Dict[str, Any]:
+        """导出一只宠物为PetAdapter格式的状态"""
+        index = self._index[pet_id]
+        if state_code is None:
+            state_code = int(self.determine_states()[index])
+        return {
+            "pet_id": pet_id,
+            "energy": float(self.energy[index]),
+            "hunger": float(self.hunger[index]),
+            "mood": float(self.mood[index]),
+            "current_state": STATE_NAMES[state_code],
+            "last_updated": _to_isoformat(float(self.last_updated[index])),
+        }
+
+    def to_states(self) -> List[Dict[str, Any]]:
+        """导出所有宠物（状态码一次算出）"""
+        codes = self.determine_states()
+        return [self.to_state(pet_id, int(codes[i])) for i, pet_id in enumerate(self.ids)]
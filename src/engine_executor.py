@@ -0,0 +1,105 @@
+"""引擎执行器 - 把阻塞的引擎调用移出事件循环
+
+背景：
+- main.py / api/index.py 的处理函数是 async def，但 LifeAdapter 的
+  get_state()/interact() 是同步调用，包含tick补偿、Redis I/O和文件I/O
+- 一次较慢的补偿会卡住整个事件循环，连带阻塞所有并发请求
+
+思路：
+- 引擎调用统一提交到有界线程池执行，事件循环只负责await结果
+- 在途请求数（执行中+排队中）有上限，超出时立即拒绝（503），
+  而不是无限排队拖垮延迟
+
+配置（环境变量）：
+- LIFE_ENGINE_WORKERS: 线程池大小（默认4）
+- LIFE_ENGINE_QUEUE_DEPTH: 线程全部繁忙时允许排队的请求数（默认64）
+
+生命周期：
+- 线程池在第一次提交时创建，shutdown() 后下一次提交重新创建
+  （同一进程内多次进入lifespan时，如TestClient复用、uvicorn reload，执行器仍可用）
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EngineBusyError(RuntimeError):
+    """在途请求数达到上限"""
+
+
+class EngineExecutor:
+    """
+    有界的引擎线程池
+
+    Args:
+        max_workers: 线程池大小
+        queue_depth: 线程全部繁忙时允许排队的请求数
+    """
+
+    def __init__(self, max_workers: int = 4, queue_depth: int = 64):
+        self.max_workers = max_workers
+        self.queue_depth = queue_depth
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_workers + queue_depth)
+
+    @classmethod
+    def from_env(cls) -> "EngineExecutor":
+        """根据环境变量创建执行器"""
+        return cls(
+            max_workers=int(os.getenv("LIFE_ENGINE_WORKERS", "4")),
+            queue_depth=int(os.getenv("LIFE_ENGINE_QUEUE_DEPTH", "64")),
+        )
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        """当前线程池（不存在或已关闭时创建）"""
+        pool = self._pool
+        if pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="life-engine"
+                    )
+                pool = self._pool
+        return pool
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        在线程池中执行fn并等待结果
+
+        Raises:
+            EngineBusyError: 在途请求数已达上限
+        """
+        if not self._slots.acquire(blocking=False):
+            logger.warning("⚠️  [Executor] 引擎繁忙，拒绝请求")
+            raise EngineBusyError("engine is busy, please retry later")
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_pool(),
+                functools.partial(fn, *args, **kwargs)
+            )
+        finally:
+            self._slots.release()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """关闭线程池（应用退出时调用；之后再提交会重新创建线程池）"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        logger.info("🛑 [Executor] 关闭引擎线程池")
+        pool.shutdown(wait=wait)
+
+
+# 进程内共享的执行器
+engine_executor = EngineExecutor.from_env()
@@ -0,0 +1,338 @@
+"""故障转移存储 - Redis故障时的熔断、本地缓冲与恢复后回放
+
+背景：
+- 原实现中Redis初始化失败就在进程生命周期内永久降级到文件存储，再也不尝试Redis，
+  该实例的状态从此与其他实例永久分叉
+- 运行中Redis出错时请求直接失败，或在超时上耗费大量时间
+
+思路（熔断器）：
+- 闭合（正常）：读写直接走主存储（Redis），并记住每个键在主存储上的最新值（基准）
+- 主存储出错 → 断开：之后的写入进入本地预写缓冲（同时写入本地后备存储），
+  读取依次查缓冲、最近已知值、本地后备存储，不再等待Redis超时
+- 断开期间按指数退避探测恢复；探测成功后回放缓冲的写入，然后闭合
+- 探测在后台线程中执行，PING不持有锁且使用短超时的探测客户端：
+  请求线程从不等待探测，只在探测成功、回放缓冲时短暂等待锁
+
+防止分叉（回放时逐键检查）：
+- 主存储上的值仍等于断开前的基准（期间没有其他实例写入）：回放本地写入
+- 主存储上的值已被其他实例修改：放弃本地写入，以主存储为准，
+  并设置 needs_reload 通知上层从存储重新加载
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from src.storage import VersionConflict
+
+try:
+    from core import StorageBackend as _StorageBackendBase
+except ImportError:
+    _StorageBackendBase = object
+
+logger = logging.getLogger(__name__)
+
+# 基准中"从未在主存储上见过该键"的标记
+_UNKNOWN = object()
+
+
+class FailoverStorage(_StorageBackendBase):
+    """
+    带熔断与回放的主/备存储
+
+    Args:
+        primary_factory: 创建主存储的函数（初始化失败时在探测中重试）
+        fallback: 本地后备存储（可选，断开期间的写入同时持久化到这里）
+        client/key_prefix/ttl: 主存储的Redis客户端与命名空间
+            （供 TickClock/SingleFlight 直接使用，主存储尚未创建时也可用）
+        probe_client: 探测时PING的客户端（短超时、不重试，默认使用client）
+        base_backoff: 首次探测前的等待秒数
+        max_backoff: 探测间隔上限（秒）
+    """
+
+    def __init__(
+        self,
+        primary_factory: Callable[[], Any],
+        fallback: Optional[Any] = None,
+        client: Optional[Any] = None,
+        key_prefix: Optional[str] = None,
+        ttl: Optional[int] = None,
+        probe_client: Optional[Any] = None,
+        base_backoff: float = 1.0,
+        max_backoff: float = 30.0
+    ):
+        self.primary_factory = primary_factory
+        self.fallback = fallback
+        self.client = client
+        self.probe_client = probe_client or client
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.RLock()
+        self._primary: Optional[Any] = None
+        self._available = False
+        self._backoff = base_backoff
+        self._next_probe = 0.0
+        self._probe_thread: Optional[threading.Thread] = None
+
+        # 断开期间的写入（按写入顺序；值为None表示删除）
+        self._buffer: "OrderedDict[str, Optional[Dict[str, Any]]]" = OrderedDict()
+        # 主存储上每个键最近一次读到/写入的值（回放时检测其他实例的写入）
+        self._base: Dict[str, Any] = {}
+        # 每个键最近已知的值（断开期间的读缓存）
+        self._known: Dict[str, Dict[str, Any]] = {}
+
+        # 有键在回放时被主存储上更新的值取代，上层应重新加载
+        self.needs_reload = False
+
+        # 观测指标
+        self.trips = 0
+        self.probes = 0
+        self.replayed_keys = 0
+        self.conflicts = 0
+
+        try:
+            self._primary = primary_factory()
+            self._available = True
+        except Exception as e:
+            self._trip(e)
+
+    def __getattr__(self, name: str) -> Any:
+        # 其余属性（round_trips等）透传给主存储
+        primary = self.__dict__.get("_primary")
+        if primary is None:
+            raise AttributeError(name)
+        return getattr(primary, name)
+
+    @property
+    def available(self) -> bool:
+        """主存储当前是否可用（熔断器闭合）"""
+        return self._available
+
+    @property
+    def buffered_keys(self) -> int:
+        return len(self._buffer)
+
+    # ==================== 熔断器 ====================
+
+    def _trip(self, error: Exception) -> None:
+        """主存储出错：断开并安排下一次探测"""
+        if self._available or self._primary is None:
+            self.trips += 1
+        self._available = False
+        self._next_probe = time.monotonic() + self._backoff
+        logger.warning(
+            f"⚠️  [Failover] 主存储不可用，切换到本地缓冲（{self._backoff:.1f}秒后探测）: {error}"
+        )
+
+    def _ensure_available(self) -> bool:
+        """
+        闭合时返回True；断开时到了探测时间则启动后台探测，本次仍走本地（需持有锁）
+        """
+        if self._available:
+            return True
+        if self._probe_thread is None and time.monotonic() >= self._next_probe:
+            self.probes += 1
+            self._probe_thread = threading.Thread(target=self._probe, name="failover-probe", daemon=True)
+            self._probe_thread.start()
+        return False
+
+    def _probe(self) -> None:
+        """后台探测：创建主存储并PING（不持有锁），成功后在锁内回放缓冲并闭合"""
+        try:
+            try:
+                primary = self._primary or self.primary_factory()
+                if self.probe_client is not None:
+                    self.probe_client.ping()
+                with self._lock:
+                    self._primary = primary
+                    self._replay()
+                    self._available = True
+                    self._backoff = self.base_backoff
+            except Exception as e:
+                with self._lock:
+                    self._backoff = min(self._backoff * 2, self.max_backoff)
+                    self._next_probe = time.monotonic() + self._backoff
+                logger.warning(f"⚠️  [Failover] 探测失败，{self._backoff:.1f}秒后重试: {e}")
+                return
+            logger.info("✅ [Failover] 主存储已恢复")
+        finally:
+            self._probe_thread = None
+
+    def wait_for_probe(self, timeout: Optional[float] = None) -> bool:
+        """等待进行中的探测结束（测试与关闭时使用），返回主存储是否可用"""
+        thread = self._probe_thread
+        if thread is not None:
+            thread.join(timeout)
+        return self._available
+
+    def _replay(self) -> None:
+        """回放缓冲的写入；主存储上已被其他实例修改的键以主存储为准"""
+        if not self._buffer:
+            return
+
+        keys = list(self._buffer)
+        current = self._primary_load_many(keys)
+
+        to_save = {}
+        for key in keys:
+            state = self._buffer[key]
+            base = self._base.get(key, _UNKNOWN)
+            unchanged = current[key] == base or (base is _UNKNOWN and not current[key])
+            if not unchanged:
+                self.conflicts += 1
+                self.needs_reload = True
+                self._known[key] = current[key]
+                self._base[key] = current[key]
+                logger.warning(f"⚠️  [Failover] {key} 已被其他实例更新，放弃本地写入")
+                continue
+            if state is None:
+                self._primary.delete(key)
+                self._base[key] = {}
+            else:
+                to_save[key] = state
+
+        if to_save:
+            self._primary_save_many(to_save)
+            self._base.update(to_save)
+        self.replayed_keys += len(to_save)
+        self._buffer.clear()
+        logger.info(f"🔁 [Failover] 回放 {len(to_save)} 个键，冲突 {self.conflicts} 个")
+
+    # ==================== 主存储访问 ====================
+
+    def _primary_save_many(self, states: Dict[str, Dict[str, Any]]) -> None:
+        if hasattr(self._primary, "save_many"):
+            self._primary.save_many(states)
+        else:
+            for key, state in states.items():
+                self._primary.save(key, state)
+
+    def _primary_load_many(self, keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        keys = list(keys)
+        if hasattr(self._primary, "load_many"):
+            return self._primary.load_many(keys)
+        return {key: self._primary.load(key) for key in keys}
+
+    # ==================== 本地访问 ====================
+
+    def _local_load(self, key: str) -> Dict[str, Any]:
+        if key in self._buffer:
+            return dict(self._buffer[key] or {})
+        if key in self._known:
+            return dict(self._known[key])
+        if self.fallback is not None:
+            try:
+                return self.fallback.load(key)
+            except Exception as e:
+                logger.warning(f"⚠️  [Failover] 本地后备存储读取失败: {e}")
+        return {}
+
+    def _local_save_many(self, states: Dict[str, Optional[Dict[str, Any]]]) -> None:
+        for key, state in states.items():
+            self._buffer.pop(key, None)
+            self._buffer[key] = state
+            self._known[key] = dict(state or {})
+        if self.fallback is not None:
+            try:
+                for key, state in states.items():
+                    if state is None:
+                        self.fallback.delete(key)
+                    else:
+                        self.fallback.save(key, state)
+            except Exception as e:
+                logger.warning(f"⚠️  [Failover] 本地后备存储写入失败: {e}")
+
+    # ==================== StorageBackend接口 ====================
+
+    def load(self, key: str) -> Dict[str, Any]:
+        return self.load_many([key])[key]
+
+    def load_many(self, keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        keys = list(keys)
+        with self._lock:
+            if self._ensure_available():
+                try:
+                    states = self._primary_load_many(keys)
+                except Exception as e:
+                    self._trip(e)
+                else:
+                    for key, state in states.items():
+                        self._base[key] = state
+                        self._known[key] = dict(state)
+                    return states
+            return {key: self._local_load(key) for key in keys}
+
+    def save(self, key: str, state: Dict[str, Any]) -> None:
+        self.save_many({key: state})
+
+    def save_many(self, states: Dict[str, Dict[str, Any]]) -> None:
+        if not states:
+            return
+        with self._lock:
+            if self._ensure_available():
+                try:
+                    self._primary_save_many(states)
+                except VersionConflict:
+                    # 主存储正常，只是被其他实例抢先写入：交给上层重试
+                    raise
+                except Exception as e:
+                    self._trip(e)
+                else:
+                    for key, state in states.items():
+                        self._base[key] = state
+                        self._known[key] = dict(state)
+                    return
+            self._local_save_many(states)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if self._ensure_available():
+                try:
+                    self._primary.delete(key)
+                except Exception as e:
+                    self._trip(e)
+                else:
+                    self._base[key] = {}
+                    self._known.pop(key, None)
+                    return
+            self._local_save_many({key: None})
+
+    def exists(self, key: str) -> bool:
+        with self._lock:
+            if self._ensure_available():
+                try:
+                    return self._primary.exists(key)
+                except Exception as e:
+                    self._trip(e)
+            return bool(self._local_load(key))
+
+    def is_stale(self) -> bool:
+        """主存储上的状态是否已被其他实例更新（断开期间无法判断，返回False）"""
+        with self._lock:
+            is_stale = getattr(self._primary, "is_stale", None)
+            if is_stale is None or not self._ensure_available():
+                return False
+            try:
+                return is_stale()
+            except Exception as e:
+                self._trip(e)
+                return False
+
+    def stats(self) -> Dict[str, Any]:
+        """故障转移指标"""
+        return {
+            "available": self._available,
+            "trips": self.trips,
+            "probes": self.probes,
+            "buffered_keys": len(self._buffer),
+            "replayed_keys": self.replayed_keys,
+            "conflicts": self.conflicts,
+        }
+
+    def __repr__(self) -> str:
+        return f"<FailoverStorage(primary={self._primary!r}, available={self._available})>"
@@ -0,0 +1,358 @@
+"""快进引擎 - 将Life的节律/能量状态一次性推进任意时长
+
+背景：
+- Serverless环境没有后台进程持续tick，每次请求需要补偿离线期间的时间
+- 原实现逐秒执行 life.tick(dt=1.0)，空闲1小时后首个请求要跑3600次tick
+
+思路（解析推进 analytic advance）：
+- 把Life包装成纯函数 step(states, dt) -> states（快照/恢复StateManager中的状态）
+- 自适应变步长积分（AdaptiveStepper）：每一步用"整步"与"两个半步"的差作为
+  局部误差估计，误差小（导数平滑）时放大步长，误差大时缩小步长
+- 阈值附近（如能量跌破30）强制小步长，保证状态分档切换的时刻足够精确
+- 步长不超过max_step，避免周期驱动下"整步"与"半步"偶然吻合（混叠）
+- 步长不小于min_step，误差仍超限时按最小步长直接推进（没有闭式解时的兜底）
+- 周期折叠：推进一个完整节律周期后状态回到原点（极限环，如能量已见底），
+  剩余的整数个周期直接跳过（O(1)）
+- 最后1秒用常规tick收尾，使派生字段（消耗率、昼夜值等）与逐秒tick一致
+- tick调用次数有上限（max_tick_calls）：状态变化剧烈时用尽预算就停下，
+  返回部分推进的结果，未推进的时长记在 AdvanceStats.remaining 中由调用方下次继续
+
+注意：
+- 依赖延迟刷盘模式（auto_flush=False），试探步只写入内存中的pending状态
+- 相位字段以周期分数表示（0-1循环），误差按环绕距离计算
+"""
+
+import logging
+import math
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Life引擎默认包含的子系统
+DEFAULT_SYSTEM_NAMES = ("rhythm", "energy")
+
+# 墙钟时间戳字段，不参与误差比较
+_TIMESTAMP_FIELDS = {"last_update", "last_calibration"}
+
+# 派生字段：每次tick根据当前时刻重新计算，不是积分出来的状态，不参与误差比较
+# （external_phase由墙钟决定，phase_difference由两个相位派生）
+_DERIVED_FIELDS = {
+    "external_phase", "phase_difference",
+    "consumption_rate", "recovery_rate", "circadian_value",
+}
+
+# 周期相位字段（0-1循环），比较时按环绕距离计算
+_PHASE_FIELDS = {"internal_phase"}
+
+# 浮点剩余时长的判零阈值（秒）
+_EPSILON = 1e-9
+
+States = Dict[str, Dict[str, Any]]
+StepFn = Callable[[States, float], States]
+# {(系统名, 字段名): [阈值, ...]}
+Thresholds = Dict[Tuple[str, str], Sequence[float]]
+
+
+def _phase_distance(a: float, b: float) -> float:
+    """相位的环绕距离（0-0.5）"""
+    d = (a - b) % 1.0
+    return min(d, 1.0 - d)
+
+
+def state_error(a: States, b: States) -> float:
+    """
+    计算两份子系统状态之间的误差
+
+    对每个数值字段取 |Δ| / max(1, |x|)，即大数值按相对误差、
+    小数值（相位等）按绝对误差，返回所有字段中的最大值
+    """
+    error = 0.0
+    for system_name, state_a in a.items():
+        state_b = b.get(system_name, {})
+        for field, value_a in state_a.items():
+            if field in _TIMESTAMP_FIELDS or field in _DERIVED_FIELDS:
+                continue
+            value_b = state_b.get(field)
+            if isinstance(value_a, bool) or not isinstance(value_a, (int, float)):
+                continue
+            if isinstance(value_b, bool) or not isinstance(value_b, (int, float)):
+                continue
+
+            if field in _PHASE_FIELDS:
+                diff = _phase_distance(value_a, value_b)
+            else:
+                diff = abs(value_a - value_b) / max(1.0, abs(value_b))
+            error = max(error, diff)
+    return error
+
+
+@dataclass
+class AdvanceStats:
+    """一次快进的统计信息"""
+    seconds: float = 0.0       # 推进的总时长（秒）
+    remaining: float = 0.0     # tick预算用尽时尚未推进的时长（秒）
+    tick_calls: int = 0        # 实际调用step的次数
+    jumps: int = 0             # 通过误差校验的步数
+    rejections: int = 0        # 校验失败、缩短步长的次数
+    coarse_steps: int = 0      # 最小步长兜底推进的次数
+    threshold_crossings: int = 0  # 跨越阈值的次数
+    folded_periods: int = 0    # 周期折叠跳过的完整周期数
+    max_error: float = 0.0     # 已接受步中的最大局部误差估计
+    error_bound: float = 0.0   # 局部误差估计之和（全局误差的估计上界）
+
+
+class LifeStepper:
+    """
+    将Life实例包装为纯函数式的 step(states, dt) -> states
+
+    通过StateManager的load/save做快照与恢复：
+    - 延迟刷盘模式下save只写内存，试探步不会触达存储后端
+    - commit()把最终结果写回Life，之后由调用方决定何时flush
+    """
+
+    def __init__(self, life: Any):
+        self.life = life
+        systems = getattr(life, "systems", None)
+        self.system_names = tuple(systems.keys()) if systems else DEFAULT_SYSTEM_NAMES
+
+    def load(self) -> States:
+        """读取Life当前的子系统状态"""
+        state_manager = self.life.state_manager
+        return {name: dict(state_manager.load(name)) for name in self.system_names}
+
+    def commit(self, states: States) -> None:
+        """把状态写回Life"""
+        state_manager = self.life.state_manager
+        for name, state in states.items():
+            state_manager.save(name, dict(state))
+
+    def step(self, states: States, dt: float) -> States:
+        """从给定状态出发执行一次 life.tick(dt)，返回新状态"""
+        self.commit(states)
+        self.life.tick(dt=dt)
+        return self.load()
+
+
+class AdaptiveStepper:
+    """
+    自适应变步长积分器（步长加倍法误差控制）
+
+    Args:
+        tolerance: 每步允许的局部误差（state_error的上限）
+        min_step: 最小步长（秒），不大于它的步不做校验直接推进
+        max_step: 最大步长（秒）
+        thresholds: 需要精确定位的阈值，跨越时步长收缩到threshold_step以内
+        threshold_step: 跨越阈值时允许的最大步长（秒）
+    """
+
+    # 步长调整的安全系数和单次缩放范围
+    SAFETY = 0.9
+    MIN_FACTOR = 0.2
+    MAX_FACTOR = 5.0
+
+    def __init__(
+        self,
+        tolerance: float = 1e-3,
+        min_step: float = 1.0,
+        max_step: float = 3600.0,
+        thresholds: Optional[Thresholds] = None,
+        threshold_step: float = 60.0
+    ):
+        if tolerance <= 0:
+            raise ValueError("tolerance must be positive")
+        if min_step <= 0 or max_step < min_step:
+            raise ValueError("require 0 < min_step <= max_step")
+        self.tolerance = tolerance
+        self.min_step = min_step
+        self.max_step = max_step
+        self.thresholds = thresholds or {}
+        self.threshold_step = max(threshold_step, min_step)
+
+    def _crosses_threshold(self, before: States, after: States) -> bool:
+        """一步之内是否有字段跨越了阈值"""
+        for (system_name, field), levels in self.thresholds.items():
+            a = before.get(system_name, {}).get(field)
+            b = after.get(system_name, {}).get(field)
+            if a is None or b is None:
+                continue
+            low, high = min(a, b), max(a, b)
+            if any(low < level <= high for level in levels):
+                return True
+        return False
+
+    def _scale(self, error: float) -> float:
+        """根据误差计算下一步的步长缩放系数（一阶方法，指数1/2）"""
+        if error == 0:
+            return self.MAX_FACTOR
+        factor = self.SAFETY * math.sqrt(self.tolerance / error)
+        return max(self.MIN_FACTOR, min(self.MAX_FACTOR, factor))
+
+    def integrate(
+        self,
+        step: StepFn,
+        states: States,
+        seconds: float,
+        stats: AdvanceStats,
+        max_tick_calls: Optional[int] = None
+    ) -> States:
+        """
+        用自适应步长把states推进seconds秒
+
+        Args:
+            max_tick_calls: stats.tick_calls的上限，用尽时停下并把未推进的时长累加到stats.remaining
+        """
+        remaining = seconds
+        h = self.max_step
+
+        while remaining > _EPSILON:
+            h = min(h, remaining, self.max_step)
+
+            calls = 1 if h <= self.min_step else 3
+            if max_tick_calls is not None and stats.tick_calls + calls > max_tick_calls:
+                stats.remaining += remaining
+                break
+
+            if h <= self.min_step:
+                # 兜底：最小步长内不做校验
+                states = step(states, h)
+                stats.tick_calls += 1
+                stats.coarse_steps += 1
+                remaining -= h
+                h = self.min_step * self.MAX_FACTOR
+                continue
+
+            # 整步 vs 两个半步
+            full = step(states, h)
+            half = step(step(states, h / 2), h / 2)
+            stats.tick_calls += 3
+
+            error = state_error(full, half)
+            crossing = self._crosses_threshold(states, half)
+
+            if crossing and h > self.threshold_step:
+                # 阈值附近：缩小步长以精确定位跨越时刻
+                stats.rejections += 1
+                h = max(h / 4, self.threshold_step)
+                continue
+
+            if error <= self.tolerance:
+                states = half
+                stats.jumps += 1
+                stats.threshold_crossings += int(crossing)
+                stats.max_error = max(stats.max_error, error)
+                stats.error_bound += error
+                remaining -= h
+            else:
+                stats.rejections += 1
+
+            h *= self._scale(error)
+
+        return states
+
+
+class FastForward:
+    """
+    解析快进器：自适应积分 + 周期折叠
+
+    Args:
+        tolerance: 每步允许的局部误差
+        min_step: 最小步长（秒）
+        max_step: 最大步长（秒）
+        period_seconds: 节律周期（秒），提供时启用周期折叠
+        thresholds: 需要精确定位的阈值（见AdaptiveStepper）
+        max_tick_calls: 单次快进最多调用step的次数（含收尾tick），None表示不限
+    """
+
+    def __init__(
+        self,
+        tolerance: float = 1e-3,
+        min_step: float = 1.0,
+        max_step: float = 3600.0,
+        period_seconds: Optional[float] = None,
+        thresholds: Optional[Thresholds] = None,
+        max_tick_calls: Optional[int] = None
+    ):
+        if max_tick_calls is not None and max_tick_calls < 1:
+            raise ValueError("max_tick_calls must be at least 1")
+        self.max_tick_calls = max_tick_calls
+        self.stepper = AdaptiveStepper(
+            tolerance=tolerance,
+            min_step=min_step,
+            max_step=max_step,
+            thresholds=thresholds,
+        )
+        self.tolerance = tolerance
+        self.period_seconds = period_seconds
+
+    def advance_states(
+        self,
+        step: StepFn,
+        states: States,
+        seconds: float
+    ) -> Tuple[States, AdvanceStats]:
+        """
+        用纯函数step把states推进seconds秒
+
+        tick预算（max_tick_calls）用尽时只推进一部分：stats.seconds为实际推进的时长，
+        stats.remaining为未推进的时长
+
+        Returns:
+            (推进后的状态, 统计信息)
+        """
+        stats = AdvanceStats(seconds=float(seconds))
+        remaining = float(seconds)
+        tail = min(1.0, remaining)
+        remaining -= tail
+        # 留一次调用给收尾tick
+        budget = None if self.max_tick_calls is None else self.max_tick_calls - 1
+
+        period = self.period_seconds
+        while remaining > _EPSILON:
+            if period and remaining >= period:
+                start = states
+                states = self.stepper.integrate(step, states, period, stats, budget)
+                remaining -= period
+                if stats.remaining > 0:
+                    break
+
+                # 一个周期后回到原状态：剩余的整数个周期可以直接跳过
+                if state_error(states, start) <= self.tolerance:
+                    cycles = int(remaining // period)
+                    remaining -= cycles * period
+                    stats.folded_periods += cycles
+                continue
+
+            states = self.stepper.integrate(step, states, remaining, stats, budget)
+            remaining = 0.0
+
+        if stats.remaining > 0:
+            stats.remaining += remaining
+            stats.seconds -= stats.remaining
+            logger.info(
+                f"⏸️  [FastForward] tick预算 {self.max_tick_calls} 已用尽，"
+                f"剩余 {stats.remaining:.0f} 秒留待下次推进"
+            )
+
+        if tail > 0:
+            states = step(states, tail)
+            stats.tick_calls += 1
+
+        return states, stats
+
+    def advance(self, life: Any, seconds: float) -> AdvanceStats:
+        """
+        把Life实例推进seconds秒（结果保留在内存中，调用方负责flush）
+
+        tick预算用尽时只推进一部分，未推进的时长见返回值的remaining
+        """
+        stepper = LifeStepper(life)
+        if seconds <= 0:
+            return AdvanceStats()
+
+        if life.state_manager.auto_flush:
+            logger.warning("⚠️  [FastForward] auto_flush=True，试探步会直接写入存储")
+
+        states, stats = self.advance_states(stepper.step, stepper.load(), seconds)
+        stepper.commit(states)
+        return stats
@@ -0,0 +1,117 @@
+"""互动命令队列 - 组提交（group commit）
+
+背景：
+- 每次 feed/greet/play 都执行一次 life.tick(dt=1.0) 和一次完整的 life.flush()
+- 热门时刻每秒几百次互动就是每秒几百次Redis写入
+
+思路（leader/follower组提交）：
+- 互动请求进入队列后阻塞等待
+- 队列空闲时第一个到达的请求成为leader：等待一个提交窗口收集更多请求，
+  然后把整批互动按到达顺序在一个引擎步内应用，并只刷盘一次
+- 提交完成后唤醒整批请求；若期间又有新请求排队，把leader身份交给队首请求
+- 每个调用方返回时，自己的互动都已提交（读到的是提交后的状态）
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (action, device_id)
+Interaction = Tuple[str, str]
+
+
+@dataclass
+class _Pending:
+    """一条排队中的互动"""
+    action: str
+    device_id: str
+    done: bool = False
+    promoted: bool = False
+    error: Optional[BaseException] = None
+
+
+class InteractionQueue:
+    """
+    组提交的互动队列
+
+    Args:
+        apply_batch: 提交函数，按顺序应用一批互动并刷盘一次
+        commit_window: leader收集请求的等待窗口（秒）
+        max_batch: 单批最多提交的互动数
+    """
+
+    def __init__(
+        self,
+        apply_batch: Callable[[List[Interaction]], None],
+        commit_window: float = 0.002,
+        max_batch: int = 256
+    ):
+        self.apply_batch = apply_batch
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+
+        self._cond = threading.Condition()
+        self._pending: List[_Pending] = []
+        self._leader_active = False
+
+        # 统计：提交批次数与互动总数
+        self.commits = 0
+        self.committed_actions = 0
+
+    def submit(self, action: str, device_id: str) -> None:
+        """
+        提交一次互动，阻塞直到它所在的批次提交完成
+
+        Raises:
+            提交函数抛出的异常（整批请求都会收到）
+        """
+        item = _Pending(action, device_id)
+
+        with self._cond:
+            self._pending.append(item)
+            if not self._leader_active:
+                self._leader_active = True
+                item.promoted = True
+            while not item.done and not item.promoted:
+                self._cond.wait()
+
+        if not item.done:
+            self._lead()
+
+        if item.error is not None:
+            raise item.error
+
+    def _lead(self) -> None:
+        """作为leader提交一批互动（批次必然包含自己的请求）"""
+        if self.commit_window > 0:
+            time.sleep(self.commit_window)
+
+        with self._cond:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+
+        error = None
+        try:
+            self.apply_batch([(item.action, item.device_id) for item in batch])
+        except Exception as e:
+            logger.error(f"❌ [InteractionQueue] 批量提交失败: {e}")
+            error = e
+
+        with self._cond:
+            for item in batch:
+                item.done = True
+                item.error = error
+
+            self.commits += 1
+            self.committed_actions += len(batch)
+
+            # 交接leader身份给队首请求
+            if self._pending:
+                self._pending[0].promoted = True
+            else:
+                self._leader_active = False
+            self._cond.notify_all()
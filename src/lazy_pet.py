@@ -0,0 +1,312 @@
+"""惰性物化 - 不常驻Life实例，读取时从紧凑记录推算宠物的当前状态
+
+背景：
+- 注册表（见 pet_registry）为每只常驻宠物保留一个Life实例
+- 海量宠物中绝大多数长时间没有人访问，为它们保留Life实例纯属浪费
+
+思路：
+- 每只宠物只持久化一条紧凑记录：最近一次写入时的子系统状态 + 写入时刻
+- 读取：一次GET取出记录，用快进引擎（Life的更新规则）推算到当前时刻，
+  构建状态后丢弃，不写回 —— 空闲宠物的常驻内存为零，读取只需一次存储访问
+- 新宠物：首次读取时写入初始记录（只在记录不存在时写入，不覆盖并发的互动），
+  之后的读取从这条记录推算 —— 从未互动的宠物也会随时间变化
+- 互动：推算到当前时刻 → 应用效果 → 写回记录（只有互动才写入存储）；
+  冷却记录保存在同一条记录中，与效果一起写回；
+  同一宠物的互动在进程内按分段锁串行；跨实例由存储保证：
+  - 版本化的Redis后端：写回时比较版本，冲突时重新读取、推算、应用效果后重试
+  - 提供 transaction() 的本地后端（SQLite）：读-改-写在一个写事务内完成
+- 定时批量推进（见 scheduler）：把已有记录推算到当前时刻后写回，与互动相同地比较版本、冲突重试；
+  缩短之后读取时的推算时长
+- 推算在求值用的Life实例上进行：每个线程一个，使用内存存储，
+  与宠物数量无关；同一记录反复推算的代价取决于状态变化而不是时长
+
+记录格式（JSON）：
+    {"t": 写入时刻（Unix秒）, "s": {"rhythm": {...}, "energy": {...}}, "c": {冷却记录}}
+"""
+
+import copy
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from src.action_effects import COOLDOWN_KEY
+from src.fast_forward import FastForward, LifeStepper
+from src.storage import VersionConflict
+
+try:
+    from core import StorageBackend as _StorageBackendBase
+except ImportError:
+    _StorageBackendBase = object
+
+logger = logging.getLogger(__name__)
+
+States = Dict[str, Dict[str, Any]]
+
+# 宠物记录在存储中的键前缀（与Life子系统的键区分）
+RECORD_KEY_PREFIX = "pet:"
+
+# 互动分段锁的数量（按宠物ID哈希分段，锁的内存与宠物数量无关）
+_LOCK_STRIPES = 64
+
+
+@dataclass
+class PetRecord:
+    """一只宠物的紧凑持久化记录"""
+    states: States
+    updated_at: float
+    cooldowns: Dict[str, float] = field(default_factory=dict)
+
+    def encode(self) -> Dict[str, Any]:
+        return {"t": self.updated_at, "s": self.states, "c": self.cooldowns}
+
+    @classmethod
+    def decode(cls, data: Dict[str, Any]) -> Optional["PetRecord"]:
+        """解析存储中的记录；不存在或格式不对时返回None"""
+        if not data or "t" not in data or "s" not in data:
+            return None
+        return cls(states=data["s"], updated_at=float(data["t"]), cooldowns=data.get("c") or {})
+
+
+class MemoryStorage(_StorageBackendBase):
+    """只在内存中的存储后端（求值用的Life实例不落盘）"""
+
+    def __init__(self):
+        self._data: Dict[str, Dict[str, Any]] = {}
+
+    def load(self, key: str) -> Dict[str, Any]:
+        return dict(self._data.get(key, {}))
+
+    def save(self, key: str, state: Dict[str, Any]) -> None:
+        self._data[key] = dict(state)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def exists(self, key: str) -> bool:
+        return key in self._data
+
+    def save_if_absent(self, key: str, state: Dict[str, Any]) -> bool:
+        if key in self._data:
+            return False
+        self._data[key] = dict(state)
+        return True
+
+
+class LazyPetEvaluator:
+    """
+    无常驻实例的宠物状态求值器
+
+    Args:
+        backend: 宠物记录的存储后端（一只宠物一个键）
+        life_factory: 创建求值用Life实例的函数（每个线程调用一次，应使用内存存储）
+        fast_forward: 快进引擎
+        max_seconds: 单次最多推算的时长（秒）
+        max_retries: 互动写回版本冲突后重新推算并重试的最多次数
+        on_change: 记录写回后调用 on_change(pet_id, 子系统状态, 状态对应的时刻)
+            （在分段锁和写事务之外调用，如重新预测状态跃迁）
+    """
+
+    def __init__(
+        self,
+        backend: Any,
+        life_factory: Callable[[], Any],
+        fast_forward: FastForward,
+        max_seconds: float = 86400 * 30,
+        max_retries: int = 3,
+        on_change: Optional[Callable[[str, States, float], None]] = None
+    ):
+        self.backend = backend
+        self.life_factory = life_factory
+        self.fast_forward = fast_forward
+        self.max_seconds = max_seconds
+        self.max_retries = max_retries
+        self.on_change = on_change
+        self._local = threading.local()
+        self._update_locks = [threading.RLock() for _ in range(_LOCK_STRIPES)]
+
+        # 观测指标
+        self.reads = 0
+        self.writes = 0
+        self.conflicts = 0
+
+    def _evaluator(self) -> Tuple[LifeStepper, States]:
+        """当前线程的求值Life及其初始状态（新宠物的起点）"""
+        stepper = getattr(self._local, "stepper", None)
+        if stepper is None:
+            stepper = LifeStepper(self.life_factory())
+            self._local.stepper = stepper
+            self._local.initial = copy.deepcopy(stepper.load())
+        return stepper, self._local.initial
+
+    @staticmethod
+    def _key(pet_id: str) -> str:
+        return f"{RECORD_KEY_PREFIX}{pet_id}"
+
+    def load(self, pet_id: str) -> Optional[PetRecord]:
+        """读取宠物记录（一次存储访问）；从未写入过时返回None"""
+        self.reads += 1
+        return PetRecord.decode(self.backend.load(self._key(pet_id)))
+
+    def _advance(self, stepper: LifeStepper, states: States, seconds: float) -> float:
+        """
+        在求值Life上把states推进seconds秒，结果留在求值Life中
+
+        Returns:
+            快进的tick预算用尽时未推进的秒数
+        """
+        seconds = min(seconds, self.max_seconds)
+        if seconds <= 0:
+            stepper.commit(states)
+            return 0.0
+        states, stats = self.fast_forward.advance_states(stepper.step, states, seconds)
+        stepper.commit(states)
+        return stats.remaining
+
+    def materialize(self, pet_id: str, now: Optional[float] = None) -> Tuple[States, Dict[str, Any]]:
+        """
+        推算宠物在now时刻的状态（不写回存储；新宠物首次读取时写入初始记录）
+
+        Returns:
+            (子系统状态, 外显表达)
+        """
+        now = time.time() if now is None else now
+        self._evaluate(pet_id, now)
+
+        life = self._evaluator()[0].life
+        return life.get_states(), life.get_expression()
+
+    def _evaluate(self, pet_id: str, now: float, create: bool = True) -> Tuple[PetRecord, float]:
+        """
+        把宠物推算到now，结果留在当前线程的求值Life中
+
+        Args:
+            create: 记录不存在时是否写入初始记录（为False时抛出ValueError）
+
+        Returns:
+            (读取到的记录, 快进的tick预算用尽时未推算的秒数（推算结果早于now这么多秒）)
+        """
+        record = self.load(pet_id)
+        stepper, initial = self._evaluator()
+
+        if record is None:
+            if not create:
+                raise ValueError(f"{self._key(pet_id)} 没有有效的记录")
+            record = self._create(pet_id, PetRecord(copy.deepcopy(initial), now))
+        return record, self._advance(stepper, copy.deepcopy(record.states), now - record.updated_at)
+
+    def _create(self, pet_id: str, record: PetRecord) -> PetRecord:
+        """
+        写入新宠物的初始记录（出生时刻为首次读取的时刻），返回实际生效的记录
+
+        后端支持 save_if_absent 时原子地只在键不存在时写入（Redis SET NX、SQLite INSERT），
+        其他实例先写入的记录（或并发的互动）不会被覆盖；否则在进程内的分段锁下先查后写
+        """
+        key = self._key(pet_id)
+        save_if_absent = getattr(self.backend, "save_if_absent", None)
+        if save_if_absent is not None:
+            created = save_if_absent(key, record.encode())
+        else:
+            with self._update_locks[hash(pet_id) % _LOCK_STRIPES]:
+                created = PetRecord.decode(self.backend.load(key)) is None
+                if created:
+                    self.backend.save(key, record.encode())
+
+        if created:
+            self.writes += 1
+            return record
+        return self.load(pet_id) or record
+
+    def update(
+        self,
+        pet_id: str,
+        mutate: Callable[[States], bool],
+        now: Optional[float] = None
+    ) -> Tuple[bool, States, Dict[str, Any]]:
+        """
+        推算到now后修改状态；mutate返回True时写回记录
+
+        其他实例在本次读取之后写入过该宠物时（VersionConflict），
+        从存储重新读取并推算，再次调用mutate后重试
+
+        Args:
+            mutate: 原地修改子系统状态，返回是否产生了效果（冲突重试时会再次调用）；
+                states[COOLDOWN_KEY] 为记录中的冷却记录，修改后随记录写回
+
+        Returns:
+            (是否写回, 子系统状态, 外显表达)
+
+        Raises:
+            VersionConflict: 连续 max_retries + 1 次冲突
+        """
+        now = time.time() if now is None else now
+        changed, _ = self._update(pet_id, mutate, now)
+
+        life = self._evaluator()[0].life
+        return changed, life.get_states(), life.get_expression()
+
+    def advance(self, pet_id: str, now: Optional[float] = None) -> float:
+        """
+        把已有记录推算到now并写回（定时批量推进调用；不为没有记录的宠物创建记录）
+
+        Returns:
+            写回前记录距now的秒数
+
+        Raises:
+            ValueError: 记录不存在或格式不对
+            VersionConflict: 连续 max_retries + 1 次冲突
+        """
+        now = time.time() if now is None else now
+        _, record = self._update(pet_id, lambda states: True, now, create=False)
+        return now - record.updated_at
+
+    def _update(
+        self,
+        pet_id: str,
+        mutate: Callable[[States], bool],
+        now: float,
+        create: bool = True
+    ) -> Tuple[bool, PetRecord]:
+        """
+        读取 → 推算 → mutate → 比较版本写回，冲突时重试（结果留在当前线程的求值Life中）
+
+        Returns:
+            (是否写回, 最后一次尝试读取到的记录)
+        """
+        key = self._key(pet_id)
+        transaction = getattr(self.backend, "transaction", None)
+        with self._update_locks[hash(pet_id) % _LOCK_STRIPES], (transaction or nullcontext)():
+            for attempt in range(self.max_retries + 1):
+                record, unadvanced = self._evaluate(pet_id, now, create)
+                stepper, _ = self._evaluator()
+
+                # 每次尝试都从刚读取的记录取冷却：上一次未写入的尝试不会挡住本次
+                states = stepper.load()
+                states[COOLDOWN_KEY] = dict(record.cooldowns)
+                changed = mutate(states)
+                cooldowns = states.pop(COOLDOWN_KEY)
+                if not changed:
+                    break
+                stepper.commit(states)
+                try:
+                    # 未推算完的时长留在记录里，之后的读取继续推算
+                    self.backend.save(key, PetRecord(states, now - unadvanced, cooldowns).encode())
+                except VersionConflict as e:
+                    self.conflicts += 1
+                    if attempt == self.max_retries:
+                        logger.warning(f"⚠️  [LazyPet] {pet_id} 连续 {attempt + 1} 次版本冲突，放弃本次写回")
+                        raise
+                    logger.info(f"🔁 [LazyPet] {pet_id} {e}，重新读取后重试")
+                    continue
+                self.writes += 1
+                break
+
+        if changed and self.on_change is not None:
+            self.on_change(pet_id, states, now - unadvanced)
+        return changed, record
+
+    def stats(self) -> Dict[str, int]:
+        """惰性求值指标"""
+        return {"reads": self.reads, "writes": self.writes, "conflicts": self.conflicts}
@@ -17,10 +17,14 @@
 
 import sys
 import os
+import re
 import threading
+import time
 import logging
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
 
 # 配置logging以便在Vercel看到日志
 logging.basicConfig(level=logging.INFO)
@@ -84,6 +88,111 @@ except ImportError as e1:
         logger.error(f"   方式2错误: {e2}")
         LIFE_ENGINE_AVAILABLE = False
 
+from src.fast_forward import FastForward, LifeStepper
+from src.tick_clock import TickClock
+from src.single_flight import SingleFlight
+from src.snapshot_cache import SnapshotCache
+from src.rwlock import RWLock
+from src.interaction_queue import InteractionQueue
+from src.action_effects import COOLDOWN_KEY, ActionEffectApplier, apply_effect, merge_cooldowns
+from src.storage import (
+    BatchedStorage, FlushTracker, NamespacedStorage, VersionConflict, create_redis_storage, require_pending_saves
+)
+from src.redis_pool import get_probe_client, get_redis_client
+from src.write_behind import WriteBehindFlusher
+from src.mmap_storage import MmapStorage
+from src.sqlite_storage import SQLiteStorage
+from src.failover_storage import FailoverStorage
+from src.pet_registry import PetRegistry
+from src.lazy_pet import LazyPetEvaluator, MemoryStorage
+
+# 时间补偿配置
+# - LIFE_ADVANCE_MODE: analytic（解析快进，默认）或 loop（逐秒tick，用于对照/回滚）
+# - LIFE_MAX_CATCHUP_SECONDS: 单次请求最多补偿的秒数（默认30天）
+# - LIFE_ADVANCE_TOLERANCE: 自适应步长每步允许的局部误差
+# - LIFE_ADVANCE_MAX_TICK_CALLS: 单次快进最多的tick调用次数（延迟预算的硬上限），
+#   用尽时只补偿一部分，剩余时长由后续请求继续补偿
+ADVANCE_MODE = os.getenv("LIFE_ADVANCE_MODE", "analytic")
+MAX_CATCHUP_SECONDS = float(os.getenv("LIFE_MAX_CATCHUP_SECONDS", str(86400 * 30)))
+ADVANCE_TOLERANCE = float(os.getenv("LIFE_ADVANCE_TOLERANCE", "1e-3"))
+ADVANCE_MAX_TICK_CALLS = int(os.getenv("LIFE_ADVANCE_MAX_TICK_CALLS", "3000"))
+
+# 离线补偿（catchup）的延迟预算（毫秒），超出时记录告警（硬上限见 LIFE_ADVANCE_MAX_TICK_CALLS）
+CATCHUP_BUDGET_MS = float(os.getenv("LIFE_CATCHUP_BUDGET_MS", "10"))
+
+# 单飞锁配置（跨实例补偿去重）
+# - LIFE_SINGLE_FLIGHT_MIN_SECONDS: 待补偿时长超过该值才走单飞锁（小段补偿直接执行）
+# - LIFE_SINGLE_FLIGHT_WAIT_MS: follower等待leader完成的最长时间
+# - LIFE_CATCHUP_LEASE_MS: 锁租约时长，leader崩溃后到期自动释放
+SINGLE_FLIGHT_MIN_SECONDS = float(os.getenv("LIFE_SINGLE_FLIGHT_MIN_SECONDS", "60"))
+SINGLE_FLIGHT_WAIT_MS = float(os.getenv("LIFE_SINGLE_FLIGHT_WAIT_MS", "200"))
+CATCHUP_LEASE_MS = int(os.getenv("LIFE_CATCHUP_LEASE_MS", "5000"))
+
+# 状态快照缓存有效期（毫秒），0表示禁用；同一窗口内所有设备共享一次计算
+SNAPSHOT_TTL_MS = float(os.getenv("LIFE_SNAPSHOT_TTL_MS", "500"))
+
+# 互动组提交配置
+# - LIFE_COMMIT_WINDOW_MS: leader收集互动的等待窗口
+# - LIFE_COMMIT_MAX_BATCH: 单批最多提交的互动数
+COMMIT_WINDOW_MS = float(os.getenv("LIFE_COMMIT_WINDOW_MS", "2"))
+COMMIT_MAX_BATCH = int(os.getenv("LIFE_COMMIT_MAX_BATCH", "256"))
+
+# 脏标记阈值：数值变化超过该值的子系统才会落盘，无变化的刷盘整体跳过
+FLUSH_EPSILON = float(os.getenv("LIFE_FLUSH_EPSILON", "1e-6"))
+
+# 刷盘模式
+# - LIFE_FLUSH_MODE: sync（请求内同步刷盘，默认，适合Serverless）或 write_behind（后台写回，适合常驻进程）
+# - LIFE_FLUSH_INTERVAL_MS: write_behind模式的最长刷盘间隔（持久性窗口）
+# - LIFE_FLUSH_MAX_MUTATIONS: write_behind模式下累计变更达到该数量时提前刷盘
+FLUSH_MODE = os.getenv("LIFE_FLUSH_MODE", "sync")
+FLUSH_INTERVAL_MS = float(os.getenv("LIFE_FLUSH_INTERVAL_MS", "1000"))
+FLUSH_MAX_MUTATIONS = int(os.getenv("LIFE_FLUSH_MAX_MUTATIONS", "50"))
+
+# 存储后端选择
+# - LIFE_STORAGE_BACKEND: auto（有REDIS_URL时用Redis，否则本地存储，默认）或 sqlite（单机自托管）
+# - LIFE_SQLITE_PATH: sqlite模式的数据库文件路径
+# - LIFE_SQLITE_LOG_RETENTION_DAYS: 互动日志保留天数，0表示不按时间裁剪
+# - LIFE_SQLITE_LOG_MAX_ROWS: 互动日志最多保留的行数，0表示不按行数裁剪
+STORAGE_BACKEND = os.getenv("LIFE_STORAGE_BACKEND", "auto")
+SQLITE_PATH = os.getenv("LIFE_SQLITE_PATH", "data/life-global_pet.db")
+SQLITE_LOG_RETENTION_DAYS = float(os.getenv("LIFE_SQLITE_LOG_RETENTION_DAYS", "30"))
+SQLITE_LOG_MAX_ROWS = int(os.getenv("LIFE_SQLITE_LOG_MAX_ROWS", "100000"))
+
+# Redis不可用时的本地存储：mmap（内存映射状态文件，多worker共享，默认）或 file（FileStorage）
+LOCAL_STORAGE = os.getenv("LIFE_LOCAL_STORAGE", "mmap")
+
+# Redis存储布局：json（每个子系统一个JSON文档，默认）或 hash（按字段存储，只写变化的字段）
+REDIS_LAYOUT = os.getenv("LIFE_REDIS_LAYOUT", "json")
+
+# 多实例乐观并发（仅Redis）
+# - LIFE_VERSIONED_WRITES: 是否使用版本化的compare-and-swap写入（默认开启）
+# - LIFE_CAS_MAX_RETRIES: 版本冲突后重新加载并重新应用的最多次数
+VERSIONED_WRITES = os.getenv("LIFE_VERSIONED_WRITES", "true").lower() == "true"
+CAS_MAX_RETRIES = int(os.getenv("LIFE_CAS_MAX_RETRIES", "3"))
+
+# 新鲜度检查：补偿前GET一次版本计数器，其他实例写入过时从存储重新加载（默认开启）
+FRESHNESS_CHECK = os.getenv("LIFE_FRESHNESS_CHECK", "true").lower() == "true"
+
+# 多宠物注册表：每个节点最多常驻的宠物Life实例数（超出时按LRU刷盘淘汰）
+PET_REGISTRY_CAPACITY = int(os.getenv("LIFE_PET_REGISTRY_CAPACITY", "1024"))
+
+# 多宠物求值方式：registry（常驻Life实例，默认）或 lazy（不常驻，读取时从紧凑记录推算）
+PET_MODE = os.getenv("LIFE_PET_MODE", "registry")
+
+# 宠物ID同时用作存储键前缀和本地目录名
+_PET_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+@dataclass
+class PetSlot:
+    """注册表中常驻的一只宠物（Life实例、tick水位线、互斥锁、刷盘脏标记与未落盘的修改）"""
+    pet_id: str
+    life: Any
+    tick_clock: TickClock
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    flush_tracker: FlushTracker = field(default_factory=lambda: FlushTracker(epsilon=FLUSH_EPSILON))
+    pending_reapply: List[Callable[[], None]] = field(default_factory=list)
+
 
 class LifeAdapter:
     """
@@ -94,6 +203,12 @@ class LifeAdapter:
     - device_id仅用于追踪互动来源和日志记录
     - 状态判断由客户端完成，Server只提供数值
     
+    并发模型：
+    - 读取状态（构建快照）持读锁，可并行
+    - tick补偿、互动、刷盘、重置持写锁，互相串行
+    - 刷盘默认在请求内同步执行；write_behind模式下由后台线程执行
+    - 多实例写入用版本号做乐观并发：冲突时重新加载，把尚未落盘的修改重新应用后重试
+    
     职责：
     1. 管理全局唯一的Life实例
     2. 提供全局共享的能量/饥饿/心情数值
@@ -103,13 +218,43 @@ class LifeAdapter:
 
     # 全局单例Life实例
     _global_life: Optional[Any] = None  # 全局共享的Life实例
-    _global_life_lock = threading.Lock()  # 线程安全锁
+    _global_life_lock = threading.Lock()  # 线程安全锁（仅保护实例创建）
+    _life_rwlock = RWLock()  # Life状态读写锁：读并行，tick/互动/刷盘/重置互斥
     _global_metadata: Dict[str, Any] = {}  # 全局元数据
+    _tick_clock: Optional[TickClock] = None  # 存储后端上的共享tick水位线
+    _single_flight: Optional[SingleFlight] = None  # 跨实例补偿单飞锁
+    _snapshot_cache = SnapshotCache(ttl=SNAPSHOT_TTL_MS / 1000)  # 状态快照缓存
+    _interaction_queue: Optional[InteractionQueue] = None  # 互动组提交队列
+    _action_effects = ActionEffectApplier()  # 互动效果表（冷却记录保存在宠物状态中）
+    _flush_tracker = FlushTracker(epsilon=FLUSH_EPSILON)  # 刷盘脏标记与指标
+    _write_behind: Optional[WriteBehindFlusher] = None  # 后台写回（write_behind模式）
+    _pending_reapply: List[Callable[[], None]] = []  # 尚未落盘的修改（版本冲突时重新应用）
+    _pending_watermark: Optional[float] = None  # write_behind模式下等待刷盘后推进的水位线
+    _cas_stats: Dict[str, int] = {"conflicts": 0, "retries": 0, "failures": 0, "stale_reloads": 0}  # 乐观并发指标
+    _pet_registry: Optional[PetRegistry] = None  # 多宠物注册表（按需创建）
+    _pet_local_store: Optional[SQLiteStorage] = None  # 注册表宠物共用的本地存储（无Redis时，按需创建）
+    _lazy_pets: Optional[LazyPetEvaluator] = None  # 多宠物惰性求值器（lazy模式，按需创建）
+    event_scheduler: Optional[Any] = None  # 状态跃迁事件调度器（见 pet_events；为None时不预测事件）
     
     # 全局宠物ID（固定）
     GLOBAL_PET_ID = "global_pet"
 
-    def __init__(self, device_id: str):
+    # 能量分档阈值（0-100）：心情分档20/40/70，饥饿分档（100-能量）对应30/50
+    # 快进时在这些阈值附近使用小步长
+    ENERGY_THRESHOLDS = (20.0, 30.0, 40.0, 50.0, 70.0)
+    # 节律相位差（绝对值）分档阈值：心情分档见 _extract_mood_value
+    RHYTHM_THRESHOLDS = (0.2, 0.3)
+
+    # 时间补偿用的快进器（无状态，可共享）
+    # period_seconds与Life的10小时生物钟周期一致，用于周期折叠
+    _fast_forward = FastForward(
+        tolerance=ADVANCE_TOLERANCE,
+        period_seconds=10.0 * 3600,
+        thresholds={("energy", "energy"): ENERGY_THRESHOLDS},
+        max_tick_calls=ADVANCE_MAX_TICK_CALLS,
+    )
+
+    def __init__(self, device_id: str, pet_id: Optional[str] = None):
         """
         初始化生命适配器
         
@@ -118,9 +263,13 @@ class LifeAdapter:
 
         Args:
             device_id: 设备标识符（用于追踪来源）
+            pet_id: 宠物ID（可选）；指定时操作注册表中的该宠物，而不是全局宠物
         """
         logger.info(f"🔧 [LifeAdapter] 初始化开始, device_id={device_id}")
         self.device_id = device_id
+        if pet_id is not None and not _PET_ID_PATTERN.match(pet_id):
+            raise ValueError(f"invalid pet_id: {pet_id!r}")
+        self.pet_id = pet_id
 
         if not LIFE_ENGINE_AVAILABLE:
             logger.error("❌ [LifeAdapter] Life引擎不可用")
@@ -129,8 +278,9 @@ class LifeAdapter:
                 "Please ensure it's properly installed."
             )
 
-        logger.info(f"✅ [LifeAdapter] Life引擎可用，开始确保全局实例存在")
-        self._ensure_global_life_exists()
+        if pet_id is None:
+            logger.info(f"✅ [LifeAdapter] Life引擎可用，开始确保全局实例存在")
+            self._ensure_global_life_exists()
         logger.info(f"✅ [LifeAdapter] 初始化完成, device_id={device_id}")
 
     def _ensure_global_life_exists(self):
@@ -147,20 +297,29 @@ class LifeAdapter:
                     # 创建全局存储后端
                     backend = self._create_storage_backend()
 
-                    # 创建全局Life实例
-                    life_instance = Life(
-                        backend=backend,
-                        time_scale=1.0,  # 正常速度
-                        auto_flush=False,  # 使用延迟刷盘优化性能
-                        internal_period_hours=10.0,  # 10小时生物钟周期
-                        external_period_hours=10.0  # 10小时环境周期
-                    )
-
-                    # 启动Life实例
-                    life_instance.start()
+                    # 创建并启动全局Life实例
+                    life_instance = self._new_life(backend)
 
                     # 赋值给类变量
                     self.__class__._global_life = life_instance
+                    # 预占租约覆盖补偿到刷盘的时间（write_behind模式下含一个刷盘周期）
+                    self.__class__._tick_clock = TickClock(
+                        backend, lease_ms=int(max(CATCHUP_LEASE_MS, 2 * FLUSH_INTERVAL_MS))
+                    )
+                    self.__class__._single_flight = SingleFlight(backend, lease_ms=CATCHUP_LEASE_MS)
+                    self.__class__._interaction_queue = InteractionQueue(
+                        apply_batch=self.__class__._commit_interactions,
+                        commit_window=COMMIT_WINDOW_MS / 1000,
+                        max_batch=COMMIT_MAX_BATCH,
+                    )
+                    if FLUSH_MODE == "write_behind":
+                        flusher = WriteBehindFlusher(
+                            flush=self.__class__._write_behind_flush,
+                            interval=FLUSH_INTERVAL_MS / 1000,
+                            max_mutations=FLUSH_MAX_MUTATIONS,
+                        )
+                        flusher.start()
+                        self.__class__._write_behind = flusher
 
                     # 初始化全局元数据
                     self.__class__._global_metadata = {
@@ -172,13 +331,49 @@ class LifeAdapter:
                     
                     logger.info(f"✅ [LifeAdapter] 全局Life实例已创建: {self.GLOBAL_PET_ID}")
 
+    @staticmethod
+    def _new_life(backend) -> Life:
+        """在存储后端上创建并启动Life实例（版本化写入时检查引擎兼容性）"""
+        life = Life(
+            backend=backend,
+            time_scale=1.0,  # 正常速度
+            auto_flush=False,  # 使用延迟刷盘优化性能
+            internal_period_hours=10.0,  # 10小时生物钟周期
+            external_period_hours=10.0  # 10小时环境周期
+        )
+        if VERSIONED_WRITES:
+            require_pending_saves(life.state_manager)
+        life.start()
+        return life
+
+    @classmethod
+    def check_engine(cls):
+        """
+        启动检查（应用生命周期开始时调用）：引擎不兼容时抛出，服务不启动
+
+        在内存存储上创建一个Life实例，检查内容见 _new_life
+        """
+        if not LIFE_ENGINE_AVAILABLE:
+            return
+        cls._new_life(MemoryStorage())
+        logger.info("✅ [LifeAdapter] 引擎兼容性检查通过")
+
     def _create_storage_backend(self):
         """
-        创建全局存储后端（优先Redis，降级到文件）
+        创建全局存储后端（优先Redis并带故障转移，否则使用本地存储）
         
         注意：使用固定的key_prefix确保所有设备访问同一份数据
         """
         logger.info("🔍 [Storage] 开始创建存储后端...")
+
+        if STORAGE_BACKEND == "sqlite":
+            # 单机自托管：状态、tick水位线、互动日志都在同一个SQLite数据库中
+            logger.info(f"🗄️  [Storage] 使用SQLite存储，数据库={SQLITE_PATH}")
+            return BatchedStorage(SQLiteStorage(
+                SQLITE_PATH,
+                log_retention_seconds=SQLITE_LOG_RETENTION_DAYS * 86400 or None,
+                log_max_rows=SQLITE_LOG_MAX_ROWS or None,
+            ))
         
         # 尝试从环境变量获取Redis配置
         # - REDIS_URL: Vercel Marketplace (Upstash) 或本地 Redis 实例
@@ -192,25 +387,51 @@ class LifeAdapter:
         if redis_url and RedisStorage:
             # 使用Redis存储（Serverless环境）
             logger.info(f"✅ [Storage] 使用Redis存储，key_prefix=life_{self.GLOBAL_PET_ID}")
+            key_prefix = f"life_{self.GLOBAL_PET_ID}"  # 全局固定前缀
+            ttl = 86400 * 30  # 30天过期（全局宠物需要更长保留）
             try:
-                backend = RedisStorage(
-                    redis_url=redis_url,
-                    key_prefix=f"life_{self.GLOBAL_PET_ID}",  # 全局固定前缀
-                    ttl=86400 * 30  # 30天过期（全局宠物需要更长保留）
-                )
-                logger.info("✅ [Storage] Redis存储初始化成功")
-                return backend
+                # 进程级连接池客户端：保活、健康检查、断线透明重连（创建时不建立连接）
+                client = get_redis_client(redis_url)
             except Exception as e:
-                logger.warning(f"⚠️  [Storage] Redis初始化失败，降级到文件存储: {e}")
-                import traceback
-                logger.warning(f"⚠️  [Storage] 错误详情: {traceback.format_exc()}")
+                logger.warning(f"⚠️  [Storage] Redis客户端创建失败，降级到本地存储: {e}")
+                client = None
+
+            if client is not None:
+                def connect():
+                    # 直接构建在连接池客户端上：重连/故障恢复重试不新建连接、不额外PING
+                    # 批量读写：一次刷盘只需一次往返；版本化写入防止多实例互相覆盖
+                    return create_redis_storage(
+                        redis_url, key_prefix, ttl=ttl, layout=REDIS_LAYOUT, versioned=VERSIONED_WRITES
+                    )
+
+                # Redis故障（包括初始化失败）时熔断到本地缓冲，恢复后回放
+                return FailoverStorage(
+                    connect,
+                    fallback=self._create_local_backend(),
+                    client=client,
+                    key_prefix=key_prefix,
+                    ttl=ttl,
+                    # 故障探测在后台线程中用短超时的独立客户端PING，不占用业务连接池的重试
+                    probe_client=get_probe_client(redis_url),
+                )
 
-        # 降级：使用文件存储（本地开发或Serverless临时存储）
+        return self._create_local_backend()
+
+    def _create_local_backend(self):
+        """创建本地存储（本地开发、Serverless临时存储或Redis故障时的后备）"""
         state_dir = f"/tmp/life-{self.GLOBAL_PET_ID}"
+        logger.info(f"ℹ️  [Storage] 注意：Serverless环境中本地存储是临时的，实例重启后会清空")
+        if LOCAL_STORAGE == "mmap":
+            try:
+                state_file = os.path.join(state_dir, "state.mmap")
+                logger.info(f"📁 [Storage] 使用内存映射存储，文件={state_file}")
+                return BatchedStorage(MmapStorage(state_file))
+            except Exception as e:
+                logger.warning(f"⚠️  [Storage] 内存映射存储初始化失败，降级到文件存储: {e}")
+
         logger.info(f"📁 [Storage] 使用文件存储，目录={state_dir}")
-        logger.info(f"ℹ️  [Storage] 注意：Serverless环境中文件存储是临时的，实例重启后会清空")
         from core import FileStorage
-        return FileStorage(state_dir)
+        return BatchedStorage(FileStorage(state_dir))
 
     def get_life(self) -> Life:
         """
@@ -229,42 +450,367 @@ class LifeAdapter:
         因此每次请求时，需要根据距离上次更新的时间来补充tick。
         
         策略：
-        - 记录上次tick的时间
-        - 计算时间差
-        - 执行相应数量的tick（每秒1个tick）
+        - tick水位线与Life状态一起存放在存储后端（见 TickClock）
+        - 原子地预占水位线到当前时间这一段，得到本实例负责补偿的时长
+        - 通过解析快进一次性推进整段时长（见 _advance_life）
+        - 补偿结果落盘后才推进水位线（见 _settle_tick）：刷盘前崩溃不会丢失这段时间
+
+        多个实例并发请求时，同一段时间只会被其中一个实例补偿；
+        进程内补偿在写锁中执行，并发线程不会重复tick或交错刷盘
         """
-        now = datetime.utcnow()
-        
-        # 从类变量获取上次tick时间
-        last_tick_time = self.__class__._global_metadata.get("last_tick_time")
-        
-        if last_tick_time:
-            # 计算时间差（秒）
-            last_tick_dt = datetime.fromisoformat(last_tick_time)
-            elapsed_seconds = (now - last_tick_dt).total_seconds()
-            
-            # 限制最大补偿时间（避免一次性tick太多次）
-            # 最多补偿1小时的tick
-            elapsed_seconds = min(elapsed_seconds, 3600)
-            
-            if elapsed_seconds >= 1.0:
-                # 执行tick（每秒1个）
-                tick_count = int(elapsed_seconds)
-                logger.info(f"⏰ [Life] 补偿 {tick_count} 个tick（距离上次 {elapsed_seconds:.1f}秒）")
-                
-                for _ in range(tick_count):
-                    life.tick(dt=1.0)
-                
+        tick_clock = self.__class__._tick_clock
+
+        # 存储上的状态已被其他实例更新（或故障恢复时本地写入被取代）：先从存储重新加载
+        if self._is_stale(life):
+            with self.__class__._life_rwlock.write_locked():
+                self.__class__._cas_stats["stale_reloads"] += 1
+                self._rebase(life)
+
+        # 距离已知水位线不足1秒：无需补偿，也不占用写锁
+        watermark = tick_clock.watermark
+        if watermark is not None and time.time() - watermark < 1.0:
+            return
+
+        with self._locked_for_write(life):
+            now = time.time()
+            elapsed_seconds = tick_clock.begin(now, min_elapsed=1.0)
+
+            if elapsed_seconds <= 0:
+                return
+
+            # 限制最大补偿时间（解析快进的代价与时长无关，默认可补偿30天）
+            elapsed_seconds = min(elapsed_seconds, MAX_CATCHUP_SECONDS)
+            logger.info(f"⏰ [Life] 补偿 {elapsed_seconds:.1f} 秒")
+            # tick预算用尽时只补偿一部分：水位线只推进到实际补偿到的时刻，剩余时长留给下次请求
+            unadvanced = 0.0
+
+            def compensate():
+                nonlocal unadvanced
+                unadvanced = elapsed_seconds - self._advance_life(life, elapsed_seconds)
+
+            try:
+                compensate()
                 # 手动刷盘（延迟刷盘模式）
-                if not life.state_manager.auto_flush:
-                    life.flush()
-                
-                # 更新上次tick时间
-                self.__class__._global_metadata["last_tick_time"] = now.isoformat()
-        else:
-            # 首次tick，只记录时间
-            logger.info("⏰ [Life] 首次tick，初始化时间戳")
-            self.__class__._global_metadata["last_tick_time"] = now.isoformat()
+                flushed = self._flush(life, reapply=compensate)
+            except BaseException:
+                tick_clock.abort()
+                raise
+
+            if flushed is None:
+                # write_behind：后台线程刷盘成功后再推进水位线（见 _write_behind_flush）
+                self.__class__._pending_watermark = now - unadvanced
+            else:
+                self._settle_tick(life, tick_clock, now - unadvanced, flushed, compensate)
+
+    @classmethod
+    def _settle_tick(
+        cls,
+        life: Life,
+        tick_clock: TickClock,
+        watermark: float,
+        flushed: bool,
+        reapply: Callable[[], None],
+        flush_tracker: Optional[FlushTracker] = None,
+        pending_reapply: Optional[List[Callable[[], None]]] = None
+    ):
+        """
+        按补偿的刷盘结果处理水位线（需持有写锁）
+
+        - 已落盘：推进水位线到watermark（tick预算用尽时早于当前时刻）
+        - 持续版本冲突未能落盘：撤销本次补偿（从存储重新加载，不再重新应用它），
+          释放预占，水位线不变，这段时间由下次请求重新补偿
+        """
+        if flushed:
+            tick_clock.commit(watermark)
+            return
+        pending = cls._pending_reapply if pending_reapply is None else pending_reapply
+        if reapply in pending:
+            pending.remove(reapply)
+        tick_clock.abort()
+        cls._rebase(life, flush_tracker, pending_reapply)
+
+    @classmethod
+    def _is_stale(cls, life: Life) -> bool:
+        """
+        内存中的状态是否落后于存储
+
+        版本化写入时只GET一次版本计数器，完整状态只在版本变化时才重新加载
+        """
+        backend = life.state_manager.backend
+        if getattr(backend, "needs_reload", False):
+            return True
+        is_stale = getattr(backend, "is_stale", None)
+        if not FRESHNESS_CHECK or is_stale is None:
+            return False
+        try:
+            return is_stale()
+        except Exception as e:
+            logger.warning(f"⚠️  [Storage] 新鲜度检查失败，使用内存中的状态: {e}")
+            return False
+
+    @classmethod
+    @contextmanager
+    def _locked_for_write(cls, life: Life) -> Iterator[None]:
+        """
+        写锁；后端提供 transaction() 时（mmap/SQLite本地存储）同时持有跨进程锁
+
+        同一主机的worker共享本地存储但写入没有版本校验：读取→修改→刷盘必须在一次
+        加锁内完成，加锁后先重新加载其他worker写入的状态，不用本进程过期的状态覆盖对方
+        """
+        with cls._life_rwlock.write_locked():
+            with cls._local_transaction(life):
+                yield
+
+    @classmethod
+    @contextmanager
+    def _local_transaction(
+        cls,
+        life: Life,
+        flush_tracker: Optional[FlushTracker] = None,
+        pending_reapply: Optional[List[Callable[[], None]]] = None
+    ) -> Iterator[None]:
+        """
+        后端提供 transaction() 时持有跨进程锁，加锁后先重新加载其他worker写入的状态
+
+        flush_tracker/pending_reapply 默认为全局宠物的，注册表中的宠物传入自己的（见 PetSlot）
+        """
+        transaction = getattr(life.state_manager.backend, "transaction", None)
+        if transaction is None:
+            yield
+            return
+        with transaction():
+            if cls._is_stale(life):
+                cls._cas_stats["stale_reloads"] += 1
+                cls._rebase(life, flush_tracker, pending_reapply)
+            yield
+
+    @classmethod
+    def _rebase(
+        cls,
+        life: Life,
+        flush_tracker: Optional[FlushTracker] = None,
+        pending_reapply: Optional[List[Callable[[], None]]] = None
+    ):
+        """
+        从存储重新加载，再按顺序重新应用尚未落盘的修改（需持有写锁）
+
+        flush_tracker/pending_reapply 默认为全局宠物的，注册表中的宠物传入自己的（见 PetSlot）
+        """
+        cls._reload_from_storage(life, flush_tracker)
+        for reapply in cls._pending_reapply if pending_reapply is None else pending_reapply:
+            reapply()
+
+    @classmethod
+    def _reload_from_storage(cls, life: Life, flush_tracker: Optional[FlushTracker] = None):
+        """从存储重新加载子系统状态，取代内存中的状态（需持有写锁）"""
+        backend = life.state_manager.backend
+        backend.needs_reload = False
+
+        stepper = LifeStepper(life)
+        states = {
+            name: state
+            for name, state in backend.load_many(stepper.system_names + (COOLDOWN_KEY,)).items()
+            if state
+        }
+        if states:
+            stepper.commit(states)
+        # 重新加载的状态与存储一致，不需要写回
+        (flush_tracker or cls._flush_tracker).remember(states)
+        cls._snapshot_cache.invalidate()
+        logger.info(f"🔄 [Life] 已从存储重新加载 {len(states)} 个子系统")
+
+    @classmethod
+    def _flush(cls, life: Life, reapply: Optional[Callable[[], None]] = None) -> Optional[bool]:
+        """
+        延迟刷盘模式下把pending状态写入存储（需持有写锁）
+
+        只写入有实质变化的子系统（见 FlushTracker），
+        通过 save_many 一次写完（Redis为一次MULTI/EXEC往返）；
+        write_behind模式下只登记变更，由后台线程刷盘
+
+        Args:
+            reapply: 重新执行本次修改的函数，版本冲突重新加载后调用
+
+        Returns:
+            是否已落盘；write_behind模式下返回None（由后台线程刷盘）
+        """
+        if life.state_manager.auto_flush:
+            return True
+        if reapply is not None:
+            cls._pending_reapply.append(reapply)
+        if cls._write_behind is not None:
+            cls._write_behind.mark_dirty()
+            return None
+        return cls._commit_flush(life)
+
+    @classmethod
+    def _commit_flush(
+        cls,
+        life: Life,
+        flush_tracker: Optional[FlushTracker] = None,
+        pending_reapply: Optional[List[Callable[[], None]]] = None
+    ) -> bool:
+        """
+        乐观并发刷盘（需持有写锁）
+
+        其他实例在本实例读取之后写入过时，存储拒绝本次写入（VersionConflict）：
+        从存储重新加载，按顺序重新应用尚未落盘的修改，然后重试
+
+        Returns:
+            是否已落盘（持续冲突时为False，修改保留到下次刷盘）
+        """
+        flush_tracker = flush_tracker or cls._flush_tracker
+        if pending_reapply is None:
+            pending_reapply = cls._pending_reapply
+
+        for attempt in range(CAS_MAX_RETRIES + 1):
+            try:
+                flush_tracker.flush(life)
+            except VersionConflict as e:
+                cls._cas_stats["conflicts"] += 1
+                if attempt == CAS_MAX_RETRIES:
+                    break
+                cls._cas_stats["retries"] += 1
+                logger.info(f"🔁 [Storage] {e}，重新加载并重新应用 {len(pending_reapply)} 个修改")
+                cls._rebase(life, flush_tracker, pending_reapply)
+                continue
+            pending_reapply.clear()
+            return True
+
+        # 保留pending状态和待重新应用的修改，下次刷盘再试
+        cls._cas_stats["failures"] += 1
+        logger.warning(f"⚠️  [Storage] 连续 {CAS_MAX_RETRIES + 1} 次版本冲突，推迟到下次刷盘")
+        return False
+
+    @classmethod
+    def _write_behind_flush(cls):
+        """后台写回线程调用的刷盘函数：落盘后推进等待中的水位线"""
+        life = cls._global_life
+        if life is None:
+            return
+        with cls._locked_for_write(life):
+            if cls._commit_flush(life) and cls._pending_watermark is not None:
+                cls._tick_clock.commit(cls._pending_watermark)
+                cls._pending_watermark = None
+
+    @classmethod
+    def shutdown(cls):
+        """
+        应用退出时调用：停止后台写回并强制刷盘，注册表中的宠物逐个刷盘
+
+        同步刷盘模式下全局宠物没有需要处理的内容
+        """
+        if cls._write_behind is not None:
+            cls._write_behind.stop(flush=True)
+            cls._write_behind = None
+        if cls._pet_registry is not None:
+            cls._pet_registry.clear()
+
+    @classmethod
+    def storage_stats(cls) -> Dict[str, Any]:
+        """存储层指标（刷盘执行/跳过次数、往返次数）"""
+        stats: Dict[str, Any] = cls._flush_tracker.stats()
+        stats["flush_mode"] = "write_behind" if cls._write_behind is not None else "sync"
+        if cls._write_behind is not None:
+            stats["pending_mutations"] = cls._write_behind.pending_mutations
+        life = cls._global_life
+        backend = getattr(getattr(life, "state_manager", None), "backend", None)
+        if backend is not None:
+            stats["round_trips"] = getattr(backend, "round_trips", None)
+        if isinstance(backend, FailoverStorage):
+            stats["failover"] = backend.stats()
+        stats["cas"] = dict(cls._cas_stats)
+        if cls._pet_registry is not None:
+            stats["pets"] = cls._pet_registry.stats()
+        if cls._lazy_pets is not None:
+            stats["lazy_pets"] = cls._lazy_pets.stats()
+        return stats
+
+    def _single_flight_catch_up(self, life: Life) -> Tuple[Dict[str, Any], bool]:
+        """
+        跨实例单飞补偿
+
+        - 待补偿时长较短：直接补偿（见 _tick_life_engine）
+        - 待补偿时长较长：获取单飞锁
+          - leader：补偿、刷盘、构建状态并发布快照
+          - follower：等待leader完成，返回其发布的快照（水位线不早于本请求的等待目标）；
+            没有可用的快照时从存储重新加载并补偿剩余时长（不使用本地未推进的状态）
+
+        Returns:
+            (返回给客户端的状态, 是否可以写入快照缓存)
+            leader仍未完成时（等待超时），存储中还不是推进后的状态，结果不缓存
+        """
+        watermark = self.__class__._tick_clock.watermark
+        if watermark is None or time.time() - watermark < SINGLE_FLIGHT_MIN_SECONDS:
+            self._tick_life_engine(life)
+            return self._build_state(life), True
+
+        single_flight = self.__class__._single_flight
+        try:
+            # 存储熔断中无法协调，直接在本实例补偿
+            if not getattr(life.state_manager.backend, "available", True):
+                raise ConnectionError("storage circuit is open")
+            token = single_flight.acquire()
+        except Exception as e:
+            logger.warning(f"⚠️  [SingleFlight] 无法获取补偿锁，本实例直接补偿: {e}")
+            self._tick_life_engine(life)
+            return self._build_state(life), True
+
+        if token is None:
+            logger.info(f"⏳ [SingleFlight] 其他实例正在补偿，等待其完成 device={self.device_id}")
+            # leader补偿到的水位线应在本请求的直接补偿范围内：更早的是以前某次补偿发布的旧快照
+            awaited = time.time() - SINGLE_FLIGHT_MIN_SECONDS
+            try:
+                finished = single_flight.wait(SINGLE_FLIGHT_WAIT_MS / 1000)
+                snapshot = single_flight.load_snapshot(min_watermark=awaited)
+            except Exception as e:
+                logger.warning(f"⚠️  [SingleFlight] 读取快照失败: {e}")
+                finished, snapshot = False, None
+            if snapshot is not None:
+                return snapshot, True
+
+            # 没有可用的快照：leader已刷盘（或仍在补偿），本地Life未推进，不能直接使用
+            logger.info(f"🔄 [SingleFlight] 未取得快照，从存储重新加载 finished={finished}")
+            with self.__class__._life_rwlock.write_locked():
+                self.__class__._cas_stats["stale_reloads"] += 1
+                self._rebase(life)
+            self._tick_life_engine(life)
+            return self._build_state(life), finished
+
+        try:
+            logger.info(f"🔒 [SingleFlight] 获得补偿锁 token={token}")
+            self._tick_life_engine(life)
+            state = self._build_state(life)
+            single_flight.publish(token, state, self.__class__._tick_clock.watermark)
+            return state, True
+        finally:
+            try:
+                single_flight.release(token)
+            except Exception as e:
+                logger.warning(f"⚠️  [SingleFlight] 释放补偿锁失败（租约到期后自动释放）: {e}")
+
+    def _advance_life(self, life: Life, seconds: float) -> float:
+        """
+        将Life推进指定秒数（结果在内存中，由调用方flush）
+
+        - analytic模式：自适应步长快进，24小时只需几百次tick；
+          tick预算（LIFE_ADVANCE_MAX_TICK_CALLS）用尽时只推进一部分
+        - loop模式：逐秒tick，与旧行为完全一致
+
+        Returns:
+            实际推进的秒数
+        """
+        if ADVANCE_MODE == "loop":
+            for _ in range(int(seconds)):
+                life.tick(dt=1.0)
+            return seconds
+
+        stats = self._fast_forward.advance(life, seconds)
+        logger.info(
+            f"⏩ [Life] 快进 {stats.seconds:.0f}/{seconds:.0f}秒: tick调用={stats.tick_calls}, "
+            f"步数={stats.jumps}, 拒绝={stats.rejections}, 误差上界={stats.error_bound:.2e}"
+        )
+        return stats.seconds
 
     def get_state(self) -> Dict[str, Any]:
         """
@@ -276,22 +822,57 @@ class LifeAdapter:
         Returns:
             包含全局共享数值的字典
         """
+        if self.pet_id is not None:
+            return self._get_pet_state()
+
         life = self.get_life()
-        
-        # 🔥 关键：在Serverless环境中，每次请求时推进Life引擎
-        # 计算距离上次更新的时间，执行相应数量的tick
-        self._tick_life_engine(life)
+        cls = self.__class__
+
+        # 读穿透缓存：水位线未变化且未过期时直接复用（一次GET，无计算）
+        watermark = cls._tick_clock.peek()
+        state = cls._snapshot_cache.get(watermark)
+
+        if state is None:
+            # 构建期间其他线程提交了修改（缓存被失效）时，本次构建的状态不进入缓存
+            generation = cls._snapshot_cache.generation
+            # 🔥 关键：在Serverless环境中，每次请求时推进Life引擎
+            # 计算距离上次更新的时间并补偿（大段补偿跨实例只执行一次）
+            state, cacheable = self._single_flight_catch_up(life)
+            if cacheable:
+                cls._snapshot_cache.put(cls._tick_clock.watermark, state, generation)
+
+        # 快照可能来自其他设备的请求，只替换来源设备
+        return {**state, "device_id": self.device_id}
 
+    def _build_state(self, life: Life) -> Dict[str, Any]:
+        """
+        基于Life当前状态构建返回给客户端的宠物状态（读锁内读取，可并行）
+        """
         # 获取Life的内在状态
-        life_states = life.get_states()
-        expression = life.get_expression()
-        metadata = self.__class__._global_metadata
+        with self.__class__._life_rwlock.read_locked():
+            life_states = life.get_states()
+            expression = life.get_expression()
+            metadata = self.__class__._global_metadata
 
-        # 映射到宠物系统的状态格式
+        return self._format_state(
+            life_states,
+            expression,
+            pet_name=metadata["pet_name"],
+            ids={"global_pet_id": self.GLOBAL_PET_ID},
+        )
+
+    def _format_state(
+        self,
+        life_states: Dict[str, Any],
+        expression: Dict[str, Any],
+        pet_name: str,
+        ids: Dict[str, str]
+    ) -> Dict[str, Any]:
+        """把Life的内在状态和外显表达映射为返回给客户端的宠物状态"""
         pet_state = {
             "device_id": self.device_id,  # 请求来源设备
-            "pet_name": metadata["pet_name"],
-            "global_pet_id": self.GLOBAL_PET_ID,
+            "pet_name": pet_name,
+            **ids,
 
             # 内在状态（来自Life引擎）
             "internal_state": {
@@ -444,40 +1025,102 @@ class LifeAdapter:
         架构变更：
         - 任何用户的互动都会影响全局宠物状态
         - 记录互动来源以便分析
+        - 互动效果由互动效果表决定（能量增减、节律同步、冷却时间）
+        - 互动进入组提交队列：同一提交窗口内的互动批量生效、
+          只刷盘一次（见 _commit_interactions）
 
         Args:
             action: 互动类型（feed, greet, play等）
 
         Returns:
-            更新后的全局宠物状态
+            提交后的全局宠物状态
         """
-        life = self.get_life()
+        if self.pet_id is not None:
+            return self._interact_pet(action)
 
         # 记录互动日志（用于追踪和分析）
         logger.info(f"🎮 [Interact] device={self.device_id}, action={action}, timestamp={datetime.utcnow().isoformat()}")
 
-        # 根据action执行不同的操作
-        # TODO: 未来可以扩展Life引擎以支持更细粒度的交互
-        if action == "feed":
-            # 喂食：执行更新
-            logger.info(f"  🍕 喂食操作 by {self.device_id}")
-        elif action == "greet":
-            # 打招呼：增加互动
-            logger.info(f"  👋 打招呼 by {self.device_id}")
-        elif action == "play":
-            # 玩耍：消耗能量，增加心情
-            logger.info(f"  🎾 玩耍 by {self.device_id}")
-
-        # 执行一个时间步的更新
-        life.tick(dt=1.0)
-
-        # 延迟刷盘模式下，需要手动刷盘
-        # （这是为了优化Serverless环境的性能）
-        if not life.state_manager.auto_flush:
-            life.flush()
+        # 阻塞直到本次互动所在的批次提交完成
+        self.__class__._interaction_queue.submit(action, self.device_id)
 
         return self.get_state()
 
+    @classmethod
+    def _commit_interactions(cls, batch: List[Tuple[str, str]]):
+        """
+        组提交：按到达顺序把一批互动的效果应用到Life状态，并只刷盘一次
+
+        效果来自互动效果表（见 action_effects.ACTION_EFFECTS），
+        直接修改节律/能量状态，不额外执行tick；冷却记录与状态在同一次刷盘中写入
+
+        Args:
+            batch: [(action, device_id), ...]
+        """
+        life = cls._global_life
+        now = time.time()
+
+        with cls._locked_for_write(life):
+            stepper = LifeStepper(life)
+            states = cls._load_for_interaction(stepper)
+            applied = cls._action_effects.apply_batch(states, batch, now=now)
+
+            if applied:
+                stepper.commit(states)
+                cooldowns = states[COOLDOWN_KEY]
+
+                # 延迟刷盘模式下，需要手动刷盘（整批只刷一次）
+                # 版本冲突时在重新加载的状态上再次应用（冷却已在首次应用时判定）
+                cls._flush(life, reapply=lambda: cls._reapply_effects(life, applied, cooldowns))
+
+        # 后端支持时记录互动日志（如SQLite）
+        log_interactions = getattr(life.state_manager.backend, "log_interactions", None)
+        if log_interactions is not None:
+            try:
+                log_interactions([(now, device_id, action) for action, device_id in batch])
+            except Exception as e:
+                logger.warning(f"⚠️  [Interact] 记录互动日志失败: {e}")
+
+        logger.info(f"📦 [Interact] 组提交 {len(batch)} 个互动，生效 {len(applied)} 个")
+
+        # 状态已被本实例修改，缓存的快照失效；数值轨迹改变，重新预测状态跃迁
+        if applied:
+            cls._snapshot_cache.invalidate()
+            cls._track_events(cls.GLOBAL_PET_ID, states, now)
+
+    @classmethod
+    def _track_events(cls, pet_id: str, states: Dict[str, Dict[str, Any]], at: float):
+        """
+        数值轨迹改变后（互动、重置）重新预测下一次跨越分档阈值的时刻
+
+        预测需要快进，调用方不应持有写锁；预测失败只记日志，不影响请求
+        """
+        scheduler = cls.event_scheduler
+        if scheduler is None:
+            return
+        life_states = {name: state for name, state in states.items() if name != COOLDOWN_KEY}
+        try:
+            scheduler.track(pet_id, {"at": at, "states": life_states})
+        except Exception as e:
+            logger.warning(f"⚠️  [Events] 预测 {pet_id} 的状态跃迁失败: {e}")
+
+    @staticmethod
+    def _load_for_interaction(stepper: LifeStepper) -> Dict[str, Dict[str, Any]]:
+        """读取子系统状态和冷却记录（冷却记录与子系统状态同存同刷）"""
+        states = stepper.load()
+        states[COOLDOWN_KEY] = dict(stepper.life.state_manager.load(COOLDOWN_KEY) or {})
+        return states
+
+    @classmethod
+    def _reapply_effects(cls, life: Life, actions: List[str], cooldowns: Dict[str, float]):
+        """把已生效的互动效果及其冷却记录重新应用到当前状态（需持有写锁）"""
+        stepper = LifeStepper(life)
+        states = cls._load_for_interaction(stepper)
+        for action in actions:
+            apply_effect(states, cls._action_effects.effects[action])
+        states[COOLDOWN_KEY] = merge_cooldowns(states[COOLDOWN_KEY], cooldowns)
+        stepper.commit(states)
+
     def reset(self) -> Dict[str, Any]:
         """
         重置全局宠物状态
@@ -487,25 +1130,38 @@ class LifeAdapter:
         logger.warning(f"⚠️  [Reset] 全局宠物状态重置 by device={self.device_id}")
         
         life = self.get_life()
-        if life:
-            life.reset()
-
-        # 重新初始化全局元数据
-        self.__class__._global_metadata = {
-            "created_at": datetime.utcnow().isoformat(),
-            "pet_name": "小糖",
-            "global_pet_id": self.GLOBAL_PET_ID,
-            "shared_mode": True,
-        }
+        states = None
+        with self.__class__._life_rwlock.write_locked():
+            if life:
+                life.reset()
+                states = LifeStepper(life).load()
+                self.__class__._tick_clock.reset(time.time())
+                # 重置后的状态必须整体落盘
+                self.__class__._flush_tracker.forget()
+                self.__class__._pending_reapply.clear()
+                self.__class__._pending_watermark = None
 
+            # 重新初始化全局元数据
+            self.__class__._global_metadata = {
+                "created_at": datetime.utcnow().isoformat(),
+                "pet_name": "小糖",
+                "global_pet_id": self.GLOBAL_PET_ID,
+                "shared_mode": True,
+            }
+
+        # 状态已被本实例修改，缓存的快照失效；数值轨迹改变，重新预测状态跃迁
+        self.__class__._snapshot_cache.invalidate()
+        if states is not None:
+            self._track_events(self.GLOBAL_PET_ID, states, time.time())
         return self.get_state()
 
     def catchup(self, hours: int = 24) -> Dict[str, Any]:
         """
         快速补偿（用于离线恢复）
 
-        当用户离线多小时后，执行快速补偿来计算宠物的状态变化
-        利用延迟刷盘的性能优势，批量执行大量tick操作
+        将全局宠物推进 hours 小时的模拟时间（hours=720 即30天）。
+        使用快进引擎批量推进：代价取决于状态变化的平滑程度而不是时长，
+        30天补偿只需几百次tick，最后一次性刷盘
 
         Args:
             hours: 需要补偿的小时数（默认24小时）
@@ -514,19 +1170,48 @@ class LifeAdapter:
             更新后的宠物状态
         """
         life = self.get_life()
+        seconds = hours * 3600
+
+        start = time.perf_counter()
+        with self._locked_for_write(life):
+            # tick预算用尽时只补偿一部分，剩余时长交给常规补偿（见 _defer_remaining）
+            unadvanced = 0.0
 
-        # 批量执行tick（充分利用延迟刷盘的性能优势）
-        # 132倍性能提升意味着可以快速处理1440个tick
-        tick_count = hours
-        for _ in range(tick_count):
-            life.tick(dt=1.0)
+            def compensate():
+                nonlocal unadvanced
+                unadvanced = seconds - self._advance_life(life, seconds)
 
-        # 一次性刷盘到存储
-        if not life.state_manager.auto_flush:
-            life.flush()
+            compensate()
+            # 一次性刷盘到存储
+            self._flush(life, reapply=compensate)
+            self._defer_remaining(unadvanced)
 
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"⏩ [Catchup] 补偿 {hours} 小时，耗时 {elapsed_ms:.1f}ms")
+        if elapsed_ms > CATCHUP_BUDGET_MS:
+            logger.warning(f"⚠️  [Catchup] 耗时超出预算 {CATCHUP_BUDGET_MS:.0f}ms")
+
+        # 状态已被本实例修改，缓存的快照失效
+        self.__class__._snapshot_cache.invalidate()
         return self.get_state()
 
+    @classmethod
+    def _defer_remaining(cls, seconds: float):
+        """
+        把本次未补偿的时长交给后续请求：水位线后退seconds秒（需持有写锁）
+
+        write_behind模式下还有等待刷盘的水位线时直接调整它
+        """
+        if seconds <= 0:
+            return
+        logger.info(f"⏸️  [Catchup] tick预算用尽，剩余 {seconds:.0f} 秒由后续请求补偿")
+        if cls._pending_watermark is not None:
+            cls._pending_watermark -= seconds
+            return
+        watermark = cls._tick_clock.peek()
+        if watermark is not None:
+            cls._tick_clock.reset(watermark - seconds)
+
     @classmethod
     def cleanup_global(cls):
         """
@@ -537,5 +1222,212 @@ class LifeAdapter:
         with cls._global_life_lock:
             if cls._global_life:
                 logger.warning("⚠️  [Cleanup] 清理全局Life实例")
+                cls.shutdown()
                 cls._global_life = None
                 cls._global_metadata = {}
+                cls._tick_clock = None
+                cls._single_flight = None
+                cls._interaction_queue = None
+                cls._snapshot_cache.invalidate()
+                cls._flush_tracker.forget()
+                cls._pending_reapply.clear()
+                cls._pending_watermark = None
+            if cls._pet_registry is not None:
+                cls._pet_registry.clear()
+                cls._pet_registry = None
+            cls._lazy_pets = None
+
+    # ==================== 多宠物 ====================
+
+    @classmethod
+    def pet_registry(cls) -> PetRegistry:
+        """多宠物注册表（首次使用时创建）"""
+        if cls._pet_registry is None:
+            with cls._global_life_lock:
+                if cls._pet_registry is None:
+                    cls._pet_registry = PetRegistry(
+                        load=cls._load_pet,
+                        capacity=PET_REGISTRY_CAPACITY,
+                        on_evict=cls._evict_pet,
+                    )
+        return cls._pet_registry
+
+    @classmethod
+    def _create_pet_backend(cls, pet_id: str):
+        """
+        创建单只宠物的存储后端（命名空间 life_{pet_id}）
+
+        - Redis：构建在进程级连接池上（不PING、不新建客户端），与全局宠物相同的
+          布局和版本化写入
+        - 其他：所有宠物共用一个SQLite数据库（sqlite模式下与全局宠物共用），
+          不为每只宠物创建目录、打开文件
+        注册表中的宠物数量很大，不为每只宠物创建本地后备存储和熔断器
+        """
+        namespace = f"life_{pet_id}"
+        redis_url = os.getenv("REDIS_URL") or os.getenv("KV_REST_API_URL")
+        if redis_url and RedisStorage:
+            return create_redis_storage(
+                redis_url, namespace, ttl=86400 * 30, layout=REDIS_LAYOUT, versioned=VERSIONED_WRITES
+            )
+
+        if cls._pet_local_store is None:
+            with cls._global_life_lock:
+                if cls._pet_local_store is None:
+                    path = SQLITE_PATH if STORAGE_BACKEND == "sqlite" else "/tmp/life-pets/registry.db"
+                    cls._pet_local_store = SQLiteStorage(path)
+        return BatchedStorage(NamespacedStorage(cls._pet_local_store, namespace))
+
+    @classmethod
+    def _load_pet(cls, pet_id: str) -> PetSlot:
+        """注册表未命中时从存储加载宠物"""
+        backend = cls._create_pet_backend(pet_id)
+        slot = PetSlot(pet_id=pet_id, life=cls._new_life(backend), tick_clock=TickClock(backend))
+        logger.info(f"📥 [PetRegistry] 加载宠物 {pet_id}")
+        return slot
+
+    @classmethod
+    def _flush_pet(cls, slot: PetSlot, reapply: Optional[Callable[[], None]] = None) -> bool:
+        """
+        注册表中宠物的刷盘：与全局宠物相同的脏标记和版本冲突重试，
+        状态按宠物隔离（需持有slot.lock）
+        """
+        if reapply is not None:
+            slot.pending_reapply.append(reapply)
+        return cls._commit_flush(slot.life, slot.flush_tracker, slot.pending_reapply)
+
+    @classmethod
+    def _evict_pet(cls, pet_id: str, slot: PetSlot):
+        """淘汰前刷盘（等待该宠物进行中的请求完成）；持续冲突时抛出，宠物保留在注册表中"""
+        with slot.lock:
+            if not cls._flush_pet(slot):
+                raise RuntimeError(f"{pet_id} 持续版本冲突，未能刷盘")
+        logger.info(f"📤 [PetRegistry] 淘汰宠物 {pet_id}")
+
+    def _tick_pet(self, slot: PetSlot):
+        """补偿注册表中宠物自上次更新以来的时间并刷盘（需持有slot.lock）"""
+        # 其他实例写入过该宠物：先重新加载（保留本实例尚未落盘的修改）
+        if self._is_stale(slot.life):
+            self.__class__._cas_stats["stale_reloads"] += 1
+            self._rebase(slot.life, slot.flush_tracker, slot.pending_reapply)
+
+        # 本地存储（SQLite/mmap）：读取→推进→刷盘持有跨进程锁，不覆盖其他worker的写入
+        with self._local_transaction(slot.life, slot.flush_tracker, slot.pending_reapply):
+            now = time.time()
+            elapsed_seconds = slot.tick_clock.begin(now, min_elapsed=1.0)
+            if elapsed_seconds <= 0:
+                return
+            elapsed_seconds = min(elapsed_seconds, MAX_CATCHUP_SECONDS)
+            unadvanced = 0.0
+
+            def compensate():
+                nonlocal unadvanced
+                unadvanced = elapsed_seconds - self._advance_life(slot.life, elapsed_seconds)
+
+            try:
+                compensate()
+                flushed = self._flush_pet(slot, reapply=compensate)
+            except BaseException:
+                slot.tick_clock.abort()
+                raise
+            # 落盘后才推进水位线（只推进到实际补偿到的时刻）
+            self._settle_tick(
+                slot.life, slot.tick_clock, now - unadvanced, flushed, compensate,
+                slot.flush_tracker, slot.pending_reapply
+            )
+
+    def _pet_state(self, slot: PetSlot) -> Dict[str, Any]:
+        return self._format_state(
+            slot.life.get_states(),
+            slot.life.get_expression(),
+            pet_name="小糖",
+            ids={"pet_id": slot.pet_id},
+        )
+
+    @classmethod
+    def lazy_pets(cls) -> LazyPetEvaluator:
+        """多宠物惰性求值器（首次使用时创建）"""
+        if cls._lazy_pets is None:
+            with cls._global_life_lock:
+                if cls._lazy_pets is None:
+                    cls._lazy_pets = LazyPetEvaluator(
+                        backend=cls._create_lazy_backend(),
+                        life_factory=lambda: cls._new_life(MemoryStorage()),
+                        fast_forward=cls._fast_forward,
+                        max_seconds=MAX_CATCHUP_SECONDS,
+                        max_retries=CAS_MAX_RETRIES,
+                        on_change=cls._track_events,
+                    )
+        return cls._lazy_pets
+
+    @classmethod
+    def _create_lazy_backend(cls):
+        """
+        惰性求值的记录存储：所有宠物共用一个命名空间，一只宠物一个键
+
+        - Redis：life_pets:pet:{pet_id}，读取为一次GET；版本化写入时互动写回比较版本，
+          冲突时重新推算后重试（见 LazyPetEvaluator.update）
+        - sqlite模式：与全局宠物共用数据库
+        - 其他：/tmp 下的SQLite数据库（海量小记录不适合一键一文件）
+        """
+        redis_url = os.getenv("REDIS_URL") or os.getenv("KV_REST_API_URL")
+        if redis_url and RedisStorage:
+            return create_redis_storage(
+                redis_url, "life_pets", ttl=86400 * 30, versioned=VERSIONED_WRITES
+            )
+
+        path = SQLITE_PATH if STORAGE_BACKEND == "sqlite" else "/tmp/life-pets/pets.db"
+        # 互动在写事务内完成读-改-写，不需要按键记录版本（宠物数量很大）
+        return BatchedStorage(SQLiteStorage(path, track_versions=False))
+
+    def _get_pet_state(self) -> Dict[str, Any]:
+        """
+        指定宠物的当前状态
+
+        - registry模式：注册表中的常驻实例（未常驻时从存储加载）
+        - lazy模式：一次读取紧凑记录并推算到当前时刻，不写回（新宠物首次读取时写入初始记录）
+        """
+        if PET_MODE == "lazy":
+            life_states, expression = self.lazy_pets().materialize(self.pet_id)
+            return self._format_state(life_states, expression, pet_name="小糖", ids={"pet_id": self.pet_id})
+
+        slot = self.pet_registry().get(self.pet_id)
+        with slot.lock:
+            self._tick_pet(slot)
+            return self._pet_state(slot)
+
+    def _interact_pet(self, action: str) -> Dict[str, Any]:
+        """
+        与注册表中的宠物互动
+
+        同一宠物的请求由slot.lock串行，效果与全局宠物使用同一张互动效果表，
+        冷却记录保存在该宠物的状态中（按设备、互动计算），与效果一起写入
+        """
+        logger.info(f"🎮 [Interact] pet={self.pet_id}, device={self.device_id}, action={action}")
+
+        if PET_MODE == "lazy":
+            _, life_states, expression = self.lazy_pets().update(
+                self.pet_id,
+                lambda states: bool(self.__class__._action_effects.apply_batch(
+                    states, [(action, self.device_id)], now=time.time()
+                )),
+            )
+            return self._format_state(life_states, expression, pet_name="小糖", ids={"pet_id": self.pet_id})
+
+        slot = self.pet_registry().get(self.pet_id)
+        now = time.time()
+        with slot.lock, self._local_transaction(slot.life, slot.flush_tracker, slot.pending_reapply):
+            self._tick_pet(slot)
+            stepper = LifeStepper(slot.life)
+            states = self._load_for_interaction(stepper)
+            applied = self.__class__._action_effects.apply_batch(
+                states, [(action, self.device_id)], now=now
+            )
+            if applied:
+                stepper.commit(states)
+                cooldowns = states[COOLDOWN_KEY]
+                self._flush_pet(slot, reapply=lambda: self._reapply_effects(slot.life, applied, cooldowns))
+            pet_state = self._pet_state(slot)
+
+        if applied:
+            self._track_events(self.pet_id, states, now)
+        return pet_state
@@ -0,0 +1,349 @@
+"""内存映射存储 - 同一主机多个worker共享的本地存储后端
+
+背景：
+- Redis不可用时降级到 FileStorage("/tmp/life-global_pet")：每次刷盘重写JSON文件，
+  写到一半崩溃会留下损坏的文件，多个uvicorn worker之间也没有任何协调
+
+思路：
+- 所有状态放在一个固定布局的文件中，各进程mmap同一个文件
+- 文件头记录布局参数；之后是定长记录，每条记录对应一个键（rhythm/energy/tick_clock...）
+- 每条记录有两个缓冲区（双缓冲）和一个序号：
+  - 写入方：持有文件锁，把新内容写入非活动缓冲区，最后一次性推进序号
+  - 读取方：不加锁（seqlock）：读序号 → 拷贝活动缓冲区 → 再读序号，序号变化时重试
+- 写到一半崩溃只会留下写了一半的非活动缓冲区，活动缓冲区不受影响；
+  序号稳定但活动缓冲区校验失败（如断电时页面未完整落盘）时退回上一个缓冲区
+- 同一主机的worker之间没有版本校验：is_stale() 比较序号发现其他进程的写入，
+  读取→修改→刷盘期间持有 transaction()（见 LifeAdapter._locked_for_write）
+- 新文件先在临时文件中初始化并fsync，再原子地链接到目标路径（已存在时不覆盖）
+- save_many 在一次加锁内写完所有键，最后只msync一次
+
+记录布局（小端）：
+    seq:u64 | key_len:u16 | key:62B | 缓冲区0 | 缓冲区1
+    缓冲区 = length:u32 | crc32:u32 | payload（JSON）
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # 非POSIX平台只有进程内锁
+    fcntl = None
+
+try:
+    from core import StorageBackend as _StorageBackendBase
+except ImportError:
+    _StorageBackendBase = object
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"PETLIFE1"
+VERSION = 1
+
+_FILE_HEADER = struct.Struct("<8sIII")  # magic, version, record_count, record_size
+_FILE_HEADER_SIZE = 64
+_SEQ = struct.Struct("<Q")
+_KEY_LEN = struct.Struct("<H")
+_KEY_SIZE = 62
+_RECORD_HEADER_SIZE = _SEQ.size + _KEY_LEN.size + _KEY_SIZE  # 72
+_BUFFER_HEADER = struct.Struct("<II")  # length, crc32
+
+# 读取重试上限（超过说明写入方持续高频写入）
+_MAX_READ_RETRIES = 1000
+
+
+class MmapStorage(_StorageBackendBase):
+    """
+    基于内存映射文件的存储后端
+
+    Args:
+        path: 状态文件路径（目录不存在时自动创建）
+        record_count: 最多容纳的键数
+        record_size: 每条记录的字节数（单个状态的JSON不能超过约一半）
+        sync_writes: 写入后是否msync落盘（关闭后只保证进程间可见）
+    """
+
+    def __init__(
+        self,
+        path: str,
+        record_count: int = 64,
+        record_size: int = 4096,
+        sync_writes: bool = True
+    ):
+        self.path = path
+        self.sync_writes = sync_writes
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._index: Dict[str, int] = {}
+        # 本实例最近一次读到/写入的每个键的序号（用于发现其他进程的写入）
+        self._observed: Dict[str, int] = {}
+
+        if not os.path.exists(path):
+            self._create_file(path, record_count, record_size)
+
+        self._fd = os.open(path, os.O_RDWR)
+        header = os.pread(self._fd, _FILE_HEADER.size, 0)
+        magic, version, self.record_count, self.record_size = _FILE_HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            os.close(self._fd)
+            raise ValueError(f"not a pet state file: {path}")
+
+        self._buffer_size = (self.record_size - _RECORD_HEADER_SIZE) // 2
+        self.max_payload = self._buffer_size - _BUFFER_HEADER.size
+        self._mm = mmap.mmap(self._fd, _FILE_HEADER_SIZE + self.record_count * self.record_size)
+        self._scan_index()
+
+        # 观测指标
+        self.read_retries = 0
+        self.corrupt_reads = 0
+
+        logger.info(
+            f"✅ [MmapStorage] 状态文件已映射: {path} "
+            f"({self.record_count}条记录 × {self.record_size}B)"
+        )
+
+    # ==================== 文件初始化 ====================
+
+    @staticmethod
+    def _create_file(path: str, record_count: int, record_size: int) -> None:
+        """在临时文件中初始化布局，fsync后原子链接到目标路径（其他worker看不到半初始化的文件）"""
+        if record_size <= _RECORD_HEADER_SIZE + 2 * _BUFFER_HEADER.size:
+            raise ValueError(f"record_size too small: {record_size}")
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".state-")
+        try:
+            header = _FILE_HEADER.pack(MAGIC, VERSION, record_count, record_size)
+            os.write(fd, header.ljust(_FILE_HEADER_SIZE, b"\0"))
+            os.ftruncate(fd, _FILE_HEADER_SIZE + record_count * record_size)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        try:
+            # 已被其他worker创建时保留对方的文件
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+
+    # ==================== 锁 ====================
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        写入方互斥（进程内线程锁 + 跨进程文件锁），可重入
+
+        读-改-写操作（如tick水位线推进）应在同一个transaction内完成
+        """
+        with self._thread_lock:
+            if self._lock_depth == 0 and fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    # ==================== 记录定位 ====================
+
+    def _record_offset(self, index: int) -> int:
+        return _FILE_HEADER_SIZE + index * self.record_size
+
+    def _read_key(self, index: int) -> Optional[str]:
+        offset = self._record_offset(index) + _SEQ.size
+        (length,) = _KEY_LEN.unpack_from(self._mm, offset)
+        if length == 0:
+            return None
+        start = offset + _KEY_LEN.size
+        return bytes(self._mm[start:start + length]).decode("utf-8")
+
+    def _scan_index(self) -> None:
+        """重建 key → 记录序号 的索引（其他进程可能新增了键）"""
+        for index in range(self.record_count):
+            key = self._read_key(index)
+            if key is None:
+                break
+            self._index[key] = index
+
+    def _find(self, key: str) -> Optional[int]:
+        index = self._index.get(key)
+        if index is None:
+            self._scan_index()
+            index = self._index.get(key)
+        return index
+
+    def _allocate(self, key: str) -> int:
+        """为新键分配记录（需持有transaction）"""
+        index = self._find(key)
+        if index is not None:
+            return index
+
+        encoded = key.encode("utf-8")
+        if len(encoded) > _KEY_SIZE:
+            raise ValueError(f"key too long: {key}")
+
+        for index in range(self.record_count):
+            if self._read_key(index) is None:
+                offset = self._record_offset(index) + _SEQ.size
+                start = offset + _KEY_LEN.size
+                self._mm[start:start + len(encoded)] = encoded
+                # 键名写完后再写长度，读取方不会看到半个键名
+                _KEY_LEN.pack_into(self._mm, offset, len(encoded))
+                self._index[key] = index
+                return index
+
+        raise RuntimeError(f"state file is full ({self.record_count} records)")
+
+    # ==================== 读写 ====================
+
+    def _buffer_offset(self, index: int, buffer: int) -> int:
+        return self._record_offset(index) + _RECORD_HEADER_SIZE + buffer * self._buffer_size
+
+    def _read_buffer(self, index: int, buffer: int) -> Optional[bytes]:
+        """拷贝缓冲区内容，长度或校验和不符时返回None"""
+        offset = self._buffer_offset(index, buffer)
+        length, crc = _BUFFER_HEADER.unpack_from(self._mm, offset)
+        if length > self.max_payload:
+            return None
+        start = offset + _BUFFER_HEADER.size
+        payload = bytes(self._mm[start:start + length])
+        return payload if zlib.crc32(payload) == crc else None
+
+    def _read_record(self, index: int) -> Tuple[int, Optional[bytes]]:
+        """
+        seqlock读取：不加锁，序号变化时重试
+
+        Returns:
+            (序号, 内容)，记录从未写入时内容为None
+        """
+        seq_offset = self._record_offset(index)
+        for _ in range(_MAX_READ_RETRIES):
+            (seq,) = _SEQ.unpack_from(self._mm, seq_offset)
+            if seq == 0:
+                return 0, None
+
+            payload = self._read_buffer(index, seq % 2)
+            (seq_after,) = _SEQ.unpack_from(self._mm, seq_offset)
+            if seq_after != seq:
+                self.read_retries += 1
+                continue
+            if payload is not None:
+                return seq, payload
+            # 序号稳定时写入方只会写非活动缓冲区：活动缓冲区本身已损坏，重试没有意义
+            return self._recover_record(index)
+
+        raise RuntimeError(f"unstable record {index} in {self.path}")
+
+    def _recover_record(self, index: int) -> Tuple[int, Optional[bytes]]:
+        """活动缓冲区校验失败：加锁排除写入方后退回上一个缓冲区"""
+        with self.transaction():
+            (seq,) = _SEQ.unpack_from(self._mm, self._record_offset(index))
+            payload = self._read_buffer(index, seq % 2)
+            if payload is not None:
+                return seq, payload
+
+            self.corrupt_reads += 1
+            previous = self._read_buffer(index, (seq - 1) % 2) if seq > 1 else None
+            if previous is None:
+                logger.error(f"❌ [MmapStorage] 记录 {index} 的两个缓冲区都已损坏，按不存在处理: {self.path}")
+            else:
+                logger.warning(f"⚠️  [MmapStorage] 记录 {index} 校验失败，使用上一个版本: {self.path}")
+            return seq, previous
+
+    def _write_record(self, index: int, payload: bytes) -> int:
+        """写入非活动缓冲区，再推进序号发布（需持有transaction），返回新序号"""
+        if len(payload) > self.max_payload:
+            raise ValueError(f"state too large: {len(payload)} > {self.max_payload} bytes")
+
+        seq_offset = self._record_offset(index)
+        (seq,) = _SEQ.unpack_from(self._mm, seq_offset)
+        new_seq = seq + 1
+
+        offset = self._buffer_offset(index, new_seq % 2)
+        start = offset + _BUFFER_HEADER.size
+        self._mm[start:start + len(payload)] = payload
+        _BUFFER_HEADER.pack_into(self._mm, offset, len(payload), zlib.crc32(payload))
+        _SEQ.pack_into(self._mm, seq_offset, new_seq)
+        return new_seq
+
+    def _sync(self) -> None:
+        if self.sync_writes:
+            self._mm.flush()
+
+    # ==================== StorageBackend接口 ====================
+
+    def load(self, key: str) -> Dict[str, Any]:
+        index = self._find(key)
+        if index is None:
+            return {}
+        seq, payload = self._read_record(index)
+        self._observed[key] = seq
+        return json.loads(payload) if payload else {}
+
+    def save(self, key: str, state: Dict[str, Any]) -> None:
+        self.save_many({key: state})
+
+    def save_many(self, states: Dict[str, Dict[str, Any]]) -> None:
+        """一次加锁写完所有键，最后只msync一次"""
+        if not states:
+            return
+        encoded = {
+            key: json.dumps(state, separators=(',', ':')).encode("utf-8")
+            for key, state in states.items()
+        }
+        with self.transaction():
+            for key, payload in encoded.items():
+                self._observed[key] = self._write_record(self._allocate(key), payload)
+            self._sync()
+
+    def delete(self, key: str) -> None:
+        """清空键的内容（记录保留给该键复用）"""
+        with self.transaction():
+            index = self._find(key)
+            if index is not None:
+                self._observed[key] = self._write_record(index, b"")
+                self._sync()
+
+    def exists(self, key: str) -> bool:
+        index = self._find(key)
+        return index is not None and bool(self._read_record(index)[1])
+
+    def is_stale(self, prefix: str = "") -> bool:
+        """
+        其他进程是否写入过本实例读到/写入的键（只比较序号，不加锁）
+
+        Args:
+            prefix: 只检查以prefix开头的键（见 NamespacedStorage）
+
+        返回True时把当前序号记为已读：调用方随即从存储重新加载
+        """
+        stale = False
+        for key, seq in self._observed.items():
+            if not key.startswith(prefix):
+                continue
+            (current,) = _SEQ.unpack_from(self._mm, self._record_offset(self._index[key]))
+            if current != seq:
+                self._observed[key] = current
+                stale = True
+        return stale
+
+    def close(self) -> None:
+        self._mm.close()
+        os.close(self._fd)
+
+    def __repr__(self) -> str:
+        return f"<MmapStorage({self.path!r})>"
@@ -1,7 +1,7 @@
 """宠物行为适配器 - 将生命引擎适配为宠物行为"""
 
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
 import json
 
 
@@ -23,9 +23,25 @@ class PetAdapter:
     STATE_GRUMPY = "grumpy"
     STATE_SLEEPY = "sleepy"
 
+    # 每分钟的数值变化（MVP版本，不区分时间段）
+    ENERGY_PER_MINUTE = -0.1   # 每分钟消耗0.1
+    HUNGER_PER_MINUTE = 0.15   # 每分钟增加0.15
+    MOOD_PER_MINUTE = -0.05    # 每分钟减少0.05
+
+    # 状态判定阈值（见 _determine_state）
+    HUNGRY_THRESHOLD = 70        # 饥饿 >= 该值：hungry
+    TIRED_ENERGY_THRESHOLD = 30  # 能量 <= 该值：sleep / sleepy
+    SLEEPY_HUNGER_THRESHOLD = 50  # 能量低且饥饿 >= 该值：sleepy
+    GRUMPY_MOOD_THRESHOLD = 30   # 心情 <= 该值：grumpy
+    PLAY_THRESHOLD = 70          # 能量与心情都 >= 该值：play
+    BORED_ENERGY_THRESHOLD = 50  # 能量 <= 该值：bored
+
     # 全局宠物状态存储（MVP阶段）
     _pet_states: Dict[str, Dict] = {}
 
+    # 状态跃迁事件调度器（见 pet_events.PetEventScheduler；为None时不预测事件）
+    event_scheduler: Optional[Any] = None
+
     def __init__(self, device_id: str):
         self.device_id = device_id
         self._ensure_pet_exists()
@@ -42,6 +58,12 @@ class PetAdapter:
                 "last_updated": datetime.utcnow().isoformat(),
                 "pet_name": "小糖",
             }
+            self._track_events(self._pet_states[self.device_id])
+
+    def _track_events(self, state: Dict):
+        """数值轨迹变化后重新预测下一次状态跃迁"""
+        if self.event_scheduler is not None:
+            self.event_scheduler.track(self.device_id, state)
 
     def get_state(self) -> Dict:
         """获取宠物当前状态"""
@@ -64,9 +86,9 @@ class PetAdapter:
 
         # 简单的每分钟规则（MVP版本）
         # 这里应该根据时间段采用不同的速率
-        energy_change = delta_minutes * (-0.1)  # 每分钟消耗0.1
-        hunger_change = delta_minutes * 0.15    # 每分钟增加0.15
-        mood_change = delta_minutes * (-0.05)   # 每分钟减少0.05
+        energy_change = delta_minutes * self.ENERGY_PER_MINUTE
+        hunger_change = delta_minutes * self.HUNGER_PER_MINUTE
+        mood_change = delta_minutes * self.MOOD_PER_MINUTE
 
         state["energy"] = max(0, min(100, state["energy"] + energy_change))
         state["hunger"] = max(0, min(100, state["hunger"] + hunger_change))
@@ -81,31 +103,32 @@ class PetAdapter:
 
         return state
 
-    def _determine_state(self, state: Dict) -> str:
+    @classmethod
+    def _determine_state(cls, state: Dict) -> str:
         """根据数值确定宠物状态"""
         energy = state["energy"]
         hunger = state["hunger"]
         mood = state["mood"]
 
         # 优先级：饥饿 > 能量 > 心情
-        if hunger >= 70:
-            return self.STATE_HUNGRY
+        if hunger >= cls.HUNGRY_THRESHOLD:
+            return cls.STATE_HUNGRY
 
-        if energy <= 30:
-            if hunger >= 50:
-                return self.STATE_SLEEPY
-            return self.STATE_SLEEP
+        if energy <= cls.TIRED_ENERGY_THRESHOLD:
+            if hunger >= cls.SLEEPY_HUNGER_THRESHOLD:
+                return cls.STATE_SLEEPY
+            return cls.STATE_SLEEP
 
-        if mood <= 30:
-            return self.STATE_GRUMPY
+        if mood <= cls.GRUMPY_MOOD_THRESHOLD:
+            return cls.STATE_GRUMPY
 
-        if energy >= 70 and mood >= 70:
-            return self.STATE_PLAY
+        if energy >= cls.PLAY_THRESHOLD and mood >= cls.PLAY_THRESHOLD:
+            return cls.STATE_PLAY
 
-        if energy <= 50:
-            return self.STATE_BORED
+        if energy <= cls.BORED_ENERGY_THRESHOLD:
+            return cls.STATE_BORED
 
-        return self.STATE_IDLE
+        return cls.STATE_IDLE
 
     def interact(self, action: str) -> Dict:
         """宠物互动"""
@@ -130,6 +153,7 @@ class PetAdapter:
         state["current_state"] = self._determine_state(state)
 
         self._pet_states[self.device_id] = state
+        self._track_events(state)
 
         return state
 
@@ -144,4 +168,5 @@ class PetAdapter:
             "last_updated": datetime.utcnow().isoformat(),
             "pet_name": "小糖",
         }
+        self._track_events(self._pet_states[self.device_id])
         return self._pet_states[self.device_id]
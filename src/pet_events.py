@@ -0,0 +1,434 @@
+"""宠物事件调度 - 预测状态跃迁时刻，到点才触发（替代客户端轮询）
+
+背景：
+- 客户端轮询 /api/pet/status 来发现状态跃迁（饥饿 >= 70、能量 <= 30 等）
+- 服务端的代价是 宠物数 × 轮询频率，而绝大多数轮询什么都没变
+
+思路：
+- 两次互动之间宠物的数值轨迹是确定的，客户端看到的变化只发生在数值跨越分档阈值的时刻
+  → 可以预测下一次跨越的时刻：
+  - 接口使用的Life宠物（LifeAdapter）：能量/节律相位差的分档阈值与简化数值一致
+    （见 LifeAdapter._derive_simplified_state），在求值Life上快进找到第一次跨越的时刻
+    （见 LifeTransitionPredictor）
+  - PetAdapter：数值按固定速率线性变化，跨越时刻可以直接算出（见 predict_next_transition）
+- 每只宠物只登记下一次跃迁到分层时间轮（见 timing_wheel），到点触发回调
+  （推送/Webhook），再从跃迁后的状态预测下一次
+- 互动改变了数值轨迹：重新登记（时间轮中同一宠物的旧事件自动取消）；
+  LifeAdapter 的全局宠物组提交、多宠物互动与lazy模式的记录写回后都会重新登记
+- CPU开销与事件数成正比，与宠物数和轮询频率无关
+
+启动：LIFE_EVENTS_ENABLED=true 时由应用生命周期启动/停止（见 start_event_scheduler），
+配置了 LIFE_EVENTS_WEBHOOK_URL 时把事件POST到该地址，否则只记日志
+"""
+
+import bisect
+import copy
+import logging
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from src import life_adapter
+from src.fast_forward import FastForward, LifeStepper
+from src.lazy_pet import MemoryStorage
+from src.pet_adapter import PetAdapter
+from src.timing_wheel import HierarchicalTimingWheel
+
+logger = logging.getLogger(__name__)
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+# 事件调度配置（环境变量）
+# - LIFE_EVENTS_ENABLED: 是否在服务进程内启动事件调度（默认false）
+# - LIFE_EVENTS_WEBHOOK_URL: 事件Webhook地址（不配置时只记日志）
+# - LIFE_EVENTS_TICK: 时间轮精度秒数（默认1）
+# - LIFE_EVENTS_HORIZON: Life宠物最远预测多少秒（默认86400，更远的跨越在下次互动后再预测）
+# - LIFE_EVENTS_SCAN_STEP: Life宠物预测时的粗扫步长秒数（默认600，跨越后二分定位到1秒）
+EVENTS_ENABLED = os.getenv("LIFE_EVENTS_ENABLED", "false").lower() == "true"
+EVENTS_WEBHOOK_URL = os.getenv("LIFE_EVENTS_WEBHOOK_URL", "")
+EVENTS_TICK = float(os.getenv("LIFE_EVENTS_TICK", "1"))
+EVENTS_HORIZON = float(os.getenv("LIFE_EVENTS_HORIZON", "86400"))
+EVENTS_SCAN_STEP = float(os.getenv("LIFE_EVENTS_SCAN_STEP", "600"))
+
+# (字段, 每分钟变化, 该字段参与判定的阈值)
+_TRAJECTORIES = (
+    ("energy", PetAdapter.ENERGY_PER_MINUTE, (
+        PetAdapter.TIRED_ENERGY_THRESHOLD,
+        PetAdapter.BORED_ENERGY_THRESHOLD,
+        PetAdapter.PLAY_THRESHOLD,
+    )),
+    ("hunger", PetAdapter.HUNGER_PER_MINUTE, (
+        PetAdapter.SLEEPY_HUNGER_THRESHOLD,
+        PetAdapter.HUNGRY_THRESHOLD,
+    )),
+    ("mood", PetAdapter.MOOD_PER_MINUTE, (
+        PetAdapter.GRUMPY_MOOD_THRESHOLD,
+        PetAdapter.PLAY_THRESHOLD,
+    )),
+)
+
+
+@dataclass
+class PetEvent:
+    """一次状态跃迁"""
+    pet_id: str
+    from_state: str
+    to_state: str
+    at: float             # 跃迁时刻（Unix秒）
+    state: Dict[str, Any]  # 跃迁时刻的宠物状态（预测函数的输入格式，用于预测下一次）
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pet_id": self.pet_id,
+            "event": "state_changed",
+            "from_state": self.from_state,
+            "to_state": self.to_state,
+            "at": datetime.fromtimestamp(self.at, timezone.utc).replace(tzinfo=None).isoformat(),
+            "state": self.state,
+        }
+
+
+def _timestamp(value: Any) -> float:
+    """PetAdapter的ISO时间（UTC，无时区）或Unix秒 → Unix秒"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+
+
+def project_state(state: Dict[str, Any], at: float) -> Dict[str, Any]:
+    """按 PetAdapter._calculate_delta 的规则把状态推算到at时刻（不修改入参）"""
+    projected = dict(state)
+    minutes = max(0.0, (at - _timestamp(state["last_updated"])) / 60)
+    for field, rate, _ in _TRAJECTORIES:
+        projected[field] = max(0, min(100, state[field] + minutes * rate))
+    projected["last_updated"] = datetime.fromtimestamp(at, timezone.utc).replace(tzinfo=None).isoformat()
+    projected["current_state"] = PetAdapter._determine_state(projected)
+    return projected
+
+
+def predict_next_transition(state: Dict[str, Any]) -> Optional[PetEvent]:
+    """
+    预测下一次状态跃迁
+
+    候选时刻是每个数值穿过每个阈值的时刻（向上取整到秒，保证跃迁时阈值已越过），
+    按时间顺序找第一个使判定结果改变的候选；数值停在0/100后不再有跃迁时返回None
+    """
+    base = _timestamp(state["last_updated"])
+    current = PetAdapter._determine_state(state)
+
+    candidates: List[float] = []
+    for field, rate, thresholds in _TRAJECTORIES:
+        value = state[field]
+        for threshold in thresholds:
+            distance = threshold - value
+            # 只看沿变化方向还未到达的阈值（恰好在阈值上时，越过它才可能改变判定）
+            if rate > 0 and distance >= 0 or rate < 0 and distance <= 0:
+                seconds = distance / rate * 60
+                candidates.append(base + math.floor(seconds) + 1)
+
+    for at in sorted(set(candidates)):
+        projected = project_state(state, at)
+        if projected["current_state"] != current:
+            pet_id = state.get("pet_id") or state.get("device_id")
+            return PetEvent(pet_id, current, projected["current_state"], at, projected)
+    return None
+
+
+class LifeTransitionPredictor:
+    """
+    Life宠物的跃迁预测：能量/节律相位差第一次跨越分档阈值的时刻
+
+    在求值Life（每个线程一个，使用内存存储）上用快进引擎按粗扫步长推进，
+    分档改变后在该步内二分定位；粗扫步长内跨越后又回到原分档的短暂波动不报告
+
+    输入状态格式：{"pet_id": ..., "at": 状态对应的时刻（Unix秒）, "states": Life子系统状态}
+
+    Args:
+        life_factory: 创建求值Life实例的函数（应使用内存存储）
+        fast_forward: 快进引擎
+        energy_thresholds: 能量分档阈值（0-100，见 LifeAdapter.ENERGY_THRESHOLDS）
+        rhythm_thresholds: 节律相位差（绝对值）分档阈值（见 LifeAdapter.RHYTHM_THRESHOLDS）
+        horizon: 最远预测时长（秒）
+        scan_step: 粗扫步长（秒）
+        resolution: 二分定位的精度（秒）
+    """
+
+    def __init__(
+        self,
+        life_factory: Callable[[], Any],
+        fast_forward: FastForward,
+        energy_thresholds: Sequence[float],
+        rhythm_thresholds: Sequence[float],
+        horizon: float = 86400.0,
+        scan_step: float = 600.0,
+        resolution: float = 1.0
+    ):
+        self.life_factory = life_factory
+        self.fast_forward = fast_forward
+        self.energy_thresholds = tuple(sorted(energy_thresholds))
+        self.rhythm_thresholds = tuple(sorted(rhythm_thresholds))
+        self.horizon = horizon
+        self.scan_step = scan_step
+        self.resolution = resolution
+        self._local = threading.local()
+
+    def band(self, states: Dict[str, Dict[str, Any]]) -> Tuple[int, int]:
+        """
+        (能量分档, 相位差分档)
+
+        能量恰好等于阈值时归入上一档（简化数值用 energy < 阈值 判定），
+        相位差恰好等于阈值时归入下一档（用 phase_difference > 阈值 判定）
+        """
+        energy = float(states.get("energy", {}).get("energy", 0.0))
+        phase = abs(float(states.get("rhythm", {}).get("phase_difference", 0.0)))
+        return (
+            bisect.bisect_right(self.energy_thresholds, energy),
+            bisect.bisect_left(self.rhythm_thresholds, phase),
+        )
+
+    def label(self, band: Tuple[int, int]) -> str:
+        """分档的可读名称（如 energy 30-40, rhythm 0-0.2）"""
+        def bounds(thresholds, index, low, high):
+            lower = thresholds[index - 1] if index > 0 else low
+            upper = thresholds[index] if index < len(thresholds) else high
+            return f"{lower:g}-{upper:g}"
+        energy_band, rhythm_band = band
+        return (
+            f"energy {bounds(self.energy_thresholds, energy_band, 0, 100)}, "
+            f"rhythm {bounds(self.rhythm_thresholds, rhythm_band, 0, 0.5)}"
+        )
+
+    def _advance(self, states: Dict[str, Dict[str, Any]], seconds: float) -> Dict[str, Dict[str, Any]]:
+        stepper = getattr(self._local, "stepper", None)
+        if stepper is None:
+            stepper = LifeStepper(self.life_factory())
+            self._local.stepper = stepper
+        advanced, _ = self.fast_forward.advance_states(stepper.step, copy.deepcopy(states), seconds)
+        return advanced
+
+    def __call__(self, state: Dict[str, Any]) -> Optional[PetEvent]:
+        """预测下一次跨越分档阈值的时刻；horizon内不跨越时返回None"""
+        pet_id, base, states = state["pet_id"], float(state["at"]), state["states"]
+        current = self.band(states)
+
+        elapsed = 0.0
+        while elapsed < self.horizon:
+            step = min(self.scan_step, self.horizon - elapsed)
+            following = self._advance(states, step)
+            if self.band(following) != current:
+                # 跨越发生在 (elapsed, elapsed + step]：二分到 resolution 秒
+                low, high, crossed = 0.0, step, following
+                while high - low > self.resolution:
+                    middle = (low + high) / 2
+                    probe = self._advance(states, middle)
+                    if self.band(probe) != current:
+                        high, crossed = middle, probe
+                    else:
+                        low = middle
+                at = base + elapsed + high
+                return PetEvent(
+                    pet_id, self.label(current), self.label(self.band(crossed)), at,
+                    {"pet_id": pet_id, "at": at, "states": crossed},
+                )
+            states = following
+            elapsed += step
+        return None
+
+
+class PetEventScheduler:
+    """
+    宠物状态跃迁事件调度器
+
+    Args:
+        on_event: 事件回调（在调度线程中调用；异常只记日志）
+        tick: 时间轮精度（秒）
+        clock: 时钟函数（测试时可替换）
+        predict: 预测函数，输入带pet_id的宠物状态，返回下一次跃迁
+            （默认按 PetAdapter 规则，Life宠物见 LifeTransitionPredictor）
+    """
+
+    def __init__(
+        self,
+        on_event: Callable[[PetEvent], None],
+        tick: float = 1.0,
+        clock: Callable[[], float] = time.time,
+        predict: Callable[[Dict[str, Any]], Optional[PetEvent]] = predict_next_transition
+    ):
+        self.on_event = on_event
+        self.clock = clock
+        self.predict = predict
+        self._wheel = HierarchicalTimingWheel(start=clock(), tick=tick)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+        # 观测指标
+        self.scheduled = 0
+        self.fired = 0
+        self.failures = 0
+
+    def __len__(self) -> int:
+        return len(self._wheel)
+
+    def track(self, pet_id: str, state: Dict[str, Any]) -> Optional[PetEvent]:
+        """
+        登记（或重新登记）宠物的下一次跃迁；状态数值变化后（互动、重置）调用
+
+        Returns:
+            预测的下一次跃迁（没有跃迁时返回None并取消已登记的事件）
+        """
+        event = self.predict({**state, "pet_id": pet_id})
+        with self._lock:
+            if event is None:
+                self._wheel.cancel(pet_id)
+                return None
+            self._wheel.schedule(pet_id, event.at, event)
+            self.scheduled += 1
+        # 新事件可能早于调度线程正在等待的时刻：唤醒它重新计算
+        self._wakeup.set()
+        return event
+
+    def untrack(self, pet_id: str) -> None:
+        with self._lock:
+            self._wheel.cancel(pet_id)
+
+    def next_event(self, pet_id: str) -> Optional[PetEvent]:
+        with self._lock:
+            entry = self._wheel.get(pet_id)
+        return None if entry is None else entry.payload
+
+    def advance(self, now: Optional[float] = None) -> List[PetEvent]:
+        """
+        推进到now：触发到期事件，并从跃迁后的状态登记下一次跃迁
+
+        Returns:
+            本次触发的事件
+        """
+        now = self.clock() if now is None else now
+        with self._lock:
+            events = [entry.payload for entry in self._wheel.advance(now)]
+
+        # 在锁外预测（Life宠物的预测需要快进），期间被 track 重新登记过的宠物以新登记为准
+        followings = [self.predict(event.state) for event in events]
+        with self._lock:
+            for event, following in zip(events, followings):
+                if following is not None and self._wheel.get(event.pet_id) is None:
+                    self._wheel.schedule(event.pet_id, following.at, following)
+                    self.scheduled += 1
+
+        for event in events:
+            self.fired += 1
+            try:
+                self.on_event(event)
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"⚠️  [Events] 事件回调失败 ({event.pet_id} → {event.to_state}): {e}")
+        return events
+
+    def start(self) -> None:
+        """启动调度线程（休眠到下一个事件，不轮询宠物）"""
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="pet-events", daemon=True)
+        self._thread.start()
+        logger.info(f"✅ [Events] 事件调度已启动，精度={self._wheel.tick}秒")
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self.advance()
+            with self._lock:
+                deadline = self._wheel.next_deadline()
+            timeout = None if deadline is None else max(0.0, deadline - self.clock())
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+    def stop(self) -> None:
+        """停止调度线程"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        """事件调度指标"""
+        return {
+            "tracked": len(self._wheel),
+            "scheduled": self.scheduled,
+            "fired": self.fired,
+            "failures": self.failures,
+        }
+
+
+class WebhookNotifier:
+    """
+    把事件POST到Webhook（作为 PetEventScheduler 的回调）
+
+    Args:
+        url: Webhook地址
+        timeout: 请求超时（秒）
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        if requests is None:
+            raise RuntimeError("requests is required for WebhookNotifier (pip install requests)")
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, event: PetEvent) -> None:
+        response = requests.post(self.url, json=event.to_dict(), timeout=self.timeout)
+        response.raise_for_status()
+
+
+def log_event(event: PetEvent) -> None:
+    """默认回调：只记日志"""
+    logger.info(f"🔔 [Events] {event.pet_id}: {event.from_state} → {event.to_state}")
+
+
+def life_predictor() -> LifeTransitionPredictor:
+    """接口使用的Life宠物的预测器（引擎参数、快进器与分档阈值和 LifeAdapter 一致）"""
+    adapter = life_adapter.LifeAdapter
+    return LifeTransitionPredictor(
+        life_factory=lambda: adapter._new_life(MemoryStorage()),
+        fast_forward=adapter._fast_forward,
+        energy_thresholds=adapter.ENERGY_THRESHOLDS,
+        rhythm_thresholds=adapter.RHYTHM_THRESHOLDS,
+        horizon=EVENTS_HORIZON,
+        scan_step=EVENTS_SCAN_STEP,
+    )
+
+
+def start_event_scheduler() -> Optional[PetEventScheduler]:
+    """
+    在服务进程内启动事件调度（应用生命周期调用），并让 LifeAdapter 在互动后登记状态跃迁
+
+    未开启（LIFE_EVENTS_ENABLED）或生命引擎不可用时返回None
+    """
+    if not EVENTS_ENABLED:
+        return None
+    if not life_adapter.LIFE_ENGINE_AVAILABLE:
+        logger.warning("⚠️  [Events] micro-life-sim 未安装，事件调度未启动")
+        return None
+    on_event = WebhookNotifier(EVENTS_WEBHOOK_URL) if EVENTS_WEBHOOK_URL else log_event
+    scheduler = PetEventScheduler(on_event, tick=EVENTS_TICK, predict=life_predictor())
+    life_adapter.LifeAdapter.event_scheduler = scheduler
+    scheduler.start()
+    return scheduler
+
+
+def stop_event_scheduler(scheduler: Optional[PetEventScheduler]) -> None:
+    """停止事件调度，LifeAdapter 不再登记事件"""
+    if scheduler is None:
+        return
+    if life_adapter.LifeAdapter.event_scheduler is scheduler:
+        life_adapter.LifeAdapter.event_scheduler = None
+    scheduler.stop()
@@ -0,0 +1,159 @@
+"""宠物注册表 - 按宠物ID按需加载、LRU淘汰的实例缓存
+
+背景：
+- LifeAdapter 只有一个全局Life单例（global_pet）
+- 社区宠物/个人宠物阶段每个节点要服务大量宠物，不可能全部常驻内存
+
+思路：
+- 按宠物ID按需加载实例（Life + 存储后端），放入有界的LRU
+- 命中时移到最近使用端；超出容量时淘汰最久未使用的实例
+- 淘汰前先刷盘（flush-on-evict），刷盘失败的实例保留在注册表中，下次淘汰时重试
+- 同一宠物的并发加载只执行一次；不同宠物的加载互不阻塞
+- 刷盘、加载都在注册表锁之外执行，慢的存储调用不会阻塞其他宠物的命中
+
+常驻内存只与容量有关，与宠物总数无关；其余宠物的状态留在存储中
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class PetRegistry(Generic[T]):
+    """
+    有界LRU宠物实例注册表
+
+    Args:
+        load: 按宠物ID创建实例的函数（从存储加载状态）
+        capacity: 最多常驻的实例数
+        on_evict: 淘汰实例前调用（刷盘、关闭连接）；抛出异常时实例保留
+    """
+
+    def __init__(
+        self,
+        load: Callable[[str], T],
+        capacity: int = 1024,
+        on_evict: Optional[Callable[[str, T], None]] = None
+    ):
+        if capacity < 1:
+            raise ValueError(f"capacity must be positive: {capacity}")
+        self.load = load
+        self.capacity = capacity
+        self.on_evict = on_evict
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, T]" = OrderedDict()
+        # 正在加载的宠物ID → 加载锁（同一宠物只加载一次）
+        self._loading: Dict[str, threading.Lock] = {}
+
+        # 观测指标
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evict_failures = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, pet_id: str) -> bool:
+        return pet_id in self._entries
+
+    def get(self, pet_id: str) -> T:
+        """返回宠物实例，不在注册表中时加载"""
+        with self._lock:
+            entry = self._entries.get(pet_id)
+            if entry is not None:
+                self._entries.move_to_end(pet_id)
+                self.hits += 1
+                return entry
+            load_lock = self._loading.setdefault(pet_id, threading.Lock())
+
+        with load_lock:
+            # 等待期间其他线程可能已加载完成
+            with self._lock:
+                entry = self._entries.get(pet_id)
+                if entry is not None:
+                    self._entries.move_to_end(pet_id)
+                    self.hits += 1
+                    return entry
+
+            try:
+                entry = self.load(pet_id)
+            except BaseException:
+                with self._lock:
+                    self._loading.pop(pet_id, None)
+                raise
+
+            with self._lock:
+                self._loading.pop(pet_id, None)
+                self.misses += 1
+                self._entries[pet_id] = entry
+                victims = self._take_victims()
+
+        self._evict_all(victims)
+        return entry
+
+    def peek(self, pet_id: str) -> Optional[T]:
+        """返回常驻的实例（不加载、不更新LRU顺序）"""
+        return self._entries.get(pet_id)
+
+    def evict(self, pet_id: str) -> bool:
+        """主动淘汰一个宠物（先刷盘）；不在注册表中时返回False"""
+        with self._lock:
+            entry = self._entries.pop(pet_id, None)
+        if entry is None:
+            return False
+        return not self._evict_all([(pet_id, entry)])
+
+    def clear(self) -> int:
+        """淘汰所有实例（应用退出时调用），返回刷盘失败的实例数"""
+        with self._lock:
+            victims = list(self._entries.items())
+            self._entries.clear()
+        failed = self._evict_all(victims)
+        return len(failed)
+
+    def _take_victims(self) -> List[Tuple[str, T]]:
+        """取出超出容量的最久未使用实例（需持有锁）"""
+        victims = []
+        while len(self._entries) > self.capacity:
+            victims.append(self._entries.popitem(last=False))
+        return victims
+
+    def _evict_all(self, victims: List[Tuple[str, T]]) -> List[Tuple[str, T]]:
+        """逐个刷盘淘汰；失败的实例放回最久未使用端，返回失败列表"""
+        failed = []
+        for pet_id, entry in victims:
+            try:
+                if self.on_evict is not None:
+                    self.on_evict(pet_id, entry)
+                self.evictions += 1
+            except Exception as e:
+                self.evict_failures += 1
+                failed.append((pet_id, entry))
+                logger.warning(f"⚠️  [PetRegistry] 淘汰 {pet_id} 前刷盘失败，保留在内存中: {e}")
+
+        if failed:
+            with self._lock:
+                for pet_id, entry in failed:
+                    # 期间被重新加载过则以新实例为准
+                    if pet_id not in self._entries:
+                        self._entries[pet_id] = entry
+                        self._entries.move_to_end(pet_id, last=False)
+        return failed
+
+    def stats(self) -> Dict[str, Any]:
+        """注册表指标"""
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "evict_failures": self.evict_failures,
+        }
@@ -0,0 +1,157 @@
+"""Redis连接池 - 跨请求、跨热启动复用Redis连接
+
+背景：
+- RedisStorage 自己创建客户端，没有连接池大小、保活、健康检查和重连策略
+- Vercel实例冻结/解冻后，池里的socket可能已被服务端或NAT断开，
+  下一次请求直接失败（初始化阶段还会整体降级到/tmp文件存储）
+
+思路：
+- 每个Redis URL在进程内只创建一个连接池（模块级缓存），热启动直接复用，
+  不重复TCP/TLS握手
+- TCP keepalive 让空闲连接不被中间设备静默回收
+- health_check_interval：连接空闲超过该时长，使用前先PING，
+  发现断开则在池内透明重连
+- 连接错误/超时按指数退避重试，调用方感知不到一次性的断线
+
+配置（环境变量）：
+- LIFE_REDIS_POOL_SIZE: 连接池上限（默认16，应不小于引擎线程数）
+- LIFE_REDIS_HEALTH_CHECK_SECONDS: 健康检查间隔（默认30）
+- LIFE_REDIS_SOCKET_TIMEOUT: 读写超时秒数（默认5）
+- LIFE_REDIS_CONNECT_TIMEOUT: 建连超时秒数（默认5）
+- LIFE_REDIS_RETRIES: 连接错误重试次数（默认3）
+- LIFE_REDIS_PROBE_TIMEOUT: 故障探测的建连/读写超时秒数（默认0.5，不重试）
+"""
+
+import logging
+import os
+import socket
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+    from redis.backoff import ExponentialBackoff, NoBackoff
+    from redis.retry import Retry
+except ImportError:
+    redis = None
+
+
+@dataclass(frozen=True)
+class RedisPoolConfig:
+    """连接池参数"""
+    max_connections: int = 16
+    health_check_interval: int = 30
+    socket_timeout: float = 5.0
+    socket_connect_timeout: float = 5.0
+    retries: int = 3
+    probe_timeout: float = 0.5
+
+    @classmethod
+    def from_env(cls) -> "RedisPoolConfig":
+        """根据环境变量创建配置"""
+        return cls(
+            max_connections=int(os.getenv("LIFE_REDIS_POOL_SIZE", "16")),
+            health_check_interval=int(os.getenv("LIFE_REDIS_HEALTH_CHECK_SECONDS", "30")),
+            socket_timeout=float(os.getenv("LIFE_REDIS_SOCKET_TIMEOUT", "5")),
+            socket_connect_timeout=float(os.getenv("LIFE_REDIS_CONNECT_TIMEOUT", "5")),
+            retries=int(os.getenv("LIFE_REDIS_RETRIES", "3")),
+            probe_timeout=float(os.getenv("LIFE_REDIS_PROBE_TIMEOUT", "0.5")),
+        )
+
+
+def _keepalive_options() -> Dict[int, int]:
+    """TCP keepalive参数（平台不支持的选项跳过）"""
+    options = {}
+    for name, value in (("TCP_KEEPIDLE", 60), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 3)):
+        if hasattr(socket, name):
+            options[getattr(socket, name)] = value
+    return options
+
+
+# 进程内缓存：redis_url -> 客户端（热启动时复用）
+_clients: Dict[str, Any] = {}
+_probe_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+
+
+def get_redis_client(redis_url: str, config: Optional[RedisPoolConfig] = None) -> Any:
+    """
+    获取redis_url对应的池化客户端（同一进程内同一URL只创建一次）
+
+    Raises:
+        RuntimeError: 未安装redis包
+    """
+    if redis is None:
+        raise RuntimeError("redis package is not installed")
+
+    client = _clients.get(redis_url)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(redis_url)
+        if client is not None:
+            return client
+
+        config = config or RedisPoolConfig.from_env()
+        pool = redis.ConnectionPool.from_url(
+            redis_url,
+            decode_responses=True,
+            max_connections=config.max_connections,
+            health_check_interval=config.health_check_interval,
+            socket_timeout=config.socket_timeout,
+            socket_connect_timeout=config.socket_connect_timeout,
+            socket_keepalive=True,
+            socket_keepalive_options=_keepalive_options(),
+            # 重试策略属于连接参数：池中每个连接断线时各自重连重试
+            retry=Retry(ExponentialBackoff(cap=1.0, base=0.05), config.retries),
+            retry_on_error=[redis.ConnectionError, redis.TimeoutError],
+        )
+        client = redis.Redis(connection_pool=pool)
+        _clients[redis_url] = client
+        logger.info(
+            f"✅ [RedisPool] 连接池已创建: max_connections={config.max_connections}, "
+            f"health_check={config.health_check_interval}s, retries={config.retries}"
+        )
+        return client
+
+
+def get_probe_client(redis_url: str, config: Optional[RedisPoolConfig] = None) -> Any:
+    """
+    获取redis_url对应的故障探测客户端：单连接、短超时、不重试
+
+    探测只需要尽快知道Redis是否可达；业务连接池的超时与重试
+    （默认5秒 × 3次）会让一次探测卡住十几秒
+
+    Raises:
+        RuntimeError: 未安装redis包
+    """
+    if redis is None:
+        raise RuntimeError("redis package is not installed")
+
+    with _clients_lock:
+        client = _probe_clients.get(redis_url)
+        if client is None:
+            config = config or RedisPoolConfig.from_env()
+            client = redis.Redis.from_url(
+                redis_url,
+                decode_responses=True,
+                max_connections=1,
+                socket_timeout=config.probe_timeout,
+                socket_connect_timeout=config.probe_timeout,
+                retry=Retry(NoBackoff(), 0),
+            )
+            _probe_clients[redis_url] = client
+        return client
+
+
+def close_redis_clients() -> None:
+    """断开所有池化连接（应用退出时调用）"""
+    with _clients_lock:
+        for client in list(_clients.values()) + list(_probe_clients.values()):
+            client.connection_pool.disconnect()
+        _clients.clear()
+        _probe_clients.clear()
@@ -0,0 +1,51 @@
+"""读写锁 - 共享Life实例的并发模型
+
+- 读操作（构建状态快照）可以并行
+- 写操作（tick补偿、互动、刷盘、重置）互斥，且与读操作互斥
+- 写优先：有写者等待时新的读者排队，避免持续轮询饿死写者
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class RWLock:
+    """写优先的读写锁（不可重入）"""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read_locked(self) -> Iterator[None]:
+        """获取读锁（与其他读者共享）"""
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write_locked(self) -> Iterator[None]:
+        """获取写锁（独占）"""
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
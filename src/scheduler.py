@@ -0,0 +1,379 @@
+"""分片调度器 - 多进程定时推进大量宠物
+
+背景：
+- 路线图中的定时任务要定期推进所有社区/个人宠物
+- 现有唯一的批量推进入口是 LifeAdapter.catchup（只针对全局宠物）
+- lazy模式下每只宠物只有一条紧凑记录，读取时才推算（见 lazy_pet）：
+  长时间无人访问的宠物，下一次读取要推算整段空闲时长
+- 单进程受GIL限制，只能用一个核
+
+思路：
+- 一致性哈希把宠物ID划分到固定数量的分片：分片数变化时只有约1/N的宠物换分片，
+  同一宠物总是由同一个分片（同一个worker）推进
+- 每轮把各分片提交到进程池，worker中逐只宠物：读取记录 → 用Life的更新规则（快进引擎）
+  推算到本轮时刻 → 写回；写回与互动走同一条路径（见 LazyPetEvaluator.advance）：
+  - 版本化的Redis后端比较版本，其他实例（互动、其他分片）先写入时重新读取、推算后重试
+  - SQLite后端在写事务内完成读-改-写
+- 格式不对的记录跳过并记录日志，不影响分片内的其他宠物
+- 存储客户端不能跨进程传递：传入可pickle的存储工厂函数，每个worker进程创建一次
+- 每个分片记录延迟（本轮计划时刻 → 写回完成）与推进前的最大陈旧时长，用于扩容判断
+
+记录的来源与启动方式：
+- lazy模式（LIFE_PET_MODE=lazy）下 /api/pets/{pet_id} 的读取与互动写入记录，
+  键为 pet:{pet_id}（存储见 LifeAdapter._create_lazy_backend）
+- 每轮推进的宠物ID取自存储中已有的记录（见 stored_pet_ids）
+- registry模式的宠物常驻内存、访问时推进，不由本调度器推进
+- 服务进程内：LIFE_SCHEDULER_ENABLED=true 时由应用生命周期启动/停止（Serverless部署不适用）
+- 独立任务：python -m src.scheduler（常驻进程，Ctrl+C退出）
+"""
+
+import bisect
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from src import life_adapter
+from src.lazy_pet import RECORD_KEY_PREFIX, LazyPetEvaluator, MemoryStorage
+
+logger = logging.getLogger(__name__)
+
+# 定时批量推进配置（环境变量）
+# - LIFE_SCHEDULER_ENABLED: 是否在服务进程内启动定时批量推进（默认false）
+# - LIFE_SCHEDULER_INTERVAL: 推进间隔秒数（默认60）
+# - LIFE_SCHEDULER_SHARDS: 分片数（默认16）
+# - LIFE_SCHEDULER_WORKERS: 进程数（默认0，即CPU核数）
+SCHEDULER_ENABLED = os.getenv("LIFE_SCHEDULER_ENABLED", "false").lower() == "true"
+SCHEDULER_INTERVAL = float(os.getenv("LIFE_SCHEDULER_INTERVAL", "60"))
+SCHEDULER_SHARDS = int(os.getenv("LIFE_SCHEDULER_SHARDS", "16"))
+SCHEDULER_WORKERS = int(os.getenv("LIFE_SCHEDULER_WORKERS", "0"))
+
+# worker进程内缓存的存储后端与求值器（按进程号和工厂函数区分：fork出的子进程不复用父进程的连接）
+_worker_storages: Dict[Tuple[int, Callable[[], Any]], Any] = {}
+_worker_evaluators: Dict[Tuple[int, Callable[[], Any], Callable[[], Any]], LazyPetEvaluator] = {}
+
+
+class ConsistentHashRing:
+    """
+    一致性哈希环
+
+    Args:
+        shards: 分片数
+        replicas: 每个分片在环上的虚拟节点数（越多分布越均匀）
+    """
+
+    def __init__(self, shards: int, replicas: int = 64):
+        if shards < 1:
+            raise ValueError(f"shards must be positive: {shards}")
+        self.shards = shards
+        points = sorted(
+            (self._hash(f"shard-{shard}#{replica}"), shard)
+            for shard in range(shards)
+            for replica in range(replicas)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        # 不使用内置hash()：进程间随机化，不同worker的结果会不一致
+        return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+    def shard_for(self, pet_id: str) -> int:
+        index = bisect.bisect(self._points, self._hash(pet_id)) % len(self._points)
+        return self._owners[index]
+
+    def partition(self, pet_ids: Iterable[str]) -> Dict[int, List[str]]:
+        """把宠物ID按分片分组（没有宠物的分片不出现在结果中）"""
+        shards: Dict[int, List[str]] = {}
+        for pet_id in pet_ids:
+            shards.setdefault(self.shard_for(pet_id), []).append(pet_id)
+        return shards
+
+
+@dataclass
+class ShardResult:
+    """一个分片一轮推进的结果（worker返回给调度器，需可pickle）"""
+    shard: int
+    pets: int = 0            # 分片内的宠物数
+    advanced: int = 0        # 实际推进的宠物数
+    written: int = 0         # 写回的记录数
+    skipped: int = 0         # 跳过的宠物数（记录格式不对、已删除或持续版本冲突）
+    max_staleness: float = 0.0  # 推进前最旧的记录距本轮时刻的秒数
+    started_at: float = 0.0
+    finished_at: float = 0.0
+    error: Optional[str] = None
+
+
+def default_storage() -> Any:
+    """默认存储工厂：lazy模式的接口读写的同一存储（见 LifeAdapter._create_lazy_backend）"""
+    return life_adapter.LifeAdapter._create_lazy_backend()
+
+
+def default_life() -> Any:
+    """默认的求值Life工厂：与lazy模式的接口相同（引擎参数一致，使用内存存储）"""
+    return life_adapter.LifeAdapter._new_life(MemoryStorage())
+
+
+def _worker_storage(storage_factory: Callable[[], Any]) -> Any:
+    key = (os.getpid(), storage_factory)
+    storage = _worker_storages.get(key)
+    if storage is None:
+        storage = storage_factory()
+        _worker_storages[key] = storage
+    return storage
+
+
+def _worker_evaluator(storage_factory: Callable[[], Any], life_factory: Callable[[], Any]) -> LazyPetEvaluator:
+    """worker进程内的求值器（参数与 LifeAdapter.lazy_pets 一致）"""
+    key = (os.getpid(), storage_factory, life_factory)
+    evaluator = _worker_evaluators.get(key)
+    if evaluator is None:
+        evaluator = LazyPetEvaluator(
+            backend=_worker_storage(storage_factory),
+            life_factory=life_factory,
+            fast_forward=life_adapter.LifeAdapter._fast_forward,
+            max_seconds=life_adapter.MAX_CATCHUP_SECONDS,
+            max_retries=life_adapter.CAS_MAX_RETRIES,
+        )
+        _worker_evaluators[key] = evaluator
+    return evaluator
+
+
+def stored_pet_ids(storage: Any) -> List[str]:
+    """存储中已有记录的宠物ID（存储需提供 keys(prefix)）"""
+    return [key[len(RECORD_KEY_PREFIX):] for key in storage.keys(RECORD_KEY_PREFIX)]
+
+
+def advance_shard(
+    storage_factory: Callable[[], Any],
+    shard: int,
+    pet_ids: List[str],
+    now: float,
+    life_factory: Callable[[], Any] = default_life
+) -> ShardResult:
+    """
+    在worker进程中推进一个分片：逐只宠物推算到now并比较版本写回（冲突时重试）
+
+    没有记录（已删除）、记录格式不对或持续版本冲突的宠物跳过并记录日志，
+    不影响分片内的其他宠物；不为没有记录的宠物创建记录（由接口的首次读取写入）
+    """
+    result = ShardResult(shard=shard, pets=len(pet_ids), started_at=time.time())
+    try:
+        evaluator = _worker_evaluator(storage_factory, life_factory)
+        for pet_id in pet_ids:
+            try:
+                staleness = evaluator.advance(pet_id, now)
+            except Exception as e:
+                result.skipped += 1
+                logger.warning(f"⚠️  [Scheduler] 跳过宠物 {pet_id}: {type(e).__name__}: {e}")
+                continue
+            result.written += 1
+            if staleness > 0:
+                result.advanced += 1
+            result.max_staleness = max(result.max_staleness, staleness)
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.finished_at = time.time()
+    return result
+
+
+class ShardedScheduler:
+    """
+    按分片定时推进宠物
+
+    Args:
+        pet_ids: 返回当前所有宠物ID的函数（每轮调用一次）
+        storage_factory: 创建存储后端的函数（可pickle的模块级函数，每个worker进程调用一次；
+            默认见 default_storage）
+        life_factory: 创建求值Life实例的函数（可pickle，默认见 default_life）
+        shards: 分片数（应不少于worker数，便于之后扩容）
+        workers: 进程数（默认CPU核数）
+        interval: 定时推进的间隔（秒）
+        executor: 自定义执行器（默认 ProcessPoolExecutor）
+    """
+
+    def __init__(
+        self,
+        pet_ids: Callable[[], Iterable[str]],
+        storage_factory: Callable[[], Any] = default_storage,
+        life_factory: Callable[[], Any] = default_life,
+        shards: int = 16,
+        workers: Optional[int] = None,
+        interval: float = 60.0,
+        executor: Optional[Executor] = None
+    ):
+        self.pet_ids = pet_ids
+        self.storage_factory = storage_factory
+        self.life_factory = life_factory
+        self.ring = ConsistentHashRing(shards)
+        self.workers = workers or os.cpu_count() or 1
+        self.interval = interval
+        self._executor = executor
+        self._owns_executor = executor is None
+
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # 观测指标
+        self.rounds = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_results: Dict[int, ShardResult] = {}
+        self.lag: Dict[int, float] = {}  # 分片 → 最近一轮的延迟（秒）
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def run_once(self, now: Optional[float] = None) -> List[ShardResult]:
+        """
+        推进一轮：所有分片并行推进到now
+
+        Returns:
+            各分片的结果
+        """
+        scheduled_at = time.time() if now is None else now
+        partitions = self.ring.partition(self.pet_ids())
+        executor = self._get_executor()
+
+        futures = [
+            executor.submit(advance_shard, self.storage_factory, shard, pet_ids, scheduled_at, self.life_factory)
+            for shard, pet_ids in sorted(partitions.items())
+        ]
+        results = [future.result() for future in futures]
+
+        self.rounds += 1
+        for result in results:
+            self.last_results[result.shard] = result
+            self.lag[result.shard] = max(0.0, result.finished_at - scheduled_at)
+            if result.error:
+                self.failures += 1
+                logger.warning(f"⚠️  [Scheduler] 分片 {result.shard} 推进失败: {result.error}")
+
+        total = sum(result.written for result in results)
+        skipped = sum(result.skipped for result in results)
+        self.skipped += skipped
+        worst = max(self.lag.values(), default=0.0)
+        logger.info(
+            f"🗓️  [Scheduler] 第{self.rounds}轮: {len(results)}个分片, 写回 {total} 只宠物, "
+            f"跳过 {skipped} 只, 最大延迟 {worst * 1000:.0f}ms"
+        )
+        return results
+
+    def start(self) -> None:
+        """启动定时推进线程"""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="pet-scheduler", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"✅ [Scheduler] 已启动: {self.ring.shards}个分片, {self.workers}个进程, "
+            f"间隔={self.interval:.0f}秒"
+        )
+
+    def _run(self) -> None:
+        next_run = time.time()
+        while not self._stopping.is_set():
+            try:
+                self.run_once(next_run)
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"⚠️  [Scheduler] 本轮推进失败: {e}")
+            next_run += self.interval
+            # 落后超过一轮时跳过错过的轮次（下一轮会一次推进整段时长）
+            now = time.time()
+            if next_run < now:
+                next_run = now
+            self._stopping.wait(max(0.0, next_run - now))
+
+    def stop(self) -> None:
+        """停止定时推进线程并关闭进程池"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+            self._thread = None
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        """调度指标（含各分片延迟）"""
+        return {
+            "shards": self.ring.shards,
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "lag_seconds": {shard: round(lag, 3) for shard, lag in sorted(self.lag.items())},
+            "max_lag_seconds": round(max(self.lag.values(), default=0.0), 3),
+        }
+
+
+def create_scheduler(
+    storage_factory: Callable[[], Any] = default_storage,
+    life_factory: Callable[[], Any] = default_life
+) -> ShardedScheduler:
+    """按环境变量创建调度器：每轮推进存储中已有记录的所有宠物"""
+    storage = _worker_storage(storage_factory)
+    return ShardedScheduler(
+        lambda: stored_pet_ids(storage),
+        storage_factory,
+        life_factory,
+        shards=SCHEDULER_SHARDS,
+        workers=SCHEDULER_WORKERS or None,
+        interval=SCHEDULER_INTERVAL,
+    )
+
+
+def _unavailable_reason() -> Optional[str]:
+    """默认配置下无法推进的原因（可以推进时返回None）"""
+    if life_adapter.PET_MODE != "lazy":
+        return "只有lazy模式（LIFE_PET_MODE=lazy）的宠物记录需要定时推进"
+    if not life_adapter.LIFE_ENGINE_AVAILABLE:
+        return "micro-life-sim 未安装"
+    return None
+
+
+def start_scheduler() -> Optional[ShardedScheduler]:
+    """
+    在服务进程内启动定时批量推进（应用生命周期调用）
+
+    未开启（LIFE_SCHEDULER_ENABLED）、不是lazy模式或生命引擎不可用时返回None
+    """
+    if not SCHEDULER_ENABLED:
+        return None
+    reason = _unavailable_reason()
+    if reason:
+        logger.warning(f"⚠️  [Scheduler] {reason}，定时批量推进未启动")
+        return None
+    scheduler = create_scheduler()
+    scheduler.start()
+    return scheduler
+
+
+def main() -> None:
+    """作为独立任务运行定时批量推进（python -m src.scheduler）"""
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    reason = _unavailable_reason()
+    if reason:
+        raise SystemExit(reason)
+    scheduler = create_scheduler()
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
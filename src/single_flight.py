@@ -0,0 +1,195 @@
+"""单飞锁 - 跨Serverless实例的补偿去重
+
+背景：
+- 全局宠物空闲一段时间后，落在不同实例上的一批 /api/pet/status 请求
+  会同时执行补偿，并在 life.flush() 上互相覆盖
+
+思路（single-flight）：
+- 大段补偿开始前先获取存储后端上的租约锁，锁值是单调递增的fencing token
+- 持锁实例（leader）完成补偿、刷盘，并把状态快照发布到存储后端
+- 其他实例（follower）短暂等待锁释放，然后直接返回leader发布的快照
+- 快照带有构建时的tick水位线：follower只接受不早于其等待目标的快照，
+  不会拿到以前某次补偿发布的旧快照（快照TTL与状态相同，可能很旧）
+- 发布快照时校验fencing token：租约过期后被新leader取代的旧leader无法
+  覆盖更新的快照
+
+原子性：
+- Redis后端：Lua脚本实现 加锁+发号 / 校验释放 / 校验发布
+- 其他后端：进程内锁（单进程部署足够）
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 存储后端中的键名（与rhythm/energy并列）
+LOCK_KEY = "catchup_lock"
+FENCE_KEY = "catchup_fence"
+SNAPSHOT_KEY = "snapshot"
+
+# 等待锁释放时的轮询间隔（秒）
+_POLL_INTERVAL = 0.02
+
+# 加锁成功后发放fencing token（KEYS: lock, fence；ARGV: lease_ms）
+_ACQUIRE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return false
+end
+local token = redis.call('INCR', KEYS[2])
+redis.call('SET', KEYS[1], token, 'PX', ARGV[1])
+return token
+"""
+
+# 仅当锁仍属于该token时释放（KEYS: lock；ARGV: token）
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# 仅当该token仍是最新发放的token时发布快照（KEYS: fence, snapshot；ARGV: token, payload, ttl）
+_PUBLISH_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+local ttl = tonumber(ARGV[3])
+if ttl > 0 then
+    redis.call('SET', KEYS[2], ARGV[2], 'EX', ttl)
+else
+    redis.call('SET', KEYS[2], ARGV[2])
+end
+return 1
+"""
+
+
+class SingleFlight:
+    """
+    存储后端上的补偿单飞锁
+
+    Args:
+        backend: micro-life-sim的存储后端（RedisStorage / FileStorage）
+        lease_ms: 锁租约时长（毫秒），leader崩溃时到期自动释放
+    """
+
+    def __init__(self, backend: Any, lease_ms: int = 5000):
+        self.backend = backend
+        self.lease_ms = lease_ms
+
+        client = getattr(backend, "client", None)
+        key_prefix = getattr(backend, "key_prefix", None)
+        if client is not None and key_prefix is not None:
+            self._redis = client
+            self._lock_key = f"{key_prefix}:{LOCK_KEY}"
+            self._fence_key = f"{key_prefix}:{FENCE_KEY}"
+            self._snapshot_key = f"{key_prefix}:{SNAPSHOT_KEY}"
+            self._acquire_script = client.register_script(_ACQUIRE_SCRIPT)
+            self._release_script = client.register_script(_RELEASE_SCRIPT)
+            self._publish_script = client.register_script(_PUBLISH_SCRIPT)
+        else:
+            self._redis = None
+            self._local_lock = threading.Lock()
+            self._local_fence = 0
+            self._local_snapshot: Optional[Dict[str, Any]] = None
+
+    def acquire(self) -> Optional[int]:
+        """
+        尝试获取锁（不阻塞）
+
+        Returns:
+            成功时返回fencing token，锁被占用时返回None
+        """
+        if self._redis is not None:
+            token = self._acquire_script(
+                keys=[self._lock_key, self._fence_key],
+                args=[self.lease_ms]
+            )
+            return int(token) if token else None
+
+        if not self._local_lock.acquire(blocking=False):
+            return None
+        self._local_fence += 1
+        return self._local_fence
+
+    def release(self, token: int) -> None:
+        """释放锁（锁已过期并被他人获取时不做任何事）"""
+        if self._redis is not None:
+            self._release_script(keys=[self._lock_key], args=[token])
+            return
+
+        if token == self._local_fence and self._local_lock.locked():
+            self._local_lock.release()
+
+    def wait(self, timeout: float) -> bool:
+        """
+        等待当前leader释放锁
+
+        Returns:
+            在超时前释放返回True
+        """
+        if self._redis is not None:
+            deadline = time.monotonic() + timeout
+            while self._redis.exists(self._lock_key):
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(_POLL_INTERVAL)
+            return True
+
+        if self._local_lock.acquire(timeout=timeout):
+            self._local_lock.release()
+            return True
+        return False
+
+    def publish(self, token: int, snapshot: Dict[str, Any], watermark: Optional[float]) -> bool:
+        """
+        发布状态快照（fencing token过期时拒绝）
+
+        Args:
+            watermark: 快照构建时的tick水位线
+
+        Returns:
+            是否发布成功
+        """
+        record = {"watermark": watermark, "state": snapshot}
+        if self._redis is not None:
+            ttl = getattr(self.backend, "ttl", None) or 0
+            payload = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+            published = self._publish_script(
+                keys=[self._fence_key, self._snapshot_key],
+                args=[token, payload, ttl]
+            )
+            if not published:
+                logger.warning(f"⚠️  [SingleFlight] token={token} 已过期，放弃发布快照")
+            return bool(published)
+
+        if token != self._local_fence:
+            return False
+        self._local_snapshot = record
+        return True
+
+    def load_snapshot(self, min_watermark: float) -> Optional[Dict[str, Any]]:
+        """
+        读取最近发布的快照
+
+        Args:
+            min_watermark: 快照的水位线不得早于该值
+
+        Returns:
+            快照；不存在、没有水位线（旧格式）或早于min_watermark时返回None
+        """
+        if self._redis is not None:
+            payload = self._redis.get(self._snapshot_key)
+            record = json.loads(payload) if payload else None
+        else:
+            record = self._local_snapshot
+        if not isinstance(record, dict) or "state" not in record:
+            return None
+        watermark = record.get("watermark")
+        if watermark is None or watermark < min_watermark:
+            logger.info(f"⏭️  [SingleFlight] 快照水位线 {watermark} 早于 {min_watermark:.0f}，不使用")
+            return None
+        return record["state"]
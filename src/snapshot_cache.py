@@ -0,0 +1,77 @@
+"""状态快照缓存 - GET /api/pet/status 的读穿透缓存
+
+背景：
+- 全局宠物只有一份状态，同一秒内所有设备拿到的结果完全相同
+- 每次请求都重新执行 get_states()/get_expression()/_derive_simplified_state
+
+思路：
+- 以tick水位线为键缓存最近一次构建的状态，TTL内直接返回
+- 水位线变化（本实例或其他实例完成了补偿）或TTL到期时重新构建
+- 本实例的写操作（互动、重置、补偿）主动失效缓存
+- 失效时代数加一：读请求在构建前记下代数，构建期间缓存被失效过时不写入
+  （否则提交前构建的旧状态会在失效之后进入缓存）
+- 返回时只替换 device_id 字段
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class SnapshotCache:
+    """
+    以tick水位线为键、带TTL的单条目快照缓存
+
+    Args:
+        ttl: 缓存有效期（秒），0表示禁用缓存
+    """
+
+    def __init__(self, ttl: float = 0.5):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entry: Optional[tuple] = None  # (watermark, expires_at, state)
+        self.generation = 0  # invalidate() 的次数
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, watermark: Optional[float]) -> Optional[Dict[str, Any]]:
+        """水位线一致且未过期时返回缓存的状态"""
+        entry = self._entry
+        if (
+            entry is not None
+            and entry[0] == watermark
+            and time.monotonic() < entry[1]
+        ):
+            self.hits += 1
+            return entry[2]
+        self.misses += 1
+        return None
+
+    def put(
+        self,
+        watermark: Optional[float],
+        state: Dict[str, Any],
+        generation: Optional[int] = None
+    ) -> bool:
+        """
+        缓存在watermark下构建的状态
+
+        Args:
+            generation: 开始构建前读到的 generation；之后缓存被失效过时丢弃本次写入
+
+        Returns:
+            是否写入了缓存
+        """
+        if self.ttl <= 0:
+            return False
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+            self._entry = (watermark, time.monotonic() + self.ttl, state)
+            return True
+
+    def invalidate(self) -> None:
+        """清空缓存（本实例修改了状态），进行中的构建结果不再写入"""
+        with self._lock:
+            self.generation += 1
+            self._entry = None
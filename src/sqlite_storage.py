@@ -0,0 +1,326 @@
+"""SQLite存储 - 单机自托管部署的持久化后端
+
+背景：
+- 自托管的单机部署：/tmp 文件存储重启即丢失，外部Redis又是额外的运维负担
+
+思路：
+- 一个SQLite数据库文件（WAL模式）存放：
+  - 各子系统状态与tick水位线（state表，与Redis/文件存储的键一致）
+  - 互动日志（interactions表，写入时按保留时长和最大行数裁剪）
+- WAL模式下读取不阻塞写入，多个worker进程可以并发读取
+- save_many 在一个事务中写完所有键（一次fsync）
+- transaction() 使用 BEGIN IMMEDIATE，跨进程的读-改-写（tick水位线推进）是原子的
+- 每个键有一个版本号，每次写入加一：is_stale() 比较本实例读到/写入的版本，
+  发现其他worker的写入（与 MmapStorage 的记录序号相同的用法）
+- 每个线程使用自己的连接
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    from core import StorageBackend as _StorageBackendBase
+except ImportError:
+    _StorageBackendBase = object
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    device_id TEXT NOT NULL,
+    action TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_created_at ON interactions (created_at);
+"""
+
+_UPSERT = """
+INSERT INTO state (key, value, updated_at) VALUES (?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET
+    value = excluded.value, updated_at = excluded.updated_at, version = state.version + 1
+"""
+
+# 变量个数上限（旧版SQLite为999），IN查询按此分批
+_MAX_VARIABLES = 500
+
+_INSERT_IF_ABSENT = """
+INSERT INTO state (key, value, updated_at) VALUES (?, ?, ?)
+ON CONFLICT(key) DO NOTHING
+"""
+
+
+class SQLiteStorage(_StorageBackendBase):
+    """
+    SQLite（WAL模式）存储后端
+
+    Args:
+        path: 数据库文件路径（目录不存在时自动创建）
+        busy_timeout_ms: 等待其他进程释放写锁的最长时间
+        log_retention_seconds: 互动日志保留时长，None表示不按时间裁剪
+        log_max_rows: 互动日志最多保留的行数，None表示不按行数裁剪
+        track_versions: 是否记录读到/写入的版本供 is_stale() 比较
+            （海量键且不需要新鲜度检查的存储可以关闭，如惰性求值的宠物记录）
+    """
+
+    def __init__(
+        self,
+        path: str,
+        busy_timeout_ms: int = 5000,
+        log_retention_seconds: Optional[float] = 86400 * 30,
+        log_max_rows: Optional[int] = 100_000,
+        track_versions: bool = True
+    ):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.log_retention_seconds = log_retention_seconds
+        self.log_max_rows = log_max_rows
+        self.track_versions = track_versions
+        self._local = threading.local()
+        # 本实例读到/写入的各键版本（见 is_stale）
+        self._observed: Dict[str, int] = {}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        conn.executescript(_SCHEMA)
+        self._migrate(conn)
+        logger.info(f"✅ [SQLiteStorage] 数据库已打开: {path}（WAL模式）")
+
+    def _connection(self) -> sqlite3.Connection:
+        """当前线程的连接（首次使用时创建）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None：由 transaction() 显式控制事务
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+            conn.execute("PRAGMA journal_mode = WAL")
+            # WAL模式下NORMAL只在检查点时fsync，断电最多丢失最后一个事务
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        """旧数据库的state表没有version列：补上（已有的行从版本1开始）"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(state)")}
+        if "version" not in columns:
+            conn.execute("ALTER TABLE state ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+            logger.info("🔧 [SQLiteStorage] state表已添加version列")
+
+    def _versions(self, conn: sqlite3.Connection, keys: List[str]) -> Dict[str, int]:
+        """各键当前的版本（不存在的键不出现在结果中）"""
+        versions: Dict[str, int] = {}
+        for start in range(0, len(keys), _MAX_VARIABLES):
+            chunk = keys[start:start + _MAX_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            versions.update(conn.execute(
+                f"SELECT key, version FROM state WHERE key IN ({placeholders})", chunk
+            ).fetchall())
+        return versions
+
+    def _observe(self, key: str, version: int) -> None:
+        if self.track_versions:
+            self._observed[key] = version
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        写事务（BEGIN IMMEDIATE，跨进程互斥），同一线程内可重入
+
+        读-改-写操作（如tick水位线推进）应在同一个transaction内完成
+        """
+        conn = self._connection()
+        if self._local.depth > 0:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self._local.depth = 0
+
+    # ==================== StorageBackend接口 ====================
+
+    def load(self, key: str) -> Dict[str, Any]:
+        row = self._connection().execute(
+            "SELECT value, version FROM state WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self._observe(key, 0)
+            return {}
+        self._observe(key, row[1])
+        try:
+            return json.loads(row[0])
+        except json.JSONDecodeError as e:
+            logger.warning(f"⚠️  [SQLiteStorage] 解析 {key} 状态失败: {e}")
+            return {}
+
+    def save(self, key: str, state: Dict[str, Any]) -> None:
+        self.save_many({key: state})
+
+    def save_many(self, states: Dict[str, Dict[str, Any]]) -> None:
+        """在一个事务中写完所有键"""
+        if not states:
+            return
+        now = time.time()
+        rows = [
+            (key, json.dumps(state, separators=(',', ':')), now)
+            for key, state in states.items()
+        ]
+        with self.transaction() as conn:
+            conn.executemany(_UPSERT, rows)
+            if self.track_versions:
+                self._observed.update(self._versions(conn, list(states)))
+
+    def load_many(self, keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """一次查询读取多个键（不存在的键返回空字典）"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        conn = self._connection()
+        found: Dict[str, str] = {}
+        for start in range(0, len(keys), _MAX_VARIABLES):
+            chunk = keys[start:start + _MAX_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            for key, value, version in conn.execute(
+                f"SELECT key, value, version FROM state WHERE key IN ({placeholders})", chunk
+            ):
+                found[key] = value
+                self._observe(key, version)
+
+        result = {}
+        for key in keys:
+            if key not in found:
+                self._observe(key, 0)
+            try:
+                result[key] = json.loads(found[key]) if key in found else {}
+            except json.JSONDecodeError as e:
+                logger.warning(f"⚠️  [SQLiteStorage] 解析 {key} 状态失败: {e}")
+                result[key] = {}
+        return result
+
+    def delete(self, key: str) -> None:
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM state WHERE key = ?", (key,))
+        self._observe(key, 0)
+
+    def exists(self, key: str) -> bool:
+        row = self._connection().execute(
+            "SELECT 1 FROM state WHERE key = ?", (key,)
+        ).fetchone()
+        return row is not None
+
+    def keys(self, prefix: str = "") -> List[str]:
+        """以prefix开头的所有键（按键排序）"""
+        rows = self._connection().execute(
+            "SELECT key FROM state WHERE substr(key, 1, ?) = ? ORDER BY key", (len(prefix), prefix)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def save_if_absent(self, key: str, state: Dict[str, Any]) -> bool:
+        """键不存在时才写入（INSERT ... DO NOTHING，跨进程原子），返回是否写入"""
+        row = (key, json.dumps(state, separators=(',', ':')), time.time())
+        with self.transaction() as conn:
+            written = conn.execute(_INSERT_IF_ABSENT, row).rowcount == 1
+        if written:
+            self._observe(key, 1)
+        return written
+
+    def is_stale(self, prefix: str = "") -> bool:
+        """
+        其他进程是否写入过本实例读到/写入的键（只查询版本号）
+
+        Args:
+            prefix: 只检查以prefix开头的键（共享数据库上的命名空间视图，见 NamespacedStorage）
+
+        返回True时把当前版本记为已读：调用方随即从存储重新加载
+        """
+        observed = {key: version for key, version in self._observed.items() if key.startswith(prefix)}
+        if not observed:
+            return False
+        current = self._versions(self._connection(), list(observed))
+        stale = False
+        for key, version in observed.items():
+            if current.get(key, 0) != version:
+                self._observed[key] = current.get(key, 0)
+                stale = True
+        return stale
+
+    # ==================== 互动日志 ====================
+
+    def log_interactions(self, records: List[Tuple[float, str, str]]) -> None:
+        """
+        追加互动日志，并在同一事务中裁剪超出保留时长/行数的旧日志
+
+        Args:
+            records: [(created_at, device_id, action), ...]
+        """
+        if not records:
+            return
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO interactions (created_at, device_id, action) VALUES (?, ?, ?)",
+                records
+            )
+            self._prune_interactions(conn)
+
+    def _prune_interactions(self, conn: sqlite3.Connection) -> None:
+        """删除过期和超出行数上限的日志（created_at与id上都有索引，代价与删除行数成正比）"""
+        if self.log_retention_seconds is not None:
+            conn.execute(
+                "DELETE FROM interactions WHERE created_at < ?",
+                (time.time() - self.log_retention_seconds,)
+            )
+        if self.log_max_rows is not None:
+            conn.execute(
+                "DELETE FROM interactions WHERE id <= "
+                "(SELECT id FROM interactions ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (self.log_max_rows,)
+            )
+
+    def recent_interactions(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """最近的互动日志（新的在前）"""
+        rows = self._connection().execute(
+            "SELECT created_at, device_id, action FROM interactions ORDER BY id DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [
+            {"created_at": created_at, "device_id": device_id, "action": action}
+            for created_at, device_id, action in rows
+        ]
+
+    def close(self) -> None:
+        """关闭当前线程的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def __repr__(self) -> str:
+        return f"<SQLiteStorage({self.path!r})>"
@@ -0,0 +1,733 @@
+"""存储层扩展 - 在micro-life-sim存储后端之上提供批量读写
+
+背景：
+- StateManager.flush() 对每个子系统单独调用 backend.save()
+- RedisStorage 每次save都是一次独立的SETEX；在Upstash上每次调用都是一次跨区域往返
+- 一次刷盘（rhythm + energy）至少2次往返，再加上读取就是2N+次
+
+思路：
+- BatchedStorage 包装任意存储后端，新增 save_many / load_many
+  - Redis后端：save_many 用 MULTI/EXEC 管道一次提交所有SET（含TTL），
+    load_many 用一次 MGET
+  - 其他后端：后端自带 save_many 时直接调用，否则逐个调用 save/load
+- flush_pending() 绕过 StateManager.flush 的逐个写入，用 save_many 一次写完
+- create_redis_storage() 直接在进程级连接池客户端上构建Redis存储，
+  不经过 RedisStorage 的构造函数（它会新建一个不走连接池的客户端并PING一次）
+
+紧凑布局（layout="hash"，仅Redis后端）：
+- 每个子系统存为一个Redis哈希（键 {prefix}:h:{system}），每个字段一个JSON编码的值
+- 记住本实例最近一次读到/写入的字段值，保存时只HSET变化的字段、HDEL消失的字段
+- 改动一个浮点数只传输这一个字段，不再重新序列化整个文档
+- 哈希不存在时回退读取旧的JSON键，首次保存时整体写入哈希（平滑迁移）
+
+版本化写入（versioned=True，仅Redis后端）：
+- 命名空间下维护一个版本计数器（键 {prefix}:version），每次写入加一
+- 读取时与状态一起原子地读出版本（MGET / MULTI），记录每个键是在哪个版本读到的
+- save_many 用Lua脚本做compare-and-swap：版本仍等于读到的版本才写入并加一，
+  否则抛出 VersionConflict，由上层重新加载、重新应用本次修改后重试
+- 热路径上没有全局锁，一次写入仍是一次往返
+- is_stale() 只GET版本计数器（一次小请求），判断其他实例是否写入过，
+  上层只在版本变化时才重新加载完整状态
+
+脏标记（FlushTracker）：
+- 延迟刷盘模式下每次请求都会刷盘，但很多时候状态没有实质变化
+- 记住每个子系统最近一次落盘的状态，只有数值变化超过epsilon的子系统才写入
+- 墙钟时间戳（last_update等）每次tick都会变，不参与比较
+- 没有任何脏子系统时整次刷盘跳过，不发出存储请求
+"""
+
+import copy
+import json
+import logging
+import threading
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from src.redis_pool import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+try:
+    from core import StorageBackend as _StorageBackendBase
+except ImportError:
+    _StorageBackendBase = object
+
+# 存储布局
+LAYOUT_JSON = "json"
+LAYOUT_HASH = "hash"
+
+# 版本计数器在存储命名空间中的键名
+VERSION_KEY = "version"
+
+# 版本匹配时写入所有键并把版本加一（KEYS: version, 状态键...；ARGV: expected, ttl, layout, payload...）
+# - json布局：payload为整个状态文档
+# - hash布局：payload为 {"set": {字段: 值}, "del": [字段]}
+_CAS_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current ~= tonumber(ARGV[1]) then
+    return {0, current}
+end
+local ttl = tonumber(ARGV[2])
+for i = 2, #KEYS do
+    local payload = ARGV[i + 2]
+    if ARGV[3] == 'hash' then
+        local spec = cjson.decode(payload)
+        for field, value in pairs(spec['set']) do
+            redis.call('HSET', KEYS[i], field, value)
+        end
+        for _, field in ipairs(spec['del']) do
+            redis.call('HDEL', KEYS[i], field)
+        end
+        if ttl > 0 then
+            redis.call('EXPIRE', KEYS[i], ttl)
+        end
+    elseif ttl > 0 then
+        redis.call('SET', KEYS[i], payload, 'EX', ttl)
+    else
+        redis.call('SET', KEYS[i], payload)
+    end
+end
+local version = redis.call('INCR', KEYS[1])
+if ttl > 0 then
+    redis.call('EXPIRE', KEYS[1], ttl)
+end
+return {1, version}
+"""
+
+# 脏标记比较时忽略的墙钟时间戳字段
+TIMESTAMP_FIELDS = frozenset({"last_update", "last_calibration"})
+
+
+class VersionConflict(RuntimeError):
+    """版本化写入时存储上的版本已被其他实例推进"""
+
+    def __init__(self, expected: int, current: int):
+        super().__init__(f"version conflict: expected {expected}, found {current}")
+        self.expected = expected
+        self.current = current
+
+
+class BatchedStorage(_StorageBackendBase):
+    """
+    支持批量读写的存储后端包装器
+
+    未覆盖的属性（client、key_prefix、ttl等）透传给被包装的后端
+
+    Args:
+        backend: micro-life-sim的存储后端（RedisStorage / FileStorage）
+        layout: Redis后端的存储布局，"json"（整体文档）或 "hash"（按字段）
+        versioned: Redis后端是否使用版本化的compare-and-swap写入
+    """
+
+    def __init__(self, backend: Any, layout: str = LAYOUT_JSON, versioned: bool = False):
+        if layout not in (LAYOUT_JSON, LAYOUT_HASH):
+            raise ValueError(f"unknown storage layout: {layout}")
+        self.backend = backend
+        self.layout = layout
+        self.versioned = versioned
+        self.round_trips = 0  # 本包装器发出的存储往返次数（用于观测）
+        self.fields_written = 0  # hash布局下实际写入的字段数（用于观测）
+        # hash布局：本实例最近一次读到/写入的字段（JSON编码后的值）
+        self._known_fields: Dict[str, Dict[str, str]] = {}
+        # 版本化写入：每个键是在哪个版本读到/写入的
+        self._observed_versions: Dict[str, int] = {}
+        self._cas_script = None
+        self.version_conflicts = 0  # 版本冲突次数（用于观测）
+        self.freshness_checks = 0  # 版本新鲜度检查次数
+
+    def __getattr__(self, name: str) -> Any:
+        # 只有在自身找不到属性时才会调用，透传给被包装的后端
+        return getattr(self.__dict__["backend"], name)
+
+    @property
+    def _redis(self) -> Any:
+        return getattr(self.backend, "client", None)
+
+    @property
+    def _use_hash(self) -> bool:
+        return self.layout == LAYOUT_HASH and self._redis is not None
+
+    @property
+    def _use_batch(self) -> bool:
+        """单键读写也需要走批量路径（hash布局或版本化写入）"""
+        return self._redis is not None and (self.layout == LAYOUT_HASH or self.versioned)
+
+    def _make_key(self, key: str) -> str:
+        return f"{self.backend.key_prefix}:{key}"
+
+    def _make_hash_key(self, key: str) -> str:
+        return f"{self.backend.key_prefix}:h:{key}"
+
+    # ==================== StorageBackend接口 ====================
+
+    def load(self, key: str) -> Dict[str, Any]:
+        if self._use_batch:
+            return self.load_many([key])[key]
+        self.round_trips += 1
+        return self.backend.load(key)
+
+    def save(self, key: str, state: Dict[str, Any]) -> None:
+        if self._use_batch:
+            self.save_many({key: state})
+            return
+        self.round_trips += 1
+        self.backend.save(key, state)
+
+    def delete(self, key: str) -> None:
+        self.round_trips += 1
+        if self._use_hash:
+            self._redis.delete(self._make_hash_key(key), self._make_key(key))
+            self._known_fields.pop(key, None)
+            return
+        self.backend.delete(key)
+
+    def exists(self, key: str) -> bool:
+        self.round_trips += 1
+        if self._use_hash:
+            return bool(self._redis.exists(self._make_hash_key(key), self._make_key(key)))
+        return self.backend.exists(key)
+
+    # ==================== 批量接口 ====================
+
+    def save_many(self, states: Dict[str, Dict[str, Any]]) -> None:
+        """
+        批量保存多个状态
+
+        Redis后端在一个MULTI/EXEC管道中完成（一次往返，原子生效）
+        """
+        if not states:
+            return
+
+        client = self._redis
+        if client is None:
+            if hasattr(self.backend, "save_many"):
+                # 后端自带批量写入（如 MmapStorage：一次加锁、一次msync）
+                self.round_trips += 1
+                self.backend.save_many(states)
+                return
+            for key, state in states.items():
+                self.save(key, state)
+            return
+
+        if self.versioned:
+            self._save_versioned(states)
+            return
+
+        if self.layout == LAYOUT_HASH:
+            self._save_hashes(states)
+            return
+
+        ttl = getattr(self.backend, "ttl", None)
+        pipe = client.pipeline(transaction=True)
+        for key, state in states.items():
+            data = json.dumps(state, separators=(',', ':'))
+            if ttl:
+                pipe.set(self._make_key(key), data, ex=ttl)
+            else:
+                pipe.set(self._make_key(key), data)
+        pipe.execute()
+        self.round_trips += 1
+
+    def load_many(self, keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量加载多个状态（不存在的键返回空字典）
+
+        Redis后端用一次MGET完成
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        client = self._redis
+        if client is None:
+            if hasattr(self.backend, "load_many"):
+                self.round_trips += 1
+                return self.backend.load_many(keys)
+            return {key: self.load(key) for key in keys}
+
+        if self.layout == LAYOUT_HASH:
+            return self._load_hashes(keys)
+
+        redis_keys = [self._make_key(key) for key in keys]
+        if self.versioned:
+            redis_keys.append(self._version_key)
+        values = client.mget(redis_keys)
+        self.round_trips += 1
+        if self.versioned:
+            self._observe(keys, int(values.pop() or 0))
+
+        result = {}
+        for key, data in zip(keys, values):
+            try:
+                result[key] = json.loads(data) if data else {}
+            except json.JSONDecodeError as e:
+                logger.warning(f"⚠️  [Storage] 解析 {key} 状态失败: {e}")
+                result[key] = {}
+        return result
+
+    # ==================== 版本化写入 ====================
+
+    @property
+    def _version_key(self) -> str:
+        return self._make_key(VERSION_KEY)
+
+    def _observe(self, keys: Iterable[str], version: int) -> None:
+        for key in keys:
+            self._observed_versions[key] = version
+
+    def expected_version(self, keys: Iterable[str]) -> int:
+        """
+        写入keys时期望的版本
+
+        这些键都在同一版本读到时返回该版本；否则（或从未读取过）返回-1，
+        写入必然冲突，上层重新加载后得到一致的版本
+        """
+        versions = {self._observed_versions.get(key, -1) for key in keys}
+        return versions.pop() if len(versions) == 1 else -1
+
+    def is_stale(self) -> bool:
+        """
+        存储上的版本是否已被其他实例推进（一次GET）
+
+        非Redis后端由后端自己判断（如 MmapStorage 比较记录序号）；
+        非版本化的Redis写入始终返回False
+        """
+        if self._redis is None:
+            is_stale = getattr(self.backend, "is_stale", None)
+            return bool(is_stale is not None and is_stale())
+        if not self.versioned or self._redis is None or not self._observed_versions:
+            return False
+        current = int(self._redis.get(self._version_key) or 0)
+        self.round_trips += 1
+        self.freshness_checks += 1
+        return current != self.expected_version(self._observed_versions)
+
+    def _save_versioned(self, states: Dict[str, Dict[str, Any]]) -> None:
+        """一次Lua脚本完成版本校验、写入和版本加一"""
+        redis_keys = []
+        payloads = []
+        written = []
+        for key, state in states.items():
+            if self.layout == LAYOUT_HASH:
+                encoded = {
+                    field: json.dumps(value, separators=(',', ':'))
+                    for field, value in state.items()
+                }
+                changed, removed = self._diff_fields(self._known_fields.get(key, {}), encoded)
+                if not (changed or removed):
+                    continue
+                redis_keys.append(self._make_hash_key(key))
+                payloads.append(json.dumps({"set": changed, "del": removed}, separators=(',', ':')))
+                written.append((key, encoded, len(changed)))
+            else:
+                redis_keys.append(self._make_key(key))
+                payloads.append(json.dumps(state, separators=(',', ':')))
+                written.append((key, None, 0))
+
+        if not redis_keys:
+            return
+
+        if self._cas_script is None:
+            self._cas_script = self._redis.register_script(_CAS_SCRIPT)
+
+        expected = self.expected_version(key for key, _, _ in written)
+        ttl = getattr(self.backend, "ttl", None) or 0
+        status, version = self._cas_script(
+            keys=[self._version_key] + redis_keys,
+            args=[expected, ttl, self.layout] + payloads
+        )
+        self.round_trips += 1
+
+        if not int(status):
+            self.version_conflicts += 1
+            raise VersionConflict(expected, int(version))
+
+        # 写入成功说明期间没有其他写入：之前读到的键也仍是最新的
+        self._observe(list(self._observed_versions) + [key for key, _, _ in written], int(version))
+        for key, encoded, fields in written:
+            if encoded is not None:
+                self._known_fields[key] = encoded
+                self.fields_written += fields
+
+    # ==================== hash布局 ====================
+
+    @staticmethod
+    def _diff_fields(
+        known: Dict[str, str],
+        encoded: Dict[str, str]
+    ) -> Tuple[Dict[str, str], List[str]]:
+        """返回 (需要写入的字段, 需要删除的字段)"""
+        changed = {field: value for field, value in encoded.items() if known.get(field) != value}
+        removed = [field for field in known if field not in encoded]
+        return changed, removed
+
+    def _save_hashes(self, states: Dict[str, Dict[str, Any]]) -> None:
+        """只写入相对已知状态变化的字段；没有任何变化时不发出请求"""
+        updates = []
+        for key, state in states.items():
+            encoded = {
+                field: json.dumps(value, separators=(',', ':'))
+                for field, value in state.items()
+            }
+            changed, removed = self._diff_fields(self._known_fields.get(key, {}), encoded)
+            if changed or removed:
+                updates.append((key, encoded, changed, removed))
+
+        if not updates:
+            return
+
+        ttl = getattr(self.backend, "ttl", None)
+        pipe = self._redis.pipeline(transaction=True)
+        for key, _, changed, removed in updates:
+            hash_key = self._make_hash_key(key)
+            if changed:
+                pipe.hset(hash_key, mapping=changed)
+            if removed:
+                pipe.hdel(hash_key, *removed)
+            if ttl:
+                pipe.expire(hash_key, ttl)
+        pipe.execute()
+        self.round_trips += 1
+
+        for key, encoded, changed, _ in updates:
+            self._known_fields[key] = encoded
+            self.fields_written += len(changed)
+
+    def _load_hashes(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """一次管道读取所有哈希；哈希不存在时回退读取旧的JSON键"""
+        # 版本化写入时用MULTI保证读到的哈希与版本一致
+        pipe = self._redis.pipeline(transaction=self.versioned)
+        for key in keys:
+            pipe.hgetall(self._make_hash_key(key))
+        if self.versioned:
+            pipe.get(self._version_key)
+        rows = pipe.execute()
+        self.round_trips += 1
+        if self.versioned:
+            self._observe(keys, int(rows.pop() or 0))
+
+        result = {}
+        legacy = []
+        for key, row in zip(keys, rows):
+            if not row:
+                legacy.append(key)
+                continue
+            try:
+                result[key] = {field: json.loads(value) for field, value in row.items()}
+                self._known_fields[key] = dict(row)
+            except json.JSONDecodeError as e:
+                logger.warning(f"⚠️  [Storage] 解析 {key} 哈希失败: {e}")
+                result[key] = {}
+                self._known_fields.pop(key, None)
+
+        if legacy:
+            values = self._redis.mget([self._make_key(key) for key in legacy])
+            self.round_trips += 1
+            for key, data in zip(legacy, values):
+                try:
+                    result[key] = json.loads(data) if data else {}
+                except json.JSONDecodeError as e:
+                    logger.warning(f"⚠️  [Storage] 解析 {key} 状态失败: {e}")
+                    result[key] = {}
+                # 哈希尚未写入：下次保存时整体写入
+                self._known_fields.pop(key, None)
+
+        return {key: result[key] for key in keys}
+
+    def __repr__(self) -> str:
+        return (
+            f"<BatchedStorage({self.backend!r}, layout={self.layout!r}, "
+            f"versioned={self.versioned})>"
+        )
+
+
+class PooledRedisStorage(_StorageBackendBase):
+    """
+    基于池化客户端的Redis存储后端（键格式与 core.RedisStorage 相同：{prefix}:{key}，值为JSON）
+
+    构造时不建立连接：连接由连接池按需创建，断线时在池内透明重连
+
+    Args:
+        client: 池化的Redis客户端（见 redis_pool.get_redis_client）
+        key_prefix: 键前缀（命名空间）
+        ttl: 过期时间（秒），None表示不过期
+    """
+
+    def __init__(self, client: Any, key_prefix: str, ttl: Optional[int] = None):
+        self.client = client
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+
+    def _make_key(self, key: str) -> str:
+        return f"{self.key_prefix}:{key}"
+
+    def load(self, key: str) -> Dict[str, Any]:
+        data = self.client.get(self._make_key(key))
+        if not data:
+            return {}
+        try:
+            return json.loads(data)
+        except json.JSONDecodeError as e:
+            logger.warning(f"⚠️  [Storage] 解析 {key} 状态失败: {e}")
+            return {}
+
+    def save(self, key: str, state: Dict[str, Any]) -> None:
+        data = json.dumps(state, separators=(',', ':'))
+        if self.ttl:
+            self.client.set(self._make_key(key), data, ex=self.ttl)
+        else:
+            self.client.set(self._make_key(key), data)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self._make_key(key))
+
+    def exists(self, key: str) -> bool:
+        return bool(self.client.exists(self._make_key(key)))
+
+    def keys(self, prefix: str = "") -> List[str]:
+        """以prefix开头的所有键（SCAN遍历，不阻塞Redis；返回不含键前缀的键名，按键排序）"""
+        head = f"{self.key_prefix}:"
+        return sorted(key[len(head):] for key in self.client.scan_iter(match=f"{head}{prefix}*", count=1000))
+
+    def save_if_absent(self, key: str, state: Dict[str, Any]) -> bool:
+        """键不存在时才写入（SET NX，原子），返回是否写入"""
+        data = json.dumps(state, separators=(',', ':'))
+        return bool(self.client.set(self._make_key(key), data, ex=self.ttl or None, nx=True))
+
+    def __repr__(self) -> str:
+        return f"PooledRedisStorage(prefix={self.key_prefix!r}, ttl={self.ttl})"
+
+
+class NamespacedStorage(_StorageBackendBase):
+    """
+    共享后端上的命名空间视图：键映射为 {namespace}:{key}
+
+    大量实例（如注册表中的宠物）共用一个本地存储（一个SQLite数据库），
+    不为每个实例创建目录或打开文件；未覆盖的属性（transaction等）透传给共享后端
+
+    Args:
+        backend: 共享的存储后端
+        namespace: 本视图的键前缀
+    """
+
+    def __init__(self, backend: Any, namespace: str):
+        self.backend = backend
+        self.namespace = namespace
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.__dict__["backend"], name)
+
+    def _make_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def load(self, key: str) -> Dict[str, Any]:
+        return self.backend.load(self._make_key(key))
+
+    def save(self, key: str, state: Dict[str, Any]) -> None:
+        self.backend.save(self._make_key(key), state)
+
+    def delete(self, key: str) -> None:
+        self.backend.delete(self._make_key(key))
+
+    def exists(self, key: str) -> bool:
+        return self.backend.exists(self._make_key(key))
+
+    def load_many(self, keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        keys = list(keys)
+        if not hasattr(self.backend, "load_many"):
+            return {key: self.load(key) for key in keys}
+        states = self.backend.load_many([self._make_key(key) for key in keys])
+        return {key: states[self._make_key(key)] for key in keys}
+
+    def save_many(self, states: Dict[str, Dict[str, Any]]) -> None:
+        if not hasattr(self.backend, "save_many"):
+            for key, state in states.items():
+                self.save(key, state)
+            return
+        self.backend.save_many({self._make_key(key): state for key, state in states.items()})
+
+    def is_stale(self) -> bool:
+        """只检查本命名空间的键：共享后端上其他视图的写入不算过期，也不会被本视图标记为已读"""
+        is_stale = getattr(self.backend, "is_stale", None)
+        return bool(is_stale is not None and is_stale(self._make_key("")))
+
+    def __repr__(self) -> str:
+        return f"<NamespacedStorage({self.backend!r}, namespace={self.namespace!r})>"
+
+
+def create_redis_storage(
+    redis_url: str,
+    key_prefix: str,
+    ttl: Optional[int] = None,
+    layout: str = LAYOUT_JSON,
+    versioned: bool = False
+) -> BatchedStorage:
+    """
+    在redis_url对应的进程级连接池上构建存储（不发起连接，不PING）
+
+    重连、故障转移重试、注册表加载新宠物都只是构建对象，
+    不再为每次创建付出一次TCP/TLS握手，也不会泄漏客户端
+
+    Raises:
+        RuntimeError: 未安装redis包
+    """
+    backend = PooledRedisStorage(get_redis_client(redis_url), key_prefix=key_prefix, ttl=ttl)
+    return BatchedStorage(backend, layout=layout, versioned=versioned)
+
+
+# pending字典是引擎 StateManager 的私有属性：缺失时只告警一次
+_missing_pending_warned = False
+
+
+def _pending_saves(state_manager: Any) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    读取 StateManager 中尚未落盘的状态（引擎的私有属性 _pending_saves）
+
+    引擎改名或移除该属性时返回None（调用方退回 life.flush()），并告警：
+    退回后批量写入与脏标记都会失效，需要同步修改这里
+    """
+    global _missing_pending_warned
+    pending = getattr(state_manager, "_pending_saves", None)
+    if pending is None and not _missing_pending_warned:
+        _missing_pending_warned = True
+        logger.warning(
+            f"⚠️  [Storage] {type(state_manager).__name__} 没有 _pending_saves，"
+            f"退回 life.flush()（批量写入与脏标记失效）"
+        )
+    return pending
+
+
+def require_pending_saves(state_manager: Any) -> None:
+    """
+    启动检查：版本化写入依赖 _pending_saves（脏标记、CAS冲突后重新应用）
+
+    退回 life.flush() 会绕过版本校验，静默地覆盖其他实例的写入，
+    因此引擎缺少该属性时直接拒绝启动，而不是只告警一次
+
+    Raises:
+        RuntimeError: StateManager没有 _pending_saves
+    """
+    if getattr(state_manager, "_pending_saves", None) is None:
+        raise RuntimeError(
+            f"{type(state_manager).__name__} 没有 _pending_saves：当前 micro-life-sim 版本与版本化写入不兼容，"
+            f"请安装 requirements.txt 中固定的版本，或设置 LIFE_VERSIONED_WRITES=false"
+        )
+
+
+def flush_pending(life: Any) -> int:
+    """
+    把Life延迟刷盘模式下的pending状态批量写入存储
+
+    后端支持 save_many 时一次写完；否则退回 life.flush()
+
+    Returns:
+        写入的子系统数（退回 life.flush() 时无法统计，返回-1）
+    """
+    state_manager = life.state_manager
+    backend = getattr(state_manager, "backend", None)
+    pending = _pending_saves(state_manager)
+
+    if pending is None or not hasattr(backend, "save_many"):
+        life.flush()
+        return -1
+
+    if not pending:
+        return 0
+
+    states = dict(pending)
+    backend.save_many(states)
+    pending.clear()
+    return len(states)
+
+
+class FlushTracker:
+    """
+    延迟刷盘的脏标记：只写入实际变化的子系统
+
+    基准是本实例最近一次落盘的状态；其他实例写入的状态不会更新基准，
+    状态可能被外部修改时（如重置）调用 forget() 强制下次整体写入
+
+    Args:
+        epsilon: 数值字段变化超过该值才视为脏
+        ignored_fields: 不参与比较的字段（墙钟时间戳）
+    """
+
+    def __init__(self, epsilon: float = 1e-6, ignored_fields: FrozenSet[str] = TIMESTAMP_FIELDS):
+        self.epsilon = epsilon
+        self.ignored_fields = ignored_fields
+        self._lock = threading.Lock()
+        self._flushed: Dict[str, Dict[str, Any]] = {}
+
+        # 观测指标
+        self.flushes_performed = 0
+        self.flushes_skipped = 0
+        self.systems_written = 0
+        self.systems_skipped = 0
+
+    def is_dirty(self, key: str, state: Dict[str, Any]) -> bool:
+        """state 相对最近一次落盘的状态是否有实质变化"""
+        previous = self._flushed.get(key)
+        if previous is None:
+            return True
+
+        fields = (set(state) | set(previous)) - self.ignored_fields
+        for field in fields:
+            if field not in state or field not in previous:
+                return True
+            old, new = previous[field], state[field]
+            if isinstance(old, (int, float)) and isinstance(new, (int, float)) \
+                    and not isinstance(old, bool) and not isinstance(new, bool):
+                if abs(new - old) > self.epsilon:
+                    return True
+            elif old != new:
+                return True
+        return False
+
+    def flush(self, life: Any) -> int:
+        """
+        只把脏子系统写入存储，干净的子系统从pending中丢弃
+
+        Returns:
+            写入的子系统数（0表示整次跳过；退回 life.flush() 时返回-1）
+        """
+        pending = _pending_saves(life.state_manager)
+
+        with self._lock:
+            if pending is None:
+                life.flush()
+                self.flushes_performed += 1
+                return -1
+
+            clean = [key for key, state in pending.items() if not self.is_dirty(key, state)]
+            for key in clean:
+                del pending[key]
+            self.systems_skipped += len(clean)
+
+            if not pending:
+                self.flushes_skipped += 1
+                return 0
+
+            dirty = {key: copy.deepcopy(state) for key, state in pending.items()}
+            written = flush_pending(life)
+            self._flushed.update(dirty)
+            self.flushes_performed += 1
+            self.systems_written += len(dirty)
+            return written
+
+    def remember(self, states: Dict[str, Dict[str, Any]]) -> None:
+        """把states记为已落盘（从存储重新加载后调用）"""
+        with self._lock:
+            self._flushed.update(copy.deepcopy(states))
+
+    def forget(self) -> None:
+        """清空基准，下次刷盘整体写入"""
+        with self._lock:
+            self._flushed.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """刷盘指标"""
+        return {
+            "flushes_performed": self.flushes_performed,
+            "flushes_skipped": self.flushes_skipped,
+            "systems_written": self.systems_written,
+            "systems_skipped": self.systems_skipped,
+        }
@@ -0,0 +1,346 @@
+"""共享tick时钟 - 与Life状态一起持久化在存储后端的tick水位线
+
+背景：
+- 原实现把 last_tick_time 放在 LifeAdapter._global_metadata 类变量中
+- 每个Vercel实例/uvicorn worker各有一份时钟：同一段时间被重复补偿，
+  冷启动的实例则从零开始计时
+
+思路：
+- 水位线（上次tick的Unix时间戳）存放在与Life状态相同的存储命名空间下
+- claim(now) 原子地把水位线推进到now，返回本次需要补偿的秒数
+- 同一段时间只会被一个实例claim到，N个并发实例总共只补偿一次
+- 补偿分两步：begin(now) 预占 [水位线, now) 但不推进水位线，
+  补偿结果刷盘成功后 commit(now) 才推进（失败时 abort() 释放预占）——
+  刷盘前崩溃时水位线仍停在原处，这段时间由下一个请求重新补偿，不会丢失
+
+原子性：
+- Redis后端：Lua脚本实现compare-and-set（单条命令，无需WATCH重试）；
+  预占是带租约的独立键，预占期间其他实例不补偿，持有者崩溃时租约到期自动释放
+- 其他后端：进程内加锁的读-改-写；后端提供 transaction()（如 MmapStorage）时
+  在其中完成，同一主机的多个worker之间也是原子的；调用方在同一个transaction内
+  完成 begin → 补偿 → 刷盘 → commit（SQLite上水位线与状态在同一事务中提交）
+
+Redis故障（后端熔断或命令出错）时：
+- 退化为本实例内存中的水位线，请求照常补偿
+- Redis恢复后先把本地水位线推进到Redis（只前进不后退），再恢复原子推进
+"""
+
+import logging
+import threading
+from contextlib import nullcontext
+from typing import Any, ContextManager, Optional
+
+logger = logging.getLogger(__name__)
+
+# 水位线在存储后端中的键名（与rhythm/energy并列）
+CLOCK_KEY = "tick_clock"
+
+# 原子推进水位线（ARGV: now, ttl, min_elapsed）：
+# - 不存在：初始化为now，返回 {0, now}
+# - now比水位线晚至少min_elapsed：写入now，返回 {1, 旧值}
+# - 其他情况（已被其他实例推进）：不修改，返回 {2, 当前值}
+_CLAIM_SCRIPT = """
+local last = redis.call('GET', KEYS[1])
+local ttl = tonumber(ARGV[2])
+if not last then
+    if ttl > 0 then
+        redis.call('SET', KEYS[1], ARGV[1], 'EX', ttl)
+    else
+        redis.call('SET', KEYS[1], ARGV[1])
+    end
+    return {0, ARGV[1]}
+end
+if tonumber(ARGV[1]) - tonumber(last) >= tonumber(ARGV[3]) then
+    if ttl > 0 then
+        redis.call('SET', KEYS[1], ARGV[1], 'EX', ttl)
+    else
+        redis.call('SET', KEYS[1], ARGV[1])
+    end
+    return {1, last}
+end
+return {2, last}
+"""
+
+# 把水位线推进到不早于ARGV[1]（ARGV: watermark, ttl），用于故障恢复后同步
+_ADVANCE_SCRIPT = """
+local last = redis.call('GET', KEYS[1])
+if last and tonumber(last) >= tonumber(ARGV[1]) then
+    return 0
+end
+local ttl = tonumber(ARGV[2])
+if ttl > 0 then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ttl)
+else
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+# 预占待补偿的时段（KEYS: clock, lease；ARGV: now, ttl, min_elapsed, lease_ms）：
+# - 水位线不存在：初始化为now，返回 {0, now}（无需补偿，不预占）
+# - now比水位线晚至少min_elapsed且没有其他预占：写入租约（值为now），返回 {1, 水位线}
+# - 其他情况：不修改，返回 {2, 水位线}
+_BEGIN_SCRIPT = """
+local last = redis.call('GET', KEYS[1])
+local ttl = tonumber(ARGV[2])
+if not last then
+    if ttl > 0 then
+        redis.call('SET', KEYS[1], ARGV[1], 'EX', ttl)
+    else
+        redis.call('SET', KEYS[1], ARGV[1])
+    end
+    return {0, ARGV[1]}
+end
+if tonumber(ARGV[1]) - tonumber(last) < tonumber(ARGV[3]) then
+    return {2, last}
+end
+if not redis.call('SET', KEYS[2], ARGV[1], 'NX', 'PX', ARGV[4]) then
+    return {2, last}
+end
+return {1, last}
+"""
+
+# 补偿已落盘：把水位线推进到ARGV[1]（只前进不后退），释放本实例的预占
+# （KEYS: clock, lease；ARGV: watermark, ttl, 预占时写入的租约值）
+_COMMIT_SCRIPT = """
+local last = redis.call('GET', KEYS[1])
+if not last or tonumber(last) < tonumber(ARGV[1]) then
+    local ttl = tonumber(ARGV[2])
+    if ttl > 0 then
+        redis.call('SET', KEYS[1], ARGV[1], 'EX', ttl)
+    else
+        redis.call('SET', KEYS[1], ARGV[1])
+    end
+end
+if redis.call('GET', KEYS[2]) == ARGV[3] then
+    redis.call('DEL', KEYS[2])
+end
+return 1
+"""
+
+# 放弃预占（租约仍属于本实例时删除；KEYS: lease；ARGV: now）
+_ABORT_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class TickClock:
+    """
+    存储后端上的共享tick水位线
+
+    Args:
+        backend: micro-life-sim的存储后端（RedisStorage / FileStorage）
+        lease_ms: begin() 预占的租约时长（毫秒），应覆盖补偿到刷盘的耗时
+    """
+
+    def __init__(self, backend: Any, lease_ms: int = 10000):
+        self.backend = backend
+        self.lease_ms = lease_ms
+        self._lock = threading.Lock()
+        # 本实例最近一次观察到的水位线（claim/peek/commit/reset时更新）
+        self.watermark: Optional[float] = None
+        # 本实例begin()后尚未commit/abort的预占（预占到的时刻）
+        self._leased: Optional[float] = None
+
+        client = getattr(backend, "client", None)
+        key_prefix = getattr(backend, "key_prefix", None)
+        if client is not None and key_prefix is not None:
+            self._redis = client
+            self._redis_key = f"{key_prefix}:{CLOCK_KEY}"
+            self._lease_key = f"{key_prefix}:{CLOCK_KEY}:lease"
+            self._claim_script = client.register_script(_CLAIM_SCRIPT)
+            self._advance_script = client.register_script(_ADVANCE_SCRIPT)
+            self._begin_script = client.register_script(_BEGIN_SCRIPT)
+            self._commit_script = client.register_script(_COMMIT_SCRIPT)
+            self._abort_script = client.register_script(_ABORT_SCRIPT)
+        else:
+            self._redis = None
+        # Redis故障期间本地推进过水位线，恢复后需要同步
+        self._unsynced = False
+
+    def _redis_available(self) -> bool:
+        """后端熔断器断开时不访问Redis（见 FailoverStorage）"""
+        return getattr(self.backend, "available", True)
+
+    def _local_claim(self, now: float, min_elapsed: float) -> float:
+        """Redis故障期间用本实例的水位线补偿"""
+        last = self.watermark
+        if last is not None and now - last < max(min_elapsed, 1e-6):
+            return 0.0
+        self.watermark = now
+        self._unsynced = True
+        return 0.0 if last is None else now - last
+
+    def _sync(self, ttl: int) -> None:
+        """把故障期间本地推进的水位线同步到Redis"""
+        if self._unsynced and self.watermark is not None:
+            self._advance_script(keys=[self._redis_key], args=[repr(self.watermark), ttl])
+            self._unsynced = False
+
+    def claim(self, now: float, min_elapsed: float = 0.0) -> float:
+        """
+        原子地把水位线推进到now
+
+        Args:
+            now: 当前Unix时间戳（秒）
+            min_elapsed: 距离水位线不足该秒数时不推进（留给下次请求累积）
+
+        Returns:
+            本实例需要补偿的秒数（首次初始化、未达到min_elapsed或已被其他实例补偿时为0）
+        """
+        if self._redis is not None:
+            if not self._redis_available():
+                return self._local_claim(now, min_elapsed)
+            ttl = getattr(self.backend, "ttl", None) or 0
+            try:
+                self._sync(ttl)
+                status, last = self._claim_script(
+                    keys=[self._redis_key],
+                    args=[repr(now), ttl, repr(max(min_elapsed, 1e-6))]
+                )
+            except Exception as e:
+                logger.warning(f"⚠️  [TickClock] Redis不可用，使用本地水位线: {e}")
+                return self._local_claim(now, min_elapsed)
+            if int(status) == 2:
+                self.watermark = float(last)
+                return 0.0
+            self.watermark = now
+            return now - float(last) if int(status) == 1 else 0.0
+
+        with self._lock, self._transaction():
+            last = self.backend.load(CLOCK_KEY).get("last_tick_time")
+            if last is not None and now - last < max(min_elapsed, 1e-6):
+                self.watermark = last
+                return 0.0
+            self.backend.save(CLOCK_KEY, {"last_tick_time": now})
+            self.watermark = now
+            return 0.0 if last is None else now - last
+
+    def begin(self, now: float, min_elapsed: float = 0.0) -> float:
+        """
+        预占 [水位线, now) 这段时间，但不推进水位线（补偿刷盘成功后调用 commit）
+
+        Args:
+            now: 当前Unix时间戳（秒）
+            min_elapsed: 距离水位线不足该秒数时不预占（留给下次请求累积）
+
+        Returns:
+            本实例需要补偿的秒数；首次初始化、未达到min_elapsed、
+            其他实例（或本实例尚未提交的补偿）已预占时为0，此时不需要commit/abort
+        """
+        if self._leased is not None:
+            return 0.0
+        if self._redis is not None:
+            if not self._redis_available():
+                return self._local_claim(now, min_elapsed)
+            ttl = getattr(self.backend, "ttl", None) or 0
+            try:
+                self._sync(ttl)
+                status, last = self._begin_script(
+                    keys=[self._redis_key, self._lease_key],
+                    args=[repr(now), ttl, repr(max(min_elapsed, 1e-6)), self.lease_ms]
+                )
+            except Exception as e:
+                logger.warning(f"⚠️  [TickClock] Redis不可用，使用本地水位线: {e}")
+                return self._local_claim(now, min_elapsed)
+            self.watermark = float(last)
+            if int(status) != 1:
+                return 0.0
+            self._leased = now
+            return now - float(last)
+
+        with self._lock, self._transaction():
+            last = self.backend.load(CLOCK_KEY).get("last_tick_time")
+            if last is None:
+                self.backend.save(CLOCK_KEY, {"last_tick_time": now})
+                self.watermark = now
+                return 0.0
+            self.watermark = last
+            if now - last < max(min_elapsed, 1e-6):
+                return 0.0
+            self._leased = now
+            return now - last
+
+    def commit(self, now: float) -> None:
+        """
+        补偿已刷盘：把水位线推进到now（只前进不后退）并释放预占
+
+        Args:
+            now: 实际补偿到的时刻（只补偿了一部分时早于begin的now）
+        """
+        leased, self._leased = self._leased, None
+        self.watermark = max(now, self.watermark or now)
+        if self._redis is not None:
+            ttl = getattr(self.backend, "ttl", None) or 0
+            try:
+                if not self._redis_available():
+                    raise ConnectionError("storage circuit is open")
+                self._commit_script(
+                    keys=[self._redis_key, self._lease_key],
+                    args=[repr(now), ttl, repr(leased) if leased is not None else ""]
+                )
+            except Exception as e:
+                logger.warning(f"⚠️  [TickClock] Redis不可用，恢复后同步水位线: {e}")
+                self._unsynced = True
+            return
+
+        with self._lock, self._transaction():
+            last = self.backend.load(CLOCK_KEY).get("last_tick_time")
+            if last is None or last < now:
+                self.backend.save(CLOCK_KEY, {"last_tick_time": now})
+
+    def abort(self) -> None:
+        """补偿未能刷盘：释放预占，水位线不变（这段时间留给下次补偿）"""
+        leased, self._leased = self._leased, None
+        if leased is None or self._redis is None:
+            return
+        try:
+            self._abort_script(keys=[self._lease_key], args=[repr(leased)])
+        except Exception as e:
+            logger.warning(f"⚠️  [TickClock] 释放预占失败（租约到期后自动释放）: {e}")
+
+    def peek(self) -> Optional[float]:
+        """读取当前水位线（不存在时返回None）"""
+        if self._redis is not None:
+            # 熔断中，或故障期间的本地水位线尚未同步（Redis上的值可能落后）
+            if not self._redis_available() or self._unsynced:
+                return self.watermark
+            try:
+                value = self._redis.get(self._redis_key)
+            except Exception as e:
+                logger.warning(f"⚠️  [TickClock] Redis不可用，使用本地水位线: {e}")
+                return self.watermark
+            self.watermark = float(value) if value is not None else None
+        else:
+            self.watermark = self.backend.load(CLOCK_KEY).get("last_tick_time")
+        return self.watermark
+
+    def reset(self, now: float) -> None:
+        """把水位线强制设置为now（用于重置宠物），放弃进行中的预占"""
+        self.abort()
+        self.watermark = now
+        if self._redis is not None:
+            ttl = getattr(self.backend, "ttl", None)
+            try:
+                if not self._redis_available():
+                    raise ConnectionError("storage circuit is open")
+                if ttl:
+                    self._redis.set(self._redis_key, repr(now), ex=ttl)
+                else:
+                    self._redis.set(self._redis_key, repr(now))
+                self._unsynced = False
+            except Exception as e:
+                logger.warning(f"⚠️  [TickClock] Redis不可用，恢复后同步水位线: {e}")
+                self._unsynced = True
+            return
+
+        with self._lock, self._transaction():
+            self.backend.save(CLOCK_KEY, {"last_tick_time": now})
+
+    def _transaction(self) -> ContextManager:
+        """后端的跨进程事务（不支持时为空上下文）"""
+        transaction = getattr(self.backend, "transaction", None)
+        return transaction() if transaction is not None else nullcontext()
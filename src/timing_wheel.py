@@ -0,0 +1,161 @@
+"""分层时间轮 - 大量定时事件的O(1)登记、取消与到期
+
+背景：
+- 宠物的状态跃迁（饥饿、犯困等）发生的时刻可以提前算出
+- 用堆保存N个定时事件，登记/取消是O(log N)，取消还要留下墓碑
+- 轮询所有宠物的代价是 宠物数 × 轮询频率，与实际发生的事件数无关
+
+思路（Varghese & Lauck 分层时间轮，同Linux内核定时器）：
+- 时间按 tick 离散化，第L层有 slots 个槽，每槽跨度 tick × slots^L
+- 登记：按距到期的tick数选择能容纳的最低层，放入对应槽（O(1)）
+- 推进：每个tick只看第0层的一个槽；第0层转完一圈时，把上一层当前槽的事件
+  重新登记到下层（级联）—— 每个事件最多级联 levels-1 次
+- 同一个键只保留最后一次登记（重新登记即取消旧的），取消为O(1)
+- 超出最高层范围的事件先放在最高层，到点时若未到期则重新登记
+
+非线程安全：调用方自行加锁
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional
+
+
+@dataclass
+class TimerEntry:
+    """一个定时事件"""
+    key: Hashable
+    deadline: float  # 到期时刻（Unix秒）
+    tick: int        # 到期的tick序号
+    payload: Any = None
+
+
+class HierarchicalTimingWheel:
+    """
+    分层时间轮
+
+    Args:
+        start: 起始时刻（Unix秒）
+        tick: 每个tick的时长（秒），即到期精度
+        slots: 每层的槽数（2的幂）
+        levels: 层数；可直接容纳的最远时长为 tick × slots^levels
+    """
+
+    def __init__(self, start: float, tick: float = 1.0, slots: int = 64, levels: int = 4):
+        if slots < 2 or slots & (slots - 1):
+            raise ValueError(f"slots must be a power of two: {slots}")
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._bits = slots.bit_length() - 1
+        self._mask = slots - 1
+        self._start = start
+        self._current = 0  # 已处理到的tick
+        self._wheels: List[List[Dict[Hashable, TimerEntry]]] = [
+            [{} for _ in range(slots)] for _ in range(levels)
+        ]
+        self._where: Dict[Hashable, Dict[Hashable, TimerEntry]] = {}  # 键 → 所在的槽
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._where
+
+    @property
+    def now(self) -> float:
+        """时间轮已推进到的时刻"""
+        return self._start + self._current * self.tick
+
+    def _tick_of(self, deadline: float) -> int:
+        # 向上取整：事件不会早于deadline触发
+        return math.ceil((deadline - self._start) / self.tick - 1e-9)
+
+    def _place(self, entry: TimerEntry) -> None:
+        delta = max(0, entry.tick - self._current)
+        if delta == 0:
+            # 级联下来的恰好在当前tick到期：放回第0层当前槽，随后在本tick触发
+            slot = self._wheels[0][self._current & self._mask]
+        else:
+            for level in range(self.levels):
+                if delta < 1 << (self._bits * (level + 1)):
+                    break
+            slot = self._wheels[level][(entry.tick >> (self._bits * level)) & self._mask]
+        slot[entry.key] = entry
+        self._where[entry.key] = slot
+
+    def schedule(self, key: Hashable, deadline: float, payload: Any = None) -> TimerEntry:
+        """登记（或改期）一个事件；同一键的旧事件被取消"""
+        self.cancel(key)
+        entry = TimerEntry(key, deadline, max(self._tick_of(deadline), self._current + 1), payload)
+        self._place(entry)
+        return entry
+
+    def cancel(self, key: Hashable) -> Optional[TimerEntry]:
+        """取消事件，返回被取消的事件（不存在时返回None）"""
+        slot = self._where.pop(key, None)
+        if slot is None:
+            return None
+        return slot.pop(key)
+
+    def get(self, key: Hashable) -> Optional[TimerEntry]:
+        slot = self._where.get(key)
+        return None if slot is None else slot[key]
+
+    def _cascade(self) -> None:
+        """第0层转完一圈时，逐层把上一层当前槽的事件重新登记到下层"""
+        for level in range(1, self.levels):
+            index = (self._current >> (self._bits * level)) & self._mask
+            slot = self._wheels[level][index]
+            entries = list(slot.values())
+            slot.clear()
+            for entry in entries:
+                self._place(entry)
+            if index != 0:
+                break
+
+    def advance(self, now: float) -> List[TimerEntry]:
+        """
+        推进到now，返回期间到期的事件（按到期tick排序）
+
+        代价与经过的tick数和到期事件数成正比，与登记的事件总数无关
+        """
+        target = math.floor((now - self._start) / self.tick + 1e-9)
+        expired: List[TimerEntry] = []
+        while self._current < target:
+            self._current += 1
+            if self._current & self._mask == 0:
+                self._cascade()
+            slot = self._wheels[0][self._current & self._mask]
+            if not slot:
+                continue
+            entries = list(slot.values())
+            slot.clear()
+            for entry in entries:
+                if entry.tick > self._current:
+                    # 超出最高层范围的远期事件：重新登记
+                    self._place(entry)
+                    continue
+                del self._where[entry.key]
+                expired.append(entry)
+        return expired
+
+    def next_deadline(self) -> Optional[float]:
+        """
+        最近一个事件到期时刻的下界（用于决定休眠多久；没有事件时返回None）
+
+        第0层给出精确的到期tick；高层只能给出槽的起点，到点推进时会级联到下层
+        """
+        if not self._where:
+            return None
+        earliest: Optional[int] = None
+        for level in range(self.levels):
+            shift = self._bits * level
+            base = self._current >> shift
+            for offset in range(1, self.slots + 1):
+                if self._wheels[level][(base + offset) & self._mask]:
+                    tick = (base + offset) << shift
+                    if earliest is None or tick < earliest:
+                        earliest = tick
+                    break
+        return self._start + max(earliest, self._current + 1) * self.tick
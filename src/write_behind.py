@@ -0,0 +1,116 @@
+"""后台写回 - 把刷盘移出请求路径
+
+背景：
+- 延迟刷盘模式下，tick补偿、互动、catchup 都在请求内同步刷盘，
+  请求延迟里包含一次存储写入
+- 常驻进程（非Serverless）部署没有必要每个请求都落盘
+
+思路（write-behind）：
+- 请求只修改内存中的Life状态并登记一次变更（mark_dirty）
+- 后台线程每隔 interval 秒刷盘一次；累计变更达到 max_mutations 时提前刷盘
+- 应用退出时（FastAPI lifespan）强制刷盘一次
+
+持久性窗口：
+- 进程崩溃时最多丢失 interval 秒或 max_mutations 次变更
+- Serverless实例随时可能被冻结/回收，应使用默认的同步刷盘
+"""
+
+import logging
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindFlusher:
+    """
+    后台刷盘调度器
+
+    Args:
+        flush: 刷盘函数（在后台线程中调用，需自行加锁）
+        interval: 最长刷盘间隔（秒）
+        max_mutations: 累计变更达到该数量时立即刷盘
+    """
+
+    def __init__(self, flush: Callable[[], None], interval: float = 1.0, max_mutations: int = 50):
+        self._flush = flush
+        self.interval = interval
+        self.max_mutations = max_mutations
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._mutations = 0  # 上次刷盘后登记的变更数
+
+        # 观测指标
+        self.flushes = 0
+        self.failures = 0
+
+    @property
+    def pending_mutations(self) -> int:
+        return self._mutations
+
+    def start(self) -> None:
+        """启动后台刷盘线程"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="life-write-behind", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"✅ [WriteBehind] 后台刷盘已启动: interval={self.interval * 1000:.0f}ms, "
+            f"max_mutations={self.max_mutations}"
+        )
+
+    def mark_dirty(self, count: int = 1) -> None:
+        """登记状态变更，达到阈值时唤醒后台线程"""
+        with self._lock:
+            self._mutations += count
+            reached = self._mutations >= self.max_mutations
+        if reached:
+            self._wakeup.set()
+
+    def flush_now(self) -> bool:
+        """
+        立即刷盘（有未落盘的变更时）
+
+        Returns:
+            是否成功（没有变更时也返回True）
+        """
+        with self._lock:
+            mutations = self._mutations
+            self._mutations = 0
+        if not mutations:
+            return True
+
+        try:
+            self._flush()
+        except Exception as e:
+            # 变更记回去，下一轮重试
+            with self._lock:
+                self._mutations += mutations
+            self.failures += 1
+            logger.error(f"❌ [WriteBehind] 刷盘失败（{mutations} 次变更待重试）: {e}")
+            return False
+
+        self.flushes += 1
+        return True
+
+    def stop(self, flush: bool = True) -> None:
+        """停止后台线程；flush=True 时最后强制刷盘一次"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if flush:
+            self.flush_now()
+        logger.info(f"🛑 [WriteBehind] 后台刷盘已停止，共刷盘 {self.flushes} 次")
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopping:
+                break
+            self.flush_now()
@@ -0,0 +1,30 @@
+"""pytest公共配置
+
+性能基准（耗时断言）默认跳过：共享CI机器上的墙钟时间不稳定。
+需要时显式开启：
+
+    python -m pytest tests/ --benchmark
+    # 或
+    LIFE_BENCHMARK=true python -m pytest tests/
+"""
+
+import os
+
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption("--benchmark", action="store_true", default=False, help="运行带耗时断言的性能基准")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: 带墙钟耗时断言的性能基准（默认跳过）")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark") or os.getenv("LIFE_BENCHMARK", "false").lower() == "true":
+        return
+    skip = pytest.mark.skip(reason="性能基准，使用 --benchmark 或 LIFE_BENCHMARK=true 开启")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
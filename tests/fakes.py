@@ -0,0 +1,264 @@
+"""
+存储测试共用的替身（Redis客户端、Life.state_manager）
+
+- FakeRedis: 记录往返次数与写入字节数的Redis客户端替身；
+  管道、CAS脚本（语义与 storage._CAS_SCRIPT 一致）、tick时钟脚本（claim/预占/提交）用Python实现，
+  可选的 Outage 模拟Redis不可达
+- redis_backend: 在替身上构建 PooledRedisStorage（与线上后端同一实现）
+- FakeStateManager / FakeLife: 与 Life.state_manager 结构相同，save只写入pending
+
+真实Lua脚本的行为由 test_versioned_storage.py 中需要 REDIS_URL 的测试覆盖
+"""
+
+import fnmatch
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import storage as storage_module
+from src import tick_clock as tick_clock_module
+from src.storage import PooledRedisStorage
+
+
+class Outage:
+    """模拟Redis是否可达"""
+
+    def __init__(self):
+        self.down = False
+
+    def check(self):
+        if self.down:
+            raise ConnectionError("redis unreachable")
+
+
+class FakePipeline:
+    """记录命令的管道，execute() 时算作一次往返"""
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def set(self, key, value, ex=None):
+        self.commands.append(lambda: self.client._set(key, value, ex))
+        return self
+
+    def get(self, key):
+        self.commands.append(lambda: self.client.data.get(key))
+        return self
+
+    def hset(self, key, mapping):
+        self.commands.append(lambda: self.client._hset(key, mapping))
+        return self
+
+    def hdel(self, key, *fields):
+        self.commands.append(lambda: self.client._hdel(key, fields))
+        return self
+
+    def hgetall(self, key):
+        self.commands.append(lambda: dict(self.client.hashes.get(key, {})))
+        return self
+
+    def expire(self, key, ttl):
+        self.commands.append(lambda: self.client.ttls.__setitem__(key, ttl) or True)
+        return self
+
+    def execute(self):
+        self.client._round_trip()
+        return [command() for command in self.commands]
+
+
+class FakeRedis:
+    """
+    Redis客户端替身（只实现存储层用到的命令）
+
+    Args:
+        outage: 可选的 Outage，down 时每个命令抛出ConnectionError
+    """
+
+    def __init__(self, outage=None):
+        self.outage = outage
+        self.data = {}
+        self.hashes = {}
+        self.ttls = {}
+        self.round_trips = 0
+        self.bytes_sent = 0
+
+    def _round_trip(self):
+        if self.outage is not None:
+            self.outage.check()
+        self.round_trips += 1
+
+    def _set(self, key, value, ex=None):
+        self.data[key] = value
+        self.ttls[key] = ex
+        self.bytes_sent += len(value)
+        return True
+
+    def _hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+        self.bytes_sent += sum(len(field) + len(value) for field, value in mapping.items())
+        return len(mapping)
+
+    def _hdel(self, key, fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+        return len(fields)
+
+    def ping(self):
+        self._round_trip()
+        return True
+
+    def get(self, key):
+        self._round_trip()
+        return self.data.get(key)
+
+    def mget(self, keys):
+        self._round_trip()
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None, nx=False):
+        self._round_trip()
+        if nx and key in self.data:
+            return None
+        return self._set(key, value, ex)
+
+    def setex(self, key, ttl, value):
+        self._round_trip()
+        return self._set(key, value, ttl)
+
+    def delete(self, *keys):
+        self._round_trip()
+        removed = 0
+        for key in keys:
+            removed += (self.data.pop(key, None) is not None) + (self.hashes.pop(key, None) is not None)
+        return removed
+
+    def exists(self, key):
+        self._round_trip()
+        return int(key in self.data or key in self.hashes)
+
+    def scan_iter(self, match="*", count=None):
+        self._round_trip()
+        return [key for key in list(self.data) + list(self.hashes) if fnmatch.fnmatchcase(key, match)]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def register_script(self, script):
+        scripts = {
+            storage_module._CAS_SCRIPT: self._cas,
+            tick_clock_module._CLAIM_SCRIPT: self._claim,
+            tick_clock_module._ADVANCE_SCRIPT: self._advance,
+            tick_clock_module._BEGIN_SCRIPT: self._begin,
+            tick_clock_module._COMMIT_SCRIPT: self._commit,
+            tick_clock_module._ABORT_SCRIPT: self._abort,
+        }
+        if script not in scripts:
+            raise NotImplementedError("FakeRedis 不支持该脚本")
+        return scripts[script]
+
+    def _cas(self, keys, args):
+        self._round_trip()
+        current = int(self.data.get(keys[0]) or 0)
+        if current != int(args[0]):
+            return [0, current]
+        ttl = int(args[1])
+        for key, payload in zip(keys[1:], args[3:]):
+            if args[2] == "hash":
+                spec = json.loads(payload)
+                self._hset(key, spec["set"])
+                self._hdel(key, spec["del"])
+                if ttl > 0:
+                    self.ttls[key] = ttl
+            else:
+                self._set(key, payload, ttl if ttl > 0 else None)
+        self.data[keys[0]] = str(current + 1)
+        return [1, current + 1]
+
+    def _claim(self, keys, args):
+        self._round_trip()
+        now, min_elapsed = float(args[0]), float(args[2])
+        last = self.data.get(keys[0])
+        if last is None:
+            self.data[keys[0]] = args[0]
+            return [0, args[0]]
+        if now - float(last) >= min_elapsed:
+            self.data[keys[0]] = args[0]
+            return [1, last]
+        return [2, last]
+
+    def _advance(self, keys, args):
+        self._round_trip()
+        last = self.data.get(keys[0])
+        if last is not None and float(last) >= float(args[0]):
+            return 0
+        self.data[keys[0]] = args[0]
+        return 1
+
+    def _begin(self, keys, args):
+        """租约不会过期（测试中由 _abort/_commit 删除）"""
+        self._round_trip()
+        now, min_elapsed = float(args[0]), float(args[2])
+        last = self.data.get(keys[0])
+        if last is None:
+            self.data[keys[0]] = args[0]
+            return [0, args[0]]
+        if now - float(last) < min_elapsed or keys[1] in self.data:
+            return [2, last]
+        self.data[keys[1]] = args[0]
+        return [1, last]
+
+    def _commit(self, keys, args):
+        self._round_trip()
+        last = self.data.get(keys[0])
+        if last is None or float(last) < float(args[0]):
+            self.data[keys[0]] = args[0]
+        if self.data.get(keys[1]) == args[2]:
+            del self.data[keys[1]]
+        return 1
+
+    def _abort(self, keys, args):
+        self._round_trip()
+        if self.data.get(keys[0]) == args[0]:
+            del self.data[keys[0]]
+            return 1
+        return 0
+
+
+def redis_backend(client, key_prefix="life_test", ttl=3600):
+    """线上使用的Redis后端（每次save一次SET），构建在替身或真实客户端上"""
+    return PooledRedisStorage(client, key_prefix=key_prefix, ttl=ttl)
+
+
+class FakeStateManager:
+    """与 Life.state_manager 结构相同：状态缓存在内存中，save只写入pending"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.auto_flush = False
+        self._pending_saves = {}
+        self._cache = {}
+
+    def load(self, key):
+        if key not in self._cache:
+            self._cache[key] = self.backend.load(key)
+        return self._cache[key]
+
+    def save(self, key, state):
+        self._cache[key] = state
+        self._pending_saves[key] = state
+
+    def flush(self):
+        for key, state in self._pending_saves.items():
+            self.backend.save(key, state)
+        self._pending_saves.clear()
+
+
+class FakeLife:
+    def __init__(self, backend):
+        self.state_manager = FakeStateManager(backend)
+
+    def flush(self):
+        self.state_manager.flush()
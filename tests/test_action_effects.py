@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+互动效果表测试
+
+测试覆盖：
+1. feed/play 对能量的影响及上下限
+2. 节律同步缩小相位差
+3. 冷却时间与生效条件；冷却记录保存在状态中，未提交的状态不留下冷却
+
+使用方法：
+    python -m pytest tests/test_action_effects.py -q
+"""
+
+import os
+import sys
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.action_effects import (
+    ACTION_EFFECTS,
+    COOLDOWN_KEY,
+    ActionEffectApplier,
+    apply_effect,
+    merge_cooldowns,
+)
+
+
+def make_states(energy=50.0, internal=0.2, external=0.3):
+    return {
+        "rhythm": {
+            "internal_phase": internal,
+            "external_phase": external,
+            "phase_difference": external - internal,
+        },
+        "energy": {"energy": energy},
+    }
+
+
+def test_feed_adds_energy_with_cap():
+    states = make_states(energy=90.0)
+    assert apply_effect(states, ACTION_EFFECTS["feed"])
+    assert states["energy"]["energy"] == 100.0
+
+
+def test_play_requires_energy():
+    states = make_states(energy=20.0)
+    assert not apply_effect(states, ACTION_EFFECTS["play"])
+    assert states["energy"]["energy"] == 20.0
+
+
+def test_phase_sync_wraps_around():
+    """相位0.95与0.05只差0.1，同步方向应跨越0点"""
+    states = make_states(internal=0.95, external=0.05)
+    apply_effect(states, ACTION_EFFECTS["play"])
+    assert states["rhythm"]["internal_phase"] == pytest.approx(0.96)
+    assert abs(states["rhythm"]["phase_difference"]) < abs(0.05 - 0.95)
+
+
+def test_batch_respects_cooldown_per_device():
+    applier = ActionEffectApplier()
+    states = make_states(energy=10.0)
+    batch = [("feed", "a"), ("feed", "a"), ("feed", "b"), ("dance", "a")]
+
+    applied = applier.apply_batch(states, batch, now=1000.0)
+
+    assert applied == ["feed", "feed"]
+    assert states["energy"]["energy"] == 50.0
+
+    # 冷却期过后再次生效
+    assert applier.apply_batch(states, [("feed", "a")], now=1061.0) == ["feed"]
+
+
+
+def test_cooldown_lives_in_states_not_applier():
+    """冷却只来自状态：另一个applier（另一实例）读到同一状态时同样冷却，丢弃的状态不留冷却"""
+    states = make_states(energy=10.0)
+    discarded = make_states(energy=10.0)
+
+    assert ActionEffectApplier().apply_batch(discarded, [("feed", "a")], now=1000.0) == ["feed"]
+    assert ActionEffectApplier().apply_batch(states, [("feed", "a")], now=1000.0) == ["feed"]
+    assert states[COOLDOWN_KEY] == {"feed:a": 1000.0}
+    assert ActionEffectApplier().apply_batch(states, [("feed", "a")], now=1030.0) == []
+
+    # 过期的冷却在下次应用时清理
+    ActionEffectApplier().apply_batch(states, [("greet", "b")], now=1070.0)
+    assert states[COOLDOWN_KEY] == {"greet:b": 1070.0}
+
+
+def test_merge_cooldowns_keeps_latest():
+    assert merge_cooldowns({"feed:a": 10.0, "greet:b": 5.0}, {"feed:a": 8.0, "play:c": 9.0}) == {
+        "feed:a": 10.0, "greet:b": 5.0, "play:c": 9.0
+    }
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
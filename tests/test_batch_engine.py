@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+批量模拟引擎测试（需要安装numpy）
+
+测试覆盖：
+1. 推进结果与 PetAdapter._calculate_delta 一致
+2. 状态码与 PetAdapter._determine_state 一致
+3. 扩容、覆盖、导出
+4. 推进不改变数组容量，对所有宠物一次完成
+5. 性能基准：单核每秒至少100万次宠物更新（默认跳过，--benchmark 开启）
+
+使用方法：
+    python -m pytest tests/test_batch_engine.py -q -s --benchmark
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+np = pytest.importorskip("numpy")
+
+from src.batch_engine import STATE_NAMES, PetBatch
+from src.pet_adapter import PetAdapter
+
+
+def make_state(pet_id, energy, hunger, mood, minutes_ago):
+    last_updated = datetime.utcnow() - timedelta(minutes=minutes_ago)
+    return {
+        "device_id": pet_id,
+        "energy": energy,
+        "hunger": hunger,
+        "mood": mood,
+        "current_state": PetAdapter.STATE_IDLE,
+        "last_updated": last_updated.isoformat(),
+        "pet_name": "小糖",
+    }
+
+
+def test_advance_matches_pet_adapter():
+    states = [
+        make_state("a", 80.0, 30.0, 70.0, 90),
+        make_state("b", 5.0, 95.0, 10.0, 600),  # 截断到0/100
+        make_state("c", 50.0, 50.0, 50.0, 0),
+    ]
+    batch = PetBatch.from_states(states)
+    batch.advance_to(time.time())
+
+    adapter = PetAdapter("batch-test")
+    for state in states:
+        expected = adapter._calculate_delta(dict(state))
+        actual = batch.to_state(state["device_id"])
+        for field in ("energy", "hunger", "mood"):
+            assert actual[field] == pytest.approx(expected[field], abs=1e-3)
+    PetAdapter._pet_states.pop("batch-test", None)
+
+
+def test_state_codes_match_pet_adapter():
+    """网格上逐点对比状态判定"""
+    adapter = PetAdapter("batch-test")
+    batch = PetBatch()
+    grid = [float(v) for v in range(0, 101, 5)]
+    for energy in grid:
+        for hunger in grid:
+            for mood in grid:
+                batch.add(f"{energy}-{hunger}-{mood}", energy, hunger, mood, 0.0)
+
+    codes = batch.determine_states()
+    for i, pet_id in enumerate(batch.ids):
+        energy, hunger, mood = (float(v) for v in pet_id.split("-"))
+        expected = adapter._determine_state({"energy": energy, "hunger": hunger, "mood": mood})
+        assert STATE_NAMES[codes[i]] == expected
+    PetAdapter._pet_states.pop("batch-test", None)
+
+
+def test_grow_and_overwrite():
+    batch = PetBatch(capacity=1)
+    for i in range(10):
+        batch.add(f"pet-{i}", 50.0, 50.0, 50.0, 0.0)
+    batch.add("pet-3", 90.0, 10.0, 90.0, 0.0)
+
+    assert len(batch) == 10
+    assert batch.capacity >= 10
+    assert batch.to_state("pet-3")["current_state"] == PetAdapter.STATE_PLAY
+    assert len(batch.to_states()) == 10
+
+
+def test_only_past_pets_advance():
+    batch = PetBatch()
+    batch.add("old", 50.0, 50.0, 50.0, 1000.0)
+    batch.add("future", 50.0, 50.0, 50.0, 5000.0)
+
+    assert batch.advance_to(1600.0) == 1
+    assert batch.to_state("old")["energy"] == pytest.approx(49.0)
+    assert batch.to_state("future")["energy"] == 50.0
+
+
+def test_advance_is_vectorized():
+    """推进在原数组上完成：不扩容、不复制，所有宠物一次推进"""
+    n = 10_000
+    batch = PetBatch(capacity=n)
+    for i in range(n):
+        batch.add(f"pet-{i}", 80.0, 20.0, 70.0, 0.0)
+    arrays = [batch.energy, batch.hunger, batch.mood, batch.last_updated]
+
+    assert batch.advance_to(600.0) == n
+    assert all(a is b for a, b in zip(arrays, [batch.energy, batch.hunger, batch.mood, batch.last_updated]))
+    assert np.allclose(batch.hunger[:n], 20.0 + 10 * PetAdapter.HUNGER_PER_MINUTE)
+    assert len(batch.determine_states()) == n
+
+
+@pytest.mark.benchmark
+def test_throughput():
+    """100万只宠物：每次推进一分钟，单核吞吐至少100万次更新/秒"""
+    n = 1_000_000
+    batch = PetBatch(capacity=n)
+    rng = np.random.default_rng(0)
+    batch.energy[:] = rng.uniform(0, 100, n)
+    batch.hunger[:] = rng.uniform(0, 100, n)
+    batch.mood[:] = rng.uniform(0, 100, n)
+    batch.last_updated[:] = 0.0
+    batch.size = n
+    batch.ids = [None] * n  # 吞吐测试不需要按ID查找
+
+    rounds = 5
+    start = time.perf_counter()
+    for i in range(1, rounds + 1):
+        batch.advance_to(60.0 * i)
+        batch.determine_states()
+    elapsed = time.perf_counter() - start
+
+    rate = n * rounds / elapsed
+    print(f"   {n}只宠物 × {rounds}轮: {elapsed * 1000:.0f}ms, {rate / 1e6:.1f}M次更新/秒")
+    assert rate >= 1_000_000
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+离线补偿性能基准：30天补偿的延迟预算
+
+测试覆盖：
+1. 参考模型上快进720小时的tick调用次数不随时长线性增长
+1a. tick预算（max_tick_calls）是硬上限：没有周期折叠时30天补偿只推进一部分，
+    剩余时长由后续补偿继续；LifeAdapter只把水位线推进到实际补偿到的时刻
+2. 真实Life引擎上 LifeAdapter.catchup(720) 的tick调用次数（需要安装micro-life-sim）
+3. 性能基准：上述两项的耗时在预算内（默认跳过，--benchmark 开启）
+
+预算通过 LIFE_CATCHUP_BUDGET_MS 配置（默认10ms），取多次运行的中位数
+
+使用方法：
+    python -m pytest tests/test_catchup_benchmark.py -q -s --benchmark
+"""
+
+import os
+import statistics
+import sys
+import time
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.fast_forward import FastForward
+from src.lazy_pet import MemoryStorage
+from src.life_adapter import ADVANCE_MAX_TICK_CALLS, CATCHUP_BUDGET_MS, LifeAdapter
+from src.storage import BatchedStorage, FlushTracker
+from src.tick_clock import TickClock
+from test_fast_forward import PERIOD_SECONDS, initial_states, reference_step
+from test_lazy_pet import ReferenceLife
+
+THIRTY_DAYS = 30 * 86400
+
+RUNS = 5
+
+# 30天补偿的tick调用上限（逐秒tick需要259万次）
+MAX_TICK_CALLS = 3000
+
+
+def _median_ms(fn):
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def _fast_forward():
+    return FastForward(
+        period_seconds=PERIOD_SECONDS,
+        thresholds={("energy", "energy"): LifeAdapter.ENERGY_THRESHOLDS},
+    )
+
+
+def test_reference_catchup_complexity():
+    """参考模型：周期折叠后，720小时与24小时的tick调用次数相当"""
+    fast_forward = _fast_forward()
+    calls = {
+        hours: fast_forward.advance_states(reference_step, initial_states(), hours * 3600)[1].tick_calls
+        for hours in (24, 168, 720)
+    }
+    print(f"   参考模型 tick调用: {calls}")
+
+    assert calls[720] < MAX_TICK_CALLS
+    assert calls[720] < 2 * calls[24]
+
+
+class CountingLife(ReferenceLife):
+    """记录tick调用次数的参考Life"""
+
+    def __init__(self, backend):
+        super().__init__(backend)
+        self.ticks = 0
+
+    def tick(self, dt):
+        self.ticks += 1
+        super().tick(dt)
+
+
+def test_tick_budget_caps_30_day_gap():
+    """没有周期折叠时30天需要上千次tick：预算用尽时停下，分几次推进的结果与一次推进一致"""
+    budget = 200
+    fast_forward = FastForward(
+        period_seconds=None,
+        thresholds={("energy", "energy"): LifeAdapter.ENERGY_THRESHOLDS},
+        max_tick_calls=budget,
+    )
+    life = CountingLife(MemoryStorage())
+
+    remaining, rounds = float(THIRTY_DAYS), 0
+    while remaining > 0:
+        life.ticks = 0
+        stats = fast_forward.advance(life, remaining)
+        assert life.ticks == stats.tick_calls <= budget
+        assert stats.seconds + stats.remaining == pytest.approx(remaining)
+        remaining, rounds = stats.remaining, rounds + 1
+    assert rounds > 1
+
+    unbounded = CountingLife(MemoryStorage())
+    FastForward(period_seconds=None, thresholds=fast_forward.stepper.thresholds).advance(unbounded, THIRTY_DAYS)
+    assert unbounded.ticks > budget
+    assert life.get_states()["energy"]["energy"] == pytest.approx(
+        unbounded.get_states()["energy"]["energy"], abs=0.5
+    )
+
+
+def test_adapter_resumes_after_tick_budget(monkeypatch):
+    """请求补偿30天：tick次数不超过预算，水位线只推进到实际补偿到的时刻，下次请求继续"""
+    now = 1700000000.0
+    backend = BatchedStorage(MemoryStorage())
+    life = CountingLife(backend)
+    clock = TickClock(backend)
+    clock.claim(now - THIRTY_DAYS)
+
+    monkeypatch.setattr(LifeAdapter, "_tick_clock", clock)
+    monkeypatch.setattr(LifeAdapter, "_flush_tracker", FlushTracker())
+    monkeypatch.setattr(LifeAdapter, "_pending_reapply", [])
+    monkeypatch.setattr(LifeAdapter, "_write_behind", None)
+    monkeypatch.setattr(LifeAdapter, "_fast_forward", FastForward(
+        period_seconds=None,
+        thresholds={("energy", "energy"): LifeAdapter.ENERGY_THRESHOLDS},
+        max_tick_calls=ADVANCE_MAX_TICK_CALLS // 10,
+    ))
+    monkeypatch.setattr("src.life_adapter.time.time", lambda: now)
+    adapter = object.__new__(LifeAdapter)
+
+    adapter._tick_life_engine(life)
+    assert life.ticks <= ADVANCE_MAX_TICK_CALLS // 10
+    watermark = TickClock(backend).peek()
+    assert now - THIRTY_DAYS < watermark < now
+
+    life.ticks = 0
+    adapter._tick_life_engine(life)
+    assert life.ticks <= ADVANCE_MAX_TICK_CALLS // 10
+    assert TickClock(backend).peek() > watermark
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("hours", [24, 168, 720])
+def test_reference_catchup_budget(hours):
+    """参考模型：补偿任意时长都在预算内"""
+    fast_forward = _fast_forward()
+
+    elapsed = _median_ms(
+        lambda: fast_forward.advance_states(reference_step, initial_states(), hours * 3600)
+    )
+    print(f"   参考模型 {hours}h: {elapsed:.2f}ms（预算 {CATCHUP_BUDGET_MS:.0f}ms）")
+
+    assert elapsed < CATCHUP_BUDGET_MS
+
+
+def test_life_catchup_complexity(monkeypatch):
+    """真实引擎：/api/pet/catchup?hours=720 只需有限次tick"""
+    from src.life_adapter import LIFE_ENGINE_AVAILABLE
+    if not LIFE_ENGINE_AVAILABLE:
+        pytest.skip("micro-life-sim 未安装")
+
+    adapter = LifeAdapter("test_catchup_benchmark")
+    adapter.get_state()
+
+    recorded = []
+    advance = LifeAdapter._fast_forward.advance
+
+    def recording_advance(life, seconds):
+        stats = advance(life, seconds)
+        recorded.append(stats)
+        return stats
+
+    monkeypatch.setattr(LifeAdapter._fast_forward, "advance", recording_advance)
+    adapter.catchup(hours=720)
+
+    catchup_stats = max(recorded, key=lambda stats: stats.seconds)
+    print(f"   Life引擎 720h: tick调用={catchup_stats.tick_calls}")
+    assert catchup_stats.seconds == pytest.approx(720 * 3600)
+    assert catchup_stats.tick_calls < MAX_TICK_CALLS
+
+
+@pytest.mark.benchmark
+def test_life_catchup_budget():
+    """真实引擎：/api/pet/catchup?hours=720 在预算内"""
+    from src.life_adapter import LIFE_ENGINE_AVAILABLE
+    if not LIFE_ENGINE_AVAILABLE:
+        pytest.skip("micro-life-sim 未安装")
+
+    adapter = LifeAdapter("test_catchup_benchmark")
+    adapter.get_state()  # 预热：创建全局实例并初始化时间戳
+
+    elapsed = _median_ms(lambda: adapter.catchup(hours=720))
+    print(f"   Life引擎 720h: {elapsed:.2f}ms（预算 {CATCHUP_BUDGET_MS:.0f}ms）")
+
+    assert elapsed < CATCHUP_BUDGET_MS
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
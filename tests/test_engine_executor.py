@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+引擎执行器测试
+
+测试覆盖：
+1. 调用在线程池中执行，不在事件循环线程
+2. 在途请求数达到上限时立即拒绝
+3. shutdown() 后再次提交可用（同一进程内多次进入lifespan）
+
+使用方法：
+    python -m pytest tests/test_engine_executor.py -q
+"""
+
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.engine_executor import EngineBusyError, EngineExecutor
+
+
+def test_runs_off_event_loop():
+    executor = EngineExecutor(max_workers=1, queue_depth=0)
+
+    async def main():
+        return threading.get_ident(), await executor.run(threading.get_ident)
+
+    loop_thread, worker_thread = asyncio.run(main())
+    assert loop_thread != worker_thread
+    executor.shutdown()
+
+
+def test_rejects_when_busy():
+    executor = EngineExecutor(max_workers=1, queue_depth=0)
+    release = threading.Event()
+
+    async def main():
+        first = asyncio.ensure_future(executor.run(release.wait, 5))
+        await asyncio.sleep(0.01)
+        with pytest.raises(EngineBusyError):
+            await executor.run(lambda: None)
+        release.set()
+        return await first
+
+    assert asyncio.run(main()) is True
+    executor.shutdown()
+
+
+def test_restart_after_shutdown():
+    executor = EngineExecutor(max_workers=1, queue_depth=0)
+    assert asyncio.run(executor.run(lambda: 1)) == 1
+
+    executor.shutdown()
+    executor.shutdown()  # 重复关闭无副作用
+    assert asyncio.run(executor.run(lambda: 2)) == 2
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
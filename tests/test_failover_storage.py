@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+故障转移存储测试
+
+测试覆盖：
+1. Redis故障期间写入进入本地缓冲，读取不再访问主存储
+2. 按退避间隔在后台探测（不阻塞请求），恢复后回放缓冲的写入
+3. 故障期间其他实例写入过的键以主存储为准（不分叉）
+4. 初始化失败后在探测中重试创建主存储
+5. tick水位线在故障期间本地推进，恢复后同步
+
+使用方法：
+    python -m pytest tests/test_failover_storage.py -q
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeRedis, Outage
+from src.failover_storage import FailoverStorage
+from src.tick_clock import TickClock
+
+
+class FlakyStorage:
+    """内存主存储，Redis不可达时所有操作抛出ConnectionError"""
+
+    def __init__(self, outage):
+        self.outage = outage
+        self.data = {}
+        self.calls = 0
+
+    def load(self, key):
+        self.calls += 1
+        self.outage.check()
+        return dict(self.data.get(key, {}))
+
+    def save(self, key, state):
+        self.calls += 1
+        self.outage.check()
+        self.data[key] = dict(state)
+
+    def delete(self, key):
+        self.outage.check()
+        self.data.pop(key, None)
+
+    def exists(self, key):
+        self.outage.check()
+        return key in self.data
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可控的单调时钟"""
+    now = [1000.0]
+    monkeypatch.setattr("src.failover_storage.time.monotonic", lambda: now[0])
+    return now
+
+
+def make_storage(outage, primary=None, **kwargs):
+    primary = primary or FlakyStorage(outage)
+    storage = FailoverStorage(lambda: primary, client=FakeRedis(outage), key_prefix="life_test", **kwargs)
+    return storage, primary
+
+
+def test_outage_buffers_writes(clock):
+    """故障期间写入进入缓冲，读取返回本地值且不访问主存储"""
+    outage = Outage()
+    storage, primary = make_storage(outage, base_backoff=5.0)
+    storage.save("energy", {"energy": 80.0})
+
+    outage.down = True
+    storage.save("energy", {"energy": 70.0})
+    assert not storage.available
+
+    calls = primary.calls
+    storage.save("energy", {"energy": 60.0})
+    assert storage.load("energy") == {"energy": 60.0}
+    assert primary.calls == calls
+    assert storage.buffered_keys == 1
+    assert primary.data["energy"] == {"energy": 80.0}
+
+
+def test_recovery_replays_buffer(clock):
+    """退避到期后探测成功，回放缓冲的写入"""
+    outage = Outage()
+    storage, primary = make_storage(outage, base_backoff=5.0)
+    storage.save("energy", {"energy": 80.0})
+
+    outage.down = True
+    storage.save("energy", {"energy": 70.0})
+    outage.down = False
+
+    # 退避未到期：仍走本地
+    clock[0] += 1.0
+    assert storage.load("energy") == {"energy": 70.0}
+    assert storage.probes == 0
+
+    clock[0] += 5.0
+    assert storage.load("energy") == {"energy": 70.0}  # 启动后台探测，本次仍走本地
+    assert storage.wait_for_probe()
+    assert storage.available
+    assert primary.data["energy"] == {"energy": 70.0}
+    assert storage.stats()["replayed_keys"] == 1
+    assert not storage.needs_reload
+
+
+def test_failed_probe_backs_off(clock):
+    outage = Outage()
+    storage, _ = make_storage(outage, base_backoff=1.0, max_backoff=4.0)
+    outage.down = True
+    storage.save("energy", {"energy": 70.0})
+
+    for _ in range(5):
+        clock[0] += 10.0
+        storage.load("energy")
+        assert not storage.wait_for_probe()
+
+    assert storage.probes == 5
+    assert storage._backoff == 4.0
+
+
+def test_conflicting_write_not_replayed(clock):
+    """故障期间其他实例写入过的键：放弃本地写入，以主存储为准"""
+    outage = Outage()
+    storage, primary = make_storage(outage, base_backoff=1.0)
+    storage.save("energy", {"energy": 80.0})
+
+    outage.down = True
+    storage.save("energy", {"energy": 70.0})
+    primary.data["energy"] = {"energy": 55.0}  # 其他实例的写入
+    outage.down = False
+
+    clock[0] += 2.0
+    storage.load("energy")
+    assert storage.wait_for_probe()
+    assert storage.load("energy") == {"energy": 55.0}
+    assert primary.data["energy"] == {"energy": 55.0}
+    assert storage.conflicts == 1
+    assert storage.needs_reload
+
+
+def test_initial_failure_retries_factory(clock):
+    """主存储初始化失败时不永久降级，探测时重新创建"""
+    outage = Outage()
+    outage.down = True
+    primary = FlakyStorage(outage)
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        outage.check()
+        return primary
+
+    storage = FailoverStorage(factory, client=FakeRedis(outage), key_prefix="life_test", base_backoff=1.0)
+    assert not storage.available
+    storage.save("energy", {"energy": 90.0})
+
+    outage.down = False
+    clock[0] += 2.0
+    storage.load("energy")
+    assert storage.wait_for_probe()
+    assert storage.load("energy") == {"energy": 90.0}
+    assert len(attempts) == 2
+    assert primary.data["energy"] == {"energy": 90.0}
+
+
+def test_fallback_receives_outage_writes(clock):
+    """故障期间的写入同时持久化到本地后备存储"""
+    outage = Outage()
+    fallback = FlakyStorage(Outage())
+    storage, _ = make_storage(outage, fallback=fallback)
+    outage.down = True
+    storage.save("energy", {"energy": 42.0})
+
+    assert fallback.data["energy"] == {"energy": 42.0}
+
+
+def test_slow_probe_does_not_block_requests(clock):
+    """探测卡住（Redis不响应）时请求不等待：PING不持有锁"""
+    outage = Outage()
+    storage, primary = make_storage(outage, base_backoff=1.0)
+    outage.down = True
+    storage.save("energy", {"energy": 70.0})
+    outage.down = False
+
+    release = threading.Event()
+
+    class SlowProbe:
+        def ping(self):
+            release.wait(5)
+            return True
+
+    storage.probe_client = SlowProbe()
+    clock[0] += 2.0
+    storage.load("energy")
+
+    start = time.perf_counter()
+    storage.save("energy", {"energy": 60.0})
+    assert storage.load("energy") == {"energy": 60.0}
+    assert time.perf_counter() - start < 1.0
+    assert storage.probes == 1 and not storage.available
+
+    release.set()
+    assert storage.wait_for_probe()
+    assert primary.data["energy"] == {"energy": 60.0}
+
+
+def test_tick_clock_during_outage(clock):
+    """故障期间水位线本地推进，恢复后同步到Redis（只前进不后退）"""
+    outage = Outage()
+    storage, _ = make_storage(outage, base_backoff=1.0)
+    tick_clock = TickClock(storage)
+    tick_clock.claim(0.0)
+
+    outage.down = True
+    storage.save("energy", {"energy": 1.0})  # 触发熔断
+    assert tick_clock.claim(60.0) == 60.0
+    assert tick_clock.claim(90.0) == 30.0
+
+    outage.down = False
+    clock[0] += 2.0
+    storage.load("energy")  # 探测恢复
+    assert storage.wait_for_probe()
+    assert tick_clock.claim(100.0) == pytest.approx(10.0)
+    assert float(storage.client.data["life_test:tick_clock"]) == 100.0
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+快进引擎一致性测试：解析快进 vs 逐秒tick
+
+测试覆盖：
+1. 参考模型（与引擎结构相同的节律+能量系统）上的一致性
+2. 自适应步长的调用次数与误差上界
+3. 真实Life引擎上的一致性（需要安装micro-life-sim）
+
+使用方法：
+    python -m pytest tests/test_fast_forward.py -q
+"""
+
+import math
+import os
+import sys
+import tempfile
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.fast_forward import AdaptiveStepper, AdvanceStats, FastForward, state_error
+
+PERIOD_SECONDS = 10 * 3600  # 与LifeAdapter一致的10小时周期
+
+
+def reference_step(states, dt):
+    """
+    参考模型：节律相位匀速前进，能量消耗率随昼夜节律变化
+
+    能量用显式欧拉积分（大步长会产生误差，用于检验误差控制）
+    """
+    rhythm = dict(states["rhythm"])
+    energy = dict(states["energy"])
+
+    circadian = 0.5 + 0.5 * math.sin(2 * math.pi * rhythm["internal_phase"])
+    rate = 0.0005 + 0.002 * circadian  # 每秒消耗
+    energy["energy"] = max(0.0, min(100.0, energy["energy"] - rate * dt))
+    energy["circadian_value"] = circadian
+
+    rhythm["internal_phase"] = (rhythm["internal_phase"] + dt / PERIOD_SECONDS) % 1.0
+    return {"rhythm": rhythm, "energy": energy}
+
+
+def initial_states():
+    return {
+        "rhythm": {"internal_phase": 0.1, "last_update": 0.0},
+        "energy": {"energy": 100.0, "circadian_value": 0.5, "last_update": 0.0},
+    }
+
+
+def loop_advance(states, seconds):
+    """对照组：逐秒tick"""
+    for _ in range(int(seconds)):
+        states = reference_step(states, 1.0)
+    return states
+
+
+@pytest.mark.parametrize("seconds", [59, 600, 3600, 6 * 3600, 24 * 3600])
+def test_reference_parity(seconds):
+    """参考模型上快进结果与逐秒tick一致"""
+    expected = loop_advance(initial_states(), seconds)
+    actual, stats = FastForward(tolerance=1e-4).advance_states(
+        reference_step, initial_states(), seconds
+    )
+
+    energy_diff = abs(actual["energy"]["energy"] - expected["energy"]["energy"])
+    print(f"   {seconds}s: tick调用={stats.tick_calls}, 能量误差={energy_diff:.4f}")
+
+    assert energy_diff < 0.5
+    assert state_error(actual, expected) < 1e-2
+    if seconds >= 3600:
+        assert stats.tick_calls < seconds / 10
+
+
+def test_reference_period_folding():
+    """能量见底后进入极限环，30天补偿通过周期折叠完成"""
+    seconds = 30 * 86400
+    fast_forward = FastForward(tolerance=1e-4, period_seconds=PERIOD_SECONDS)
+    actual, stats = fast_forward.advance_states(reference_step, initial_states(), seconds)
+
+    expected_phase = (0.1 + seconds / PERIOD_SECONDS) % 1.0
+    print(f"   30天: tick调用={stats.tick_calls}, 折叠周期={stats.folded_periods}")
+
+    assert stats.folded_periods > 0
+    assert stats.tick_calls < 3000
+    assert actual["energy"]["energy"] == 0.0
+    assert abs(actual["rhythm"]["internal_phase"] - expected_phase) < 1e-6
+
+
+@pytest.mark.parametrize("seconds", [12 * 3600, 24 * 3600])
+def test_adaptive_error_bound(seconds):
+    """12/24小时补偿：几百次调用，实测误差不超过估计上界"""
+    thresholds = {("energy", "energy"): (30.0, 70.0)}
+    fast_forward = FastForward(tolerance=1e-3, thresholds=thresholds)
+
+    expected = loop_advance(initial_states(), seconds)
+    actual, stats = fast_forward.advance_states(reference_step, initial_states(), seconds)
+
+    measured = state_error(actual, expected)
+    print(f"   {seconds}s: tick调用={stats.tick_calls}, 实测误差={measured:.2e}, 估计上界={stats.error_bound:.2e}")
+
+    assert stats.tick_calls < 500
+    assert stats.threshold_crossings >= 1
+    assert measured <= stats.error_bound
+
+
+def test_threshold_crossing_uses_small_steps():
+    """跨越阈值的那一步不超过threshold_step"""
+    accepted = []
+
+    def recording_step(states, dt):
+        accepted.append(dt)
+        return reference_step(states, dt)
+
+    stepper = AdaptiveStepper(
+        tolerance=1.0,  # 误差放宽，只让阈值约束步长
+        thresholds={("energy", "energy"): (90.0,)},
+        threshold_step=60.0,
+    )
+    stats = AdvanceStats()
+    states = stepper.integrate(recording_step, initial_states(), 4 * 3600, stats)
+
+    assert stats.threshold_crossings == 1
+    assert states["energy"]["energy"] < 90.0
+    assert min(accepted) <= 30.0  # 跨越阈值时的半步
+
+
+def test_phase_error_wraps():
+    """相位误差按环绕距离计算"""
+    a = {"rhythm": {"internal_phase": 0.999}}
+    b = {"rhythm": {"internal_phase": 0.001}}
+    assert state_error(a, b) == pytest.approx(0.002)
+
+
+def test_timestamps_ignored():
+    """墙钟时间戳不计入误差"""
+    a = {"energy": {"energy": 50.0, "last_update": 1.0}}
+    b = {"energy": {"energy": 50.0, "last_update": 9999.0}}
+    assert state_error(a, b) == 0.0
+
+
+def _create_life(state_dir):
+    from src.life_adapter import Life
+    from core import FileStorage
+
+    life = Life(
+        backend=FileStorage(state_dir),
+        time_scale=1.0,
+        auto_flush=False,
+        internal_period_hours=10.0,
+        external_period_hours=10.0,
+    )
+    life.start()
+    return life
+
+
+@pytest.mark.parametrize("seconds", [600, 3600, 4 * 3600])
+def test_life_parity(seconds):
+    """真实Life引擎上快进结果与逐秒tick一致"""
+    from src.life_adapter import LIFE_ENGINE_AVAILABLE
+    if not LIFE_ENGINE_AVAILABLE:
+        pytest.skip("micro-life-sim 未安装")
+
+    with tempfile.TemporaryDirectory() as dir_a, tempfile.TemporaryDirectory() as dir_b:
+        life_loop = _create_life(dir_a)
+        life_fast = _create_life(dir_b)
+
+        for _ in range(seconds):
+            life_loop.tick(dt=1.0)
+        stats = FastForward().advance(life_fast, seconds)
+
+        expected = life_loop.get_states()
+        actual = life_fast.get_states()
+        print(f"   {seconds}s: tick调用={stats.tick_calls}, 误差={state_error(actual, expected):.2e}")
+
+        assert state_error(actual, expected) < 1e-2
+        assert stats.tick_calls < seconds
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+互动组提交队列测试
+
+测试覆盖：
+1. 并发互动被合并成少量批次，且每个调用方返回时自己的互动已提交
+2. 批内保持到达顺序
+3. 提交失败时整批调用方都收到异常
+
+使用方法：
+    python -m pytest tests/test_interaction_queue.py -q
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.interaction_queue import InteractionQueue
+
+
+def test_concurrent_interactions_group_commit():
+    committed = []
+    lock = threading.Lock()
+
+    def apply_batch(batch):
+        time.sleep(0.005)  # 模拟一次刷盘
+        with lock:
+            committed.extend(batch)
+
+    queue = InteractionQueue(apply_batch, commit_window=0.005)
+    returned_after_commit = []
+
+    def worker(i):
+        queue.submit("feed", f"device-{i}")
+        with lock:
+            returned_after_commit.append((("feed", f"device-{i}") in committed))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(100)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(committed) == 100
+    assert all(returned_after_commit)
+    assert queue.committed_actions == 100
+    assert queue.commits < 100
+    print(f"   100个互动 → {queue.commits} 次提交")
+
+
+def test_batch_preserves_arrival_order():
+    batches = []
+    queue = InteractionQueue(batches.append, commit_window=0)
+
+    for action in ("feed", "greet", "play"):
+        queue.submit(action, "device-1")
+
+    assert [a for batch in batches for a, _ in batch] == ["feed", "greet", "play"]
+
+
+def test_commit_error_reaches_every_caller():
+    def apply_batch(batch):
+        raise RuntimeError("storage down")
+
+    queue = InteractionQueue(apply_batch, commit_window=0.01)
+    errors = []
+
+    def worker():
+        try:
+            queue.submit("play", "device-x")
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == ["storage down"] * 5
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+惰性物化测试
+
+测试覆盖：
+1. 读取只访问一次存储、不写回；同一记录在不同时刻推算出不同状态
+   新宠物首次读取时写入初始记录（不覆盖其他实例先写入的记录），之后随时间变化
+2. 推算结果与常驻实例逐秒推进一致
+3. 只有产生效果的互动才写回记录；两个实例共享版本化的Redis/SQLite时互动都不丢失
+   冷却记录随记录写回：实例间共享，冲突重试不被自己上一次尝试的冷却挡住
+4. 求值用的Life实例按线程复用，与宠物数量无关
+5. LifeAdapter lazy模式（需要安装micro-life-sim）
+
+使用方法：
+    python -m pytest tests/test_lazy_pet.py -q
+"""
+
+import math
+import os
+import sys
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeRedis, redis_backend
+from src.action_effects import COOLDOWN_KEY, ActionEffectApplier
+from src.fast_forward import FastForward
+from src.lazy_pet import LazyPetEvaluator, MemoryStorage, PetRecord
+from src.sqlite_storage import SQLiteStorage
+from src.storage import BatchedStorage, VersionConflict
+
+PERIOD_SECONDS = 10 * 3600
+
+
+class ReferenceLife:
+    """
+    与Life接口相同的参考模型（节律相位匀速前进，能量按昼夜节律消耗）
+
+    状态保存在 state_manager 中，tick/get_states/get_expression 与Life用法一致
+    """
+
+    class _StateManager:
+        def __init__(self, backend):
+            self.backend = backend
+            self.auto_flush = False
+            self._pending_saves = {}
+
+        def load(self, key):
+            if key in self._pending_saves:
+                return self._pending_saves[key]
+            return self.backend.load(key)
+
+        def save(self, key, state):
+            self._pending_saves[key] = dict(state)
+
+    systems = {"rhythm": None, "energy": None}
+    created = 0
+
+    def __init__(self, backend):
+        ReferenceLife.created += 1
+        self.state_manager = self._StateManager(backend)
+        self.state_manager.save("rhythm", {"internal_phase": 0.1})
+        self.state_manager.save("energy", {"energy": 100.0})
+
+    def tick(self, dt):
+        rhythm = dict(self.state_manager.load("rhythm"))
+        energy = dict(self.state_manager.load("energy"))
+        circadian = 0.5 + 0.5 * math.sin(2 * math.pi * rhythm["internal_phase"])
+        energy["energy"] = max(0.0, energy["energy"] - (0.0005 + 0.002 * circadian) * dt)
+        rhythm["internal_phase"] = (rhythm["internal_phase"] + dt / PERIOD_SECONDS) % 1.0
+        self.state_manager.save("rhythm", rhythm)
+        self.state_manager.save("energy", energy)
+
+    def get_states(self):
+        return {name: dict(self.state_manager.load(name)) for name in self.systems}
+
+    def get_expression(self):
+        return {"feeling": "tired" if self.state_manager.load("energy")["energy"] < 30 else "ok"}
+
+
+class CountingStorage(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.loads = 0
+        self.saves = 0
+
+    def load(self, key):
+        self.loads += 1
+        return super().load(key)
+
+    def save(self, key, state):
+        self.saves += 1
+        super().save(key, state)
+
+
+def make_evaluator():
+    storage = CountingStorage()
+    evaluator = LazyPetEvaluator(
+        backend=storage,
+        life_factory=lambda: ReferenceLife(MemoryStorage()),
+        fast_forward=FastForward(tolerance=1e-4, period_seconds=PERIOD_SECONDS),
+    )
+    return evaluator, storage
+
+
+def test_read_is_one_load_without_write():
+    evaluator, storage = make_evaluator()
+    storage.save("pet:a", PetRecord({"rhythm": {"internal_phase": 0.1}, "energy": {"energy": 80.0}}, 0.0).encode())
+    storage.saves = 0
+
+    states, expression = evaluator.materialize("a", now=3600.0)
+    later, _ = evaluator.materialize("a", now=7200.0)
+
+    assert storage.loads == 2
+    assert storage.saves == 0
+    assert states["energy"]["energy"] < 80.0
+    assert later["energy"]["energy"] < states["energy"]["energy"]
+    assert expression == {"feeling": "ok"}
+
+
+def test_matches_resident_life():
+    """惰性推算与常驻实例逐秒推进的结果一致"""
+    evaluator, storage = make_evaluator()
+    start = {"rhythm": {"internal_phase": 0.3}, "energy": {"energy": 90.0}}
+    storage.save("pet:a", PetRecord(start, 1000.0).encode())
+
+    resident = ReferenceLife(MemoryStorage())
+    resident.state_manager.save("rhythm", start["rhythm"])
+    resident.state_manager.save("energy", start["energy"])
+    for _ in range(4 * 3600):
+        resident.tick(1.0)
+
+    states, _ = evaluator.materialize("a", now=1000.0 + 4 * 3600)
+    assert states["energy"]["energy"] == pytest.approx(resident.get_states()["energy"]["energy"], abs=0.5)
+
+
+def test_new_pet_starts_from_initial_state():
+    evaluator, storage = make_evaluator()
+    states, _ = evaluator.materialize("new", now=5000.0)
+    assert states["energy"]["energy"] == 100.0
+
+    # 首次读取写入了初始记录，之后的读取从出生时刻推算（不再写入）
+    record = PetRecord.decode(storage.load("pet:new"))
+    assert record.updated_at == 5000.0
+    later, _ = evaluator.materialize("new", now=5000.0 + 3600)
+    assert later["energy"]["energy"] < 100.0
+    assert evaluator.stats()["writes"] == 1
+
+
+def test_new_pet_keeps_concurrent_record():
+    """其他实例先写入了记录：不覆盖，从那条记录推算"""
+    class RacingStorage(MemoryStorage):
+        def save_if_absent(self, key, state):
+            self.save(key, PetRecord({"rhythm": {"internal_phase": 0.1}, "energy": {"energy": 40.0}}, 0.0).encode())
+            return super().save_if_absent(key, state)
+
+    storage = RacingStorage()
+    evaluator = LazyPetEvaluator(
+        backend=storage,
+        life_factory=lambda: ReferenceLife(MemoryStorage()),
+        fast_forward=FastForward(tolerance=1e-4, period_seconds=PERIOD_SECONDS),
+    )
+    states, _ = evaluator.materialize("a", now=0.0)
+    assert states["energy"]["energy"] == 40.0
+    assert PetRecord.decode(storage.load("pet:a")).states["energy"]["energy"] == 40.0
+    assert evaluator.stats()["writes"] == 0
+
+
+def test_new_pet_record_on_redis():
+    """Redis后端用 SET NX 创建初始记录，第二次读取只有一次GET"""
+    client = FakeRedis()
+    evaluator = LazyPetEvaluator(
+        backend=redis_backend(client, key_prefix="life_pets"),
+        life_factory=lambda: ReferenceLife(MemoryStorage()),
+        fast_forward=FastForward(tolerance=1e-4, period_seconds=PERIOD_SECONDS),
+    )
+    evaluator.materialize("a", now=100.0)
+    assert "life_pets:pet:a" in client.data
+
+    before = client.round_trips
+    states, _ = evaluator.materialize("a", now=100.0 + 3600)
+    assert client.round_trips - before == 1
+    assert states["energy"]["energy"] < 100.0
+
+
+def test_new_pet_without_save_if_absent():
+    """后端不支持 save_if_absent 时在进程内的锁下先查后写（update 内可重入）"""
+    class PlainStorage:
+        def __init__(self):
+            self.data = {}
+
+        def load(self, key):
+            return dict(self.data.get(key, {}))
+
+        def save(self, key, state):
+            self.data[key] = dict(state)
+
+    storage = PlainStorage()
+    evaluator = LazyPetEvaluator(
+        backend=storage,
+        life_factory=lambda: ReferenceLife(MemoryStorage()),
+        fast_forward=FastForward(tolerance=1e-4, period_seconds=PERIOD_SECONDS),
+    )
+    changed, states, _ = evaluator.update("a", lambda states: states["energy"].update(energy=50.0) or True, now=10.0)
+    assert changed and states["energy"]["energy"] == 50.0
+    assert PetRecord.decode(storage.data["pet:a"]).states["energy"]["energy"] == 50.0
+
+
+def test_only_effective_interactions_write():
+    evaluator, storage = make_evaluator()
+
+    def feed(states):
+        states["energy"]["energy"] = min(100.0, states["energy"]["energy"] + 10.0)
+        return True
+
+    changed, _, _ = evaluator.update("a", lambda states: False, now=100.0)
+    assert not changed and storage.saves == 0  # 只写入了初始记录
+
+    evaluator.update("a", lambda states: states["energy"].update(energy=50.0) or True, now=100.0)
+    changed, states, _ = evaluator.update("a", feed, now=100.0)
+    assert changed
+    assert states["energy"]["energy"] == 60.0
+    assert storage.saves == 2
+
+    record = PetRecord.decode(storage.load("pet:a"))
+    assert record.updated_at == 100.0
+    assert record.states["energy"]["energy"] == 60.0
+    assert evaluator.stats() == {"reads": 3, "writes": 3, "conflicts": 0}  # 含首次读取写入的初始记录
+
+
+def _add_energy(amount):
+    def mutate(states):
+        states["energy"]["energy"] += amount
+        return True
+    return mutate
+
+
+def _shared_evaluators(make_backend):
+    return [
+        LazyPetEvaluator(
+            backend=make_backend(),
+            life_factory=lambda: ReferenceLife(MemoryStorage()),
+            fast_forward=FastForward(tolerance=1e-4, period_seconds=PERIOD_SECONDS),
+        )
+        for _ in range(2)
+    ]
+
+
+def _interleaved_feeds(first, second):
+    """first读取之后、写回之前，second完成一次互动；两次互动都应生效"""
+    first.update("a", lambda states: states["energy"].update(energy=50.0) or True, now=100.0)
+    calls = []
+
+    def feed_first(states):
+        calls.append(states["energy"]["energy"])
+        if len(calls) == 1:
+            second.update("a", _add_energy(10.0), now=100.0)
+        states["energy"]["energy"] += 1.0
+        return True
+
+    _, states, _ = first.update("a", feed_first, now=100.0)
+    return calls, states
+
+
+def test_concurrent_updates_on_redis():
+    """两个实例共享一个Redis：后写回的实例版本冲突，重新读取后在对方的结果上应用"""
+    client = FakeRedis()
+    first, second = _shared_evaluators(
+        lambda: BatchedStorage(redis_backend(client, key_prefix="life_pets"), versioned=True)
+    )
+    calls, states = _interleaved_feeds(first, second)
+
+    assert calls == [50.0, 60.0]
+    assert states["energy"]["energy"] == 61.0
+    assert PetRecord.decode(second.backend.load("pet:a")).states["energy"]["energy"] == 61.0
+    assert first.stats()["conflicts"] == 1
+
+
+def test_concurrent_updates_give_up_after_retries():
+    """持续冲突：重试max_retries次后抛出，不覆盖对方的写入"""
+    client = FakeRedis()
+    first, second = _shared_evaluators(
+        lambda: BatchedStorage(redis_backend(client, key_prefix="life_pets"), versioned=True)
+    )
+    first.max_retries = 1
+    second.update("a", lambda states: states["energy"].update(energy=50.0) or True, now=100.0)
+
+    def always_overtaken(states):
+        second.update("a", _add_energy(10.0), now=100.0)
+        states["energy"]["energy"] = 0.0
+        return True
+
+    with pytest.raises(VersionConflict):
+        first.update("a", always_overtaken, now=100.0)
+    assert PetRecord.decode(second.backend.load("pet:a")).states["energy"]["energy"] == 70.0
+
+
+def test_cooldown_written_with_record_and_replayed_on_conflict():
+    """冲突重试时同一次喂食仍然生效；冷却写在记录里，另一实例同一设备的喂食进入冷却"""
+    client = FakeRedis()
+    first, second = _shared_evaluators(
+        lambda: BatchedStorage(redis_backend(client, key_prefix="life_pets"), versioned=True)
+    )
+    first.update("a", lambda states: states["energy"].update(energy=50.0) or True, now=100.0)
+    applier = ActionEffectApplier()
+    attempts = []
+
+    def feed(states):
+        attempts.append(dict(states[COOLDOWN_KEY]))
+        if len(attempts) == 1:
+            second.update("a", _add_energy(1.0), now=100.0)
+        return bool(applier.apply_batch(states, [("feed", "phone")], now=100.0))
+
+    changed, states, _ = first.update("a", feed, now=100.0)
+
+    assert changed and attempts == [{}, {}]
+    assert states["energy"]["energy"] == 71.0
+    assert PetRecord.decode(second.backend.load("pet:a")).cooldowns == {"feed:phone": 100.0}
+
+    changed, states, _ = second.update(
+        "a", lambda states: bool(applier.apply_batch(states, [("feed", "phone")], now=130.0)), now=130.0
+    )
+    assert not changed
+
+
+def test_concurrent_updates_on_sqlite(tmp_path):
+    """两个实例共享一个SQLite数据库：读-改-写在写事务内完成，不会交错"""
+    import threading
+
+    path = str(tmp_path / "pets.db")
+    first, second = _shared_evaluators(
+        lambda: BatchedStorage(SQLiteStorage(path, track_versions=False))
+    )
+    first.update("a", lambda states: states["energy"].update(energy=50.0) or True, now=100.0)
+
+    def feed(evaluator):
+        for _ in range(20):
+            evaluator.update("a", _add_energy(1.0), now=100.0)
+
+    threads = [threading.Thread(target=feed, args=(evaluator,)) for evaluator in (first, second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert PetRecord.decode(SQLiteStorage(path).load("pet:a")).states["energy"]["energy"] == 90.0
+
+
+def test_evaluator_life_reused_across_pets():
+    """宠物数量增加时不创建新的Life实例"""
+    evaluator, _ = make_evaluator()
+    before = ReferenceLife.created
+    for i in range(1000):
+        evaluator.materialize(f"pet-{i}", now=float(i))
+    assert ReferenceLife.created - before == 1
+
+
+def test_adapter_lazy_mode(monkeypatch):
+    from src.life_adapter import LIFE_ENGINE_AVAILABLE, LifeAdapter
+    if not LIFE_ENGINE_AVAILABLE:
+        pytest.skip("micro-life-sim 未安装")
+
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    monkeypatch.delenv("KV_REST_API_URL", raising=False)
+    monkeypatch.setattr("src.life_adapter.PET_MODE", "lazy")
+    monkeypatch.setattr(LifeAdapter, "_lazy_pets", None)
+
+    state = LifeAdapter("device-1", pet_id="lazy-test").get_state()
+    assert state["pet_id"] == "lazy-test"
+    LifeAdapter("device-1", pet_id="lazy-test").interact("greet")
+    assert LifeAdapter.lazy_pets().stats()["reads"] >= 2
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+内存映射存储测试
+
+测试覆盖：
+1. 基本读写、删除、跨实例持久化
+2. 写到一半崩溃不影响已发布的状态；活动缓冲区损坏时退回上一个版本
+3. 多进程并发写入时读取方看不到撕裂的状态
+4. 多进程共享tick水位线时同一段时间只补偿一次
+5. is_stale 发现其他进程的写入；多进程读-改-写不丢失更新
+6. 与 FileStorage 的刷盘耗时对比（需要安装micro-life-sim）
+
+使用方法：
+    python -m pytest tests/test_mmap_storage.py -q -s
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeLife
+from src.life_adapter import LifeAdapter
+from src.mmap_storage import MmapStorage
+from src.storage import BatchedStorage
+from src.tick_clock import TickClock
+
+
+def energy_state(energy):
+    return {"energy": energy, "consumption_rate": 0.5, "last_update": 1700000000.0}
+
+
+def test_roundtrip(tmp_path):
+    storage = MmapStorage(str(tmp_path / "state.mmap"))
+    assert storage.load("energy") == {}
+    assert not storage.exists("energy")
+
+    storage.save_many({"energy": energy_state(80.0), "rhythm": {"internal_phase": 0.25}})
+    storage.save("energy", energy_state(79.0))
+
+    assert storage.load("energy") == energy_state(79.0)
+    assert storage.load("rhythm") == {"internal_phase": 0.25}
+    assert storage.exists("rhythm")
+
+    storage.delete("rhythm")
+    assert storage.load("rhythm") == {}
+    assert not storage.exists("rhythm")
+
+
+def test_persists_across_instances(tmp_path):
+    """另一个实例（另一个worker）打开同一文件能看到已写入的状态"""
+    path = str(tmp_path / "state.mmap")
+    MmapStorage(path).save("energy", energy_state(42.0))
+
+    other = MmapStorage(path, record_count=8)
+    assert other.record_count == 64  # 以文件头中的布局为准
+    assert other.load("energy") == energy_state(42.0)
+
+
+def test_torn_write_keeps_published_state(tmp_path):
+    """模拟写到一半崩溃：非活动缓冲区写了一半，序号未推进"""
+    storage = MmapStorage(str(tmp_path / "state.mmap"))
+    storage.save("energy", energy_state(50.0))
+
+    index = storage._find("energy")
+    inactive = storage._buffer_offset(index, 0)  # 第一次写入后活动缓冲区为1
+    storage._mm[inactive:inactive + 32] = b"\xff" * 32
+
+    reopened = MmapStorage(storage.path)
+    assert reopened.load("energy") == energy_state(50.0)
+
+
+def test_corrupt_active_buffer_uses_previous(tmp_path):
+    """序号稳定但活动缓冲区校验失败：不重试，直接退回上一个版本"""
+    storage = MmapStorage(str(tmp_path / "state.mmap"))
+    storage.save("energy", energy_state(50.0))
+    storage.save("energy", energy_state(60.0))
+
+    index = storage._find("energy")
+    active = storage._buffer_offset(index, 0)  # 第二次写入后活动缓冲区为0
+    storage._mm[active + 8:active + 16] = b"\xff" * 8
+
+    reopened = MmapStorage(storage.path)
+    assert reopened.load("energy") == energy_state(50.0)
+    assert reopened.corrupt_reads == 1
+    assert reopened.read_retries == 0
+
+
+def test_corrupt_record_without_previous(tmp_path):
+    """只写入过一次的记录损坏：按不存在处理，下次保存覆盖"""
+    storage = MmapStorage(str(tmp_path / "state.mmap"))
+    storage.save("energy", energy_state(50.0))
+
+    index = storage._find("energy")
+    active = storage._buffer_offset(index, 1)
+    storage._mm[active + 8:active + 16] = b"\xff" * 8
+
+    assert storage.load("energy") == {}
+    storage.save("energy", energy_state(40.0))
+    assert storage.load("energy") == energy_state(40.0)
+
+
+def test_oversized_state_rejected(tmp_path):
+    storage = MmapStorage(str(tmp_path / "state.mmap"), record_size=256)
+    with pytest.raises(ValueError):
+        storage.save("energy", {"blob": "x" * 500})
+
+
+def test_full_file_rejected(tmp_path):
+    storage = MmapStorage(str(tmp_path / "state.mmap"), record_count=2)
+    storage.save_many({"a": {}, "b": {}})
+    with pytest.raises(RuntimeError):
+        storage.save("c", {})
+
+
+def _writer(path, rounds):
+    storage = MmapStorage(path, sync_writes=False)
+    for i in range(rounds):
+        # 两个字段必须始终一致，读取方据此检测撕裂
+        storage.save("energy", {"energy": float(i), "check": -float(i), "pad": "x" * (i % 200)})
+
+
+def _reader(path, rounds, errors):
+    storage = MmapStorage(path, sync_writes=False)
+    for _ in range(rounds):
+        state = storage.load("energy")
+        if state and state["energy"] != -state["check"]:
+            errors.put(state)
+
+
+def test_concurrent_processes_see_consistent_state(tmp_path):
+    """两个写入进程 + 两个读取进程：读取方只会看到完整的状态"""
+    path = str(tmp_path / "state.mmap")
+    MmapStorage(path).save("energy", {"energy": 0.0, "check": -0.0})
+
+    ctx = multiprocessing.get_context("fork")
+    errors = ctx.Queue()
+    processes = [ctx.Process(target=_writer, args=(path, 3000)) for _ in range(2)]
+    processes += [ctx.Process(target=_reader, args=(path, 5000, errors)) for _ in range(2)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    assert errors.empty()
+
+
+def _claimer(path, start, results):
+    clock = TickClock(BatchedStorage(MmapStorage(path)))
+    total = 0.0
+    for i in range(1, 201):
+        total += clock.claim(start + i)
+    results.put(total)
+
+
+def test_tick_clock_shared_across_processes(tmp_path):
+    """多个worker并发推进同一水位线：总补偿时长等于实际经过的时长"""
+    path = str(tmp_path / "state.mmap")
+    start = 1700000000.0
+    TickClock(MmapStorage(path)).reset(start)
+
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_claimer, args=(path, start, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+
+    total = sum(results.get() for _ in processes)
+    assert total == pytest.approx(200.0)
+
+
+def test_is_stale_detects_other_process(tmp_path):
+    """只有其他实例写入过本实例读到的键时才报告过期，报告一次后记为已读"""
+    path = str(tmp_path / "state.mmap")
+    storage, other = MmapStorage(path), MmapStorage(path)
+    assert not storage.is_stale()
+
+    storage.load("energy")
+    storage.save("energy", energy_state(80.0))
+    assert not storage.is_stale()  # 自己的写入不算过期
+
+    other.save("energy", energy_state(70.0))
+    other.save("rhythm", {"internal_phase": 0.5})  # 本实例从未读取的键
+    assert BatchedStorage(storage).is_stale()
+    assert not storage.is_stale()
+
+
+def _feed(life):
+    state = dict(life.state_manager.load("energy"))
+    state["energy"] = state.get("energy", 0.0) + 1.0
+    life.state_manager.save("energy", state)
+
+
+def _incrementer(path, rounds):
+    life = FakeLife(BatchedStorage(MmapStorage(path, sync_writes=False)))
+    for _ in range(rounds):
+        with LifeAdapter._locked_for_write(life):
+            _feed(life)
+            LifeAdapter._commit_flush(life)
+
+
+def test_read_modify_write_across_processes(tmp_path):
+    """多个worker共享状态文件：读取→修改→刷盘在文件锁内完成，不丢失其他worker的修改"""
+    path = str(tmp_path / "state.mmap")
+    MmapStorage(path).save("energy", {"energy": 0.0})
+
+    ctx = multiprocessing.get_context("fork")
+    processes = [ctx.Process(target=_incrementer, args=(path, 100)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    assert MmapStorage(path).load("energy") == {"energy": 400.0}
+
+
+@pytest.mark.benchmark
+def test_flush_latency_vs_file_storage(tmp_path):
+    """一次刷盘（2个子系统）的耗时对比"""
+    from src.life_adapter import LIFE_ENGINE_AVAILABLE
+    if not LIFE_ENGINE_AVAILABLE:
+        pytest.skip("micro-life-sim 未安装")
+    from core import FileStorage
+
+    states = {"rhythm": {"internal_phase": 0.25}, "energy": energy_state(80.0)}
+    rounds = 200
+    results = {}
+    for name, storage in (
+        ("file", BatchedStorage(FileStorage(str(tmp_path / "files")))),
+        ("mmap", BatchedStorage(MmapStorage(str(tmp_path / "state.mmap")))),
+    ):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            storage.save_many(states)
+        results[name] = (time.perf_counter() - start) * 1000 / rounds
+
+    print(f"   每次刷盘: file={results['file']:.3f}ms, mmap={results['mmap']:.3f}ms")
+    assert results["mmap"] < results["file"]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
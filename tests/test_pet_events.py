@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+宠物事件调度测试
+
+测试覆盖：
+1. 预测的跃迁时刻与逐秒模拟 PetAdapter 规则的结果一致
+2. 数值停在0/100、不再跃迁时不登记事件
+3. 调度器到点触发，并从跃迁后的状态登记下一次跃迁
+4. 互动后重新预测（旧事件取消）；回调异常不影响调度
+5. 10万只宠物：CPU开销与事件数成正比
+6. 生命周期启动/停止：LifeAdapter 登记事件（需要安装micro-life-sim），事件POST到Webhook
+7. Life宠物：预测的阈值跨越时刻与逐秒推进一致；接口的互动（全局组提交、registry、lazy）重新登记
+
+使用方法：
+    python -m pytest tests/test_pet_events.py -q -s
+"""
+
+import os
+import random
+import sys
+import time
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeLife
+from src.fast_forward import LifeStepper
+from src.lazy_pet import MemoryStorage
+from src.life_adapter import LIFE_ENGINE_AVAILABLE, LifeAdapter
+from src.pet_adapter import PetAdapter
+from src import pet_events
+from src.pet_events import (
+    LifeTransitionPredictor,
+    PetEventScheduler,
+    WebhookNotifier,
+    predict_next_transition,
+    project_state,
+    start_event_scheduler,
+    stop_event_scheduler,
+)
+from test_lazy_pet import ReferenceLife
+
+T0 = 1_700_000_000.0
+
+
+def make_state(energy, hunger, mood, pet_id="pet-1"):
+    state = {"pet_id": pet_id, "energy": energy, "hunger": hunger, "mood": mood, "last_updated": T0}
+    state["current_state"] = PetAdapter._determine_state(state)
+    return state
+
+
+def brute_force_transition(state, horizon=86400):
+    """逐秒推算，返回第一次状态改变的时刻"""
+    current = PetAdapter._determine_state(state)
+    for second in range(1, horizon):
+        projected = project_state(state, T0 + second)
+        if projected["current_state"] != current:
+            return T0 + second, projected["current_state"]
+    return None
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_prediction_matches_brute_force(seed):
+    rng = random.Random(seed)
+    state = make_state(rng.uniform(0, 100), rng.uniform(0, 100), rng.uniform(0, 100))
+    event = predict_next_transition(state)
+    expected = brute_force_transition(state)
+
+    if expected is None:
+        assert event is None
+    else:
+        # 候选时刻向上取整到秒，可能比逐秒模拟晚1秒
+        assert expected[0] <= event.at <= expected[0] + 1
+        assert event.to_state == expected[1]
+        assert event.from_state == state["current_state"]
+
+
+def test_known_threshold():
+    """按速率直接算出的跃迁时刻"""
+    # 饥饿从40涨到70：(70-40)/0.15 = 200分钟
+    event = predict_next_transition(make_state(80.0, 40.0, 60.0))
+    assert event.to_state == PetAdapter.STATE_HUNGRY
+    assert event.at == pytest.approx(T0 + 200 * 60, abs=2)
+
+    # 能量从80降到70以下：100分钟，play → idle
+    event = predict_next_transition(make_state(80.0, 10.0, 90.0))
+    assert event.to_state == PetAdapter.STATE_IDLE
+    assert event.at == pytest.approx(T0 + 100 * 60, abs=2)
+
+    event = predict_next_transition(make_state(60.0, 40.0, 60.0))
+    assert event.to_state == PetAdapter.STATE_BORED  # 能量降到50：100分钟
+    assert event.at == pytest.approx(T0 + 100 * 60, abs=2)
+
+
+def test_no_transition_when_saturated():
+    assert predict_next_transition(make_state(0.0, 100.0, 0.0)) is None
+
+
+def test_scheduler_fires_chain():
+    fired = []
+    scheduler = PetEventScheduler(fired.append, clock=lambda: T0)
+    scheduler.track("pet-1", make_state(60.0, 40.0, 60.0))
+
+    assert scheduler.advance(T0 + 100 * 60 - 5) == []
+    assert [event.to_state for event in scheduler.advance(T0 + 100 * 60 + 1)] == [PetAdapter.STATE_BORED]
+
+    # 之后的跃迁依次触发，直到数值饱和
+    scheduler.advance(T0 + 86400 * 3)
+    states = [event.to_state for event in fired]
+    assert states[0] == PetAdapter.STATE_BORED
+    assert states[-1] == PetAdapter.STATE_HUNGRY
+    assert len(scheduler) == 0
+    assert all(a.at < b.at for a, b in zip(fired, fired[1:]))
+
+
+def test_retrack_replaces_event():
+    scheduler = PetEventScheduler(lambda event: None, clock=lambda: T0)
+    first = scheduler.track("pet-1", make_state(60.0, 40.0, 60.0))
+    second = scheduler.track("pet-1", make_state(60.0, 65.0, 60.0))
+    assert second.at < first.at
+    assert scheduler.next_event("pet-1") is second
+    assert len(scheduler) == 1
+
+
+def test_callback_failure_is_counted():
+    def failing(event):
+        raise ConnectionError("webhook down")
+
+    scheduler = PetEventScheduler(failing, clock=lambda: T0)
+    scheduler.track("pet-1", make_state(60.0, 40.0, 60.0))
+    assert len(scheduler.advance(T0 + 86400)) >= 1
+    assert scheduler.stats()["failures"] == scheduler.stats()["fired"]
+
+
+def test_pet_adapter_tracks_on_interact(monkeypatch):
+    scheduler = PetEventScheduler(lambda event: None)
+    monkeypatch.setattr(PetAdapter, "event_scheduler", scheduler)
+    PetAdapter._pet_states.pop("events-test", None)
+
+    adapter = PetAdapter("events-test")
+    before = scheduler.next_event("events-test")
+    assert before is not None
+
+    adapter.interact("play")
+    after = scheduler.next_event("events-test")
+    assert after is not before
+    PetAdapter._pet_states.pop("events-test", None)
+
+
+def test_background_thread_fires():
+    fired = []
+    scheduler = PetEventScheduler(fired.append, tick=0.05)
+    scheduler.start()
+    try:
+        # 能量恰好在阈值上，下一秒降到70以下：play → idle
+        now = time.time()
+        scheduler.track("pet-1", {"energy": 70.0, "hunger": 10.0, "mood": 90.0, "last_updated": now - 0.9})
+        deadline = time.time() + 3
+        while not fired and time.time() < deadline:
+            time.sleep(0.02)
+    finally:
+        scheduler.stop()
+    assert [event.to_state for event in fired] == [PetAdapter.STATE_IDLE]
+
+
+def test_cost_scales_with_events():
+    """10万只宠物推进一小时：只处理到期的宠物"""
+    fired = []
+    scheduler = PetEventScheduler(fired.append, clock=lambda: T0)
+    rng = random.Random(0)
+    for i in range(100_000):
+        scheduler.track(f"pet-{i}", make_state(rng.uniform(0, 100), rng.uniform(0, 100), rng.uniform(0, 100)))
+
+    start = time.perf_counter()
+    for minute in range(1, 61):
+        scheduler.advance(T0 + minute * 60)
+    elapsed = time.perf_counter() - start
+
+    print(f"   10万只宠物, 推进1小时: {len(fired)}个事件, {elapsed * 1000:.0f}ms")
+    assert 0 < len(fired) < 100_000
+    assert all(event.at <= T0 + 3600 for event in fired)
+
+
+
+def test_start_event_scheduler(monkeypatch):
+    monkeypatch.setattr(LifeAdapter, "event_scheduler", None)
+    assert start_event_scheduler() is None  # 默认不开启
+
+    monkeypatch.setattr(pet_events, "EVENTS_ENABLED", True)
+    if not LIFE_ENGINE_AVAILABLE:
+        assert start_event_scheduler() is None
+        pytest.skip("micro-life-sim 未安装")
+
+    scheduler = start_event_scheduler()
+    try:
+        assert LifeAdapter.event_scheduler is scheduler
+        assert scheduler.on_event is pet_events.log_event
+        assert isinstance(scheduler.predict, LifeTransitionPredictor)
+    finally:
+        stop_event_scheduler(scheduler)
+    assert LifeAdapter.event_scheduler is None
+    stop_event_scheduler(None)  # 未启动时无副作用
+
+
+def test_webhook_callback(monkeypatch):
+    if pet_events.requests is None:
+        pytest.skip("requests 未安装")
+    posted = []
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+    monkeypatch.setattr(pet_events.requests, "post", lambda url, json, timeout: posted.append((url, json)) or Response())
+
+    scheduler = PetEventScheduler(WebhookNotifier("http://hooks.test/pet"), tick=0.05)
+    scheduler.start()
+    try:
+        # 能量恰好在阈值上，下一秒降到70以下：play → idle
+        scheduler.track("pet-1", {"energy": 70.0, "hunger": 10.0, "mood": 90.0, "last_updated": time.time() - 0.9})
+        deadline = time.time() + 3
+        while not posted and time.time() < deadline:
+            time.sleep(0.02)
+    finally:
+        scheduler.stop()
+    assert posted[0][0] == "http://hooks.test/pet"
+    assert posted[0][1]["to_state"] == PetAdapter.STATE_IDLE
+
+
+
+def reference_predictor(**kwargs):
+    return LifeTransitionPredictor(
+        life_factory=lambda: ReferenceLife(MemoryStorage()),
+        fast_forward=LifeAdapter._fast_forward,
+        energy_thresholds=LifeAdapter.ENERGY_THRESHOLDS,
+        rhythm_thresholds=LifeAdapter.RHYTHM_THRESHOLDS,
+        **kwargs,
+    )
+
+
+def life_states(energy, internal_phase=0.1):
+    return {"rhythm": {"internal_phase": internal_phase}, "energy": {"energy": energy}}
+
+
+@pytest.mark.parametrize("energy", [72.0, 45.0, 21.0])
+def test_life_prediction_matches_stepping(energy):
+    """Life宠物：预测的跨越时刻与逐秒推进参考模型第一次跨越分档阈值的时刻一致"""
+    predictor = reference_predictor()
+    event = predictor({"pet_id": "p", "at": T0, "states": life_states(energy)})
+
+    stepper = LifeStepper(ReferenceLife(MemoryStorage()))
+    states, second = life_states(energy), 0
+    while predictor.band(states) == predictor.band(life_states(energy)):
+        states = stepper.step(states, 1.0)
+        second += 1
+
+    # 快进引擎按容差积分，和逐秒推进相差在1%以内
+    assert event.at - T0 == pytest.approx(second, rel=0.01, abs=3)
+    assert event.from_state.startswith("energy ") and event.to_state != event.from_state
+    assert event.state["at"] == event.at
+
+
+def test_life_prediction_chain_and_horizon():
+    """跨越后从跨越时刻的状态预测下一次；horizon内不跨越时不登记"""
+    fired = []
+    scheduler = PetEventScheduler(fired.append, clock=lambda: T0, predict=reference_predictor())
+    scheduler.track("p", {"at": T0, "states": life_states(72.0)})
+    scheduler.advance(T0 + 86400)
+    following = scheduler.next_event("p")
+    assert following.at > fired[0].at
+    scheduler.advance(T0 + 86401)  # 已过期的后续跃迁在下一个tick触发
+    assert [event.to_state.split(",")[0] for event in fired] == ["energy 50-70", "energy 40-50"]
+
+    short = reference_predictor(horizon=600.0)
+    assert short({"pet_id": "p", "at": T0, "states": life_states(100.0)}) is None
+
+
+@pytest.fixture
+def life_events(monkeypatch, tmp_path):
+    """接口路径使用参考模型：LifeAdapter 的Life实例换成 ReferenceLife，并开启事件登记"""
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    monkeypatch.delenv("KV_REST_API_URL", raising=False)
+    monkeypatch.setattr("src.life_adapter.LIFE_ENGINE_AVAILABLE", True)
+    monkeypatch.setattr("src.life_adapter.STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr("src.life_adapter.SQLITE_PATH", str(tmp_path / "pets.db"))
+    monkeypatch.setattr(LifeAdapter, "_new_life", staticmethod(ReferenceLife))
+    monkeypatch.setattr(LifeAdapter, "_lazy_pets", None)
+    monkeypatch.setattr(LifeAdapter, "_pet_registry", None)
+    monkeypatch.setattr(LifeAdapter, "_pet_local_store", None)
+    scheduler = PetEventScheduler(lambda event: None, predict=reference_predictor())
+    monkeypatch.setattr(LifeAdapter, "event_scheduler", scheduler)
+    return scheduler
+
+
+@pytest.mark.parametrize("mode", ["lazy", "registry"])
+def test_pet_interaction_rearms_events(life_events, monkeypatch, mode):
+    """/api/pets/{pet_id}/interact 的路径：互动写入后重新预测该宠物的下一次跨越"""
+    monkeypatch.setattr("src.life_adapter.PET_MODE", mode)
+    LifeAdapter("device-1", pet_id="events-pet").interact("greet")
+    first = life_events.next_event("events-pet")
+    assert first is not None
+
+    LifeAdapter("device-2", pet_id="events-pet").interact("feed")
+    assert life_events.next_event("events-pet") is not first
+    assert len(life_events) == 1
+
+
+def test_global_interaction_rearms_events(life_events, monkeypatch):
+    """/api/pet/interact 的组提交：整批生效后重新预测全局宠物的下一次跨越"""
+    storage = MemoryStorage()
+    storage.save("rhythm", {"internal_phase": 0.1})
+    storage.save("energy", {"energy": 72.0})
+    monkeypatch.setattr(LifeAdapter, "_global_life", FakeLife(storage))
+
+    LifeAdapter._commit_interactions([("greet", "device-1")])
+    event = life_events.next_event(LifeAdapter.GLOBAL_PET_ID)
+    assert event is not None and event.to_state.startswith("energy 50-70")
+
+    LifeAdapter._commit_interactions([("dance", "device-1")])  # 未生效的互动不重新预测
+    assert life_events.next_event(LifeAdapter.GLOBAL_PET_ID) is event
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
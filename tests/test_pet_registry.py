@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+宠物注册表测试
+
+测试覆盖：
+1. 按需加载、命中时不重复加载、LRU顺序
+2. 超出容量时淘汰最久未使用的宠物，淘汰前刷盘
+3. 刷盘失败的宠物保留在内存中，下次重试
+4. 同一宠物的并发加载只执行一次
+5. 10万只宠物依次访问时常驻实例数不超过容量
+6. 宠物存储：Redis构建在连接池上且版本化写入；本地共用一个SQLite数据库
+7. 宠物刷盘走版本冲突重试，修改按宠物隔离；持续冲突时不淘汰
+8. LifeAdapter 多宠物互动与状态（需要安装micro-life-sim）
+
+使用方法：
+    python -m pytest tests/test_pet_registry.py -q -s
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeLife, FakeRedis, redis_backend
+from src.life_adapter import LifeAdapter, PetSlot
+from src.pet_registry import PetRegistry
+from src.sqlite_storage import SQLiteStorage
+from src.storage import BatchedStorage
+
+
+class FakeStore:
+    """记录加载与刷盘的存储替身"""
+
+    def __init__(self):
+        self.loads = []
+        self.flushed = []
+        self.fail_flush = set()
+
+    def load(self, pet_id):
+        self.loads.append(pet_id)
+        return {"pet_id": pet_id}
+
+    def flush(self, pet_id, entry):
+        if pet_id in self.fail_flush:
+            raise ConnectionError("redis unreachable")
+        self.flushed.append(pet_id)
+
+
+def make_registry(capacity=2):
+    store = FakeStore()
+    return PetRegistry(store.load, capacity=capacity, on_evict=store.flush), store
+
+
+def test_load_on_demand():
+    registry, store = make_registry()
+    assert registry.get("a") == {"pet_id": "a"}
+    assert registry.get("a") is registry.get("a")
+    assert store.loads == ["a"]
+    assert registry.stats()["hits"] == 2
+
+
+def test_lru_eviction_flushes():
+    registry, store = make_registry(capacity=2)
+    registry.get("a")
+    registry.get("b")
+    registry.get("a")  # b变为最久未使用
+    registry.get("c")
+
+    assert "b" not in registry
+    assert store.flushed == ["b"]
+    assert len(registry) == 2
+
+    registry.get("b")  # 重新从存储加载
+    assert store.loads == ["a", "b", "c", "b"]
+
+
+def test_failed_flush_keeps_pet():
+    registry, store = make_registry(capacity=1)
+    registry.get("a")
+    store.fail_flush.add("a")
+    registry.get("b")
+
+    assert "a" in registry
+    assert registry.stats()["evict_failures"] == 1
+
+    # 存储恢复后下次淘汰时刷盘
+    store.fail_flush.clear()
+    registry.get("c")
+    assert "a" in store.flushed
+    assert "a" not in registry
+
+
+def test_clear_flushes_all():
+    registry, store = make_registry(capacity=4)
+    for pet_id in "abc":
+        registry.get(pet_id)
+    assert registry.clear() == 0
+    assert sorted(store.flushed) == ["a", "b", "c"]
+    assert len(registry) == 0
+
+
+def test_concurrent_load_once():
+    """多个线程同时访问同一只未加载的宠物：只加载一次"""
+    loads = []
+
+    def slow_load(pet_id):
+        loads.append(pet_id)
+        time.sleep(0.05)
+        return object()
+
+    registry = PetRegistry(slow_load, capacity=8)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("a"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loads == ["a"]
+    assert len({id(result) for result in results}) == 1
+
+
+def test_100k_pets_bounded():
+    """10万只宠物：常驻实例数不超过容量，被淘汰的宠物都已刷盘"""
+    registry, store = make_registry(capacity=1000)
+    total = 100_000
+
+    start = time.perf_counter()
+    for i in range(total):
+        registry.get(f"pet-{i}")
+    elapsed = time.perf_counter() - start
+
+    print(f"   {total}只宠物: {elapsed * 1000:.0f}ms, 常驻={len(registry)}")
+    assert len(registry) == 1000
+    assert len(store.flushed) == total - 1000
+    assert registry.stats()["evictions"] == total - 1000
+
+
+def test_invalid_pet_id_rejected():
+    """宠物ID用作存储键和目录名，只允许安全字符"""
+    with pytest.raises(ValueError):
+        LifeAdapter("device-1", pet_id="../global_pet")
+
+
+def test_pet_backends_share_local_store(tmp_path, monkeypatch):
+    """没有Redis时所有宠物共用一个SQLite数据库，键按宠物隔离"""
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    monkeypatch.delenv("KV_REST_API_URL", raising=False)
+    store = SQLiteStorage(str(tmp_path / "pets.db"))
+    monkeypatch.setattr(LifeAdapter, "_pet_local_store", store)
+
+    first = LifeAdapter._create_pet_backend("pet-a")
+    second = LifeAdapter._create_pet_backend("pet-b")
+    first.save_many({"energy": {"energy": 10.0}})
+    second.save("energy", {"energy": 20.0})
+
+    assert first.load_many(["energy", "rhythm"]) == {"energy": {"energy": 10.0}, "rhythm": {}}
+    assert second.load("energy") == {"energy": 20.0}
+    assert store.load_many(["life_pet-a:energy", "life_pet-b:energy"]) == {
+        "life_pet-a:energy": {"energy": 10.0},
+        "life_pet-b:energy": {"energy": 20.0},
+    }
+    assert not os.path.exists("/tmp/life-pet-a")
+
+
+def test_pet_backend_uses_redis_pool(monkeypatch):
+    """Redis宠物存储构建在连接池上：不PING、不新建客户端，版本化写入与全局宠物一致"""
+    pytest.importorskip("redis")
+    from src.redis_pool import close_redis_clients, get_redis_client
+
+    url = "redis://localhost:6399/0"  # 无人监听：构建时一旦连接就会失败
+    monkeypatch.setenv("REDIS_URL", url)
+    monkeypatch.setattr("src.life_adapter.RedisStorage", object)
+    monkeypatch.setattr("src.life_adapter.VERSIONED_WRITES", True)
+    try:
+        backend = LifeAdapter._create_pet_backend("pet-a")
+        assert backend.client is get_redis_client(url)
+        assert backend.versioned
+        assert backend._make_key("energy") == "life_pet-a:energy"
+        assert backend.client.connection_pool._created_connections == 0
+    finally:
+        close_redis_clients()
+
+
+@pytest.fixture
+def cas_stats(monkeypatch):
+    monkeypatch.setattr(LifeAdapter, "_pending_reapply", [])
+    monkeypatch.setattr(LifeAdapter, "_cas_stats", {"conflicts": 0, "retries": 0, "failures": 0, "stale_reloads": 0})
+
+
+def make_slot(client, pet_id="pet-a"):
+    backend = BatchedStorage(redis_backend(client, key_prefix=f"life_{pet_id}"), versioned=True)
+    slot = PetSlot(pet_id=pet_id, life=FakeLife(backend), tick_clock=None)
+    slot.life.state_manager.load("energy")
+    return slot
+
+
+def feed(life):
+    state = dict(life.state_manager.load("energy"))
+    state["energy"] = state.get("energy", 0.0) + 10.0
+    life.state_manager.save("energy", state)
+
+
+def test_pet_flush_retries_conflict(cas_stats):
+    """其他实例先写入该宠物：重新加载后重新应用本实例的修改，不影响全局宠物的待重放列表"""
+    client = FakeRedis()
+    slot = make_slot(client)
+    other = BatchedStorage(redis_backend(client, key_prefix="life_pet-a"), versioned=True)
+    other.load("energy")
+    other.save("energy", {"energy": 40.0})
+
+    feed(slot.life)
+    assert LifeAdapter._flush_pet(slot, reapply=lambda: feed(slot.life))
+
+    assert other.load("energy") == {"energy": 50.0}
+    assert slot.pending_reapply == []
+    assert LifeAdapter._pending_reapply == []
+    assert LifeAdapter._cas_stats["retries"] == 1
+
+
+def test_pet_not_evicted_on_persistent_conflict(cas_stats, monkeypatch):
+    """持续冲突时淘汰失败，宠物及其未落盘的修改保留在注册表中"""
+    monkeypatch.setattr("src.life_adapter.CAS_MAX_RETRIES", 0)
+    client = FakeRedis()
+    slot = make_slot(client)
+    feed(slot.life)
+    slot.pending_reapply.append(lambda: feed(slot.life))
+    client.data["life_pet-a:version"] = "3"  # 其他实例已写入
+
+    registry = PetRegistry(lambda pet_id: slot, capacity=1, on_evict=LifeAdapter._evict_pet)
+    registry.get("pet-a")
+    assert not registry.evict("pet-a")
+    assert "pet-a" in registry
+    assert len(slot.pending_reapply) == 1
+
+
+def test_adapter_pets_are_independent(tmp_path, monkeypatch):
+    """不同宠物的互动互不影响；淘汰后重新加载得到已刷盘的状态"""
+    from src.life_adapter import LIFE_ENGINE_AVAILABLE
+    if not LIFE_ENGINE_AVAILABLE:
+        pytest.skip("micro-life-sim 未安装")
+
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    monkeypatch.delenv("KV_REST_API_URL", raising=False)
+    monkeypatch.setattr("src.life_adapter.PET_REGISTRY_CAPACITY", 1)
+    monkeypatch.setattr(LifeAdapter, "_pet_registry", None)
+    monkeypatch.setattr(LifeAdapter, "_pet_local_store", SQLiteStorage(str(tmp_path / "pets.db")))
+
+    suffix = str(int(time.time() * 1000))
+    first, second = f"test-a-{suffix}", f"test-b-{suffix}"
+    before = LifeAdapter("device-1", pet_id=first).get_state()
+    LifeAdapter("device-1", pet_id=second).get_state()  # 淘汰first
+    assert first not in LifeAdapter.pet_registry()
+
+    after = LifeAdapter("device-1", pet_id=first).get_state()
+    assert after["pet_id"] == first
+    assert after["simplified_state"]["energy"] == pytest.approx(
+        before["simplified_state"]["energy"], abs=1.0
+    )
+    LifeAdapter.pet_registry().clear()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Redis连接池测试
+
+测试覆盖：
+1. 环境变量配置
+2. 同一URL复用同一客户端（热启动不重复握手）
+3. 连接池参数：保活、健康检查、重试
+4. create_redis_storage 复用池化客户端，构建时不建立连接
+5. 故障探测客户端：短超时、不重试，不可达时快速失败
+6. 真实Redis上的断线重连（需要 REDIS_URL）
+
+使用方法：
+    python -m pytest tests/test_redis_pool.py -q
+"""
+
+import os
+import sys
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import redis_pool
+from src.redis_pool import RedisPoolConfig, close_redis_clients, get_probe_client, get_redis_client
+
+
+def test_config_from_env(monkeypatch):
+    """环境变量覆盖默认参数"""
+    monkeypatch.setenv("LIFE_REDIS_POOL_SIZE", "32")
+    monkeypatch.setenv("LIFE_REDIS_HEALTH_CHECK_SECONDS", "10")
+    monkeypatch.setenv("LIFE_REDIS_RETRIES", "5")
+
+    config = RedisPoolConfig.from_env()
+
+    assert config.max_connections == 32
+    assert config.health_check_interval == 10
+    assert config.retries == 5
+    assert config.socket_timeout == 5.0
+
+
+def test_client_cached_per_url():
+    """同一URL只创建一个连接池；连接在首次使用时才建立"""
+    pytest.importorskip("redis")
+    url = "redis://localhost:6399/0"
+    try:
+        client = get_redis_client(url, RedisPoolConfig(max_connections=8))
+        assert get_redis_client(url) is client
+        assert get_redis_client("redis://localhost:6399/1") is not client
+    finally:
+        close_redis_clients()
+    assert redis_pool._clients == {}
+
+
+def test_pool_options():
+    """连接池开启保活、健康检查和断线重试"""
+    pytest.importorskip("redis")
+    try:
+        client = get_redis_client(
+            "redis://localhost:6399/0",
+            RedisPoolConfig(max_connections=8, health_check_interval=15, retries=2)
+        )
+        pool = client.connection_pool
+        kwargs = pool.connection_kwargs
+
+        assert pool.max_connections == 8
+        assert kwargs["socket_keepalive"] is True
+        assert kwargs["health_check_interval"] == 15
+        assert kwargs["decode_responses"] is True
+        assert kwargs["retry"]._retries == 2
+    finally:
+        close_redis_clients()
+
+
+def test_create_redis_storage_uses_pool():
+    """重复构建存储（重连、故障恢复、加载新宠物）不新建客户端、不发起连接"""
+    pytest.importorskip("redis")
+    from src.storage import LAYOUT_HASH, create_redis_storage
+
+    url = "redis://localhost:6399/0"  # 无人监听：构建时一旦连接就会失败
+    try:
+        first = create_redis_storage(url, "life_a", ttl=60, layout=LAYOUT_HASH, versioned=True)
+        second = create_redis_storage(url, "life_b", ttl=60)
+        assert first.client is second.client is get_redis_client(url)
+        assert first.versioned and first.layout == LAYOUT_HASH
+        assert first._make_key("energy") == "life_a:energy"
+        assert first.client.connection_pool._created_connections == 0
+    finally:
+        close_redis_clients()
+
+
+def test_probe_client_fails_fast():
+    """探测客户端与业务连接池分开：单连接、短超时、不重试"""
+    redis = pytest.importorskip("redis")
+    url = "redis://localhost:6399/0"
+    try:
+        probe = get_probe_client(url, RedisPoolConfig(probe_timeout=0.2))
+        assert get_probe_client(url) is probe
+        assert probe is not get_redis_client(url)
+
+        kwargs = probe.connection_pool.connection_kwargs
+        assert probe.connection_pool.max_connections == 1
+        assert kwargs["socket_connect_timeout"] == 0.2
+        assert kwargs["retry"]._retries == 0
+        with pytest.raises(redis.ConnectionError):
+            probe.ping()
+    finally:
+        close_redis_clients()
+    assert redis_pool._probe_clients == {}
+
+
+def test_reconnect_after_disconnect():
+    """真实Redis：连接被断开后下一次命令透明重连"""
+    redis_url = os.getenv("REDIS_URL")
+    if not redis_url:
+        pytest.skip("未设置 REDIS_URL")
+    pytest.importorskip("redis")
+
+    try:
+        client = get_redis_client(redis_url)
+        assert client.ping()
+        # 模拟冻结/解冻后失效的socket
+        client.connection_pool.disconnect()
+        assert client.ping()
+    finally:
+        close_redis_clients()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+读写锁测试
+
+测试覆盖：
+1. 多个读者可以同时持有读锁
+2. 写者与读者、写者与写者互斥
+3. 写优先：有写者等待时新读者排队
+
+使用方法：
+    python -m pytest tests/test_rwlock.py -q
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.rwlock import RWLock
+
+
+def test_readers_run_in_parallel():
+    lock = RWLock()
+    barrier = threading.Barrier(4, timeout=1.0)
+
+    def reader():
+        with lock.read_locked():
+            barrier.wait()  # 4个读者必须同时在锁内才能通过
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not barrier.broken
+
+
+def test_writers_are_exclusive():
+    lock = RWLock()
+    counter = {"value": 0, "inside": 0, "max_inside": 0}
+
+    def writer():
+        for _ in range(200):
+            with lock.write_locked():
+                counter["inside"] += 1
+                counter["max_inside"] = max(counter["max_inside"], counter["inside"])
+                counter["value"] += 1
+                counter["inside"] -= 1
+
+    threads = [threading.Thread(target=writer) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert counter["value"] == 1600
+    assert counter["max_inside"] == 1
+
+
+def test_waiting_writer_blocks_new_readers():
+    lock = RWLock()
+    order = []
+    reader_holding = threading.Event()
+    release_reader = threading.Event()
+
+    def first_reader():
+        with lock.read_locked():
+            reader_holding.set()
+            release_reader.wait()
+
+    def writer():
+        with lock.write_locked():
+            order.append("writer")
+
+    def late_reader():
+        with lock.read_locked():
+            order.append("reader")
+
+    t1 = threading.Thread(target=first_reader)
+    t1.start()
+    reader_holding.wait()
+
+    t2 = threading.Thread(target=writer)
+    t2.start()
+    time.sleep(0.05)  # 写者开始等待
+    t3 = threading.Thread(target=late_reader)
+    t3.start()
+    time.sleep(0.05)
+
+    release_reader.set()
+    for t in (t1, t2, t3):
+        t.join()
+
+    assert order == ["writer", "reader"]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
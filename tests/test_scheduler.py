@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+分片调度器测试
+
+测试覆盖：
+1. 一致性哈希：分布均匀、跨进程稳定、增加分片时只有少量宠物换分片
+2. 一轮推进：lazy模式的宠物记录推算到本轮时刻后写回，结果与读取时的推算一致；
+   不为没有记录的宠物创建记录
+3. 多进程推进（SQLite存储，各进程各自打开连接）
+4. 格式不对的记录跳过并计数，分片内其他宠物照常推进；各分片延迟可观测
+5. 推进期间其他实例写入同一宠物：版本冲突后重新读取推算，不覆盖对方的写入
+6. 默认存储即lazy模式接口的存储；接口写入的记录被推进（需要安装micro-life-sim）；生命周期启动/停止
+
+使用方法：
+    python -m pytest tests/test_scheduler.py -q -s
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeRedis, redis_backend
+from src import scheduler as scheduler_module
+from src.lazy_pet import RECORD_KEY_PREFIX, LazyPetEvaluator, MemoryStorage, PetRecord
+from src.life_adapter import LIFE_ENGINE_AVAILABLE, LifeAdapter
+from src.scheduler import (
+    ConsistentHashRing,
+    ShardedScheduler,
+    default_storage,
+    start_scheduler,
+    stored_pet_ids,
+)
+from src.sqlite_storage import SQLiteStorage
+from src.storage import BatchedStorage
+from test_lazy_pet import ReferenceLife
+
+# 版本化写入测试共用的Redis替身（模块级工厂需要可pickle，不能捕获局部变量）
+_redis = FakeRedis()
+
+
+def sqlite_storage():
+    """模块级工厂（可pickle），路径由环境变量传给worker进程；与lazy模式的SQLite存储相同的包装"""
+    return BatchedStorage(SQLiteStorage(os.environ["TEST_SCHEDULER_DB"], track_versions=False))
+
+
+def redis_storage():
+    return BatchedStorage(redis_backend(_redis, key_prefix="life_pets"), versioned=True)
+
+
+def reference_life():
+    return ReferenceLife(MemoryStorage())
+
+
+def make_evaluator(storage, life_factory=reference_life):
+    return LazyPetEvaluator(
+        backend=storage,
+        life_factory=life_factory,
+        fast_forward=LifeAdapter._fast_forward,
+    )
+
+
+@pytest.fixture(autouse=True)
+def fresh_worker_storages(monkeypatch):
+    """每个测试使用各自的数据库：清空进程内缓存的存储与求值器"""
+    monkeypatch.setattr("src.scheduler._worker_storages", {})
+    monkeypatch.setattr("src.scheduler._worker_evaluators", {})
+
+
+def seed(path, count, minutes_ago=60):
+    """写入count只宠物的记录（最近一次写入在minutes_ago分钟前）"""
+    storage = SQLiteStorage(str(path))
+    updated_at = time.time() - minutes_ago * 60
+    states = reference_life().get_states()
+    pet_ids = [f"pet-{i}" for i in range(count)]
+    storage.save_many({
+        f"{RECORD_KEY_PREFIX}{pet_id}": PetRecord(states, updated_at).encode()
+        for pet_id in pet_ids
+    })
+    storage.close()
+    return pet_ids
+
+
+def test_ring_balanced_and_stable():
+    ring = ConsistentHashRing(8)
+    pet_ids = [f"pet-{i}" for i in range(20000)]
+    sizes = [len(ids) for ids in ring.partition(pet_ids).values()]
+
+    assert len(sizes) == 8
+    assert max(sizes) < 2 * min(sizes)
+    # 哈希不依赖进程的随机种子
+    assert ConsistentHashRing(8).shard_for("pet-42") == ring.shard_for("pet-42")
+
+
+def test_ring_minimal_remap():
+    """8 → 9个分片：约1/9的宠物换分片，其余保持不变"""
+    before, after = ConsistentHashRing(8), ConsistentHashRing(9)
+    pet_ids = [f"pet-{i}" for i in range(20000)]
+    moved = sum(before.shard_for(pet_id) != after.shard_for(pet_id) for pet_id in pet_ids)
+    assert moved / len(pet_ids) < 0.2
+    # 换分片的宠物都去了新分片
+    assert all(
+        after.shard_for(pet_id) == 8
+        for pet_id in pet_ids
+        if before.shard_for(pet_id) != after.shard_for(pet_id)
+    )
+
+
+def test_run_once_advances_and_writes_back(tmp_path, monkeypatch):
+    path = tmp_path / "pets.db"
+    monkeypatch.setenv("TEST_SCHEDULER_DB", str(path))
+    pet_ids = seed(path, 50)
+    storage = sqlite_storage()
+    now = time.time()
+    expected, _ = make_evaluator(storage).materialize("pet-0", now=now)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        scheduler = ShardedScheduler(
+            lambda: pet_ids + ["missing"], sqlite_storage, reference_life, shards=4, executor=executor
+        )
+        results = scheduler.run_once(now)
+
+    assert sum(result.written for result in results) == 50
+    assert sum(result.advanced for result in results) == 50
+    assert sum(result.skipped for result in results) == 1  # 没有记录的宠物
+    assert all(result.error is None for result in results)
+    assert max(result.max_staleness for result in results) == pytest.approx(3600, abs=5)
+
+    record = PetRecord.decode(storage.load(f"{RECORD_KEY_PREFIX}pet-0"))
+    assert record.updated_at == now
+    assert record.states["energy"]["energy"] == pytest.approx(expected["energy"]["energy"])
+    assert not storage.exists(f"{RECORD_KEY_PREFIX}missing")
+
+
+def test_process_pool(tmp_path, monkeypatch):
+    """多进程推进：每个worker各自打开存储，所有宠物都被写回"""
+    path = tmp_path / "pets.db"
+    monkeypatch.setenv("TEST_SCHEDULER_DB", str(path))
+    pet_ids = seed(path, 200)
+
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=2, mp_context=context) as executor:
+        scheduler = ShardedScheduler(lambda: pet_ids, sqlite_storage, reference_life, shards=4, executor=executor)
+        start = time.perf_counter()
+        now = time.time()
+        results = scheduler.run_once(now)
+        elapsed = time.perf_counter() - start
+
+    print(f"   {len(pet_ids)}只宠物, 4个分片: {elapsed * 1000:.0f}ms, 延迟={scheduler.stats()['lag_seconds']}")
+    assert sum(result.written for result in results) == len(pet_ids)
+    assert set(scheduler.stats()["lag_seconds"]) == {result.shard for result in results}
+    assert PetRecord.decode(sqlite_storage().load(f"{RECORD_KEY_PREFIX}pet-199")).updated_at == now
+
+
+def test_bad_record_is_skipped(tmp_path, monkeypatch):
+    """格式不对的记录跳过（不覆盖），同一分片的其他宠物照常推进"""
+    path = tmp_path / "pets.db"
+    monkeypatch.setenv("TEST_SCHEDULER_DB", str(path))
+    pet_ids = seed(path, 100)
+    storage = sqlite_storage()
+    storage.save(f"{RECORD_KEY_PREFIX}pet-0", {"energy": 50.0})  # 缺字段的坏记录
+    storage.save(f"{RECORD_KEY_PREFIX}pet-1", {"t": 0.0, "s": {"energy": {}}})  # 子系统状态不全
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        scheduler = ShardedScheduler(lambda: pet_ids, sqlite_storage, reference_life, shards=4, executor=executor)
+        results = scheduler.run_once()
+
+    assert all(result.error is None for result in results)
+    assert sum(result.skipped for result in results) == 2
+    assert sum(result.written for result in results) == 98
+    assert scheduler.stats()["skipped"] == 2
+    assert scheduler.stats()["failures"] == 0
+    assert storage.load(f"{RECORD_KEY_PREFIX}pet-0") == {"energy": 50.0}
+
+
+class InterruptedLife(ReferenceLife):
+    """推算时另一实例写入同一宠物（模拟推进期间的并发互动），只触发一次"""
+    interrupt = None
+
+    def tick(self, dt):
+        interrupt, InterruptedLife.interrupt = InterruptedLife.interrupt, None
+        if interrupt is not None:
+            interrupt()
+        super().tick(dt)
+
+
+def interrupted_life():
+    return InterruptedLife(MemoryStorage())
+
+
+def test_concurrent_write_is_not_overwritten():
+    """版本化的Redis：推进期间对方写入，本次写回冲突后在对方的结果上重新推算"""
+    _redis.data.clear()
+    other = make_evaluator(redis_storage())
+    other.update("a", lambda states: states["energy"].update(energy=50.0) or True, now=0.0)
+    now = time.time()
+
+    def feed():
+        other.update("a", lambda states: states["energy"].update(energy=90.0) or True, now=now)
+
+    InterruptedLife.interrupt = feed
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        scheduler = ShardedScheduler(lambda: ["a"], redis_storage, interrupted_life, shards=1, executor=executor)
+        results = scheduler.run_once(now)
+
+    assert results[0].written == 1
+    record = PetRecord.decode(redis_storage().load(f"{RECORD_KEY_PREFIX}a"))
+    assert record.states["energy"]["energy"] == 90.0
+    evaluator = scheduler_module._worker_evaluators[(os.getpid(), redis_storage, interrupted_life)]
+    assert evaluator.stats()["conflicts"] == 1
+
+
+def test_default_storage_is_lazy_backend(tmp_path, monkeypatch):
+    """默认存储与lazy模式的接口相同：接口写入的记录能被列出"""
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    monkeypatch.delenv("KV_REST_API_URL", raising=False)
+    monkeypatch.setattr("src.life_adapter.STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr("src.life_adapter.SQLITE_PATH", str(tmp_path / "pets.db"))
+
+    make_evaluator(LifeAdapter._create_lazy_backend()).materialize("a", now=0.0)
+    assert stored_pet_ids(default_storage()) == ["a"]
+
+
+def test_endpoint_records_are_advanced(tmp_path, monkeypatch):
+    """lazy模式接口写入的记录被默认配置的调度器推进"""
+    if not LIFE_ENGINE_AVAILABLE:
+        pytest.skip("micro-life-sim 未安装")
+
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    monkeypatch.delenv("KV_REST_API_URL", raising=False)
+    monkeypatch.setattr("src.life_adapter.PET_MODE", "lazy")
+    monkeypatch.setattr("src.life_adapter.STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr("src.life_adapter.SQLITE_PATH", str(tmp_path / "pets.db"))
+    monkeypatch.setattr(LifeAdapter, "_lazy_pets", None)
+
+    LifeAdapter("device-1", pet_id="scheduled").interact("feed")
+    storage = default_storage()
+    assert stored_pet_ids(storage) == ["scheduled"]
+
+    now = time.time() + 600
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        scheduler = ShardedScheduler(lambda: stored_pet_ids(storage), shards=2, executor=executor)
+        results = scheduler.run_once(now)
+    assert sum(result.written for result in results) == 1
+    assert PetRecord.decode(storage.load(f"{RECORD_KEY_PREFIX}scheduled")).updated_at == now
+
+
+def test_stored_pet_ids_on_redis():
+    storage = redis_backend(FakeRedis(), key_prefix="life_pets")
+    storage.save(f"{RECORD_KEY_PREFIX}a", {"t": 0.0, "s": {}})
+    storage.save(f"{RECORD_KEY_PREFIX}b", {"t": 0.0, "s": {}})
+    storage.save("other", {})
+    assert stored_pet_ids(storage) == ["a", "b"]
+
+
+def test_start_scheduler(tmp_path, monkeypatch):
+    assert start_scheduler() is None  # 默认不开启
+
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    monkeypatch.delenv("KV_REST_API_URL", raising=False)
+    monkeypatch.setattr("src.life_adapter.STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr("src.life_adapter.SQLITE_PATH", str(tmp_path / "pets.db"))
+    monkeypatch.setattr(scheduler_module, "SCHEDULER_ENABLED", True)
+    monkeypatch.setattr(scheduler_module, "SCHEDULER_INTERVAL", 3600.0)
+    monkeypatch.setattr(scheduler_module, "SCHEDULER_WORKERS", 1)
+
+    monkeypatch.setattr("src.life_adapter.PET_MODE", "registry")
+    assert start_scheduler() is None  # registry模式的宠物不需要定时推进
+
+    monkeypatch.setattr("src.life_adapter.PET_MODE", "lazy")
+    if not LIFE_ENGINE_AVAILABLE:
+        assert start_scheduler() is None
+        return
+
+    scheduler = start_scheduler()
+    try:
+        deadline = time.time() + 10
+        while scheduler.rounds == 0 and time.time() < deadline:
+            time.sleep(0.02)
+        assert scheduler.rounds == 1
+    finally:
+        scheduler.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
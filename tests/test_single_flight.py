@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+补偿单飞锁测试（进程内实现）
+
+测试覆盖：
+1. 同一时间只有一个leader，fencing token单调递增
+2. 过期token无法发布快照，水位线早于等待目标的快照不返回
+3. follower等待leader完成后读取快照
+4. follower取不到可用的快照（没有快照或只有旧快照）时从存储重新加载并补偿，
+   leader未完成时结果不进入快照缓存
+5. 快照缓存：构建期间缓存被失效（其他线程提交了修改）时，构建结果不写入缓存
+
+使用方法：
+    python -m pytest tests/test_single_flight.py -q
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.single_flight import SingleFlight
+from src.snapshot_cache import SnapshotCache
+
+
+class MemoryStorage:
+    """不带Redis客户端的存储后端，SingleFlight使用进程内实现"""
+
+
+def test_single_leader_and_monotonic_tokens():
+    single_flight = SingleFlight(MemoryStorage())
+
+    first = single_flight.acquire()
+    assert first is not None
+    assert single_flight.acquire() is None
+
+    single_flight.release(first)
+    second = single_flight.acquire()
+    assert second is not None and second > first
+
+
+def test_stale_token_cannot_publish():
+    single_flight = SingleFlight(MemoryStorage())
+
+    stale = single_flight.acquire()
+    single_flight.release(stale)
+    fresh = single_flight.acquire()
+
+    assert not single_flight.publish(stale, {"energy": 1}, 100.0)
+    assert single_flight.publish(fresh, {"energy": 2}, 100.0)
+    assert single_flight.load_snapshot(min_watermark=100.0) == {"energy": 2}
+
+
+def test_old_snapshot_rejected():
+    """以前某次补偿发布的快照水位线早于等待目标：不返回"""
+    single_flight = SingleFlight(MemoryStorage())
+    token = single_flight.acquire()
+    single_flight.publish(token, {"energy": 2}, 100.0)
+
+    assert single_flight.load_snapshot(min_watermark=100.5) is None
+    assert single_flight.load_snapshot(min_watermark=99.0) == {"energy": 2}
+
+
+def test_follower_serves_leader_snapshot():
+    single_flight = SingleFlight(MemoryStorage())
+    token = single_flight.acquire()
+
+    def leader():
+        time.sleep(0.05)
+        single_flight.publish(token, {"energy": 42}, 100.0)
+        single_flight.release(token)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+
+    assert single_flight.wait(timeout=1.0)
+    assert single_flight.load_snapshot(min_watermark=100.0) == {"energy": 42}
+    thread.join()
+
+
+def test_follower_wait_times_out():
+    single_flight = SingleFlight(MemoryStorage())
+    token = single_flight.acquire()
+
+    assert not single_flight.wait(timeout=0.01)
+    single_flight.release(token)
+
+
+class FakeTickClock:
+    def __init__(self, watermark):
+        self.watermark = watermark
+
+    def peek(self):
+        return self.watermark
+
+
+class FakeBackend:
+    available = True
+
+
+class FakeLife:
+    class state_manager:
+        backend = FakeBackend()
+
+
+@pytest.mark.parametrize("old_snapshot", [False, True])
+@pytest.mark.parametrize("leader_finished", [True, False])
+def test_adapter_follower_without_snapshot_reloads(monkeypatch, leader_finished, old_snapshot):
+    """follower没有拿到快照（或只有以前补偿发布的旧快照）：不能返回本地未推进的状态或旧快照"""
+    from src.life_adapter import LifeAdapter
+
+    single_flight = SingleFlight(MemoryStorage())
+    if old_snapshot:
+        # 30天前的一次补偿发布的快照仍在存储中
+        previous = single_flight.acquire()
+        single_flight.publish(previous, {"energy": -1}, time.time() - 30 * 86400)
+        single_flight.release(previous)
+    token = single_flight.acquire()  # 其他实例是leader
+    if leader_finished:
+        # 等待期间leader刷盘并释放了锁，但没有发布快照
+        monkeypatch.setattr(single_flight, "acquire", lambda: None)
+        single_flight.release(token)
+
+    calls = []
+    cache = SnapshotCache(ttl=60)
+    monkeypatch.setattr(LifeAdapter, "_tick_clock", FakeTickClock(time.time() - 3600))
+    monkeypatch.setattr(LifeAdapter, "_single_flight", single_flight)
+    monkeypatch.setattr(LifeAdapter, "_snapshot_cache", cache)
+    monkeypatch.setattr("src.life_adapter.SINGLE_FLIGHT_WAIT_MS", 10)
+    monkeypatch.setattr(LifeAdapter, "get_life", lambda self: FakeLife())
+    monkeypatch.setattr(LifeAdapter, "_rebase", classmethod(lambda cls, life: calls.append("rebase")))
+    monkeypatch.setattr(LifeAdapter, "_tick_life_engine", lambda self, life: calls.append("tick"))
+    monkeypatch.setattr(LifeAdapter, "_build_state", lambda self, life: {"energy": len(calls)})
+
+    adapter = object.__new__(LifeAdapter)
+    adapter.device_id, adapter.pet_id = "device-1", None
+    state = adapter.get_state()
+
+    assert calls == ["rebase", "tick"]
+    assert state["energy"] == 2
+    assert (cache.get(LifeAdapter._tick_clock.watermark) is not None) == leader_finished
+
+
+def test_snapshot_cache_drops_put_after_invalidate():
+    """读请求在提交前开始构建，提交失效缓存后才put：旧状态不进入缓存"""
+    cache = SnapshotCache(ttl=60)
+    generation = cache.generation  # 读请求开始构建
+    cache.invalidate()  # 其他线程提交互动
+    assert not cache.put(1.0, {"energy": 50}, generation)
+    assert cache.get(1.0) is None
+
+    assert cache.put(1.0, {"energy": 51}, cache.generation)
+    assert cache.get(1.0) == {"energy": 51}
+
+
+def test_adapter_does_not_cache_state_built_before_commit(monkeypatch):
+    """get_state 构建快照期间互动提交并失效缓存：下一次读取重新构建"""
+    from src.life_adapter import LifeAdapter
+
+    cache = SnapshotCache(ttl=60)
+    builds = []
+
+    def catch_up(self, life):
+        builds.append(len(builds))
+        if len(builds) == 1:
+            cache.invalidate()  # 构建进行中，其他线程的互动提交
+        return {"energy": len(builds)}, True
+
+    monkeypatch.setattr(LifeAdapter, "_tick_clock", FakeTickClock(time.time()))
+    monkeypatch.setattr(LifeAdapter, "_snapshot_cache", cache)
+    monkeypatch.setattr(LifeAdapter, "get_life", lambda self: FakeLife())
+    monkeypatch.setattr(LifeAdapter, "_single_flight_catch_up", catch_up)
+
+    adapter = object.__new__(LifeAdapter)
+    adapter.device_id, adapter.pet_id = "device-1", None
+
+    assert adapter.get_state()["energy"] == 1
+    assert adapter.get_state()["energy"] == 2
+    assert adapter.get_state()["energy"] == 2  # 第二次构建在失效之后，可以缓存
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
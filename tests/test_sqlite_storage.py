@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+SQLite存储测试与基准
+
+测试覆盖：
+1. 基本读写、批量事务、只在不存在时写入、按前缀列出键、损坏的行、互动日志及其裁剪
+1a. 两个连接共享数据库：is_stale() 发现另一个连接的写入（按命名空间隔离），
+    读-改-写在事务中先重新加载，不覆盖另一个连接写入的值
+2. 多进程共享tick水位线时同一段时间只补偿一次
+3. 写入进行中其他进程可以并发读取（WAL）
+4. 刷盘耗时基准：SQLite vs mmap vs FileStorage vs 本地Redis
+   （FileStorage需要安装micro-life-sim，Redis需要 REDIS_URL 和 redis 包）
+
+使用方法：
+    python -m pytest tests/test_sqlite_storage.py -q -s
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeLife
+
+from src.life_adapter import LifeAdapter
+from src.mmap_storage import MmapStorage
+from src.sqlite_storage import SQLiteStorage
+from src.storage import BatchedStorage, FlushTracker, NamespacedStorage
+from src.tick_clock import TickClock
+
+STATES = {
+    "rhythm": {"internal_phase": 0.25, "external_phase": 0.3, "last_update": 1700000000.0},
+    "energy": {"energy": 80.0, "consumption_rate": 0.5, "last_update": 1700000000.0},
+}
+
+
+def test_roundtrip(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "state.db"))
+    assert storage.load("energy") == {}
+
+    storage.save_many(STATES)
+    storage.save("energy", {"energy": 79.0})
+
+    assert storage.load("energy") == {"energy": 79.0}
+    assert storage.load_many(["rhythm", "missing"]) == {"rhythm": STATES["rhythm"], "missing": {}}
+    assert storage.exists("rhythm")
+
+    storage.delete("rhythm")
+    assert not storage.exists("rhythm")
+
+    conn = storage._connection()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_transaction_rolls_back(tmp_path):
+    """事务中出错时整批写入回滚"""
+    storage = SQLiteStorage(str(tmp_path / "state.db"))
+    storage.save("energy", {"energy": 50.0})
+
+    with pytest.raises(RuntimeError):
+        with storage.transaction():
+            storage.save_many(STATES)
+            raise RuntimeError("boom")
+
+    assert storage.load("energy") == {"energy": 50.0}
+    assert not storage.exists("rhythm")
+
+
+def test_corrupt_row_reads_as_empty(tmp_path):
+    """损坏的行在 load 和 load_many 中都按空状态处理，不影响其他键"""
+    storage = SQLiteStorage(str(tmp_path / "state.db"))
+    storage.save("rhythm", STATES["rhythm"])
+    with storage.transaction() as conn:
+        conn.execute("INSERT INTO state (key, value, updated_at) VALUES ('energy', '{bad', 0)")
+
+    assert storage.load("energy") == {}
+    assert storage.load_many(["energy", "rhythm"]) == {"energy": {}, "rhythm": STATES["rhythm"]}
+
+
+def test_save_if_absent(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "state.db"))
+    assert storage.save_if_absent("pet:a", {"t": 1.0})
+    assert not storage.save_if_absent("pet:a", {"t": 2.0})
+    assert storage.load("pet:a") == {"t": 1.0}
+
+
+def test_keys_by_prefix(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "state.db"))
+    storage.save_many({"pet:b": {}, "pet:a": {}, "energy": {}})
+    assert storage.keys("pet:") == ["pet:a", "pet:b"]
+    assert len(storage.keys()) == 3
+
+
+def test_is_stale_detects_other_connection(tmp_path):
+    """只有另一个连接写入过本实例读到的键时才报告过期，报告一次后记为已读"""
+    path = str(tmp_path / "state.db")
+    storage, other = SQLiteStorage(path), SQLiteStorage(path)
+    storage.save("energy", {"energy": 50.0})
+    assert not storage.is_stale()  # 自己的写入不算过期
+
+    other.save("energy", {"energy": 80.0})
+    other.save("rhythm", {"internal_phase": 0.5})  # 本实例从未读取的键
+    assert BatchedStorage(storage).is_stale()
+    assert not storage.is_stale()
+    assert storage.load("energy") == {"energy": 80.0}
+
+
+def test_migrates_database_without_versions(tmp_path):
+    """旧数据库的state表没有version列：打开时补上，已有的行照常读取"""
+    import sqlite3
+
+    path = str(tmp_path / "state.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE state (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)")
+    conn.execute("""INSERT INTO state VALUES ('energy', '{"energy": 50.0}', 0)""")
+    conn.commit()
+    conn.close()
+
+    storage = SQLiteStorage(path)
+    assert storage.load("energy") == {"energy": 50.0}
+    SQLiteStorage(path).save("energy", {"energy": 80.0})
+    assert storage.is_stale()
+
+
+def test_is_stale_per_namespace(tmp_path):
+    """共享数据库上的命名空间视图：其他宠物的写入不算过期，也不会吞掉本宠物的过期通知"""
+    path = str(tmp_path / "pets.db")
+    shared, other = SQLiteStorage(path), SQLiteStorage(path)
+    pet_a, pet_b = NamespacedStorage(shared, "life_a"), NamespacedStorage(shared, "life_b")
+    pet_a.load_many(["energy"])
+    pet_b.load_many(["energy"])
+
+    NamespacedStorage(other, "life_b").save("energy", {"energy": 80.0})
+    assert not pet_a.is_stale()
+    NamespacedStorage(other, "life_a").save("energy", {"energy": 70.0})
+    assert pet_a.is_stale()
+    assert pet_b.is_stale()
+
+
+def _feed(life, flush_tracker):
+    """一个worker的读-改-写：在本地事务中先重新加载其他worker的写入，再加1并刷盘"""
+    with LifeAdapter._local_transaction(life, flush_tracker, []):
+        state = dict(life.state_manager.load("energy"))
+        state["energy"] += 1.0
+        life.state_manager.save("energy", state)
+        assert LifeAdapter._commit_flush(life, flush_tracker, [])
+
+
+def test_second_writer_sees_first_writers_value(tmp_path):
+    """两个worker各自缓存了宠物状态：后写入的worker先重新加载，不丢失先写入的修改"""
+    path = str(tmp_path / "pets.db")
+    SQLiteStorage(path).save("life_pet-1:energy", {"energy": 50.0})
+    workers = [
+        (FakeLife(BatchedStorage(NamespacedStorage(SQLiteStorage(path), "life_pet-1"))), FlushTracker())
+        for _ in range(2)
+    ]
+    for life, _ in workers:
+        assert life.state_manager.load("energy") == {"energy": 50.0}
+
+    life_b, tracker_b = workers[1]
+    life_b.state_manager.save("energy", {"energy": 80.0})
+    assert LifeAdapter._commit_flush(life_b, tracker_b, [])
+
+    _feed(*workers[0])
+
+    assert SQLiteStorage(path).load("life_pet-1:energy") == {"energy": 81.0}
+    assert workers[0][0].state_manager.load("energy") == {"energy": 81.0}
+
+
+def test_interaction_log(tmp_path):
+    storage = BatchedStorage(SQLiteStorage(str(tmp_path / "state.db"), log_retention_seconds=None))
+    storage.log_interactions([(1.0, "device-a", "feed"), (2.0, "device-b", "play")])
+
+    recent = storage.recent_interactions(limit=1)
+    assert recent == [{"created_at": 2.0, "device_id": "device-b", "action": "play"}]
+
+
+def test_interaction_log_pruned(tmp_path):
+    """写入时裁剪：超过保留时长的日志删除，行数不超过上限"""
+    storage = SQLiteStorage(str(tmp_path / "state.db"), log_retention_seconds=3600, log_max_rows=3)
+    now = time.time()
+    storage.log_interactions([(now - 7200, "device-a", "feed")])
+    storage.log_interactions([(now + i, "device-b", f"play-{i}") for i in range(5)])
+
+    recent = storage.recent_interactions(limit=10)
+    assert [record["action"] for record in recent] == ["play-4", "play-3", "play-2"]
+
+
+def _claimer(path, start, results):
+    clock = TickClock(BatchedStorage(SQLiteStorage(path)))
+    total = 0.0
+    for i in range(1, 101):
+        total += clock.claim(start + i)
+    results.put(total)
+
+
+def test_tick_clock_shared_across_processes(tmp_path):
+    """多个worker并发推进同一水位线：总补偿时长等于实际经过的时长"""
+    path = str(tmp_path / "state.db")
+    start = 1700000000.0
+    TickClock(SQLiteStorage(path)).reset(start)
+
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_claimer, args=(path, start, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+
+    total = sum(results.get() for _ in processes)
+    assert total == pytest.approx(100.0)
+
+
+def test_reader_not_blocked_by_writer(tmp_path):
+    """WAL：写事务未提交时其他连接仍能读到上一次提交的状态"""
+    path = str(tmp_path / "state.db")
+    writer = SQLiteStorage(path)
+    writer.save("energy", {"energy": 50.0})
+    reader = SQLiteStorage(path)
+
+    with writer.transaction():
+        writer.save("energy", {"energy": 10.0})
+        assert reader.load("energy") == {"energy": 50.0}
+
+    assert reader.load("energy") == {"energy": 10.0}
+
+
+def _measure(storage, rounds=200):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        storage.save_many(STATES)
+    return (time.perf_counter() - start) * 1000 / rounds
+
+
+@pytest.mark.benchmark
+def test_flush_benchmark(tmp_path):
+    """一次刷盘（2个子系统）的耗时：SQLite vs mmap vs FileStorage vs 本地Redis"""
+    results = {
+        "sqlite": _measure(BatchedStorage(SQLiteStorage(str(tmp_path / "state.db")))),
+        "mmap": _measure(BatchedStorage(MmapStorage(str(tmp_path / "state.mmap")))),
+    }
+
+    from src.life_adapter import LIFE_ENGINE_AVAILABLE
+    if LIFE_ENGINE_AVAILABLE:
+        from core import FileStorage
+        results["file"] = _measure(BatchedStorage(FileStorage(str(tmp_path / "files"))))
+
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        try:
+            import redis
+        except ImportError:
+            redis = None
+        if redis is not None:
+            client = redis.from_url(redis_url, decode_responses=True)
+
+            class _Backend:
+                key_prefix = "life_benchmark"
+                ttl = 60
+
+                def __init__(self):
+                    self.client = client
+
+            results["redis"] = _measure(BatchedStorage(_Backend()), rounds=50)
+            client.delete(*[f"life_benchmark:{key}" for key in STATES])
+
+    print("   每次刷盘: " + ", ".join(f"{name}={ms:.3f}ms" for name, ms in results.items()))
+    # 单机部署的刷盘应在毫秒级
+    assert results["sqlite"] < 50
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
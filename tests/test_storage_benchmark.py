@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+批量刷盘测试：一次刷盘的存储往返次数
+
+测试覆盖：
+1. 逐个save（StateManager.flush 原行为）与 save_many 的往返次数对比
+2. load_many 一次MGET读取
+3. flush_pending 清空pending并一次写完；版本化写入时引擎缺少 _pending_saves 拒绝启动
+4. hash布局只写入变化的字段，旧JSON键平滑迁移
+5. 脏标记：无实质变化的刷盘整体跳过
+6. 真实StateManager：私有属性 _pending_saves 仍然存在；一次请求端到端的读写往返
+7. 真实Redis上的往返耗时（需要 REDIS_URL 和 redis 包）
+
+使用方法：
+    python -m pytest tests/test_storage_benchmark.py -q -s
+"""
+
+import json
+import os
+import sys
+import time
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeLife, FakeRedis, redis_backend
+from src.storage import BatchedStorage, FlushTracker, flush_pending, require_pending_saves
+
+
+def make_states(n):
+    return {f"system_{i}": {"value": float(i), "last_update": 0.0} for i in range(n)}
+
+
+@pytest.mark.parametrize("n", [2, 8])
+def test_save_many_single_round_trip(n):
+    """N个子系统：逐个save需要N次往返，save_many只需1次"""
+    client = FakeRedis()
+    backend = redis_backend(client)
+    for key, state in make_states(n).items():
+        backend.save(key, state)
+    per_key = client.round_trips
+
+    client = FakeRedis()
+    storage = BatchedStorage(redis_backend(client))
+    storage.save_many(make_states(n))
+
+    print(f"   {n}个子系统: 逐个save={per_key}次往返, save_many={client.round_trips}次往返")
+    assert per_key == n
+    assert client.round_trips == 1
+    assert storage.round_trips == 1
+    # TTL与逐个SETEX一致
+    assert set(client.ttls.values()) == {3600}
+
+
+def test_load_many_single_round_trip():
+    """load_many 一次MGET读取，缺失的键返回空字典"""
+    client = FakeRedis()
+    storage = BatchedStorage(redis_backend(client))
+    storage.save_many(make_states(3))
+    client.round_trips = 0
+
+    states = storage.load_many(["system_0", "system_2", "missing"])
+
+    assert client.round_trips == 1
+    assert states["system_2"]["value"] == 2.0
+    assert states["missing"] == {}
+
+
+def test_flush_pending_uses_save_many():
+    """flush_pending 一次写完所有pending状态并清空"""
+    client = FakeRedis()
+    life = FakeLife(BatchedStorage(redis_backend(client)))
+    life.state_manager._pending_saves.update(make_states(2))
+
+    written = flush_pending(life)
+
+    assert written == 2
+    assert client.round_trips == 1
+    assert life.state_manager._pending_saves == {}
+    assert json.loads(client.data["life_test:system_1"])["value"] == 1.0
+
+
+def test_flush_pending_falls_back_without_save_many():
+    """后端不支持批量写入时退回 life.flush()"""
+    client = FakeRedis()
+    life = FakeLife(redis_backend(client))
+    life.state_manager._pending_saves.update(make_states(2))
+
+    assert flush_pending(life) == -1
+    assert client.round_trips == 2
+    assert life.state_manager._pending_saves == {}
+
+
+def test_flush_pending_warns_without_pending_attribute(monkeypatch, caplog):
+    """引擎不再提供 _pending_saves：退回 life.flush() 并告警（只告警一次）"""
+    monkeypatch.setattr("src.storage._missing_pending_warned", False)
+    client = FakeRedis()
+    life = FakeLife(BatchedStorage(redis_backend(client)))
+    monkeypatch.delattr(life.state_manager, "_pending_saves")
+    monkeypatch.setattr(life, "flush", lambda: None)
+
+    with caplog.at_level("WARNING", logger="src.storage"):
+        assert flush_pending(life) == -1
+        assert FlushTracker().flush(life) == -1
+    assert sum("_pending_saves" in record.message for record in caplog.records) == 1
+
+
+def test_missing_pending_attribute_fails_startup_when_versioned(monkeypatch):
+    """版本化写入时引擎缺少 _pending_saves：创建Life即抛出（启动检查），关闭版本化时照常创建"""
+    from src import life_adapter
+
+    class StubLife:
+        def __init__(self, backend, **kwargs):
+            self.state_manager = FakeLife(backend).state_manager
+            del self.state_manager._pending_saves
+
+        def start(self):
+            pass
+
+    monkeypatch.setattr(life_adapter, "Life", StubLife)
+    monkeypatch.setattr(life_adapter, "LIFE_ENGINE_AVAILABLE", True)
+    monkeypatch.setattr(life_adapter, "VERSIONED_WRITES", True)
+    with pytest.raises(RuntimeError, match="_pending_saves"):
+        life_adapter.LifeAdapter.check_engine()
+
+    monkeypatch.setattr(life_adapter, "VERSIONED_WRITES", False)
+    life_adapter.LifeAdapter.check_engine()
+
+    require_pending_saves(FakeLife(None).state_manager)
+
+
+def energy_state(energy):
+    return {
+        "energy": energy,
+        "consumption_rate": 0.5,
+        "recovery_rate": 0.3,
+        "circadian_value": 0.8,
+        "last_update": 1700000000.0,
+    }
+
+
+def test_hash_layout_writes_changed_fields_only():
+    """hash布局：首次整体写入，之后只写变化的字段，无变化时不发请求"""
+    client = FakeRedis()
+    storage = BatchedStorage(redis_backend(client), layout="hash")
+
+    storage.save_many({"energy": energy_state(80.0)})
+    assert storage.fields_written == 5
+    first_bytes = client.bytes_sent
+
+    storage.save_many({"energy": energy_state(79.5)})
+    assert storage.fields_written == 6
+    assert client.bytes_sent - first_bytes < first_bytes / 3
+
+    trips = client.round_trips
+    storage.save_many({"energy": energy_state(79.5)})
+    assert client.round_trips == trips
+
+    assert client.ttls["life_test:h:energy"] == 3600
+    assert storage.load("energy") == energy_state(79.5)
+
+
+def test_hash_layout_removes_missing_fields():
+    """字段从状态中消失时HDEL"""
+    client = FakeRedis()
+    storage = BatchedStorage(redis_backend(client), layout="hash")
+    storage.save("rhythm", {"internal_phase": 0.1, "last_calibration": 5.0})
+    storage.save("rhythm", {"internal_phase": 0.2})
+
+    assert storage.load("rhythm") == {"internal_phase": 0.2}
+
+
+def test_hash_layout_migrates_json_documents():
+    """哈希不存在时读取旧的JSON文档，首次保存整体写入哈希"""
+    client = FakeRedis()
+    redis_backend(client).save("energy", energy_state(60.0))
+
+    storage = BatchedStorage(redis_backend(client), layout="hash")
+    assert storage.load("energy") == energy_state(60.0)
+
+    storage.save("energy", energy_state(60.0))
+    assert storage.fields_written == 5
+    assert storage.load_many(["energy"])["energy"] == energy_state(60.0)
+
+
+def test_hash_vs_json_bandwidth():
+    """一次互动只改能量：hash布局的写入字节数远小于整体文档"""
+    json_client = FakeRedis()
+    json_storage = BatchedStorage(redis_backend(json_client))
+    hash_client = FakeRedis()
+    hash_storage = BatchedStorage(redis_backend(hash_client), layout="hash")
+
+    for storage in (json_storage, hash_storage):
+        storage.save_many({"energy": energy_state(80.0)})
+    json_client.bytes_sent = hash_client.bytes_sent = 0
+
+    for i in range(100):
+        for storage in (json_storage, hash_storage):
+            storage.save_many({"energy": energy_state(80.0 - i * 0.1)})
+
+    print(f"   100次互动写入: json={json_client.bytes_sent}B, hash={hash_client.bytes_sent}B")
+    assert hash_client.bytes_sent * 3 < json_client.bytes_sent
+
+
+def test_flush_tracker_skips_clean_flush():
+    """状态没有变化（只有时间戳变化）时不发出存储请求"""
+    client = FakeRedis()
+    life = FakeLife(BatchedStorage(redis_backend(client)))
+    tracker = FlushTracker(epsilon=1e-6)
+
+    life.state_manager._pending_saves["energy"] = energy_state(80.0)
+    assert tracker.flush(life) == 1
+
+    state = energy_state(80.0 + 1e-9)
+    state["last_update"] += 1.0
+    life.state_manager._pending_saves["energy"] = state
+    assert tracker.flush(life) == 0
+
+    assert client.round_trips == 1
+    assert life.state_manager._pending_saves == {}
+    assert tracker.stats() == {
+        "flushes_performed": 1,
+        "flushes_skipped": 1,
+        "systems_written": 1,
+        "systems_skipped": 1,
+    }
+
+
+def test_flush_tracker_writes_dirty_systems_only():
+    """只写入变化超过epsilon的子系统"""
+    client = FakeRedis()
+    life = FakeLife(BatchedStorage(redis_backend(client)))
+    tracker = FlushTracker(epsilon=1e-3)
+    rhythm = {"internal_phase": 0.1, "last_update": 0.0}
+
+    life.state_manager._pending_saves.update({"energy": energy_state(80.0), "rhythm": rhythm})
+    tracker.flush(life)
+
+    life.state_manager._pending_saves.update({"energy": energy_state(79.0), "rhythm": dict(rhythm)})
+    assert tracker.flush(life) == 1
+    assert json.loads(client.data["life_test:energy"])["energy"] == 79.0
+
+
+def test_flush_tracker_accumulates_small_drift():
+    """每次变化都小于epsilon，但累计变化超过epsilon时写入"""
+    client = FakeRedis()
+    life = FakeLife(BatchedStorage(redis_backend(client)))
+    tracker = FlushTracker(epsilon=0.01)
+
+    life.state_manager._pending_saves["energy"] = energy_state(80.0)
+    tracker.flush(life)
+    written = []
+    for i in range(1, 6):
+        life.state_manager._pending_saves["energy"] = energy_state(80.0 - i * 0.004)
+        written.append(tracker.flush(life))
+
+    assert written == [0, 0, 1, 0, 0]
+
+
+def test_flush_tracker_forget_forces_write():
+    """forget() 后下次刷盘整体写入"""
+    client = FakeRedis()
+    life = FakeLife(BatchedStorage(redis_backend(client)))
+    tracker = FlushTracker()
+
+    life.state_manager._pending_saves["energy"] = energy_state(80.0)
+    tracker.flush(life)
+    tracker.forget()
+    life.state_manager._pending_saves["energy"] = energy_state(80.0)
+    assert tracker.flush(life) == 1
+
+
+def test_unknown_layout_rejected():
+    with pytest.raises(ValueError):
+        BatchedStorage(redis_backend(FakeRedis()), layout="binary")
+
+
+def test_attribute_passthrough():
+    """client/key_prefix/ttl透传给被包装的后端（供TickClock/SingleFlight使用）"""
+    client = FakeRedis()
+    storage = BatchedStorage(redis_backend(client, key_prefix="life_global_pet"))
+    assert storage.client is client
+    assert storage.key_prefix == "life_global_pet"
+    assert storage.ttl == 3600
+
+
+def test_file_backend_batching(tmp_path):
+    """非Redis后端：save_many 逐个保存，行为不变"""
+    from src.life_adapter import LIFE_ENGINE_AVAILABLE
+    if not LIFE_ENGINE_AVAILABLE:
+        pytest.skip("micro-life-sim 未安装")
+
+    from core import FileStorage
+    storage = BatchedStorage(FileStorage(str(tmp_path)))
+    storage.save_many(make_states(2))
+    assert storage.load_many(["system_0", "system_1"])["system_1"]["value"] == 1.0
+
+
+def test_engine_state_manager_contract():
+    """真实StateManager：flush_pending/FlushTracker 依赖的私有属性 _pending_saves 仍然存在"""
+    from src.life_adapter import LIFE_ENGINE_AVAILABLE, LifeAdapter
+    if not LIFE_ENGINE_AVAILABLE:
+        pytest.skip("micro-life-sim 未安装")
+
+    client = FakeRedis()
+    life = LifeAdapter._new_life(BatchedStorage(redis_backend(client)))
+    state_manager = life.state_manager
+    pending = getattr(state_manager, "_pending_saves", None)
+    assert isinstance(pending, dict), (
+        f"{type(state_manager).__name__}._pending_saves 不存在或类型改变："
+        f"flush_pending/FlushTracker 会退回 life.flush()，批量写入与脏标记失效"
+    )
+
+    life.tick(dt=1.0)
+    assert pending, "tick后没有pending状态：引擎不再通过 _pending_saves 延迟刷盘"
+    count = len(pending)
+    assert flush_pending(life) == count
+    assert state_manager._pending_saves == {}
+    assert client.round_trips == 1
+
+
+def test_engine_request_round_trips():
+    """一次请求（推进 → 刷盘 → 读取状态与表达）端到端的存储往返次数"""
+    from src.life_adapter import LIFE_ENGINE_AVAILABLE, LifeAdapter
+    if not LIFE_ENGINE_AVAILABLE:
+        pytest.skip("micro-life-sim 未安装")
+
+    client = FakeRedis()
+    life = LifeAdapter._new_life(BatchedStorage(redis_backend(client)))
+    tracker = FlushTracker()
+    tracker.flush(life)  # 初始状态落盘
+    client.round_trips = 0
+
+    life.tick(dt=60.0)
+    tracker.flush(life)
+    writes = client.round_trips
+    life.get_states()
+    life.get_expression()
+    reads = client.round_trips - writes
+
+    print(f"   一次请求: 写入={writes}次往返, 读取={reads}次往返")
+    assert writes == 1
+    # 刷盘后的读取来自StateManager的内存状态，不访问存储
+    assert reads == 0
+
+
+@pytest.mark.benchmark
+def test_redis_flush_latency():
+    """真实Redis：逐个save vs save_many 的刷盘耗时"""
+    redis_url = os.getenv("REDIS_URL")
+    if not redis_url:
+        pytest.skip("未设置 REDIS_URL")
+    redis = pytest.importorskip("redis")
+
+    client = redis.from_url(redis_url, decode_responses=True)
+    backend = redis_backend(client, key_prefix="life_benchmark", ttl=60)
+    storage = BatchedStorage(backend)
+    states = make_states(2)
+    rounds = 20
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for key, state in states.items():
+            backend.save(key, state)
+    per_key_ms = (time.perf_counter() - start) * 1000 / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        storage.save_many(states)
+    batched_ms = (time.perf_counter() - start) * 1000 / rounds
+
+    print(f"   每次刷盘: 逐个save={per_key_ms:.2f}ms, save_many={batched_ms:.2f}ms")
+    client.delete(*[f"life_benchmark:{key}" for key in states])
+    assert batched_ms < per_key_ms * 1.5
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
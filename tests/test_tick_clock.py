@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+共享tick时钟测试
+
+测试覆盖：
+1. 首次claim只初始化水位线
+2. 多个实例（共享同一存储）并发claim，同一段时间只补偿一次
+3. begin/commit：刷盘成功后才推进水位线，预占期间其他实例不补偿；
+   abort或崩溃（未commit）时水位线不变，这段时间由下次补偿；刷盘失败时LifeAdapter不推进水位线
+
+使用方法：
+    python -m pytest tests/test_tick_clock.py -q
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeRedis, redis_backend
+from src.tick_clock import TickClock
+
+
+class MemoryStorage:
+    """最小的内存存储后端（与FileStorage相同的load/save接口）"""
+
+    def __init__(self):
+        self.data = {}
+
+    def load(self, key):
+        return dict(self.data.get(key, {}))
+
+    def save(self, key, state):
+        self.data[key] = dict(state)
+
+
+def test_first_claim_initializes():
+    clock = TickClock(MemoryStorage())
+    assert clock.claim(1000.0) == 0.0
+    assert clock.peek() == 1000.0
+    assert clock.claim(1010.0) == 10.0
+
+
+def test_min_elapsed_accumulates():
+    """不足min_elapsed时不推进，时间留给下次请求"""
+    clock = TickClock(MemoryStorage())
+    clock.claim(1000.0)
+    assert clock.claim(1000.5, min_elapsed=1.0) == 0.0
+    assert clock.claim(1001.5, min_elapsed=1.0) == pytest.approx(1.5)
+
+
+def test_concurrent_instances_claim_once():
+    """共享存储的多个时钟：总补偿时长等于真实流逝时长"""
+    storage = MemoryStorage()
+    clocks = [TickClock(storage) for _ in range(8)]
+    clocks[0].claim(0.0)
+
+    claimed = []
+    barrier = threading.Barrier(len(clocks))
+
+    def worker(clock):
+        barrier.wait()
+        claimed.append(clock.claim(3600.0))
+
+    # 每个"实例"有独立的锁，这里用共享锁模拟同一进程内的串行化
+    shared_lock = threading.Lock()
+    for clock in clocks:
+        clock._lock = shared_lock
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in clocks]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sum(claimed) == 3600.0
+    assert claimed.count(3600.0) == 1
+
+
+def test_begin_moves_watermark_only_on_commit():
+    storage = MemoryStorage()
+    clock = TickClock(storage)
+    clock.claim(1000.0)
+
+    assert clock.begin(1010.0) == 10.0
+    assert TickClock(storage).peek() == 1000.0  # 补偿尚未落盘
+    assert clock.begin(1020.0) == 0.0  # 本实例的预占尚未提交
+    clock.commit(1010.0)
+    assert TickClock(storage).peek() == 1010.0
+
+    assert clock.begin(1030.0) == 20.0
+    clock.abort()
+    assert clock.begin(1040.0) == 30.0  # 放弃的时段留给下次补偿
+
+
+@pytest.mark.parametrize("backend", ["memory", "redis"])
+def test_crash_before_commit_keeps_time(backend):
+    """补偿后、刷盘前崩溃：新实例从原水位线重新补偿整段时间"""
+    if backend == "redis":
+        client = FakeRedis()
+        storage = redis_backend(client)
+    else:
+        client, storage = None, MemoryStorage()
+    TickClock(storage).claim(1000.0)
+
+    crashed = TickClock(storage)
+    assert crashed.begin(1600.0) == 600.0
+    if client is not None:
+        # 预占期间其他实例不补偿；持有者崩溃后租约到期
+        assert TickClock(storage).begin(1700.0) == 0.0
+        del client.data["life_test:tick_clock:lease"]
+
+    restarted = TickClock(storage)
+    assert restarted.begin(1700.0) == 700.0
+    restarted.commit(1700.0)
+    assert TickClock(storage).peek() == 1700.0
+
+
+def test_adapter_keeps_watermark_when_flush_fails(monkeypatch):
+    """刷盘持续冲突：撤销本次补偿并释放预占，水位线不变"""
+    from src.life_adapter import LifeAdapter
+
+    class FakeLife:
+        class state_manager:
+            backend = MemoryStorage()
+            auto_flush = False
+
+    storage = MemoryStorage()
+    clock = TickClock(storage)
+    clock.claim(1000.0)
+    calls = []
+    monkeypatch.setattr(LifeAdapter, "_tick_clock", clock)
+    monkeypatch.setattr(LifeAdapter, "_write_behind", None)
+    monkeypatch.setattr(LifeAdapter, "_pending_reapply", [])
+    monkeypatch.setattr("src.life_adapter.time.time", lambda: 1600.0)
+    monkeypatch.setattr(LifeAdapter, "_is_stale", classmethod(lambda cls, life: False))
+    monkeypatch.setattr(LifeAdapter, "_advance_life", lambda self, life, seconds: calls.append(seconds) or seconds)
+    monkeypatch.setattr(LifeAdapter, "_commit_flush", classmethod(lambda cls, life: False))
+    monkeypatch.setattr(LifeAdapter, "_rebase", classmethod(
+        lambda cls, life, flush_tracker=None, pending_reapply=None: calls.append("rebase")
+    ))
+
+    adapter = object.__new__(LifeAdapter)
+    adapter._tick_life_engine(FakeLife())
+    assert calls == [600.0, "rebase"]
+    assert LifeAdapter._pending_reapply == []
+    assert TickClock(storage).peek() == 1000.0
+
+    monkeypatch.setattr(LifeAdapter, "_commit_flush", classmethod(lambda cls, life: True))
+    adapter._tick_life_engine(FakeLife())
+    assert TickClock(storage).peek() == 1600.0
+
+
+def test_life_adapter_uses_shared_clock():
+    """LifeAdapter的水位线持久化在存储后端中"""
+    from src.life_adapter import LIFE_ENGINE_AVAILABLE, LifeAdapter
+    if not LIFE_ENGINE_AVAILABLE:
+        pytest.skip("micro-life-sim 未安装")
+
+    LifeAdapter.cleanup_global()
+    adapter = LifeAdapter("test_tick_clock")
+    adapter.get_state()
+    assert LifeAdapter._tick_clock.peek() is not None
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+分层时间轮测试
+
+测试覆盖：
+1. 事件在到期后一个tick内触发，不会提前
+2. 取消与改期（同一键只保留最后一次登记）
+3. 跨层级联与超出最高层范围的远期事件
+4. next_deadline 不晚于最近的事件
+5. 推进代价与登记的事件总数无关
+
+使用方法：
+    python -m pytest tests/test_timing_wheel.py -q -s
+"""
+
+import os
+import random
+import sys
+import time
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.timing_wheel import HierarchicalTimingWheel
+
+
+def test_fires_within_one_tick():
+    wheel = HierarchicalTimingWheel(start=0.0, tick=1.0, slots=8, levels=3)
+    deadlines = {i: random.Random(i).uniform(0.5, 400) for i in range(500)}
+    for key, deadline in deadlines.items():
+        wheel.schedule(key, deadline)
+
+    fired = {}
+    for second in range(1, 402):
+        for entry in wheel.advance(float(second)):
+            fired[entry.key] = second
+    assert fired.keys() == deadlines.keys()
+    for key, second in fired.items():
+        assert deadlines[key] <= second < deadlines[key] + 1
+    assert len(wheel) == 0
+
+
+def test_cancel_and_reschedule():
+    wheel = HierarchicalTimingWheel(start=0.0, slots=8, levels=2)
+    wheel.schedule("a", 5)
+    wheel.schedule("b", 5)
+    wheel.schedule("a", 30)  # 改期
+    assert wheel.cancel("b").deadline == 5
+    assert wheel.cancel("missing") is None
+
+    assert wheel.advance(10) == []
+    assert [entry.key for entry in wheel.advance(30)] == ["a"]
+
+
+def test_beyond_top_level():
+    """8^2=64个tick之外的事件：先放在最高层，到点前反复重新登记"""
+    wheel = HierarchicalTimingWheel(start=0.0, slots=8, levels=2)
+    wheel.schedule("far", 1000.0)
+    assert wheel.advance(999.0) == []
+    assert [entry.key for entry in wheel.advance(1000.0)] == ["far"]
+
+
+def test_advance_in_large_steps():
+    wheel = HierarchicalTimingWheel(start=100.0, slots=8, levels=3)
+    wheel.schedule("a", 150.0, payload=1)
+    wheel.schedule("b", 120.0, payload=2)
+    expired = wheel.advance(200.0)
+    # 按到期顺序返回
+    assert [(entry.key, entry.payload) for entry in expired] == [("b", 2), ("a", 1)]
+
+
+def test_next_deadline_is_lower_bound():
+    wheel = HierarchicalTimingWheel(start=0.0, slots=8, levels=3)
+    assert wheel.next_deadline() is None
+    rng = random.Random(0)
+    for key in range(50):
+        wheel.schedule(key, rng.uniform(1, 500))
+
+    now = 0.0
+    while len(wheel):
+        deadline = wheel.next_deadline()
+        earliest = min(wheel.get(key).deadline for key in range(50) if key in wheel)
+        assert deadline <= earliest + 1
+        now = deadline
+        wheel.advance(now)
+
+
+@pytest.mark.benchmark
+def test_advance_cost_independent_of_size():
+    """100万个远期事件：推进一小时不触碰它们"""
+    wheel = HierarchicalTimingWheel(start=0.0)
+    for key in range(1_000_000):
+        wheel.schedule(key, 86400.0 + key % 3600)
+
+    start = time.perf_counter()
+    assert wheel.advance(3600.0) == []
+    elapsed = time.perf_counter() - start
+
+    print(f"   100万个事件, 推进3600个tick: {elapsed * 1000:.1f}ms")
+    assert elapsed < 0.5
+
+
+def test_invalid_slots():
+    with pytest.raises(ValueError):
+        HierarchicalTimingWheel(start=0.0, slots=60)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+版本化写入（乐观并发）测试
+
+测试覆盖：
+1. 读取时记录版本，写入成功后版本加一
+2. 其他实例先写入时本实例的写入被拒绝（VersionConflict），存储不被覆盖
+3. hash布局的版本化写入只传输变化的字段
+4. LifeAdapter 冲突时重新加载、重新应用未落盘的修改后重试，并记录指标；
+   互动的冷却记录随重新应用一起写入，其他实例可见
+5. 版本冲突不会触发故障转移熔断
+6. 新鲜度检查：只GET版本计数器，版本变化时才重新加载完整状态
+7. 真实Redis执行 _CAS_SCRIPT（替身只是Python复刻，需要 REDIS_URL 和 redis 包）
+
+使用方法：
+    python -m pytest tests/test_versioned_storage.py -q
+"""
+
+import json
+import os
+import sys
+import time
+import uuid
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeLife, FakeRedis, redis_backend
+from src.failover_storage import FailoverStorage
+from src.action_effects import COOLDOWN_KEY, ActionEffectApplier
+from src.fast_forward import LifeStepper
+from src.life_adapter import LifeAdapter
+from src.storage import BatchedStorage, FlushTracker, VersionConflict
+
+
+def make_storage(client, layout="json"):
+    return BatchedStorage(redis_backend(client), layout=layout, versioned=True)
+
+
+def test_write_bumps_version():
+    client = FakeRedis()
+    storage = make_storage(client)
+    assert storage.load_many(["energy", "rhythm"]) == {"energy": {}, "rhythm": {}}
+    assert storage.expected_version(["energy"]) == 0
+
+    storage.save_many({"energy": {"energy": 80.0}, "rhythm": {"internal_phase": 0.1}})
+    assert client.data["life_test:version"] == "1"
+    assert storage.expected_version(["energy", "rhythm"]) == 1
+
+    storage.save("energy", {"energy": 79.0})
+    assert storage.load("energy") == {"energy": 79.0}
+    assert storage.expected_version(["energy"]) == 2
+
+
+def test_concurrent_writer_rejected():
+    """两个实例读到同一版本：后写入的一方被拒绝，不覆盖先写入的状态"""
+    client = FakeRedis()
+    first, second = make_storage(client), make_storage(client)
+    first.load_many(["energy"])
+    second.load_many(["energy"])
+
+    first.save("energy", {"energy": 70.0})
+    with pytest.raises(VersionConflict) as exc:
+        second.save("energy", {"energy": 90.0})
+
+    assert exc.value.current == 1
+    assert second.version_conflicts == 1
+    assert json.loads(client.data["life_test:energy"]) == {"energy": 70.0}
+
+    # 重新加载后基于最新版本写入成功
+    assert second.load("energy") == {"energy": 70.0}
+    second.save("energy", {"energy": 71.0})
+    assert client.data["life_test:version"] == "2"
+
+
+def test_write_without_read_conflicts():
+    """从未读取过的实例不能盲写"""
+    client = FakeRedis()
+    with pytest.raises(VersionConflict):
+        make_storage(client).save("energy", {"energy": 1.0})
+    assert "life_test:energy" not in client.data
+
+
+def test_hash_layout_sends_changed_fields():
+    client = FakeRedis()
+    storage = make_storage(client, layout="hash")
+    storage.load("energy")
+    storage.save("energy", {"energy": 80.0, "consumption_rate": 0.5})
+    storage.save("energy", {"energy": 79.0, "consumption_rate": 0.5})
+    assert storage.fields_written == 3
+
+    # 没有变化时不发出请求，也不推进版本
+    trips = client.round_trips
+    storage.save("energy", {"energy": 79.0, "consumption_rate": 0.5})
+    assert client.round_trips == trips
+    assert client.hashes["life_test:h:energy"] == {"energy": "79.0", "consumption_rate": "0.5"}
+    assert client.data["life_test:version"] == "2"
+
+
+def test_failover_does_not_trip_on_conflict():
+    client = FakeRedis()
+    primary = make_storage(client)
+    storage = FailoverStorage(lambda: primary)
+    storage.load("energy")
+    client.data["life_test:version"] = "5"  # 其他实例已写入
+
+    with pytest.raises(VersionConflict):
+        storage.save("energy", {"energy": 1.0})
+    assert storage.available
+    assert storage.buffered_keys == 0
+
+
+@pytest.fixture
+def adapter_state(monkeypatch):
+    """隔离 LifeAdapter 的类级状态"""
+    monkeypatch.setattr(LifeAdapter, "_flush_tracker", FlushTracker())
+    monkeypatch.setattr(LifeAdapter, "_pending_reapply", [])
+    monkeypatch.setattr(LifeAdapter, "_cas_stats", {"conflicts": 0, "retries": 0, "failures": 0, "stale_reloads": 0})
+    monkeypatch.setattr(LifeAdapter, "_write_behind", None)
+
+
+def feed(life):
+    """模拟一次未落盘的修改：能量+10"""
+    state = dict(life.state_manager.load("energy"))
+    state["energy"] = state.get("energy", 0.0) + 10.0
+    life.state_manager.save("energy", state)
+
+
+def test_adapter_reapplies_after_conflict(adapter_state):
+    """其他实例先写入：重新加载对方的状态，再应用本实例的修改"""
+    client = FakeRedis()
+    other = make_storage(client)
+    other.load("energy")
+    other.save("energy", {"energy": 50.0})
+
+    life = FakeLife(make_storage(client))
+    life.state_manager.load("energy")
+    other.save("energy", {"energy": 40.0})  # 本实例读取之后的并发写入
+
+    feed(life)
+    LifeAdapter._flush(life, reapply=lambda: feed(life))
+
+    assert json.loads(client.data["life_test:energy"]) == {"energy": 50.0}
+    assert LifeAdapter._cas_stats["conflicts"] == 1
+    assert LifeAdapter._cas_stats["retries"] == 1
+    assert LifeAdapter._cas_stats["failures"] == 0
+    assert LifeAdapter._pending_reapply == []
+    assert "cas" in LifeAdapter.storage_stats()
+
+
+def test_interaction_cooldown_replayed_after_conflict(adapter_state, monkeypatch):
+    """组提交与并发写入冲突：重新应用后效果和冷却一起落盘，另一实例的同一设备进入冷却"""
+    client = FakeRedis()
+    other = make_storage(client)
+    other.load("energy")
+    other.save("energy", {"energy": 50.0})
+
+    life = FakeLife(make_storage(client))
+    monkeypatch.setattr(LifeAdapter, "_global_life", life)
+
+    class ContendedApplier(ActionEffectApplier):
+        def apply_batch(self, states, batch, now):
+            applied = super().apply_batch(states, batch, now)
+            other.save("energy", {"energy": 40.0})  # 本实例读取之后的并发写入
+            return applied
+
+    monkeypatch.setattr(LifeAdapter, "_action_effects", ContendedApplier())
+    LifeAdapter._commit_interactions([("feed", "phone")])
+
+    assert LifeAdapter._cas_stats["retries"] == 1
+    assert json.loads(client.data["life_test:energy"]) == {"energy": 60.0}
+    assert "feed:phone" in json.loads(client.data[f"life_test:{COOLDOWN_KEY}"])
+
+    states = LifeAdapter._load_for_interaction(LifeStepper(FakeLife(make_storage(client))))
+    assert ActionEffectApplier().apply_batch(states, [("feed", "phone")], now=time.time()) == []
+
+
+def test_adapter_gives_up_after_retries(adapter_state, monkeypatch):
+    """持续冲突时保留未落盘的修改，下次刷盘再试"""
+    monkeypatch.setattr("src.life_adapter.CAS_MAX_RETRIES", 1)
+    client = FakeRedis()
+    life = FakeLife(make_storage(client))
+    life.state_manager.load("energy")
+
+    def contended_feed():
+        client.data["life_test:version"] = str(int(client.data.get("life_test:version") or 0) + 1)
+        feed(life)
+
+    contended_feed()
+    LifeAdapter._flush(life, reapply=contended_feed)
+
+    assert LifeAdapter._cas_stats["failures"] == 1
+    assert len(LifeAdapter._pending_reapply) == 1
+    assert life.state_manager._pending_saves
+
+
+def test_is_stale_single_get():
+    """新鲜度检查只发出一次GET；只有其他实例写入后才报告过期"""
+    client = FakeRedis()
+    storage, other = make_storage(client), make_storage(client)
+    assert not storage.is_stale()  # 尚未读取过任何状态
+
+    storage.load_many(["energy"])
+    trips = client.round_trips
+    assert not storage.is_stale()
+    assert client.round_trips == trips + 1
+
+    storage.save("energy", {"energy": 1.0})
+    assert not storage.is_stale()  # 自己的写入不算过期
+
+    other.load_many(["energy"])
+    other.save("energy", {"energy": 2.0})
+    assert storage.is_stale()
+    storage.load_many(["energy"])
+    assert not storage.is_stale()
+    assert storage.freshness_checks == 4
+
+
+def test_failover_is_stale_when_open():
+    """熔断期间无法判断新鲜度，按不过期处理且不访问主存储"""
+    client = FakeRedis()
+    primary = make_storage(client)
+    storage = FailoverStorage(lambda: primary, base_backoff=60.0)
+    storage.load("energy")
+    storage._trip(ConnectionError("redis unreachable"))
+    client.data["life_test:version"] = "3"
+
+    trips = client.round_trips
+    assert not storage.is_stale()
+    assert client.round_trips == trips
+
+
+def test_adapter_rebases_stale_state(adapter_state):
+    """其他实例推进过状态：重新加载，并保留本实例尚未落盘的修改（write_behind）"""
+    client = FakeRedis()
+    life = FakeLife(make_storage(client))
+    life.state_manager.load("energy")
+    assert not LifeAdapter._is_stale(life)
+
+    feed(life)
+    LifeAdapter._pending_reapply.append(lambda: feed(life))
+
+    other = make_storage(client)
+    other.load("energy")
+    other.save("energy", {"energy": 30.0})
+
+    assert LifeAdapter._is_stale(life)
+    LifeAdapter._rebase(life)
+    assert life.state_manager.load("energy") == {"energy": 40.0}
+    assert not LifeAdapter._is_stale(life)
+
+    LifeAdapter._commit_flush(life)
+    assert json.loads(client.data["life_test:energy"]) == {"energy": 40.0}
+    assert LifeAdapter._cas_stats["conflicts"] == 0
+
+
+def test_freshness_check_disabled(adapter_state, monkeypatch):
+    monkeypatch.setattr("src.life_adapter.FRESHNESS_CHECK", False)
+    client = FakeRedis()
+    life = FakeLife(make_storage(client))
+    life.state_manager.load("energy")
+    client.data["life_test:version"] = "7"
+    assert not LifeAdapter._is_stale(life)
+
+
+@pytest.mark.parametrize("layout", ["json", "hash"])
+def test_cas_script_on_real_redis(layout):
+    """真实Lua脚本：版本不存在按0处理、冲突时不写入、HSET/HDEL、状态键与版本键的TTL"""
+    redis_url = os.getenv("REDIS_URL")
+    if not redis_url:
+        pytest.skip("未设置 REDIS_URL")
+    redis = pytest.importorskip("redis")
+
+    client = redis.from_url(redis_url, decode_responses=True)
+    prefix = f"life_cas_test_{uuid.uuid4().hex[:8]}"
+    backend = redis_backend(client, key_prefix=prefix, ttl=60)
+    first = BatchedStorage(backend, layout=layout, versioned=True)
+    second = BatchedStorage(backend, layout=layout, versioned=True)
+    state_key = f"{prefix}:h:energy" if layout == "hash" else f"{prefix}:energy"
+    version_key = f"{prefix}:version"
+
+    try:
+        assert first.load_many(["energy", "rhythm"]) == {"energy": {}, "rhythm": {}}
+        second.load("energy")
+        first.save_many({"energy": {"energy": 80.0, "consumption_rate": 0.5}, "rhythm": {"internal_phase": 0.1}})
+        assert client.get(version_key) == "1"
+        assert 0 < client.ttl(state_key) <= 60
+        assert 0 < client.ttl(version_key) <= 60
+
+        # 读到版本0的实例写入被拒绝，存储不变
+        with pytest.raises(VersionConflict) as exc:
+            second.save("energy", {"energy": 10.0})
+        assert exc.value.current == 1
+        assert client.get(version_key) == "1"
+
+        # 字段从状态中消失：hash布局在脚本中HDEL
+        assert second.load("energy") == {"energy": 80.0, "consumption_rate": 0.5}
+        second.save("energy", {"energy": 79.0})
+        assert client.get(version_key) == "2"
+        assert first.load("energy") == {"energy": 79.0}
+        if layout == "hash":
+            assert client.hgetall(state_key) == {"energy": "79.0"}
+        else:
+            assert json.loads(client.get(state_key)) == {"energy": 79.0}
+    finally:
+        keys = list(client.scan_iter(f"{prefix}:*"))
+        if keys:
+            client.delete(*keys)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+后台写回测试
+
+测试覆盖：
+1. 变更达到 max_mutations 时提前刷盘
+2. 没有变更时定时器不刷盘
+3. 停止时强制刷盘
+4. 刷盘失败时变更保留到下一轮
+
+使用方法：
+    python -m pytest tests/test_write_behind.py -q
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.write_behind import WriteBehindFlusher
+
+
+class CountingFlush:
+    def __init__(self):
+        self.calls = 0
+        self.called = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.called.set()
+
+
+def test_flush_after_max_mutations():
+    """累计变更达到阈值时不等定时器"""
+    flush = CountingFlush()
+    flusher = WriteBehindFlusher(flush, interval=60.0, max_mutations=3)
+    flusher.start()
+    try:
+        flusher.mark_dirty()
+        flusher.mark_dirty()
+        assert not flush.called.wait(0.05)
+
+        flusher.mark_dirty()
+        assert flush.called.wait(1.0)
+        assert flusher.pending_mutations == 0
+    finally:
+        flusher.stop()
+    assert flush.calls == 1
+
+
+def test_flush_on_interval():
+    """定时刷盘；没有变更时不调用刷盘函数"""
+    flush = CountingFlush()
+    flusher = WriteBehindFlusher(flush, interval=0.02, max_mutations=1000)
+    flusher.start()
+    try:
+        time.sleep(0.1)
+        assert flush.calls == 0
+
+        flusher.mark_dirty()
+        assert flush.called.wait(1.0)
+    finally:
+        flusher.stop()
+    assert flusher.flushes == 1
+
+
+def test_stop_forces_flush():
+    """退出时把窗口内的变更刷盘"""
+    flush = CountingFlush()
+    flusher = WriteBehindFlusher(flush, interval=60.0, max_mutations=1000)
+    flusher.start()
+    flusher.mark_dirty(5)
+
+    flusher.stop(flush=True)
+
+    assert flush.calls == 1
+    assert flusher.pending_mutations == 0
+
+
+def test_failed_flush_is_retried():
+    """刷盘失败时变更记回，下一次刷盘重试"""
+    attempts = []
+
+    def flaky_flush():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("storage unavailable")
+
+    flusher = WriteBehindFlusher(flaky_flush, interval=60.0, max_mutations=1000)
+    flusher.mark_dirty(2)
+
+    assert flusher.flush_now() is False
+    assert flusher.pending_mutations == 2
+    assert flusher.flush_now() is True
+    assert flusher.pending_mutations == 0
+    assert flusher.failures == 1
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))